@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+from logging import getLogger, INFO
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import List
+
+from tabulate import tabulate
+
+from vnet_manager.conf import settings
+from vnet_manager.log import setup_console_logging
+from vnet_manager.environment.lxc import ensure_lxc_golden_machine
+from vnet_manager.operations.machine import get_lxc_container_source, destroy_lxc_machine
+from vnet_manager.providers.lxc import get_lxd_client
+
+
+logger = getLogger("tools.lxc_create_benchmark")
+
+
+def benchmark_lxc_create_strategy(strategy: str, count: int) -> List[float]:
+    """
+    Create and destroy containers with a creation strategy and time the creations
+    :param str strategy: The creation strategy, 'image' or 'copy'
+    :param int count: The amount of containers to create
+    :return: list: The creation time of each container in seconds
+    """
+    client = get_lxd_client()
+    timings = []
+    for i in range(count):
+        name = f"vnet-bench-{strategy}-{i}"
+        machine_config = {
+            "name": name,
+            "source": get_lxc_container_source(strategy),
+            "ephemeral": False,
+            "devices": {"eth0": {"type": "none"}},
+            "profiles": [settings.LXC_VNET_PROFILE],
+        }
+        start = perf_counter()
+        client.containers.create(machine_config, wait=True)
+        timings.append(perf_counter() - start)
+        destroy_lxc_machine(name, wait=True)
+    return timings
+
+
+def main():
+    """
+    This script compares creating LXC containers from the base image with copying the golden container.
+    The VNet LXC environment (storage pool, profile and base image) should have been created already.
+    """
+    setup_console_logging(verbosity=INFO)
+    parser = ArgumentParser(description="Benchmark the LXC container creation strategies")
+    parser.add_argument("-n", "--count", type=int, default=5, help="The amount of containers to create per strategy (default: 5)")
+    args = parser.parse_args()
+
+    ensure_lxc_golden_machine()
+    rows = []
+    for strategy in ("image", "copy"):
+        logger.info(f"Creating {args.count} containers with the {strategy} strategy")
+        timings = benchmark_lxc_create_strategy(strategy, args.count)
+        rows.append([strategy, f"{min(timings):.2f}", f"{sum(timings) / len(timings):.2f}", f"{max(timings):.2f}"])
+    print(tabulate(rows, headers=["Strategy", "Min (s)", "Mean (s)", "Max (s)"], tablefmt="pretty"))
+
+
+if __name__ == "__main__":
+    main()
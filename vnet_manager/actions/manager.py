@@ -1,26 +1,18 @@
 from logging import getLogger
-from os import EX_OK, EX_USAGE, EX_OSERR
+from os import EX_OK, EX_USAGE, EX_OSERR, EX_SOFTWARE
 from os.path import isdir
+from sys import modules
 from typing import Optional, Tuple, List
 
-import vnet_manager.operations.machine as machine_op
 from vnet_manager.conf import settings
 from vnet_manager.config.config import get_config
-from vnet_manager.config.validate import ValidateConfig
 from vnet_manager.utils.version import show_version
 from vnet_manager.utils.user import request_confirmation, generate_bash_completion_script
 from vnet_manager.utils.files import write_file_to_disk, get_yaml_files_from_disk_path
-from vnet_manager.environment.lxc import ensure_vnet_lxc_environment, cleanup_vnet_lxc_environment
-from vnet_manager.operations.image import destroy_lxc_image
-from vnet_manager.operations.files import put_files_on_machine, generate_vnet_hosts_file, place_vnet_hosts_file_on_machines
-from vnet_manager.operations.interface import (
-    bring_up_vnet_interfaces,
-    bring_down_vnet_interfaces,
-    delete_vnet_interfaces,
-    show_vnet_interface_status,
-    show_vnet_veth_interface_status,
-    kill_tcpdump_processes_on_vnet_interfaces,
-)
+
+# The operations, providers and environments are imported by the actions that use them,
+# so the CLI does not load PyLXD, pyroute2, psutil and tabulate for actions like 'version'
+# pylint: disable=import-outside-toplevel
 
 logger = getLogger(__name__)
 
@@ -41,11 +33,21 @@ class ActionManager:
         purge: bool = False,
         pcap_dir: str = settings.VNET_SNIFFER_PCAP_DIR,
         provider: str = "lxc",
+        parallel: int = 1,
+        sniffer_options: Optional[dict] = None,
+        sniffer_engine: str = "tcpdump",
+        dry_run: bool = False,
+        prune: bool = False,
     ):
         """
         :param str config_path: The path to the config
         :param bool sniffer: Whether to enable sniffers on 'start'
         :param bool base_image: Whether to delete the base image on 'destroy'
+        :param int parallel: The amount of machines to create, start, stop or destroy concurrently
+        :param dict sniffer_options: The default sniffer options (rotation, snap length, filter) on 'start'
+        :param str sniffer_engine: The capture engine to use for the sniffers on 'start'
+        :param bool dry_run: Only show the changes 'create' would make
+        :param bool prune: Remove the VNet machines and interfaces that are not in the config on 'create'
         """
         self.config_path = config_path
         self.config = None
@@ -56,6 +58,11 @@ class ActionManager:
         self.machines = machines
         self.purge = purge
         self.pcap_dir = pcap_dir
+        self.parallel = parallel
+        self.sniffer_options = sniffer_options or {}
+        self.sniffer_engine = sniffer_engine
+        self.dry_run = dry_run
+        self.prune = prune
         self._config_validated = False
 
     def execute(self, action: str) -> int:
@@ -74,8 +81,16 @@ class ActionManager:
             return EX_USAGE
         # Preform the action
         logger.info(f"Initiating {action} action")
+        # The LXD provider is only loaded by the actions that talk to LXD, the others do not perform any handshakes
+        lxd_provider = modules.get("vnet_manager.providers.lxc")
+        if lxd_provider:
+            lxd_provider.reset_lxd_handshake_count()
+        ret = getattr(self, f"preform_{action_func}_action")()
+        lxd_provider = modules.get("vnet_manager.providers.lxc")
+        if lxd_provider:
+            logger.debug(f"Action {action} performed {lxd_provider.get_lxd_handshake_count()} LXD client handshake(s)")
         # Return the exit code provided by the execute function or exit EX_OK if no exit code is provided
-        return getattr(self, f"preform_{action_func}_action")() or EX_OK
+        return ret or EX_OK
 
     def parse_config(self) -> bool:
         """
@@ -83,12 +98,16 @@ class ActionManager:
         Updates the config accordingly
         :return: bool: True if config parsing successful, False otherwise
         """
+        from vnet_manager.providers.lxc import configure_lxd_remotes
+
         self.config = get_config(self.config_path)
         # Config passed and required, validate it
         check_result, self.config = self.check_and_update_config()
         if not check_result:
             # Config NOT OK, quit execution and return usage code
             return False
+        # The machines are looked up on the LXD remote the validator placed them on
+        configure_lxd_remotes(self.config)
         return True
 
     def check_and_update_config(self) -> Tuple[bool, dict]:
@@ -97,27 +116,55 @@ class ActionManager:
         The validator can also fix some minor config issues, these are returned.
         :return: bool: True if config successfully validated, False otherwise / dict: The updated config
         """
-        validator = ValidateConfig(self.config)
+        from vnet_manager.config.validate import ValidateConfig
+        from vnet_manager.config.topology import register_topology
+
+        lxd_instances = None
+        if "lxd_remotes" in self.config:
+            from vnet_manager.operations.machine import get_lxd_remote_instance_names
+
+            # Machines that already exist stay on the LXD remote they were created on
+            lxd_instances = get_lxd_remote_instance_names
+        validator = ValidateConfig(self.config, lxd_instances=lxd_instances)
         validator.validate()
         if not validator.config_validation_successful:
             logger.error("The config seems to have unrecoverable issues, please fix them before proceeding")
             return False, {}
         # Everything okay
         logger.debug("Config validation successful")
+        # The operations look up the machines, switches and their relations in the compiled topology of the config
+        register_topology(validator.updated_config, validator.topology)
         return True, validator.updated_config
 
     def preform_show_action(self):
+        from vnet_manager.operations import machine as machine_op
+        from vnet_manager.operations.interface import show_vnet_interface_status, show_vnet_veth_interface_status
+
         machine_op.show_status(self.config)
         show_vnet_interface_status(self.config)
         if "veths" in self.config:
             show_vnet_veth_interface_status(self.config)
 
     def preform_start_action(self):
-        bring_up_vnet_interfaces(self.config, sniffer=self.sniffer, pcap_dir=self.pcap_dir)
-        machine_op.change_machine_status(self.config, machines=self.machines, status="start")
+        from vnet_manager.operations import machine as machine_op
+        from vnet_manager.operations.interface import bring_up_vnet_interfaces
+        from vnet_manager.operations.network import ensure_vnet_lxd_networks
+
+        bring_up_vnet_interfaces(
+            self.config,
+            sniffer=self.sniffer,
+            pcap_dir=self.pcap_dir,
+            sniffer_options=self.sniffer_options,
+            sniffer_engine=self.sniffer_engine,
+        )
+        ensure_vnet_lxd_networks(self.config)
+        machine_op.change_machine_status(self.config, machines=self.machines, status="start", parallel=self.parallel)
 
     def preform_stop_action(self):
-        machine_op.change_machine_status(self.config, machines=self.machines, status="stop")
+        from vnet_manager.operations import machine as machine_op
+        from vnet_manager.operations.interface import bring_down_vnet_interfaces, kill_tcpdump_processes_on_vnet_interfaces
+
+        machine_op.change_machine_status(self.config, machines=self.machines, status="stop", parallel=self.parallel)
         # If specific machines are specified, we don't want to mess with the interfaces
         if self.machines:
             logger.warning("Not bringing down VNet interfaces as we are only stopping specific machines, this may leave lingering sniffers")
@@ -131,6 +178,8 @@ class ActionManager:
                 kill_tcpdump_processes_on_vnet_interfaces(self.config)
 
     def preform_connect_action(self):
+        from vnet_manager.operations import machine as machine_op
+
         # Make the provider exists
         if self.provider not in settings.PROVIDERS.keys():
             logger.error(f"Provider {self.provider} not supported")
@@ -140,27 +189,41 @@ class ActionManager:
         return EX_OK
 
     def preform_create_action(self):
+        from vnet_manager.environment.lxc import ensure_vnet_lxc_environment
+        from vnet_manager.operations.network import ensure_vnet_lxd_networks
+        from vnet_manager.operations.reconcile import reconcile_machines
+
         # Make sure the provider environments are correct
         ensure_vnet_lxc_environment(self.config)
-        # Make the machines
-        machine_op.create_machines(self.config, machines=self.machines)
-        # Put user requested file on the machines
-        put_files_on_machine(self.config)
-        if not self.no_hosts:
-            # Put /etc/hosts on the machines
-            generate_vnet_hosts_file(self.config)
-            place_vnet_hosts_file_on_machines(self.config)
-        # Configure type specific stuff
-        machine_op.enable_type_specific_machine_configuration(self.config)
+        # Machines on LXD remotes are connected to the VNet bridges of their remote
+        ensure_vnet_lxd_networks(self.config)
+        # Only create, update or remove what differs between the config and the running machines and interfaces
+        failed_machines = reconcile_machines(
+            self.config,
+            machines=self.machines,
+            parallel=self.parallel,
+            hosts=not self.no_hosts,
+            dry_run=self.dry_run,
+            prune=self.prune,
+        )
+        if failed_machines:
+            logger.error(f"The following machines could not be created: {', '.join(failed_machines)}")
+            return EX_SOFTWARE
+        return EX_OK
 
     def preform_destroy_action(self):
+        from vnet_manager.operations import machine as machine_op
+        from vnet_manager.operations.image import destroy_lxc_image
+        from vnet_manager.operations.interface import delete_vnet_interfaces
+        from vnet_manager.operations.network import delete_vnet_lxd_networks
+
         if self.purge:
             self.preform_purge_action()
         elif self.base_image:
             request_confirmation(prompt="Are you sure you want to delete the VNet base images (y/n)? ")
             destroy_lxc_image(settings.LXC_BASE_IMAGE_ALIAS, by_alias=True)
         else:
-            machine_op.destroy_machines(self.config, machines=self.machines)
+            machine_op.destroy_machines(self.config, machines=self.machines, parallel=self.parallel)
             # If specific machines are specified, we don't want to mess with the interfaces
             if self.machines:
                 logger.warning(
@@ -168,21 +231,37 @@ class ActionManager:
                 )
             else:
                 delete_vnet_interfaces(self.config)
+                delete_vnet_lxd_networks(self.config)
 
     def preform_list_action(self):
+        from vnet_manager.operations import machine as machine_op
+
         if not isdir(self.config_path):
             logger.error(f"Provided path {self.config_path} does not seem to be a directory")
             return EX_OSERR
         yaml_files = get_yaml_files_from_disk_path(self.config_path)
+        # Fetch the machine statuses of each LXD remote once for all configs
+        remote_instances = {}
         for path in yaml_files:
             self.config_path = path
             if not self.parse_config():
                 logger.error(f"Config {path} does not seem to be a valid config, skipping")
                 continue
             logger.info(f"Showing machine status for {path}")
-            machine_op.show_status(self.config)
+            # The LXD remotes of the config have been configured by parsing it
+            machine_op.show_status(self.config, lxc_instances=machine_op.get_lxc_instances(remote_instances=remote_instances))
         return EX_OK
 
+    def preform_sniffer_list_action(self):
+        from vnet_manager.operations.interface import get_vnet_interface_names_from_config
+        from vnet_manager.operations.sniffer import show_sniffer_status
+
+        interfaces = None
+        if self.config:
+            # Only show the sniffers of this config
+            interfaces = get_vnet_interface_names_from_config(self.config) + list(self.config.get("veths", {}))
+        show_sniffer_status(interfaces)
+
     @staticmethod
     def preform_version_action():
         show_version()
@@ -195,4 +274,6 @@ class ActionManager:
 
     @staticmethod
     def preform_purge_action():
+        from vnet_manager.environment.lxc import cleanup_vnet_lxc_environment
+
         cleanup_vnet_lxc_environment()
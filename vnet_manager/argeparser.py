@@ -1,4 +1,4 @@
-from argparse import Namespace, ArgumentParser
+from argparse import Namespace, ArgumentParser, ArgumentTypeError
 from typing import Sequence
 
 from vnet_manager.conf import settings
@@ -16,6 +16,21 @@ class VNetParser(ArgumentParser):
         logging_group.add_argument("-q", "--quite", action="count", default=0, help="Be more quite")
 
 
+def positive_int(value: str) -> int:
+    """
+    Argparse type for options that only make sense as a positive number, like the sniffer options in the config
+    :param str value: The value passed on the command line
+    :return: int: The parsed value
+    """
+    try:
+        number = int(value)
+    except ValueError as e:
+        raise ArgumentTypeError(f"invalid int value: '{value}'") from e
+    if number <= 0:
+        raise ArgumentTypeError(f"should be a positive number: '{value}'")
+    return number
+
+
 def parse_vnet_args(args: Sequence = None) -> Namespace:
     parser = ArgumentParser(description="VNet-manager a virtual network manager - manages containers to create virtual networks")
     # Add parsers for all the possible user actions
@@ -43,6 +58,23 @@ def add_action_parsers(parser: ArgumentParser) -> ArgumentParser:
     create_parser.add_argument(
         "-m", "--machines", nargs="*", help="Only create the following machines (defaults to all machines in the config file)"
     )
+    create_parser.add_argument(
+        "-p",
+        "--parallel",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Configure up to N machines concurrently, each machine runs through its own pipeline. "
+        "The creation of all machines is submitted to LXD at once (default: 1)",
+    )
+    create_parser.add_argument(
+        "-n", "--dry-run", action="store_true", help="Only show the changes needed to bring the running machines in line with the config"
+    )
+    create_parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Also remove the VNet machines and interfaces that are not in the config, including those of other configs on this host",
+    )
 
     connect_parser = action_parser.add_parser("connect", help="Open a shell on a machine")
     connect_parser.add_argument("config", help="Which machine to connect to", metavar="machine")
@@ -59,12 +91,19 @@ def add_action_parsers(parser: ArgumentParser) -> ArgumentParser:
     destroy_opt.add_argument("-c", "--config", help="The config (YAML) to destroy the machines and VNet-interfaces for")
     destroy_opt.add_argument("-b", "--base-image", action="store_true", help="Destroy the VNet-manager base image")
     destroy_opt.add_argument(
-        "-p",
         "--purge",
         action="store_true",
         help="Purge the VNet-manager provider specific configurations from this machine. "
         "All previously build configs must have been destroyed. (This operation was previously called 'clean'",
     )
+    destroy_parser.add_argument(
+        "-p",
+        "--parallel",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Force stop all machines at once and delete up to N machines concurrently (default: 1)",
+    )
 
     list_parser = action_parser.add_parser("list", help="Recursive search for all configs in the supplied directory")
     list_parser.add_argument("config", help="The directory in which to list the machines statuses", metavar="directory")
@@ -72,6 +111,15 @@ def add_action_parsers(parser: ArgumentParser) -> ArgumentParser:
     show_parser = action_parser.add_parser("show", help="Show the current status of the supplied config file", aliases=["status"])
     show_parser.add_argument("config", help="The config (YAML) to get the status for")
 
+    sniffer_parser = action_parser.add_parser("sniffer", help="Manage the TCPdump sniffers started by VNet-manager")
+    sniffer_action_parser = sniffer_parser.add_subparsers(
+        title="Sniffer actions", dest="sniffer_action", required=True, parser_class=VNetParser
+    )
+    sniffer_list_parser = sniffer_action_parser.add_parser("list", help="List the running sniffers and the bytes they captured")
+    sniffer_list_parser.add_argument(
+        "config", nargs="?", help="Only list the sniffers of the VNet interfaces in this config (YAML) (defaults to all sniffers)"
+    )
+
     start_parser = action_parser.add_parser("start", help="Starts up a previously built config")
     start_parser.add_argument("config", help="The config (YAML) to startup")
     start_parser.add_argument("-s", "--sniffer", action="store_true", help="Start a TCPdump sniffer on the VNet interfaces")
@@ -84,12 +132,39 @@ def add_action_parsers(parser: ArgumentParser) -> ArgumentParser:
     start_parser.add_argument(
         "-m", "--machines", nargs="*", help="Only start the following machines (defaults to all machines in the config file)"
     )
+    sniffer_group = start_parser.add_argument_group(
+        "Sniffer options", "Defaults for all sniffers, the sniffer options of a switch or veth in the config take precedence"
+    )
+    sniffer_group.add_argument(
+        "--sniffer-engine",
+        default="tcpdump",
+        choices=settings.VNET_SNIFFER_ENGINES,
+        help="tcpdump starts a process per interface, builtin captures all interfaces from one process into a single pcapng "
+        "file (only supports the snaplen option) (default: tcpdump)",
+    )
+    sniffer_group.add_argument("--sniffer-snaplen", type=positive_int, metavar="BYTES", help="Only capture the first BYTES of each packet")
+    sniffer_group.add_argument("--sniffer-filter", metavar="EXPRESSION", help="Only capture packets matching this BPF filter")
+    sniffer_group.add_argument(
+        "--sniffer-rotate-size", type=positive_int, metavar="MB", help="Rotate the PCAP file when it grows larger than MB million bytes"
+    )
+    sniffer_group.add_argument("--sniffer-rotate-seconds", type=positive_int, metavar="SECONDS", help="Rotate the PCAP file every SECONDS")
+    sniffer_group.add_argument(
+        "--sniffer-rotate-count",
+        type=positive_int,
+        metavar="N",
+        help="Keep at most N rotated PCAP files (note: when only rotating on time, the sniffer stops after N files)",
+    )
+    sniffer_group.add_argument(
+        "--sniffer-compress", action="store_true", help="Compress the rotated PCAP files (requires size or time based rotation)"
+    )
+    start_parser.add_argument("-p", "--parallel", type=int, default=1, metavar="N", help="Start up to N machines concurrently (default: 1)")
 
     stop_parser = action_parser.add_parser("stop", help="Stops a previously started config.")
     stop_parser.add_argument("config", help="The config (YAML) to stop")
     stop_parser.add_argument(
         "-m", "--machines", nargs="*", help="Only stop the following machines (defaults to all machines in the config file)"
     )
+    stop_parser.add_argument("-p", "--parallel", type=int, default=1, metavar="N", help="Stop up to N machines concurrently (default: 1)")
 
     action_parser.add_parser("version", help="Show the current version and exit")
 
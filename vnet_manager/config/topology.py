@@ -0,0 +1,199 @@
+from dataclasses import dataclass
+from ipaddress import ip_interface
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from vnet_manager.conf import settings
+
+# The topology of the validated config in use, see register_topology()
+_registered_topology: Optional[Tuple[dict, "Topology"]] = None
+
+
+@dataclass(frozen=True)
+class Interface:
+    """
+    A machine interface connected to a switch
+    """
+
+    __slots__ = ("machine", "name", "mac", "switch", "bridge", "ipv4", "ipv6")
+    machine: str
+    name: str
+    mac: str
+    switch: int
+    bridge: str  # The VNet bridge of the switch, point-to-point switches do not create it
+    ipv4: Optional[str]
+    ipv6: Optional[str]
+
+
+@dataclass(frozen=True)
+class Machine:
+    """
+    A machine and its interfaces, in the order of the config
+    """
+
+    __slots__ = ("name", "type", "provider", "remote", "interfaces")
+    name: str
+    type: str
+    provider: str
+    remote: Optional[str]
+    interfaces: Tuple[Interface, ...]
+
+
+@dataclass(frozen=True)
+class Switch:
+    """
+    A switch and the machine interfaces connected to it
+    """
+
+    __slots__ = ("number", "bridge", "p2p", "interfaces")
+    number: int
+    bridge: str
+    p2p: bool  # Wired with a veth pair instead of the VNet bridge
+    interfaces: Tuple[Interface, ...]
+
+
+@dataclass(frozen=True)
+class Veth:
+    """
+    A VNet veth interface
+    """
+
+    __slots__ = ("name", "bridge", "peer", "stp")
+    name: str
+    bridge: str
+    peer: Optional[str]
+    stp: Optional[bool]
+
+
+@dataclass(frozen=True)
+class Topology:
+    """
+    The compiled, read only topology of a validated config, with indexes for the lookups the operations need
+    """
+
+    __slots__ = ("machines", "switches", "veths", "machines_by_bridge", "interfaces_by_bridge", "bridges_by_machine", "machine_by_ip")
+    machines: Mapping[str, Machine]
+    switches: Mapping[int, Switch]
+    veths: Mapping[str, Veth]
+    machines_by_bridge: Mapping[str, Tuple[str, ...]]  # VNet bridge -> the machines connected to it
+    interfaces_by_bridge: Mapping[str, Tuple[Interface, ...]]  # VNet bridge -> the machine interfaces connected to it
+    bridges_by_machine: Mapping[str, Tuple[str, ...]]  # Machine -> the VNet bridges it is connected to
+    machine_by_ip: Mapping[str, str]  # IP address (without prefix length) -> machine
+
+    @property
+    def bridge_names(self) -> List[str]:
+        """
+        The VNet bridges that are created, point-to-point switches do not have one
+        """
+        return [switch.bridge for switch in self.switches.values() if not switch.p2p]
+
+
+def get_vnet_p2p_switches_from_config(config: dict) -> Dict[int, List[Tuple[str, str]]]:
+    """
+    Get the switches that are wired with a veth pair instead of a VNet bridge
+    A switch is point-to-point when it sets p2p: true, or when it is detected automatically: it connects exactly two LXC machines
+    on the same LXD remote, no veth interface is connected to it and it has no sniffer options
+    :param dict config: The config generated by get_config()
+    :return: dict: switch number -> [(machine name, interface name), (machine name, interface name)]
+    """
+    switch_config = config.get("switch_config") or {}
+    veth_bridges = {veth["bridge"] for veth in config.get("veths", {}).values()}
+    ends = {}
+    for name, machine in config["machines"].items():
+        for ifname, interface in machine["interfaces"].items():
+            ends.setdefault(int(interface["bridge"]), []).append((name, ifname))
+    switches = {}
+    for switch, links in sorted(ends.items()):
+        p2p = switch_config.get(switch, {}).get("p2p")
+        if p2p is None:
+            p2p = (
+                settings.VNET_P2P_AUTO_DETECT
+                and len(links) == 2
+                and links[0][0] != links[1][0]
+                and all(settings.MACHINE_TYPE_PROVIDER_MAPPING[config["machines"][name]["type"]] == "lxc" for name, _ in links)
+                and config["machines"][links[0][0]].get("remote") == config["machines"][links[1][0]].get("remote")
+                and f"{settings.VNET_BRIDGE_NAME}{switch}" not in veth_bridges
+                and "sniffer" not in switch_config.get(switch, {})
+            )
+        if p2p:
+            switches[switch] = links
+    return switches
+
+
+def compile_topology(config: dict) -> Topology:
+    """
+    Compile a validated config into a Topology
+    :param dict config: The config validated by ValidateConfig
+    :return: Topology: The compiled topology
+    """
+    p2p = get_vnet_p2p_switches_from_config(config)
+    machines = {}
+    switch_interfaces: Dict[int, List[Interface]] = {switch: [] for switch in range(int(config["switches"]))}
+    machine_by_ip = {}
+    for name, data in config["machines"].items():
+        interfaces = []
+        for ifname, int_data in data["interfaces"].items():
+            switch = int(int_data["bridge"])
+            interface = Interface(
+                machine=name,
+                name=ifname,
+                mac=int_data["mac"],
+                switch=switch,
+                bridge=f"{settings.VNET_BRIDGE_NAME}{switch}",
+                ipv4=int_data.get("ipv4"),
+                ipv6=int_data.get("ipv6"),
+            )
+            interfaces.append(interface)
+            switch_interfaces.setdefault(switch, []).append(interface)
+            for address in (interface.ipv4, interface.ipv6):
+                if address:
+                    machine_by_ip[str(ip_interface(address).ip)] = name
+        machines[name] = Machine(
+            name=name,
+            type=data["type"],
+            provider=settings.MACHINE_TYPE_PROVIDER_MAPPING[data["type"]],
+            remote=data.get("remote"),
+            interfaces=tuple(interfaces),
+        )
+    switches = {
+        number: Switch(number=number, bridge=f"{settings.VNET_BRIDGE_NAME}{number}", p2p=number in p2p, interfaces=tuple(interfaces))
+        for number, interfaces in sorted(switch_interfaces.items())
+    }
+    veths = {
+        name: Veth(name=name, bridge=data["bridge"], peer=data.get("peer"), stp=data.get("stp"))
+        for name, data in (config.get("veths") or {}).items()
+    }
+    return Topology(
+        machines=MappingProxyType(machines),
+        switches=MappingProxyType(switches),
+        veths=MappingProxyType(veths),
+        machines_by_bridge=MappingProxyType(
+            {switch.bridge: tuple(dict.fromkeys(interface.machine for interface in switch.interfaces)) for switch in switches.values()}
+        ),
+        interfaces_by_bridge=MappingProxyType({switch.bridge: switch.interfaces for switch in switches.values()}),
+        bridges_by_machine=MappingProxyType(
+            {name: tuple(dict.fromkeys(interface.bridge for interface in machine.interfaces)) for name, machine in machines.items()}
+        ),
+        machine_by_ip=MappingProxyType(machine_by_ip),
+    )
+
+
+def register_topology(config: dict, topology: Topology):
+    """
+    Register the compiled topology of a validated config, get_topology() returns it for that config from now on
+    :param dict config: The config validated by ValidateConfig
+    :param Topology topology: The topology compiled by ValidateConfig
+    """
+    global _registered_topology  # pylint: disable=global-statement
+    _registered_topology = (config, topology)
+
+
+def get_topology(config: dict) -> Topology:
+    """
+    Get the topology of a config, the registered topology if the config was registered, otherwise it is compiled
+    :param dict config: The config validated by ValidateConfig
+    :return: Topology: The topology of the config
+    """
+    if _registered_topology is not None and _registered_topology[0] is config:
+        return _registered_topology[1]
+    return compile_topology(config)
@@ -3,9 +3,11 @@ from re import fullmatch
 from logging import getLogger
 from os.path import isdir, isfile, join
 from copy import deepcopy
+from typing import Callable, Dict, List, Optional
 
 from vnet_manager.utils.mac import random_mac_generator
 from vnet_manager.conf import settings
+from vnet_manager.config.topology import Topology, compile_topology
 
 logger = getLogger(__name__)
 
@@ -15,15 +17,19 @@ class ValidateConfig:
     Validates the config generated by get_config() and updates some values if missing
     """
 
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, lxd_instances: Optional[Callable[[dict], Dict[str, List[str]]]] = None):
         """
         :param dict config: The config generated by get_config()
+        :param callable lxd_instances: Gets the instance names on each LXD remote of a valid lxd_remotes config,
+            used to keep the existing machines on their remote. Without it the machines are placed on the config alone
         """
         self._all_ok = True
         self._validators_ran = 0
         self._new_config = deepcopy(config)
+        self._topology = None
         self.default_message = ". Please check your settings"
         self.config = config
+        self.lxd_instances = lxd_instances
 
     def __str__(self) -> str:
         return (
@@ -45,6 +51,15 @@ class ValidateConfig:
         """
         return self._new_config
 
+    @property
+    def topology(self) -> Topology:
+        """
+        This property contains the topology compiled from the updated config, only use it if the validation was successful
+        """
+        if self._topology is None:
+            self._topology = compile_topology(self._new_config)
+        return self._topology
+
     @property
     def validators_ran(self) -> int:
         """
@@ -61,6 +76,10 @@ class ValidateConfig:
         self.validate_machine_config()
         if "veths" in self.config:
             self.validate_veth_config()
+        if "lxd_remotes" in self.config:
+            self.validate_lxd_remotes_config()
+        if isinstance(self.config.get("switch_config"), dict):
+            self.validate_p2p_switch_config()
 
     def validate_switch_config(self):
         """
@@ -73,6 +92,62 @@ class ValidateConfig:
         elif not isinstance(self.config["switches"], int):
             logger.error(f"Config item 'switches: {self.config['switches']}' does not seem to be an integer{self.default_message}")
             self._all_ok = False
+        elif "switch_config" in self.config:
+            self.validate_switch_specific_config()
+
+    def validate_switch_specific_config(self):
+        """
+        Validates the optional per switch config
+        Assumes the switches config item is valid
+        """
+        if not isinstance(self.config["switch_config"], dict):
+            logger.error(f"Config item 'switch_config' does not seem to be a dict{self.default_message}")
+            self._all_ok = False
+            return
+        for switch, values in self.config["switch_config"].items():
+            if not isinstance(switch, int) or not 0 <= switch < self.config["switches"]:
+                logger.error(
+                    f"Invalid switch number {switch} found in switch_config. The switch number should correspond to the interface "
+                    "number of the vnet bridge (starting at iface number 0)"
+                )
+                self._all_ok = False
+            elif not isinstance(values, dict):
+                logger.error(f"switch_config for switch {switch} does not seem to be a dict{self.default_message}")
+                self._all_ok = False
+            else:
+                if "sniffer" in values:
+                    self.validate_sniffer_config(values["sniffer"], f"switch {switch}")
+                if "p2p" in values and not isinstance(values["p2p"], bool):
+                    logger.error(f"p2p parameter for switch {switch} does not seem to be a boolean{self.default_message}")
+                    self._all_ok = False
+
+    def validate_sniffer_config(self, sniffer: dict, owner: str):
+        """
+        Validates the sniffer options of a switch or veth interface
+        :param dict sniffer: The sniffer options to validate
+        :param str owner: The switch or veth interface the sniffer options belong to, used for logging
+        """
+        if not isinstance(sniffer, dict):
+            logger.error(f"Sniffer config for {owner} does not seem to be a dict{self.default_message}")
+            self._all_ok = False
+            return
+        for option, value in sniffer.items():
+            if option not in settings.VNET_SNIFFER_OPTIONS:
+                logger.error(
+                    f"Unknown sniffer option {option} for {owner}, supported options: "
+                    f"{', '.join(settings.VNET_SNIFFER_OPTIONS)}{self.default_message}"
+                )
+                self._all_ok = False
+            # Booleans are integers as well, so we check the exact type
+            elif type(value) is not settings.VNET_SNIFFER_OPTIONS[option]:  # pylint: disable=unidiomatic-typecheck
+                logger.error(
+                    f"Sniffer option {option} for {owner} does not seem to be a "
+                    f"{settings.VNET_SNIFFER_OPTIONS[option].__name__}{self.default_message}"
+                )
+                self._all_ok = False
+            elif isinstance(value, int) and not isinstance(value, bool) and value <= 0:
+                logger.error(f"Sniffer option {option} for {owner} should be a positive number{self.default_message}")
+                self._all_ok = False
 
     def validate_machine_config(self):
         # TODO: Refactor
@@ -99,6 +174,17 @@ class ValidateConfig:
                     )
                     self._all_ok = False
 
+                # Provider specific
+                if settings.MACHINE_TYPE_PROVIDER_MAPPING.get(values.get("type")) == "netns":
+                    self.validate_netns_machine_config(name)
+
+                # Placement hint
+                if "remote" in values and values["remote"] not in (self.config.get("lxd_remotes") or {}):
+                    logger.error(
+                        f"Machine {name} is placed on LXD remote {values['remote']}, but that remote is not defined in lxd_remotes"
+                    )
+                    self._all_ok = False
+
                 # Files
                 if "files" in values:
                     if not isinstance(values["files"], dict):
@@ -145,6 +231,19 @@ class ValidateConfig:
                 else:
                     self.validate_machine_bridge_config(name)
 
+    def validate_netns_machine_config(self, machine: str):
+        """
+        Validates the config items of a netns machine, a network namespace only has the interfaces of the config
+        :param str machine: The name of the machine to validate
+        """
+        values = self.config["machines"][machine]
+        for item in ("remote", "vlans", "bridges"):
+            if item in values:
+                logger.error(f"Machine {machine} is a netns machine, these do not support {item}{self.default_message}")
+                self._all_ok = False
+        if "files" in values:
+            logger.warning(f"Machine {machine} is a netns machine, the files directive is ignored for it")
+
     def validate_vlan_config(self, machine):
         """
         Validates the VLAN config of a particular machine
@@ -343,6 +442,7 @@ class ValidateConfig:
                         self._all_ok = False
 
     def validate_veth_config(self):
+        # pylint: disable=too-many-branches
         """
         Validates the veth config if present
         """
@@ -377,3 +477,111 @@ class ValidateConfig:
                 elif not isinstance(values["stp"], bool):
                     logger.error(f"veth interface {name} stp parameter does not seem to be a boolean{self.default_message}")
                     self._all_ok = False
+                if "sniffer" in values:
+                    self.validate_sniffer_config(values["sniffer"], f"veth interface {name}")
+
+    def validate_lxd_remotes_config(self):
+        # pylint: disable=too-many-branches
+        """
+        Validates the LXD remotes config and places the machines without a remote hint on the least loaded remote
+        """
+        self._validators_ran += 1
+        if not isinstance(self.config["lxd_remotes"], dict):
+            logger.error(f"Config item: 'lxd_remotes' does not seem to be a dict{self.default_message}")
+            self._all_ok = False
+            return
+        if settings.LXC_LOCAL_REMOTE_NAME not in self.config["lxd_remotes"]:
+            logger.error(
+                f"LXD remote {settings.LXC_LOCAL_REMOTE_NAME} is missing from lxd_remotes, it should contain the tunnel_address "
+                f"of this host{self.default_message}"
+            )
+            self._all_ok = False
+            return
+        for name, values in self.config["lxd_remotes"].items():
+            if not isinstance(values, dict):
+                logger.error(f"LXD remote {name} data does not seem to be a dict{self.default_message}")
+                self._all_ok = False
+                continue
+            try:
+                ip_address(values.get("tunnel_address"))
+            except ValueError:
+                logger.error(f"LXD remote {name} tunnel_address does not seem to be a valid IP address{self.default_message}")
+                self._all_ok = False
+            if name == settings.LXC_LOCAL_REMOTE_NAME:
+                continue
+            if not isinstance(values.get("endpoint"), str) or not values["endpoint"].startswith("https://"):
+                logger.error(f"LXD remote {name} endpoint does not seem to be a https:// URL{self.default_message}")
+                self._all_ok = False
+            if "cert" in values:
+                if not isinstance(values["cert"], list) or len(values["cert"]) != 2:
+                    logger.error(f"LXD remote {name} cert should be a list with a certificate and key file{self.default_message}")
+                    self._all_ok = False
+                else:
+                    for path in values["cert"]:
+                        if not isfile(path):
+                            logger.error(f"LXD remote {name} cert file {path} does not exist{self.default_message}")
+                            self._all_ok = False
+            if "verify" in values and not isinstance(values["verify"], (bool, str)):
+                logger.error(f"LXD remote {name} verify parameter should be a boolean or a CA file{self.default_message}")
+                self._all_ok = False
+        if isinstance(self.config.get("machines"), dict):
+            self.place_machines_on_lxd_remotes()
+
+    def place_machines_on_lxd_remotes(self):
+        """
+        Places the LXC machines without a remote hint on the remote they already exist on,
+        new machines go to the remote with the least instances, in the order of the lxd_remotes config
+        """
+        # The remotes are only queried when they are valid, the placement does not matter for an invalid config anyway
+        instances = self.lxd_instances(self.config["lxd_remotes"]) if self.lxd_instances and self._all_ok else {}
+        load = {name: len(instances.get(name, [])) for name in self.config["lxd_remotes"]}
+        for name, values in self.config["machines"].items():
+            if values.get("remote") in load and name not in instances.get(values["remote"], []):
+                load[values["remote"]] += 1
+        for name, values in self.config["machines"].items():
+            if "remote" in values or settings.MACHINE_TYPE_PROVIDER_MAPPING.get(values.get("type")) != "lxc":
+                continue
+            existing = [remote for remote in load if name in instances.get(remote, [])]
+            if existing:
+                # Moving an existing machine would leave it behind on its current remote
+                remote = existing[0]
+            else:
+                remote = min(load, key=load.get)
+                load[remote] += 1
+            logger.debug(f"Placing machine {name} on LXD remote {remote}")
+            self._new_config["machines"][name]["remote"] = remote
+
+    def validate_p2p_switch_config(self):
+        """
+        Validates the switches that are explicitly point-to-point, these are wired with a veth pair between two machines
+        """
+        self._validators_ran += 1
+        machines = self._new_config.get("machines")
+        if not isinstance(machines, dict):
+            return
+        for switch, values in self.config["switch_config"].items():
+            if not isinstance(values, dict) or values.get("p2p") is not True:
+                continue
+            ends = [
+                name
+                for name, machine in machines.items()
+                for interface in (machine.get("interfaces") or {}).values()
+                if isinstance(interface, dict) and str(interface.get("bridge")) == str(switch)
+            ]
+            if len(ends) != 2:
+                logger.error(
+                    f"Point-to-point switch {switch} should connect exactly two interfaces, found {len(ends)}{self.default_message}"
+                )
+                self._all_ok = False
+            elif any(settings.MACHINE_TYPE_PROVIDER_MAPPING.get(machines[end].get("type")) != "lxc" for end in ends):
+                logger.error(f"Point-to-point switch {switch} can only connect LXC machines{self.default_message}")
+                self._all_ok = False
+            elif machines[ends[0]].get("remote") != machines[ends[1]].get("remote"):
+                logger.error(f"Point-to-point switch {switch} connects machines on different LXD remotes{self.default_message}")
+                self._all_ok = False
+            veths = self.config.get("veths") if isinstance(self.config.get("veths"), dict) else {}
+            if any(isinstance(veth, dict) and veth.get("bridge") == f"{settings.VNET_BRIDGE_NAME}{switch}" for veth in veths.values()):
+                logger.error(
+                    f"Point-to-point switch {switch} has no VNet bridge, so no veth interface can connect to it{self.default_message}"
+                )
+                self._all_ok = False
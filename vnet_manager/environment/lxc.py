@@ -2,13 +2,21 @@ import shlex
 from logging import getLogger
 from time import sleep
 from typing import Tuple, AnyStr
+from pylxd.exceptions import NotFound
 
 from vnet_manager.operations.image import check_if_lxc_image_exists, create_lxc_image_from_container, destroy_lxc_image
 from vnet_manager.operations.profile import check_if_lxc_profile_exists, create_vnet_lxc_profile, delete_vnet_lxc_profile
 from vnet_manager.operations.storage import check_if_lxc_storage_pool_exists, create_lxc_storage_pool, delete_lxc_storage_pool
-from vnet_manager.operations.machine import create_lxc_base_image_container, change_lxc_machine_status, destroy_lxc_machine
+from vnet_manager.operations.machine import (
+    create_lxc_base_image_container,
+    create_lxc_golden_machine,
+    check_if_lxc_machine_exists,
+    change_lxc_machine_status,
+    destroy_lxc_machine,
+)
 from vnet_manager.environment.host import check_for_supported_os
-from vnet_manager.providers.lxc import get_lxd_client
+from vnet_manager.operations.network import get_vnet_lxd_remotes_from_config
+from vnet_manager.providers.lxc import get_lxd_client, use_lxd_remote
 from vnet_manager.conf import settings
 from vnet_manager.utils.user import request_confirmation
 
@@ -34,6 +42,23 @@ def ensure_vnet_lxc_environment(config: dict):
             prompt="Continue anyway? (y/n) ",
         )
 
+    # Every LXD remote that machines are placed on needs its own environment
+    if any(
+        machine.get("remote", settings.LXC_LOCAL_REMOTE_NAME) == settings.LXC_LOCAL_REMOTE_NAME
+        for machine in config["machines"].values()
+        if settings.MACHINE_TYPE_PROVIDER_MAPPING[machine["type"]] == "lxc"
+    ):
+        ensure_vnet_lxc_remote_environment()
+    for remote in get_vnet_lxd_remotes_from_config(config):
+        logger.info(f"Ensuring the VNet LXC environment on LXD remote {remote}")
+        with use_lxd_remote(remote):
+            ensure_vnet_lxc_remote_environment()
+
+
+def ensure_vnet_lxc_remote_environment():
+    """
+    Checks and creates the LXC storage pool, profile, base image and golden machine on the active LXD remote
+    """
     # Check if the storage pool exists
     if not check_if_lxc_storage_pool_exists(settings.LXC_STORAGE_POOL_NAME):
         logger.info("VNet LXC storage pool does not exist, creating it")
@@ -59,6 +84,30 @@ def ensure_vnet_lxc_environment(config: dict):
     else:
         logger.debug(f"Base image {settings.LXC_BASE_IMAGE_ALIAS} found")
 
+    # With the copy strategy the machines are created from the golden machine instead of the base image
+    if settings.LXC_CREATE_STRATEGY == "copy":
+        ensure_lxc_golden_machine()
+
+
+def ensure_lxc_golden_machine():
+    """
+    Makes sure the golden LXC machine exists and was created from the current base image
+    """
+    client = get_lxd_client()
+    fingerprint = client.images.get_by_alias(settings.LXC_BASE_IMAGE_ALIAS).fingerprint
+    try:
+        golden = client.containers.get(settings.LXC_GOLDEN_MACHINE_NAME)
+    except NotFound:
+        logger.info("Golden machine does not exist, creating it")
+    else:
+        # LXD records the fingerprint of the image a container was created from
+        if golden.config.get("volatile.base_image") == fingerprint:
+            logger.debug(f"Golden machine {settings.LXC_GOLDEN_MACHINE_NAME} found")
+            return
+        logger.info("Golden machine was created from an older base image, recreating it")
+        destroy_lxc_machine(settings.LXC_GOLDEN_MACHINE_NAME, wait=True)
+    create_lxc_golden_machine()
+
 
 def cleanup_vnet_lxc_environment():
     """
@@ -66,6 +115,9 @@ def cleanup_vnet_lxc_environment():
     No environments should be active when calling this function
     """
     request_confirmation(message="Cleanup will delete the VNet LXC configurations, such as base_image, profile and storage pools")
+    if check_if_lxc_machine_exists(settings.LXC_GOLDEN_MACHINE_NAME):
+        logger.info("Destroying VNet-manager golden machine")
+        destroy_lxc_machine(settings.LXC_GOLDEN_MACHINE_NAME, wait=True)
     logger.info("Destroying VNet-manager base image")
     destroy_lxc_image(settings.LXC_BASE_IMAGE_ALIAS, by_alias=True, wait=True)
     logger.info("Cleaning up VNet LXC configuration")
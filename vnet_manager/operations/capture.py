@@ -0,0 +1,217 @@
+import sys
+from argparse import ArgumentParser
+from logging import getLogger
+from mmap import mmap
+from select import poll, POLLIN, POLLERR
+from socket import socket, AF_PACKET, SOCK_RAW, htons
+from struct import Struct, pack, pack_into, unpack_from
+from typing import BinaryIO, Dict, Iterator, List, Sequence, Tuple
+
+from vnet_manager.conf import settings
+
+logger = getLogger(__name__)
+
+# Linux AF_PACKET constants, see linux/if_packet.h
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+ETH_P_ALL = 0x0003
+
+# struct tpacket_req3: block_size, block_nr, frame_size, frame_nr, retire_blk_tov, sizeof_priv, feature_req_word
+TPACKET_REQ3 = Struct("=7I")
+# struct tpacket_block_desc, offsets of the tpacket_hdr_v1 fields used
+BLOCK_STATUS_OFFSET = 8
+BLOCK_NUM_PKTS_OFFSET = 12
+# struct tpacket3_hdr: tp_next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len, tp_status, tp_mac, tp_net
+TPACKET3_HDR = Struct("=6IHH")
+
+# pcapng block types and options, see https://www.ietf.org/archive/id/draft-ietf-opsawg-pcapng-01.html
+PCAPNG_SECTION_HEADER_BLOCK = 0x0A0D0D0A
+PCAPNG_INTERFACE_DESCRIPTION_BLOCK = 0x00000001
+PCAPNG_ENHANCED_PACKET_BLOCK = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_OPT_END = 0
+PCAPNG_OPT_IF_NAME = 2
+PCAPNG_OPT_IF_TSRESOL = 9
+LINKTYPE_ETHERNET = 1
+
+
+def get_pcapng_option(code: int, value: bytes) -> bytes:
+    """
+    Encode a pcapng option, the value is padded to 32 bits
+    :param int code: The option code
+    :param bytes value: The option value
+    :return: bytes: The encoded option
+    """
+    return pack("=HH", code, len(value)) + value + b"\x00" * (-len(value) % 4)
+
+
+def get_pcapng_block(block_type: int, body: bytes) -> bytes:
+    """
+    Encode a pcapng block, the body is padded to 32 bits
+    :param int block_type: The block type
+    :param bytes body: The block body
+    :return: bytes: The encoded block
+    """
+    body += b"\x00" * (-len(body) % 4)
+    length = len(body) + 12
+    return pack("=II", block_type, length) + body + pack("=I", length)
+
+
+class PcapNgWriter:
+    """
+    Minimal pcapng writer, writes a single section with an interface description block per captured interface
+    Timestamps are written with nanosecond resolution
+    """
+
+    def __init__(self, fh: BinaryIO):
+        """
+        :param BinaryIO fh: The file to write to, opened in binary mode
+        """
+        self.fh = fh
+        self.interfaces = 0
+        # Section header block, with an unspecified section length
+        self.fh.write(get_pcapng_block(PCAPNG_SECTION_HEADER_BLOCK, pack("=IHHq", PCAPNG_BYTE_ORDER_MAGIC, 1, 0, -1)))
+
+    def add_interface(self, ifname: str, snaplen: int) -> int:
+        """
+        Write an interface description block
+        :param str ifname: The name of the interface
+        :param int snaplen: The maximum amount of bytes captured per packet
+        :return: int: The interface id to pass to write_packet()
+        """
+        options = get_pcapng_option(PCAPNG_OPT_IF_NAME, ifname.encode("utf-8"))
+        options += get_pcapng_option(PCAPNG_OPT_IF_TSRESOL, bytes([9]))
+        options += get_pcapng_option(PCAPNG_OPT_END, b"")
+        self.fh.write(get_pcapng_block(PCAPNG_INTERFACE_DESCRIPTION_BLOCK, pack("=HHI", LINKTYPE_ETHERNET, 0, snaplen) + options))
+        self.interfaces += 1
+        return self.interfaces - 1
+
+    def write_packet(self, interface_id: int, timestamp: int, data: bytes, length: int):
+        """
+        Write an enhanced packet block
+        :param int interface_id: The id returned by add_interface()
+        :param int timestamp: The capture time in nanoseconds since the epoch
+        :param bytes data: The captured bytes
+        :param int length: The original length of the packet on the wire
+        """
+        header = pack("=IIIII", interface_id, timestamp >> 32, timestamp & 0xFFFFFFFF, len(data), length)
+        self.fh.write(get_pcapng_block(PCAPNG_ENHANCED_PACKET_BLOCK, header + data))
+
+
+class PacketRing:
+    """
+    An AF_PACKET socket bound to a single interface, with a TPACKET_V3 memory mapped receive ring
+    The kernel fills whole blocks of packets, which are handed over to user space in one go
+    """
+
+    def __init__(
+        self,
+        ifname: str,
+        block_size: int = settings.VNET_CAPTURE_RING_BLOCK_SIZE,
+        block_nr: int = settings.VNET_CAPTURE_RING_BLOCK_NR,
+        frame_size: int = settings.VNET_CAPTURE_RING_FRAME_SIZE,
+        block_timeout: int = settings.VNET_CAPTURE_RING_BLOCK_TIMEOUT,
+    ):
+        """
+        :param str ifname: The interface to capture on
+        :param int block_size: The size of a ring block in bytes, must be a multiple of the page size
+        :param int block_nr: The amount of blocks in the ring
+        :param int frame_size: The frame size, only used by the kernel to size the ring
+        :param int block_timeout: Hand over partially filled blocks after this many milliseconds
+        """
+        self.ifname = ifname
+        self.block_size = block_size
+        self.block_nr = block_nr
+        self.block = 0
+        self.sock = socket(AF_PACKET, SOCK_RAW, htons(ETH_P_ALL))
+        self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        request = TPACKET_REQ3.pack(block_size, block_nr, frame_size, block_size * block_nr // frame_size, block_timeout, 0, 0)
+        self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING, request)
+        self.ring = mmap(self.sock.fileno(), block_size * block_nr)
+        self.sock.bind((ifname, ETH_P_ALL))
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def read_packets(self) -> Iterator[Tuple[int, bytes, int]]:
+        """
+        Read the packets of all blocks that have been handed over by the kernel, the blocks are returned to the kernel afterwards
+        :return: Iterator of (timestamp in nanoseconds, captured bytes, original packet length)
+        """
+        while True:
+            offset = self.block * self.block_size
+            if not unpack_from("=I", self.ring, offset + BLOCK_STATUS_OFFSET)[0] & TP_STATUS_USER:
+                return
+            num_pkts, packet = unpack_from("=II", self.ring, offset + BLOCK_NUM_PKTS_OFFSET)
+            packet += offset
+            for _ in range(num_pkts):
+                next_offset, sec, nsec, snaplen, length, _, mac, _ = TPACKET3_HDR.unpack_from(self.ring, packet)
+                yield sec * 10**9 + nsec, self.ring[packet + mac : packet + mac + snaplen], length
+                packet += next_offset
+            pack_into("=I", self.ring, offset + BLOCK_STATUS_OFFSET, TP_STATUS_KERNEL)
+            self.block = (self.block + 1) % self.block_nr
+
+    def close(self):
+        self.ring.close()
+        self.sock.close()
+
+
+def parse_capture_interfaces(specs: Sequence[str]) -> Dict[str, int]:
+    """
+    Parse the interfaces to capture on
+    :param list specs: The interfaces to capture on, formatted as 'ifname[:snaplen]'
+    :return: dict: interface name -> snap length
+    """
+    interfaces = {}
+    for spec in specs:
+        ifname, _, snaplen = spec.partition(":")
+        interfaces[ifname] = int(snaplen) if snaplen else settings.VNET_CAPTURE_DEFAULT_SNAPLEN
+    return interfaces
+
+
+def run_capture_engine(interfaces: Dict[str, int], path: str):
+    """
+    Capture on all passed interfaces from a single process and write the packets to one pcapng file
+    Runs until the process is killed
+    :param dict interfaces: interface name -> snap length
+    :param str path: The pcapng file to write to
+    """
+    rings: List[PacketRing] = []
+    try:
+        with open(path, "wb") as fh:
+            writer = PcapNgWriter(fh)
+            poller = poll()
+            by_fd = {}
+            for ifname, snaplen in interfaces.items():
+                ring = PacketRing(ifname)
+                rings.append(ring)
+                by_fd[ring.fileno()] = (ring, writer.add_interface(ifname, snaplen), snaplen)
+                poller.register(ring, POLLIN | POLLERR)
+            fh.flush()
+            while True:
+                for fd, _ in poller.poll():
+                    ring, interface_id, snaplen = by_fd[fd]
+                    for timestamp, data, length in ring.read_packets():
+                        writer.write_packet(interface_id, timestamp, data[:snaplen], length)
+                # Flush after every batch, so a killed engine leaves a readable capture behind
+                fh.flush()
+    finally:
+        for ring in rings:
+            ring.close()
+
+
+def main(args: Sequence[str] = None) -> int:
+    parser = ArgumentParser(description="VNet-manager builtin capture engine")
+    parser.add_argument("path", help="The pcapng file to write to")
+    parser.add_argument("interfaces", nargs="+", metavar="ifname[:snaplen]", help="The interfaces to capture on")
+    parsed = parser.parse_args(args)
+    run_capture_engine(parse_capture_interfaces(parsed.interfaces), parsed.path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,60 +1,173 @@
-from os import listdir
-from os.path import isfile, isdir, join, basename
+from contextlib import contextmanager
+from hashlib import sha256
+from json import dumps, loads
+from mmap import mmap, ACCESS_READ
+from os import walk, fstat
+from os.path import isfile, isdir, join, getsize, relpath
 from sys import modules
-from typing import AnyStr
+from tarfile import open as open_tar
+from tempfile import TemporaryFile
+from time import perf_counter
+from typing import AnyStr, BinaryIO, Dict, Iterator, List, Tuple, Union
 from logging import getLogger
 from pylxd.exceptions import NotFound
 
-from vnet_manager.providers.lxc import get_lxd_client
+from vnet_manager.providers.lxc import get_lxd_client, use_lxd_machine_remote
 from vnet_manager.conf import settings
+from vnet_manager.config.topology import get_topology
 from vnet_manager.utils.files import write_file_to_disk
 
 logger = getLogger(__name__)
 
 
-def put_files_on_machine(config: dict):
-    for name, data in config["machines"].items():
+def put_files_on_machine(config: dict, machines: List[str] = None) -> Dict[str, dict]:
+    """
+    Puts the user requested files on the machines, all files of a machine are transferred in one go
+    :param dict config: The config generated by get_config()
+    :param list machines: The machines to put the files on, defaults to all machines in the config
+    :return: dict: machine name -> transfer stats of the machine
+    """
+    stats = {}
+    topology = get_topology(config)
+    for name in topology.machines if machines is None else machines:
+        data = config["machines"].get(name, {})
         if "files" in data:
-            provider = settings.MACHINE_TYPE_PROVIDER_MAPPING[data["type"]]
+            provider = topology.machines[name].provider
             logger.info(f"Putting requested files on machine {name}")
-            select_files_and_put_on_machine(name, data["files"], provider)
+            stats[name] = getattr(modules[__name__], f"put_files_on_{provider}_machine")(name, get_files_to_put_on_machine(data["files"]))
+    return stats
 
 
-def select_files_and_put_on_machine(machine: str, files: dict, provider: str):
+def get_files_to_put_on_machine(files: dict) -> List[Tuple[str, str]]:
     """
-    Checks if the requested files are files or a dict and calls the provider file place function for each file
-    :param str machine: The machine to put the files on
+    Resolves the machine file dict from the config to the host files and their guest paths
+    The files in a directory, including those in its subdirectories, are placed in the guest directory with the same layout
     :param dict files: The machines file dict from the config
-    :param str provider: The provider of the machine
+    :return: list: (host path, guest path) tuples
     """
-    # Get the files
+    selected = []
     for host_path, guest_path in files.items():
         if isdir(host_path):
             logger.debug(f"Getting files from file dir {host_path}")
-            files = [join(host_path, f) for f in listdir(host_path)]
-            for file_path in files:
-                # Place the file on the machine
-                getattr(modules[__name__], f"place_file_on_{provider}_machine")(machine, file_path, join(guest_path, basename(file_path)))
+            for root, dirs, dir_files in walk(host_path):
+                # Walk in a predictable order
+                dirs.sort()
+                for file_name in sorted(dir_files):
+                    file_path = join(root, file_name)
+                    selected.append((file_path, join(guest_path, relpath(file_path, host_path))))
         elif isfile(host_path):
-            getattr(modules[__name__], f"place_file_on_{provider}_machine")(machine, host_path, guest_path)
+            selected.append((host_path, guest_path))
         else:
             logger.error(f"Tried to select file {host_path} for copying, but it is neither a file nor a directory")
+    return selected
+
+
+def select_files_and_put_on_machine(machine: str, files: dict, provider: str):
+    """
+    Checks if the requested files are files or a dict and calls the provider file place function for each file
+    :param str machine: The machine to put the files on
+    :param dict files: The machines file dict from the config
+    :param str provider: The provider of the machine
+    """
+    for host_path, guest_path in get_files_to_put_on_machine(files):
+        # Place the file on the machine
+        getattr(modules[__name__], f"place_file_on_{provider}_machine")(machine, host_path, guest_path)
+
+
+def get_sha256(data: Union[AnyStr, BinaryIO]) -> str:
+    """
+    Get the SHA-256 hex digest of file data
+    :param data: The file data, file objects are read in chunks and rewound afterwards
+    :return: str: The hex digest
+    """
+    digest = sha256()
+    if isinstance(data, str):
+        digest.update(data.encode("utf-8"))
+    elif isinstance(data, (bytes, bytearray, mmap)):
+        digest.update(data)
+    else:
+        for chunk in iter(lambda: data.read(settings.VNET_FILES_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        data.seek(0)
+    return digest.hexdigest()
 
 
-def write_file_to_lxc_container(container: str, file_path: str, data: AnyStr):
+def get_file_sha256(host_file_path: str) -> str:
+    """
+    Get the SHA-256 hex digest of a host file
+    :param str host_file_path: The file to hash
+    :return: str: The hex digest
+    """
+    with open(host_file_path, "rb") as fh:
+        return get_sha256(fh)
+
+
+def get_lxc_file_manifest(name: str, config: dict) -> Dict[str, str]:
+    """
+    Get the manifest of the files VNet-manager placed on a LXC container, it is stored in the container config
+    :param str name: The name of the container
+    :param dict config: The config of the container, from the container object or the instance data of get_lxc_instances()
+    :return: dict: guest path -> SHA-256 hex digest
+    """
+    try:
+        return loads(config.get(settings.LXC_FILE_MANIFEST_CONFIG_KEY, "{}"))
+    except ValueError:
+        logger.warning(f"File manifest of LXC container {name} is corrupt, ignoring it")
+        return {}
+
+
+def update_lxc_file_manifest(machine, hashes: Dict[str, str]):
+    """
+    Add file hashes to the file manifest of a LXC container
+    :param pylxd.models.Container machine: The container to update the manifest of
+    :param dict hashes: guest path -> SHA-256 hex digest
+    """
+    manifest = get_lxc_file_manifest(machine.name, machine.config)
+    manifest.update(hashes)
+    value = dumps(manifest, sort_keys=True)
+    # PATCH only merges the manifest key, the rest of the container config is left alone
+    machine.api.patch(json={"config": {settings.LXC_FILE_MANIFEST_CONFIG_KEY: value}})
+    machine.config[settings.LXC_FILE_MANIFEST_CONFIG_KEY] = value
+
+
+def write_file_to_lxc_container(container: str, file_path: str, data: Union[AnyStr, BinaryIO]):
     """
     Writes file data to a path on the LXC container
+    The write is skipped if the file manifest of the container shows the same data has been written before
     :param container: str: The name of the container
     :param file_path: str: The guest path to write the file to
-    :param data: The data to write
+    :param data: The data to write, file objects are streamed to the container
     """
     try:
-        machine = get_lxd_client().containers.get(container)
+        with use_lxd_machine_remote(container):
+            machine = get_lxd_client().containers.get(container)
+        digest = get_sha256(data)
+        if get_lxc_file_manifest(machine.name, machine.config).get(file_path) == digest:
+            logger.debug(f"File {file_path} on LXC container {container} is unchanged, skipping it")
+            return
         machine.files.put(file_path, data)
+        update_lxc_file_manifest(machine, {file_path: digest})
     except NotFound:
         logger.error(f"Tried to write data to path {file_path} on LXC container {container}, but the container does not exist")
 
 
+@contextmanager
+def open_file_for_upload(host_file_path: str, use_mmap: bool = settings.VNET_FILES_MMAP) -> Iterator[BinaryIO]:
+    """
+    Opens a host file in binary mode, so it can be streamed to a machine in chunks instead of being read into memory
+    :param str host_file_path: The file to open
+    :param bool use_mmap: Memory map the file instead of reading it through the file handle
+    :return: The file handle, or the memory map of the file
+    """
+    with open(host_file_path, "rb") as fh:
+        # Empty files can not be memory mapped
+        if use_mmap and fstat(fh.fileno()).st_size:
+            with mmap(fh.fileno(), 0, access=ACCESS_READ) as mapped:
+                yield mapped
+        else:
+            yield fh
+
+
 def place_file_on_lxc_machine(container: str, host_file_path: str, guest_file_path: str):
     """
     Places a local file on a LXC container
@@ -67,12 +180,98 @@ def place_file_on_lxc_machine(container: str, host_file_path: str, guest_file_pa
         logger.error(f"Tried to copy {host_file_path} to LXC container {container}, but the file doesn't exists")
         return
 
-    # Get the file contents
-    with open(host_file_path, "r", encoding="utf-8") as fh:
-        file_data = fh.read()
-    # Place the file content
     logger.debug(f"Copying {host_file_path} to container {container} at path {guest_file_path}")
-    write_file_to_lxc_container(container, guest_file_path, file_data)
+    with open_file_for_upload(host_file_path) as fh:
+        write_file_to_lxc_container(container, guest_file_path, fh)
+
+
+def create_tar_archive(files: List[Tuple[str, str]], fileobj: BinaryIO):
+    """
+    Packs host files in a tar archive, with the guest paths as member names
+    The mode and ownership of the host files are preserved
+    :param list files: (host path, guest path) tuples
+    :param BinaryIO fileobj: The file to write the tar archive to
+    """
+    with open_tar(fileobj=fileobj, mode="w") as tar:
+        for host_file_path, guest_file_path in files:
+            tar.add(host_file_path, arcname=guest_file_path.lstrip("/"), recursive=False)
+
+
+def put_files_on_lxc_machine(container: str, files: List[Tuple[str, str]]) -> dict:
+    """
+    Places local files on a LXC container, by uploading them as a single tar archive and extracting it in the container
+    Files that are unchanged according to the file manifest of the container are skipped
+    Falls back to placing the files one by one if the archive can not be extracted
+    :param str container: The container to place the files on
+    :param list files: (host path, guest path) tuples
+    :return: dict: The transfer stats (files, skipped files, bytes, archive size and duration in seconds)
+    """
+    start = perf_counter()
+    existing = []
+    for host_file_path, guest_file_path in files:
+        if isfile(host_file_path):
+            existing.append((host_file_path, guest_file_path))
+        else:
+            logger.error(f"Tried to copy {host_file_path} to LXC container {container}, but the file doesn't exists")
+    stats = {"files": 0, "skipped": 0, "bytes": 0, "archive": 0}
+    if existing:
+        try:
+            with use_lxd_machine_remote(container):
+                machine = get_lxd_client().containers.get(container)
+        except NotFound:
+            logger.error(f"Tried to put files on LXC container {container}, but the container does not exist")
+            return {}
+        manifest = get_lxc_file_manifest(machine.name, machine.config)
+        hashes = {guest_file_path: get_file_sha256(host_file_path) for host_file_path, guest_file_path in existing}
+        changed = [
+            (host_file_path, guest_file_path)
+            for host_file_path, guest_file_path in existing
+            if manifest.get(guest_file_path) != hashes[guest_file_path]
+        ]
+        stats.update(
+            files=len(changed), skipped=len(existing) - len(changed), bytes=sum(getsize(host_file_path) for host_file_path, _ in changed)
+        )
+        if changed and put_files_on_lxc_machine_as_tar_archive(machine, changed, stats):
+            update_lxc_file_manifest(machine, {guest_file_path: hashes[guest_file_path] for _, guest_file_path in changed})
+    stats["duration"] = perf_counter() - start
+    logger.info(
+        f"Put {stats['files']} file(s) ({stats['bytes']} bytes, {stats['archive']} bytes transferred, {stats['skipped']} unchanged) "
+        f"on LXC container {container} in {stats['duration']:.3f}s"
+    )
+    return stats
+
+
+def put_files_on_lxc_machine_as_tar_archive(machine, files: List[Tuple[str, str]], stats: dict) -> bool:
+    """
+    Uploads local files to a LXC container as a single tar archive and extracts it in the container
+    If the archive can not be extracted, the files are placed one by one
+    :param pylxd.models.Container machine: The container to place the files on
+    :param list files: (host path, guest path) tuples
+    :param dict stats: The transfer stats, the archive size is added to it
+    :return: bool: True if the archive has been extracted, False if the files were placed one by one
+    """
+    # The archive is spooled to disk and streamed from there, so large files are never held in memory
+    with TemporaryFile() as archive:
+        create_tar_archive(files, archive)
+        stats["archive"] = archive.tell()
+        archive.seek(0)
+        logger.debug(f"Copying {len(files)} file(s) to container {machine.name} in a {stats['archive']} bytes archive")
+        machine.files.put(settings.VNET_FILES_ARCHIVE_GUEST_PATH, archive)
+    # Extract as root, so ownership is preserved, and always clean up the archive
+    result = machine.execute(
+        [
+            "sh",
+            "-c",
+            f"tar -xpf {settings.VNET_FILES_ARCHIVE_GUEST_PATH} --same-owner --numeric-owner -C /; "
+            f"ret=$?; rm -f {settings.VNET_FILES_ARCHIVE_GUEST_PATH}; exit $ret",
+        ]
+    )
+    if result[0] != 0:
+        logger.warning(f"Unable to extract files archive on LXC container {machine.name}, got: {result[2]}; placing files one by one")
+        for host_file_path, guest_file_path in files:
+            place_file_on_lxc_machine(machine.name, host_file_path, guest_file_path)
+        return False
+    return True
 
 
 def generate_vnet_hosts_file(config: dict):
@@ -82,23 +281,20 @@ def generate_vnet_hosts_file(config: dict):
     :param dict config: The config generated by get_config()
     """
     logger.info("Generating VNet hosts file")
-    vnet_hosts = []
-    for machine_name, machine_data in config["machines"].items():
-        for int_data in machine_data["interfaces"].values():
-            if "ipv4" in int_data:
-                vnet_hosts.append(f"{int_data['ipv4'].split('/')[0]}   {machine_name}")
-            if "ipv6" in int_data:
-                vnet_hosts.append(f"{int_data['ipv6'].split('/')[0]}   {machine_name}")
+    vnet_hosts = [f"{address}   {machine_name}" for address, machine_name in get_topology(config).machine_by_ip.items()]
     vnet_etc_hosts_data = settings.VNET_STATIC_HOSTS_FILE_PART + "\n".join(vnet_hosts) + "\n"
     write_file_to_disk(settings.VNET_ETC_HOSTS_FILE_PATH, vnet_etc_hosts_data)
 
 
-def place_vnet_hosts_file_on_machines(config: dict):
+def place_vnet_hosts_file_on_machines(config: dict, machines: List[str] = None):
     """
-    Places the generated /etc/hosts file on all VNet machines defined in the config
+    Places the generated /etc/hosts file on the VNet machines defined in the config
     :param dict config: The config generated by get_config()
+    :param list machines: The machines to place the hosts file on, defaults to all machines in the config
     """
     logger.info("Placing VNet /etc/hosts file on machines")
-    for name, data in config["machines"].items():
-        provider = settings.MACHINE_TYPE_PROVIDER_MAPPING[data["type"]]
-        select_files_and_put_on_machine(name, {settings.VNET_ETC_HOSTS_FILE_PATH: "/etc/hosts"}, provider)
+    topology = get_topology(config)
+    for name in topology.machines if machines is None else machines:
+        if name not in topology.machines:
+            continue
+        select_files_and_put_on_machine(name, {settings.VNET_ETC_HOSTS_FILE_PATH: "/etc/hosts"}, topology.machines[name].provider)
@@ -1,27 +1,33 @@
+import sys
 import shlex
-from typing import List
+from typing import Dict, List, Optional, Tuple
 from logging import getLogger
-from subprocess import check_call, CalledProcessError, Popen, DEVNULL
+from time import perf_counter
+from subprocess import check_output, run, CalledProcessError, Popen, PIPE, STDOUT
+from os import kill
 from os.path import join
+from signal import SIGKILL
 from datetime import datetime
 from pyroute2.iproute import IPRoute
-from pyroute2.ndb.main import NDB
-from psutil import process_iter
 from tabulate import tabulate
 
 from vnet_manager.conf import settings
+from vnet_manager.config.topology import get_topology, get_vnet_p2p_switches_from_config
 from vnet_manager.utils.mac import random_mac_generator
+from vnet_manager.operations.machine import get_lxc_instances
+from vnet_manager.operations.network import get_vnet_p2p_interface_names, get_vnet_vxlan_interfaces_from_config
+from vnet_manager.operations.sniffer import register_sniffer, unregister_sniffer, get_registered_sniffers, get_sniffer_pid_map
 
 logger = getLogger(__name__)
 
 
 def get_vnet_interface_names_from_config(config: dict) -> List[str]:
     """
-    Gets the VNet inetface names from the config
+    Gets the VNet inetface names from the config, point-to-point switches do not have a VNet bridge
     :param dict config: The conifg generated by get_config()
     :return: list: The VNet interface names
     """
-    return [settings.VNET_BRIDGE_NAME + str(i) for i in range(0, config["switches"])]
+    return get_topology(config).bridge_names
 
 
 def get_machines_by_vnet_interface_name(config: dict, ifname: str) -> List[str]:
@@ -31,12 +37,7 @@ def get_machines_by_vnet_interface_name(config: dict, ifname: str) -> List[str]:
     :param str ifname: The interface to check for
     :return: list of VNet machines using that interface
     """
-    machines = []
-    for m_name, m_data in config["machines"].items():
-        for int_data in m_data["interfaces"].values():
-            if int(int_data["bridge"]) == int(ifname[-1]):
-                machines.append(m_name)
-    return machines
+    return list(get_topology(config).machines_by_bridge.get(ifname, ()))
 
 
 def show_vnet_interface_status(config: dict):
@@ -48,18 +49,21 @@ def show_vnet_interface_status(config: dict):
     header = ["Name", "Status", "L2_addr", "Sniffer", "STP", "Used by"]
     statuses = []
     ip = IPRoute()
-    ndb = NDB(log=False)
-    for ifname in get_vnet_interface_names_from_config(config):
+    try:
+        links = get_interface_name_map(get_interface_status_map(ip))
+    finally:
+        ip.close()
+    vnet_interfaces = get_vnet_interface_names_from_config(config)
+    sniffers = get_sniffer_pid_map(vnet_interfaces)
+    for ifname in vnet_interfaces:
         used_by = get_machines_by_vnet_interface_name(config, ifname)
-        dev = ip.link_lookup(ifname=ifname)
-        if not dev:
+        if ifname not in links:
             # Link does not exist
             statuses.append([ifname, "NA", "NA", "NA", "NA", ", ".join(used_by)])
         else:
-            # Get the link info
-            sniffer = check_if_sniffer_exists(ifname)
-            with ndb.interfaces[ifname] as info:
-                statuses.append([ifname, info["state"], info["address"], sniffer, bool(info["br_stp_state"]), ", ".join(used_by)])
+            link = links[ifname]
+            sniffer = check_if_sniffer_exists(ifname, sniffers=sniffers)
+            statuses.append([ifname, link["state"], link["address"], sniffer, link["stp"], ", ".join(used_by)])
     print(tabulate(statuses, headers=header, tablefmt="pretty"))
 
 
@@ -73,80 +77,267 @@ def show_vnet_veth_interface_status(config: dict):
     header = ["Name", "Status", "L2_addr", "Peer", "Master"]
     statuses = []
     ip = IPRoute()
+    try:
+        links = get_interface_status_map(ip)
+    finally:
+        ip.close()
+    names = get_interface_name_map(links)
     for name, data in config["veths"].items():
-        dev = ip.link_lookup(ifname=name)
-        if not dev:
+        if name not in names:
             # Link does not exist
             statuses.append([name, "NA", "NA", "NA", data["bridge"]])
         else:
-            # Get the link info
-            info = ip.link("get", index=dev[0])
-            state = info[0]["state"]
-            l2_addr = [attr[1] for attr in info[0]["attrs"] if attr[0] == "IFLA_ADDRESS"][0]
-            peer_id = [attr[1] for attr in info[0]["attrs"] if attr[0] == "IFLA_LINK"][0]
-            peer_name = [attr[1] for attr in ip.link("get", index=peer_id)[0]["attrs"] if attr[0] == "IFLA_IFNAME"][0]
-            master_id = [attr[1] for attr in info[0]["attrs"] if attr[0] == "IFLA_MASTER"][0]
-            master_name = [attr[1] for attr in ip.link("get", index=master_id)[0]["attrs"] if attr[0] == "IFLA_IFNAME"][0]
-            statuses.append([name, state, l2_addr, peer_name, master_name])
+            link = names[name]
+            peer_name = links[link["link"]]["name"] if link["link"] in links else "NA"
+            master_name = links[link["master"]]["name"] if link["master"] in links else "NA"
+            statuses.append([name, link["state"], link["address"], peer_name, master_name])
     print(tabulate(statuses, headers=header, tablefmt="pretty"))
 
 
-def check_if_interface_exists(ifname: str) -> bool:
+def get_interface_status_map(ip: IPRoute) -> Dict[int, dict]:
+    """
+    Builds an interface index to link status map from a single link dump
+    :param IPRoute ip: The netlink socket to use
+    :return: dict: interface index -> {"name": str, "state": str, "address": str, "link": int or None, "master": int or None,
+        "stp": bool}
+    """
+    return {
+        link["index"]: {
+            "name": link.get_attr("IFLA_IFNAME"),
+            "state": link["state"],
+            "address": link.get_attr("IFLA_ADDRESS"),
+            "link": link.get_attr("IFLA_LINK"),
+            "master": link.get_attr("IFLA_MASTER"),
+            "stp": get_bridge_stp_state(link),
+        }
+        for link in ip.get_links()
+    }
+
+
+def get_interface_name_map(links: Dict[int, dict]) -> Dict[str, dict]:
+    """
+    Re-index the link statuses returned by get_interface_status_map() by interface name
+    :param dict links: The link statuses by interface index
+    :return: dict: interface name -> link status
+    """
+    return {link["name"]: link for link in links.values()}
+
+
+def get_bridge_stp_state(link) -> bool:
+    """
+    Get the STP state of a bridge from its link info
+    :param pyroute2.netlink.rtnl.ifinfmsg.ifinfmsg link: The link message returned by IPRoute.link("get") or IPRoute.get_links()
+    :return: bool: True if STP is enabled on the bridge
+    """
+    return bool(link.get_nested("IFLA_LINKINFO", "IFLA_INFO_DATA", "IFLA_BR_STP_STATE"))
+
+
+def set_bridge_stp_state(bridge: str, enable: bool, ip: IPRoute):
+    """
+    Enable or disable STP on a bridge
+    :param str bridge: The name of the bridge
+    :param bool enable: Whether to enable STP or disable it
+    :param IPRoute ip: The netlink socket to use
+    """
+    dev = ip.link_lookup(ifname=bridge)
+    if not dev:
+        logger.error(f"Unable to set the STP state of VNet interface {bridge}, it does not exist")
+        return
+    ip.link("set", index=dev[0], kind="bridge", br_stp_state=1 if enable else 0)
+
+
+def check_if_interface_exists(ifname: str, ip: IPRoute = None) -> bool:
     """
     Check if an interface exists
     :param str ifname: The interface name to check for
+    :param IPRoute ip: The netlink socket to use, a new one is opened if not passed
     :return: bool: True if the interface exists, False otherwise
     """
-    return bool(IPRoute().link_lookup(ifname=ifname))
+    return bool((ip or IPRoute()).link_lookup(ifname=ifname))
 
 
-def create_vnet_interface(ifname: str):
+def get_interface_index_map(ip: IPRoute) -> Dict[str, int]:
     """
-    Creates a VNet bridge interface
-    :param str ifname: The name of the interface to create
+    Builds an interface name to index map from a single link dump
+    :param IPRoute ip: The netlink socket to use
+    :return: dict: The interface indexes by interface name
     """
-    logger.info(f"Creating VNet bridge interface {ifname}")
-    IPRoute().link("add", ifname=ifname, kind="bridge")
-    # Bring up the interface
-    configure_vnet_interface(ifname)
+    return {link.get_attr("IFLA_IFNAME"): link["index"] for link in ip.get_links()}
 
 
-def create_veth_interface(name: str, data: dict):
+def get_interface_link_map(ip: IPRoute) -> Dict[str, dict]:
+    """
+    Builds an interface name to link info map from a single link dump
+    :param IPRoute ip: The netlink socket to use
+    :return: dict: interface name -> {"index": int, "kind": str or None, "master": int or None}
+    """
+    links = {}
+    for link in ip.get_links():
+        info = link.get_attr("IFLA_LINKINFO")
+        links[link.get_attr("IFLA_IFNAME")] = {
+            "index": link["index"],
+            "kind": info.get_attr("IFLA_INFO_KIND") if info else None,
+            "master": link.get_attr("IFLA_MASTER"),
+        }
+    return links
+
+
+def create_vnet_interfaces(ifnames: List[str], ip: IPRoute) -> Dict[str, int]:
+    """
+    Creates and configures multiple VNet bridge interfaces over a single netlink socket
+    :param list ifnames: The names of the interfaces to create
+    :param IPRoute ip: The netlink socket to use
+    :return: dict: The indexes of the created interfaces by interface name
+    """
+    for ifname in ifnames:
+        logger.info(f"Creating VNet bridge interface {ifname}")
+        ip.link("add", ifname=ifname, kind="bridge")
+    # Resolve all new interface indexes at once
+    created = {ifname: index for ifname, index in get_interface_index_map(ip).items() if ifname in ifnames}
+    for index in created.values():
+        # Set the mac and bring up the (still down) interface in a single request
+        ip.link("set", index=index, address=random_mac_generator(), state="up")
+    return created
+
+
+def create_vnet_vxlan_interfaces(interfaces: Dict[str, dict], links: Dict[str, int], ip: IPRoute) -> Dict[str, int]:
+    """
+    Creates the VXLAN interfaces that stretch the VNet bridges to the LXD remotes and connects them to their bridge
+    :param dict interfaces: The interfaces returned by get_vnet_vxlan_interfaces_from_config() to create
+    :param dict links: The interface indexes by interface name, should contain the VNet bridges
+    :param IPRoute ip: The netlink socket to use
+    :return: dict: The indexes of the created interfaces by interface name
+    """
+    for ifname, data in interfaces.items():
+        logger.info(f"Creating VNet VXLAN interface {ifname} to {data['remote']} for VNet interface {data['bridge']}")
+        ip.link(
+            "add",
+            ifname=ifname,
+            kind="vxlan",
+            vxlan_id=data["id"],
+            vxlan_local=data["local"],
+            vxlan_group=data["remote"],
+            vxlan_port=settings.VNET_VXLAN_PORT,
+        )
+    created = {ifname: index for ifname, index in get_interface_index_map(ip).items() if ifname in interfaces}
+    for ifname, index in created.items():
+        ip.link("set", index=index, master=links[interfaces[ifname]["bridge"]], state="up")
+    return created
+
+
+def create_vnet_p2p_interfaces(config: dict, links: Dict[str, int], ip: IPRoute) -> List[str]:
+    """
+    Creates the veth pairs of the point-to-point switches, each machine on the switch gets one end of the pair
+    LXD moves the ends into the machines when they start and back to the host when they stop,
+    so a pair is only created when both ends are missing and none of its machines are running
+    :param dict config: The config generated by get_config()
+    :param dict links: The interface indexes by interface name
+    :param IPRoute ip: The netlink socket to use
+    :return: list: The names of the created veth pairs (first end)
+    """
+    created = []
+    instances = None
+    for switch, ends in get_vnet_p2p_switches_from_config(config).items():
+        names = get_vnet_p2p_interface_names(switch)
+        if any(name in links for name in names):
+            continue
+        if instances is None:
+            # The machine statuses are only fetched when a pair might have to be created
+            instances = get_lxc_instances()
+        if any(instances.get(machine, {}).get("status") == "Running" for machine, _ in ends):
+            logger.debug(f"Veth pair {names[0]} of point-to-point switch {switch} is in use by the running machines")
+            continue
+        logger.info(f"Creating VNet point-to-point veth pair {names[0]} for switch {switch}")
+        ip.link("add", ifname=names[0], kind="veth", peer=names[1])
+        created.append(names[0])
+    return created
+
+
+def create_veth_interface(name: str, data: dict, ip: IPRoute = None):
     """
     Creates a veth interface pair
     :param str name: The name of the veth interface to create
     :param dict data: The bridge and peer data
+    :param IPRoute ip: The netlink socket to use, a new one is opened if not passed
     """
     # We only create the interface if it has a peer
     if "peer" in data:
-        IPRoute().link("add", ifname=name, kind="veth", peer=data["peer"])
+        (ip or IPRoute()).link("add", ifname=name, kind="veth", peer=data["peer"])
 
 
-def create_vnet_interface_iptables_rules(ifname: str):
+def get_vnet_interface_iptables_rules(ifnames: List[str]) -> List[str]:
+    """
+    Get the IPtables filter rules, in iptables-save format, that isolate the passed VNet interfaces from the outside world
+    :param list ifnames: The VNet interfaces to get the rules for
+    :return: list: The rules
+    """
+    return [f"-A OUTPUT -o {ifname} -j DROP" for ifname in ifnames]
+
+
+def get_iptables_filter_rules() -> List[str]:
+    """
+    Read the current IPtables filter table with a single iptables-save call
+    :return: list: The rules currently in the filter table, in iptables-save format
+    """
+    output = check_output(shlex.split("iptables-save -t filter"), universal_newlines=True)
+    return [line.strip() for line in output.splitlines() if line.startswith("-A ")]
+
+
+def apply_iptables_filter_rules(rules: List[str]):
+    """
+    Apply a set of IPtables filter rules in a single atomic iptables-restore transaction
+    The existing rules are left alone, so the passed rules should only contain the delta
+    :param list rules: The rules to apply, in iptables-save format (-A to append, -D to delete)
+    :raises CalledProcessError: If iptables-restore failed to apply the rules
+    """
+    ruleset = "\n".join(["*filter"] + rules + ["COMMIT", ""])
+    run(shlex.split("iptables-restore --noflush"), input=ruleset, universal_newlines=True, check=True, stdout=PIPE, stderr=STDOUT)
+
+
+def create_vnet_interface_iptables_rules(ifnames: List[str]):
     """
     VNet interfaces should act as dump bridges and should not have any connectivity to the outside world
-    So this function makes some IPtables rules to make sure the VNet interface cannot talk to the outside.
-    :param str ifname: The interface the create IPtables rules for
+    So this function makes some IPtables rules to make sure the VNet interfaces cannot talk to the outside.
+    The filter table is read once and only the missing rules are added, in one transaction
+    :param list ifnames: The interfaces the create IPtables rules for
+    """
+    try:
+        existing_rules = set(get_iptables_filter_rules())
+        missing_rules = [rule for rule in get_vnet_interface_iptables_rules(ifnames) if rule not in existing_rules]
+        if not missing_rules:
+            logger.debug("IPtables DROP rules for all VNet interfaces already exist, skipping creation")
+            return
+        logger.info(f"Creating {len(missing_rules)} IPtables DROP rule(s) to the outside world for the VNet interfaces")
+        apply_iptables_filter_rules(missing_rules)
+    except CalledProcessError as e:
+        logger.error(f"Unable to create IPtables rules, got output: {e.output}")
+
+
+def delete_vnet_interface_iptables_rules(ifnames: List[str]):
+    """
+    Remove the IPtables rules created by create_vnet_interface_iptables_rules()
+    The filter table is read once and only the rules that exist are removed, in one transaction
+    :param list ifnames: The interfaces to remove the IPtables rules for
     """
-    rule = f"OUTPUT -o {ifname} -j DROP"
-    # First we check if the rule already exists
     try:
-        check_call(shlex.split(f"iptables -C {rule}"), stderr=DEVNULL)
-        logger.debug(f"IPtables DROP rule for VNet interface {ifname} already exists, skipping creation")
-    except CalledProcessError:
-        logger.info(f"Creating IPtables DROP rule to the outside world for VNet interface {ifname}")
-        try:
-            check_call(shlex.split(f"iptables -A {rule}"))
-        except CalledProcessError as e:
-            logger.error(f"Unable to create IPtables rule, got output: {e.output}")
+        existing_rules = set(get_iptables_filter_rules())
+        present_rules = [rule for rule in get_vnet_interface_iptables_rules(ifnames) if rule in existing_rules]
+        if not present_rules:
+            logger.debug("No IPtables DROP rules found for the VNet interfaces, nothing to remove")
+            return
+        logger.info(f"Removing {len(present_rules)} IPtables DROP rule(s) of the VNet interfaces")
+        apply_iptables_filter_rules([f"-D {rule[3:]}" for rule in present_rules])
+    except CalledProcessError as e:
+        logger.error(f"Unable to remove IPtables rules, got output: {e.output}")
 
 
-def configure_vnet_interface(ifname: str):
+def configure_vnet_interface(ifname: str, ip: IPRoute = None):
     """
     Configures an vnet interface to be in the correct state for forwarding vnet machine traffic
     :param str ifname: The vnet interface to configure
+    :param IPRoute ip: The netlink socket to use, a new one is opened if not passed
     """
-    ip = IPRoute()
+    ip = ip or IPRoute()
     dev = ip.link_lookup(ifname=ifname)[0]
     # Make sure it's set to down state
     ip.link("set", index=dev, state="down")
@@ -156,79 +347,157 @@ def configure_vnet_interface(ifname: str):
     ip.link("set", index=dev, state="up")
 
 
-def configure_veth_interface(name: str, data: dict):
+def configure_veth_interface(name: str, data: dict, ip: IPRoute = None):
     """
     Configures a veth interface, connects to the correct bridge
     :param str name: The name of the veth interface
     :param dict data: The veth interface data (bridge name)
+    :param IPRoute ip: The netlink socket to use, a new one is opened if not passed
     """
     logger.info(f"Creating VNet veth interface {name}")
-    ip = IPRoute()
+    ip = ip or IPRoute()
     dev = ip.link_lookup(ifname=name)[0]
     bridge = ip.link_lookup(ifname=data["bridge"])[0]
     # Connect the veth interface to the bridge
     ip.link("set", index=dev, master=bridge)
 
 
-def bring_up_vnet_interfaces(config: dict, sniffer: bool = False, pcap_dir: str = settings.VNET_SNIFFER_PCAP_DIR):
+def bring_up_vnet_interfaces(
+    config: dict,
+    sniffer: bool = False,
+    pcap_dir: str = settings.VNET_SNIFFER_PCAP_DIR,
+    sniffer_options: Optional[dict] = None,
+    sniffer_engine: str = "tcpdump",
+):
     """
     Check the status of the vnet interfaces defined in the config and brings up the interfaces if needed
     :param dict config: The config generated by get_config()
     :param bool sniffer: Check for a sniffer process and create it if it does not exist
     :param str pcap_dir: The path to store the sniffer dumps at
+    :param dict sniffer_options: The default sniffer options, overridden by the sniffer options in the config
+    :param str sniffer_engine: The capture engine to use for the sniffers, see settings.VNET_SNIFFER_ENGINES
     """
+    # All netlink requests of this action go over a single socket
     ip = IPRoute()
-    for ifname in get_vnet_interface_names_from_config(config):
-        if not check_if_interface_exists(ifname):
-            create_vnet_interface(ifname)
+    timings = {}
+    try:
+        start = perf_counter()
+        links = get_interface_index_map(ip)
+        vnet_interfaces = get_vnet_interface_names_from_config(config)
+        missing = [ifname for ifname in vnet_interfaces if ifname not in links]
+        timings["link dump"] = perf_counter() - start
+
+        start = perf_counter()
+        if missing:
+            links.update(create_vnet_interfaces(missing, ip))
+        timings["bridge creation"] = perf_counter() - start
+
+        start = perf_counter()
+        vxlan_interfaces = get_vnet_vxlan_interfaces_from_config(config)
+        missing_vxlan_interfaces = {ifname: data for ifname, data in vxlan_interfaces.items() if ifname not in links}
+        if missing_vxlan_interfaces:
+            links.update(create_vnet_vxlan_interfaces(missing_vxlan_interfaces, links, ip))
+        timings["vxlan creation"] = perf_counter() - start
+
+        start = perf_counter()
+        if get_vnet_p2p_switches_from_config(config):
+            create_vnet_p2p_interfaces(config, links, ip)
+            if sniffer:
+                logger.warning("Point-to-point switches are wired without a VNet bridge, no sniffers are started for them")
+        timings["p2p creation"] = perf_counter() - start
+
+        start = perf_counter()
         # Block traffic to the outside world
-        create_vnet_interface_iptables_rules(ifname)
-        # Make sure the interface is up
-        ip.link("set", ifname=ifname, state="up")
-        if sniffer and not check_if_sniffer_exists(ifname):
-            # Create it
-            start_tcpdump_on_vnet_interface(ifname=ifname, path=pcap_dir)
-    if "veths" in config:
-        ensure_vnet_veth_interfaces(config=config, sniffer=sniffer, pcap_dir=pcap_dir)
-
-
-def ensure_vnet_veth_interfaces(config: dict, sniffer: bool = False, pcap_dir: str = settings.VNET_SNIFFER_PCAP_DIR):
+        create_vnet_interface_iptables_rules(vnet_interfaces)
+        timings["iptables"] = perf_counter() - start
+
+        start = perf_counter()
+        for ifname in vnet_interfaces:
+            # Make sure the interface is up, newly created interfaces already are
+            if ifname not in missing:
+                ip.link("set", index=links[ifname], state="up")
+        timings["link up"] = perf_counter() - start
+
+        start = perf_counter()
+        # The sniffer registry is only consulted once for all interfaces
+        sniffers = get_sniffer_pid_map(vnet_interfaces + list(config.get("veths", {}))) if sniffer else {}
+        tcpdump_sniffer = sniffer and sniffer_engine == "tcpdump"
+        for ifname in vnet_interfaces:
+            if tcpdump_sniffer and not check_if_sniffer_exists(ifname, sniffers=sniffers):
+                # Create it
+                start_tcpdump_on_vnet_interface(
+                    ifname=ifname, path=pcap_dir, options=get_sniffer_options_for_interface(config, ifname, defaults=sniffer_options)
+                )
+        timings["sniffers"] = perf_counter() - start
+
+        start = perf_counter()
+        if "veths" in config:
+            ensure_vnet_veth_interfaces(
+                config=config, sniffer=tcpdump_sniffer, pcap_dir=pcap_dir, ip=ip, sniffers=sniffers, sniffer_options=sniffer_options
+            )
+        timings["veths"] = perf_counter() - start
+
+        if sniffer and sniffer_engine == "builtin":
+            start = perf_counter()
+            # All interfaces, including the veths, are captured by a single capture engine process
+            interfaces = [i for i in vnet_interfaces + list(config.get("veths", {})) if not check_if_sniffer_exists(i, sniffers=sniffers)]
+            if interfaces:
+                start_capture_engine_on_vnet_interfaces(config, interfaces, path=pcap_dir, sniffer_options=sniffer_options)
+            timings["capture engine"] = perf_counter() - start
+    finally:
+        ip.close()
+    logger.debug(f"VNet interface bring up timings: {', '.join(f'{step}: {duration:.3f}s' for step, duration in timings.items())}")
+
+
+def ensure_vnet_veth_interfaces(
+    config: dict,
+    sniffer: bool = False,
+    pcap_dir: str = settings.VNET_SNIFFER_PCAP_DIR,
+    ip: IPRoute = None,
+    sniffers: Dict[str, List[int]] = None,
+    sniffer_options: Optional[dict] = None,
+):
     """
     Create en configure the veth interfaces defined in the VNet config
     Assumes there are veth interfaces present in the config
     :param dict config: The config generated by get_config()
     :param bool sniffer: Create sniffer process on veth interfaces if it doesn't exist
     :param str pcap_dir: The path to store the sniffer dumps at
+    :param IPRoute ip: The netlink socket to use, a new one is opened if not passed
+    :param dict sniffers: The sniffers from get_sniffer_pid_map(), the registry is consulted if not passed
+    :param dict sniffer_options: The default sniffer options, overridden by the sniffer options in the config
     """
+    ip = ip or IPRoute()
+    if sniffer and sniffers is None:
+        sniffers = get_sniffer_pid_map(list(config["veths"]))
     logger.info("VNet veth config found, ensuring interfaces")
     for name, data in config["veths"].items():
         # Set STP on the master if required
         if "stp" in data:
             logger.info(f"{'Enabling' if data['stp'] else 'Disabling'} STP on VNet interface {data['bridge']}")
-            state = 1 if data["stp"] else 0
-            nbd = NDB(log=False)
-            with nbd.interfaces[data["bridge"]] as bridge:
-                bridge.set("br_stp_state", state)
-        if not check_if_interface_exists(name):
-            create_veth_interface(name, data)
+            set_bridge_stp_state(data["bridge"], data["stp"], ip)
+        if not check_if_interface_exists(name, ip=ip):
+            create_veth_interface(name, data, ip=ip)
         # Always configure a VNet veth interface to make sure it is connected to its master bridge
-        configure_veth_interface(name, data)
-        configure_vnet_interface(name)
-        if sniffer and not check_if_sniffer_exists(name):
-            start_tcpdump_on_vnet_interface(ifname=name, path=pcap_dir)
+        configure_veth_interface(name, data, ip=ip)
+        configure_vnet_interface(name, ip=ip)
+        if sniffer and not check_if_sniffer_exists(name, sniffers=sniffers):
+            start_tcpdump_on_vnet_interface(
+                ifname=name, path=pcap_dir, options=get_sniffer_options_for_interface(config, name, defaults=sniffer_options)
+            )
 
 
-def check_if_sniffer_exists(ifname: str) -> bool:
+def check_if_sniffer_exists(ifname: str, sniffers: Dict[str, List[int]] = None) -> bool:
     """
     Check if there is already a sniffer running for a VNet interface
     :param str ifname: The VNet interface name to check
+    :param dict sniffers: The sniffers from get_sniffer_pid_map(), the registry is consulted if not passed
     :return bool: True if it exists, False otherwise
     """
-    for process in process_iter():
-        process_line = process.cmdline()
-        if "tcpdump" in process_line and ifname in process_line:
-            logger.debug(f"A TCPdump sniffer for interface {ifname} already exists")
-            return True
+    sniffers = get_sniffer_pid_map([ifname]) if sniffers is None else sniffers
+    if sniffers.get(ifname):
+        logger.debug(f"A TCPdump sniffer for interface {ifname} already exists")
+        return True
     return False
 
 
@@ -240,25 +509,26 @@ def bring_down_vnet_interfaces(config: dict) -> bool:
     :return bool: If any lingering sniffers were found for the interfaces that have been brought down
     """
     ip = IPRoute()
+    sniffers = get_sniffer_pid_map(list(config.get("veths", {})) + get_vnet_interface_names_from_config(config))
     lingering_sniffers = False
     if "veths" in config:
         for name in config["veths"].keys():
-            if check_if_interface_exists(name):
+            if check_if_interface_exists(name, ip=ip):
                 logger.info(f"Bringing down VNet veth interface {name}")
                 ip.link("set", ifname=name, state="down")
-                if check_if_sniffer_exists(name):
+                if check_if_sniffer_exists(name, sniffers=sniffers):
                     lingering_sniffers = True
     vnet_interfaces = get_vnet_interface_names_from_config(config)
     for ifname in vnet_interfaces:
         # Set the interface to down status
-        if check_if_interface_exists(ifname):
+        if check_if_interface_exists(ifname, ip=ip):
             logger.info(f"Bringing down VNet interface {ifname}")
             ip.link("set", ifname=ifname, state="down")
         else:
             # Device doesn't exist
             logger.warning(f"Tried to bring down VNet interface {ifname}, but the interface doesn't exist")
         # check if there is still a sniffer on this interface
-        if check_if_sniffer_exists(ifname):
+        if check_if_sniffer_exists(ifname, sniffers=sniffers):
             lingering_sniffers = True
     return lingering_sniffers
 
@@ -272,40 +542,142 @@ def delete_vnet_interfaces(config: dict):
     if "veths" in config:
         for name, data in config["veths"].items():
             # Veth interfaces are deleted in pairs, so we only delete the ones with a peer
-            if "peer" in data and check_if_interface_exists(name):
+            if "peer" in data and check_if_interface_exists(name, ip=ip):
                 logger.info(f"Deleting VNet veth interface {name}")
                 ip.link("del", ifname=name)
-    for ifname in get_vnet_interface_names_from_config(config):
+    # Deleting one end of a point-to-point veth pair deletes both, ends that are inside a machine are deleted with it
+    for switch in get_vnet_p2p_switches_from_config(config):
+        for ifname in get_vnet_p2p_interface_names(switch):
+            if check_if_interface_exists(ifname, ip=ip):
+                logger.info(f"Deleting VNet point-to-point interface {ifname}")
+                ip.link("del", ifname=ifname)
+                break
+    # VXLAN interfaces are not removed together with their bridge
+    for ifname in get_vnet_vxlan_interfaces_from_config(config):
+        if check_if_interface_exists(ifname, ip=ip):
+            logger.info(f"Deleting VNet VXLAN interface {ifname}")
+            ip.link("del", ifname=ifname)
+    vnet_interfaces = get_vnet_interface_names_from_config(config)
+    for ifname in vnet_interfaces:
         # Delete the interface
-        if check_if_interface_exists(ifname):
+        if check_if_interface_exists(ifname, ip=ip):
             logger.info(f"Deleting VNet interface {ifname}")
             ip.link("del", ifname=ifname)
         else:
             # Device doesn't exist
             logger.info(f"Tried to delete VNet interface {ifname}, but it is already gone. That's okay")
+    # Remove the rules that isolated the interfaces
+    delete_vnet_interface_iptables_rules(vnet_interfaces)
 
 
-def start_tcpdump_on_vnet_interface(ifname: str, path: str = settings.VNET_SNIFFER_PCAP_DIR):
+def get_sniffer_options_for_interface(config: dict, ifname: str, defaults: Optional[dict] = None) -> dict:
+    """
+    Get the sniffer options for a VNet interface
+    The sniffer options of a veth or switch in the config take precedence over the passed defaults
+    :param dict config: The config generated by get_config()
+    :param str ifname: The VNet (veth) interface to get the sniffer options for
+    :param dict defaults: The default sniffer options, usually passed on the command line
+    :return: dict: The sniffer options
+    """
+    options = dict(defaults or {})
+    if ifname in config.get("veths", {}):
+        options.update(config["veths"][ifname].get("sniffer", {}))
+    elif ifname.startswith(settings.VNET_BRIDGE_NAME):
+        switch = int(ifname[len(settings.VNET_BRIDGE_NAME) :])
+        options.update(config.get("switch_config", {}).get(switch, {}).get("sniffer", {}))
+    return options
+
+
+def get_tcpdump_command(ifname: str, path: str, options: Optional[dict] = None) -> Tuple[List[str], str, str]:
+    """
+    Build the tcpdump command for a sniffer on a VNet interface
+    :param str ifname: The interface to sniff on
+    :param str path: The directory to store the PCAP files in
+    :param dict options: The sniffer options, see settings.VNET_SNIFFER_OPTIONS
+    :return: list, str, str: The tcpdump command, the PCAP file it writes to and a glob matching all of its (rotated) PCAP files
+    """
+    options = options or {}
+    prefix = join(path, f"{ifname}.{datetime.now().strftime('%y%m%d%H%M')}")
+    # When rotating on time tcpdump expands the strftime format in the file name
+    pcap = f"{prefix}.%Y%m%d%H%M%S.pcap" if options.get("rotate_seconds") else f"{prefix}.pcap"
+    command = ["tcpdump", "-i", ifname, "-U", "-w", pcap]
+    if options.get("snaplen"):
+        command.extend(["-s", str(options["snaplen"])])
+    if options.get("rotate_size"):
+        command.extend(["-C", str(options["rotate_size"])])
+    if options.get("rotate_seconds"):
+        command.extend(["-G", str(options["rotate_seconds"])])
+    if options.get("rotate_count"):
+        command.extend(["-W", str(options["rotate_count"])])
+    if options.get("compress"):
+        if options.get("rotate_size") or options.get("rotate_seconds"):
+            command.extend(["-z", settings.VNET_SNIFFER_COMPRESS_COMMAND])
+        else:
+            logger.warning(f"Compression of the sniffer on {ifname} requires rotation to be enabled, not compressing")
+    if options.get("filter"):
+        command.append(options["filter"])
+    return command, pcap, f"{prefix}*"
+
+
+def start_tcpdump_on_vnet_interface(ifname: str, path: str = settings.VNET_SNIFFER_PCAP_DIR, options: Optional[dict] = None):
     """
     Starts a tcpdump process on a vnet interface
     :param str ifname: The interface to start the tcpdump on
+    :param str path: The directory to store the PCAP files in
+    :param dict options: The sniffer options (rotation, snap length, filter), see settings.VNET_SNIFFER_OPTIONS
     """
-    path = join(path, f"{ifname}.{datetime.now().strftime('%y%m%d%H%M')}.pcap")
-    logger.info(f"Starting sniffer on VNet interface {ifname}, PCAP location: {path}")
-    Popen(shlex.split(f"tcpdump -i {ifname} -U -w {path}"))  # pylint: disable=consider-using-with
+    command, pcap, pcap_files = get_tcpdump_command(ifname, path, options=options)
+    logger.info(f"Starting sniffer on VNet interface {ifname}, PCAP location: {pcap}")
+    process = Popen(command)  # pylint: disable=consider-using-with
+    register_sniffer(ifname, process.pid, pcap, pcap_files=pcap_files)
+
+
+def start_capture_engine_on_vnet_interfaces(
+    config: dict, ifnames: List[str], path: str = settings.VNET_SNIFFER_PCAP_DIR, sniffer_options: Optional[dict] = None
+):
+    """
+    Starts a single builtin capture engine process that sniffs on all passed VNet interfaces
+    The packets of all interfaces are written to one pcapng file, with an interface description per VNet interface
+    :param dict config: The config generated by get_config()
+    :param list ifnames: The interfaces to start sniffing on
+    :param str path: The directory to store the pcapng file in
+    :param dict sniffer_options: The default sniffer options, overridden by the sniffer options in the config
+    """
+    interfaces = []
+    for ifname in ifnames:
+        options = get_sniffer_options_for_interface(config, ifname, defaults=sniffer_options)
+        unsupported = sorted(option for option in options if option != "snaplen")
+        if unsupported:
+            logger.warning(
+                f"The builtin capture engine does not support the {', '.join(unsupported)} sniffer option(s), ignoring them for {ifname}"
+            )
+        interfaces.append(f"{ifname}:{options['snaplen']}" if "snaplen" in options else ifname)
+    pcap = join(path, f"vnet.{datetime.now().strftime('%y%m%d%H%M')}.pcapng")
+    logger.info(f"Starting builtin capture engine on {len(ifnames)} VNet interface(s), PCAP location: {pcap}")
+    # Run in its own session, so it keeps running when the terminal is closed like the tcpdump sniffers
+    process = Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-m", "vnet_manager.operations.capture", pcap] + interfaces, start_new_session=True
+    )
+    for ifname in ifnames:
+        register_sniffer(ifname, process.pid, pcap)
 
 
 def kill_tcpdump_processes_on_vnet_interfaces(config: dict):
     """
-    Tries to kill all TCPdump processes on associated VNet interfaces
+    Tries to kill all sniffer processes (TCPdump or the builtin capture engine) on associated VNet interfaces
     :param config: The config generated by get_config()
     """
     interfaces = get_vnet_interface_names_from_config(config)
     if "veths" in config:
         interfaces.extend(list(config["veths"].keys()))
-    for ifname in interfaces:
-        for process in process_iter():
-            process_line = process.cmdline()
-            if "tcpdump" in process_line and ifname in process_line:
-                logger.info(f"Killing PID {process.pid}")
-                process.kill()
+    killed = set()
+    for ifname, state in get_registered_sniffers(interfaces).items():
+        # The builtin capture engine is registered for multiple interfaces, so we only have to kill it once
+        if state["pid"] not in killed:
+            logger.info(f"Killing PID {state['pid']}")
+            try:
+                kill(state["pid"], SIGKILL)
+            except ProcessLookupError:
+                logger.debug(f"Sniffer process {state['pid']} already exited")
+            killed.add(state["pid"])
+        unregister_sniffer(ifname)
@@ -1,42 +1,162 @@
 from sys import modules
 from logging import getLogger
-from time import sleep
+from os.path import basename
+from queue import Empty
+from time import sleep, monotonic
 from subprocess import call
-from typing import List
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tabulate import tabulate
 from yaml import safe_dump
 from pylxd.exceptions import NotFound, LXDAPIException
+from pyroute2.netlink.exceptions import NetlinkError
 
 from vnet_manager.conf import settings
 from vnet_manager.operations.files import write_file_to_lxc_container
-from vnet_manager.providers.lxc import get_lxd_client
+from vnet_manager.config.topology import get_topology
+from vnet_manager.operations.network import get_vnet_p2p_interface_names
+
+# The netns provider functions are called through the provider dispatch of this module
+# pylint: disable=unused-import
+from vnet_manager.operations.netns import (
+    create_netns_machine,
+    get_netns_machine_status,
+    change_netns_machine_status,
+    destroy_netns_machine,
+    connect_to_netns_machine,
+)
+
+# pylint: enable=unused-import
+from vnet_manager.providers.lxc import (
+    configure_lxd_remotes,
+    get_lxd_client,
+    get_lxd_lifecycle_event_listener,
+    get_lxd_machine_remote,
+    get_lxd_remotes,
+    use_lxd_machine_remote,
+    use_lxd_remote,
+    LXDEventListener,
+)
 from vnet_manager.utils.user import request_confirmation
 
 logger = getLogger(__name__)
 
 
-def show_status(config: dict):
+def show_status(config: dict, lxc_instances: Dict[str, dict] = None):
     """
     Print a table with the current machine statuses
     :param dict config: The config provided by vnet_manager.config.get_config()
+    :param dict lxc_instances: The LXC instances provided by get_lxc_instances(), fetched if not passed
     """
     logger.info("Listing VNet machine statuses")
-    header = ["Name", "Status", "Provider"]
+    header = ["Name", "Status", "Provider", "IPv4", "IPv6", "Memory", "CPU time", "Processes"]
     statuses = []
-    for name, info in config["machines"].items():
-        provider = settings.MACHINE_TYPE_PROVIDER_MAPPING[info["type"]]
+    for name, machine in get_topology(config).machines.items():
+        provider = machine.provider
+        if provider == "lxc":
+            # All LXC statuses are resolved from a single API call
+            if lxc_instances is None:
+                lxc_instances = get_lxc_instances()
+            statuses.append(get_lxc_machine_status_from_instances(name, lxc_instances))
+            continue
         # Call the relevant provider get_%s_machine_status function
-        statuses.append(getattr(modules[__name__], f"get_{provider}_machine_status")(name))
+        status = getattr(modules[__name__], f"get_{provider}_machine_status")(name)
+        statuses.append(status + ["NA"] * (len(header) - len(status)))
     print(tabulate(statuses, headers=header, tablefmt="pretty"))
 
 
+def get_lxc_remote_instances(remote_instances: Optional[dict] = None) -> Dict[Optional[str], List[dict]]:
+    """
+    Get all LXC instances of each LXD remote, including their state, in a single API call per LXD remote
+    :param dict remote_instances: The instances fetched per LXD client, pass the same dict to fetch each remote only once
+        when getting the instances of multiple configs
+    :return: dict: The instance data, by LXD remote name (None is the local LXD)
+    """
+    remote_instances = {} if remote_instances is None else remote_instances
+    instances = {}
+    for remote in get_lxd_remotes():
+        with use_lxd_remote(remote):
+            client = get_lxd_client()
+        # The clients are pooled per set of parameters, so the same remote has the same client in every config
+        if client not in remote_instances:
+            try:
+                response = client.api.instances.get(params={"recursion": 2})
+            except NotFound:
+                # LXD versions without the instances API
+                response = client.api.containers.get(params={"recursion": 2})
+            remote_instances[client] = response.json()["metadata"]
+        instances[remote] = remote_instances[client]
+    return instances
+
+
+def get_lxd_remote_instance_names(lxd_remotes: dict) -> Dict[str, List[str]]:
+    """
+    Get the names of the LXC instances on each LXD remote, the config validator keeps existing machines on their remote
+    :param dict lxd_remotes: The validated lxd_remotes config
+    :return: dict: The instance names, by LXD remote name
+    """
+    configure_lxd_remotes({"lxd_remotes": lxd_remotes})
+    return {
+        remote or settings.LXC_LOCAL_REMOTE_NAME: [instance["name"] for instance in instances]
+        for remote, instances in get_lxc_remote_instances().items()
+    }
+
+
+def get_lxc_instances(remote_instances: Optional[dict] = None) -> Dict[str, dict]:
+    """
+    Get all LXC instances, including their state, in a single API call per LXD remote
+    :param dict remote_instances: The instances fetched per LXD client, see get_lxc_remote_instances()
+    :return: dict: The instance data, by instance name
+    """
+    instances = {}
+    for remote, data in get_lxc_remote_instances(remote_instances=remote_instances).items():
+        for instance in data:
+            # Every remote has its own base image machine, the machines themselves are looked up on the remote they are placed on
+            if instance["name"] not in instances or get_lxd_machine_remote(instance["name"]) == remote:
+                instances[instance["name"]] = instance
+    return instances
+
+
+def get_lxc_machine_status_from_instances(name: str, instances: Dict[str, dict]) -> list:
+    """
+    Gets the LXC machine status from the instances returned by get_lxc_instances()
+    :param str name: The name of the machine
+    :param dict instances: The instances provided by get_lxc_instances()
+    :return: list: [name, state, provider, ipv4, ipv6, memory, cpu time, processes]
+    """
+    if name not in instances:
+        return [name, "NA", "LXC", "NA", "NA", "NA", "NA", "NA"]
+    state = instances[name].get("state") or {}
+    addresses = {"inet": [], "inet6": []}
+    for ifname, data in (state.get("network") or {}).items():
+        if ifname == "lo":
+            continue
+        for address in data.get("addresses", []):
+            if address["family"] in addresses and address.get("scope") != "link":
+                addresses[address["family"]].append(address["address"])
+    memory = state.get("memory", {}).get("usage")
+    cpu = state.get("cpu", {}).get("usage")
+    return [
+        name,
+        instances[name]["status"],
+        "LXC",
+        "\n".join(addresses["inet"]),
+        "\n".join(addresses["inet6"]),
+        f"{memory / 1024 ** 2:.1f}MiB" if memory else "NA",
+        f"{cpu / 10 ** 9:.1f}s" if cpu else "NA",
+        state.get("processes", "NA"),
+    ]
+
+
 def check_if_lxc_machine_exists(machine: str) -> bool:
     """
     Checks if an LXC machine exists
     :param str machine: The machine/container to check for
     :return: bool: True if it exists, false otherwise
     """
-    return get_lxd_client().containers.exists(machine)
+    with use_lxd_machine_remote(machine):
+        return get_lxd_client().containers.exists(machine)
 
 
 def connect_to_lxc_machine(machine: str) -> bool:
@@ -53,7 +173,9 @@ def connect_to_lxc_machine(machine: str) -> bool:
         return False
     # Connect to it
     logger.info(f"Connecting to LXC machine {machine}")
-    call(["lxc", "exec", machine, settings.SHELL])
+    # Machines on an LXD remote are reached through the lxc remote with the same name
+    remote = get_lxd_machine_remote(machine)
+    call(["lxc", "exec", f"{remote}:{machine}" if remote else machine, settings.SHELL])
     logger.info("Connection closed, goodbye")
     return True
 
@@ -65,7 +187,8 @@ def get_lxc_machine_status(name: str) -> List[str]:
     :return: list: [name, state, provider]
     """
     # TODO: Let's not return a list here, simply the status
-    client = get_lxd_client()
+    with use_lxd_machine_remote(name):
+        client = get_lxd_client()
     try:
         status = client.containers.get(name).status
     except NotFound:
@@ -94,31 +217,178 @@ def wait_for_lxc_machine_status(container, status: str):
     raise TimeoutError(f"Wait time for container {container.name} to converge to {status} status expired, giving up")
 
 
-def change_machine_status(config: dict, status: str = "stop", machines: List[str] = None):
+def change_machine_status(config: dict, status: str = "stop", machines: List[str] = None, parallel: int = 1):
     """
     Change the status of the passed machines to the requested state
     :param dict config: The config provided by get_config()
     :param str status: The status to change the machine to
     :param list machines: A list of machine names to stop/start, if None all will be changed
+    :param int parallel: The amount of LXC machines to change the status of concurrently, 1 changes them one by one
     """
     # Check for valid status change
     if status not in settings.VALID_STATUSES:
         raise NotImplementedError(f"Requested machine status change {status} unknown")
 
     # Get all the machines from the config if not already provided
-    machines = machines if machines else config["machines"].keys()
+    topology = get_topology(config)
+    machines = machines if machines else topology.machines.keys()
+    lxc_machines = []
 
     # For each machine get the provider and execute the relevant status change function
     for machine in machines:
         # First check if the machine exists
-        if machine not in config["machines"]:
+        if machine not in topology.machines:
             logger.error(f"Tried to {status} machine {machine}, but there is no config entry for it, skipping...")
             continue
         # Get the provider
-        provider = settings.MACHINE_TYPE_PROVIDER_MAPPING[config["machines"][machine]["type"]]
+        provider = topology.machines[machine].provider
+        if parallel > 1 and provider == "lxc":
+            # Changed all at once below
+            lxc_machines.append(machine)
+            continue
         # Call the provider change_status function
         logger.info(f"{'Starting' if status == 'start' else 'Stopping'} machine {machine} with provider {provider}")
         getattr(modules[__name__], f"change_{provider}_machine_status")(machine, status=status)
+    if lxc_machines:
+        change_lxc_machines_status_in_parallel(lxc_machines, status=status, parallel=parallel)
+
+
+def change_lxc_machines_status_in_parallel(machines: List[str], status: str = "stop", parallel: int = 0) -> Dict[str, str]:
+    """
+    Change the status of multiple LXC machines concurrently
+    The status changes are issued without waiting, convergence is detected through the LXD lifecycle events
+    and failures through the events of the status change operations
+    :param list machines: The names of the machines to change the status of
+    :param str status: The status to change the LXC machines to
+    :param int parallel: The maximum amount of status changes in flight, 0 issues all status changes at once
+    :return: dict: The result per machine
+    """
+    required_state = "Stopped" if status == "stop" else "Running"
+    parallel = parallel or len(machines)
+    # Subscribe before issuing any status changes, so we cannot miss an event
+    listener = get_lxd_lifecycle_event_listener()
+    deadline = monotonic() + settings.LXC_PARALLEL_STATUS_TIMEOUT
+    to_issue = list(machines)
+    in_flight = {}
+    results = {}
+    try:
+        while (to_issue or in_flight) and monotonic() < deadline:
+            while to_issue and len(in_flight) < parallel:
+                name = to_issue.pop(0)
+                try:
+                    with use_lxd_machine_remote(name):
+                        container = get_lxd_client().containers.get(name)
+                    if container.status.lower() == required_state.lower():
+                        logger.debug(f"LXC container {name} is already {container.status}")
+                        results[name] = [name, container.status, "OK", 0.0]
+                        continue
+                    logger.info(f"{'Starting' if status == 'start' else 'Stopping'} LXC container {name}")
+                    # The same request as container.start() and container.stop(), but we keep the operation to detect failures
+                    response = container.api.state.put(json={"action": status, "timeout": 30, "force": True})
+                    in_flight[name] = (container, monotonic(), basename(urlparse(response.json()["operation"]).path))
+                except NotFound:
+                    logger.error(f"Tried to change machine status of LXC container {name}, but it doesn't exist!")
+                    results[name] = [name, "NA", "Not found", 0.0]
+                except LXDAPIException as e:
+                    logger.error(f"Unable to {status} LXC container {name}, got error: {e}")
+                    results[name] = [name, "NA", f"Error: {e}", 0.0]
+            # Wait for the machines to converge
+            operations = {operation: name for name, (_, _, operation) in in_flight.items()}
+            converged, failed = get_lxc_machines_from_lifecycle_events(
+                listener, required_state, min(settings.LXC_STATUS_WAIT_SLEEP, deadline - monotonic()), operations=operations
+            )
+            if not converged and not failed:
+                # No (relevant) events for a while, make sure we did not miss any
+                logger.debug("No LXC lifecycle events received, checking the status of the remaining containers")
+                converged, failed = poll_lxc_machines_in_flight(in_flight, required_state)
+            # A machine can show up more than once, a failed operation takes precedence
+            for name in [name for name in dict.fromkeys((*failed, *converged)) if name in in_flight]:
+                elapsed = round(monotonic() - in_flight.pop(name)[1], 1)
+                if name in failed:
+                    logger.error(f"Unable to {status} LXC container {name}, got error: {failed[name]}")
+                    results[name] = [name, "NA", f"Error: {failed[name]}", elapsed]
+                else:
+                    logger.debug(f"LXC container {name} converged to {required_state} status in {elapsed} seconds")
+                    results[name] = [name, required_state, "OK", elapsed]
+    finally:
+        if listener:
+            listener.close()
+    for name, (container, issued, _) in in_flight.items():
+        logger.error(f"Unable to change LXC status container {name}, got timeout after issuing {status} command")
+        results[name] = [name, container.state().status, "Timeout", round(monotonic() - issued, 1)]
+    results.update({name: [name, "NA", "Timeout", 0.0] for name in to_issue})
+    statuses = [results[name] for name in machines]
+    print(tabulate(statuses, headers=["Name", "Status", "Result", "Time (s)"], tablefmt="pretty"))
+    return {name: result[2] for name, result in results.items()}
+
+
+def get_lxc_machines_from_lifecycle_events(
+    listener: Optional[LXDEventListener], status: str, timeout: float, operations: Optional[Dict[str, str]] = None
+) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Waits for LXD lifecycle and operation events and returns the machines that converged to the requested status or failed
+    :param LXDEventListener listener: The listener to get the events from, if None we only wait
+    :param str status: The status the machines should have converged to
+    :param float timeout: The maximum amount of seconds to wait for events
+    :param dict operations: The machine names by the ID of their status change operation
+    :return: list: The names of the machines that converged to the requested status / dict: The error by failed machine name
+    """
+    operations = operations or {}
+    if listener is None:
+        sleep(max(timeout, 0))
+        return [], {}
+    events = []
+    try:
+        events.append(listener.events.get(timeout=max(timeout, 0)))
+        while True:
+            events.append(listener.events.get_nowait())
+    except Empty:
+        pass
+    machines = []
+    failed = {}
+    for event in events:
+        metadata = event.get("metadata") or {}
+        if event.get("type") == "operation":
+            if metadata.get("id") in operations and metadata.get("status") == "Failure":
+                failed[operations[metadata["id"]]] = metadata.get("err") or "Operation failed"
+        elif settings.LXC_LIFECYCLE_EVENT_STATUS_MAPPING.get(metadata.get("action")) == status:
+            machines.append(basename(urlparse(metadata.get("source", "")).path))
+    return machines, failed
+
+
+def poll_lxc_machines_in_flight(in_flight: Dict[str, tuple], status: str) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Checks the status change operations and the status of the machines that have not converged yet
+    :param dict in_flight: The (container, issue time, operation ID) by machine name
+    :param str status: The status the machines should converge to
+    :return: list: The names of the machines that converged to the requested status / dict: The error by failed machine name
+    """
+    converged = []
+    failed = {}
+    for name, (container, _, operation) in in_flight.items():
+        error = get_lxc_operation_error(container, operation)
+        if error is not None:
+            failed[name] = error
+        elif container.state().status.lower() == status.lower():
+            converged.append(name)
+    return converged, failed
+
+
+def get_lxc_operation_error(container, operation: str) -> Optional[str]:
+    """
+    Get the error of a failed LXD operation, the operation is looked up on the LXD remote of the container
+    :param Container container: The container the operation was issued for
+    :param str operation: The ID of the operation
+    :return: str: The error of the operation, None if it did not fail (yet)
+    """
+    try:
+        metadata = container.client.api.operations[operation].get().json()["metadata"]
+    except NotFound:
+        # LXD only keeps finished operations around for a few seconds, the container state tells if it succeeded
+        return None
+    if metadata.get("status") != "Failure":
+        return None
+    return metadata.get("err") or "Operation failed"
 
 
 def change_lxc_machine_status(machine: str, status: str = "stop"):
@@ -127,7 +397,8 @@ def change_lxc_machine_status(machine: str, status: str = "stop"):
     :param str machine: The name of the machine to change the status of
     :param str status: The status to change the LXC machine to
     """
-    client = get_lxd_client()
+    with use_lxd_machine_remote(machine):
+        client = get_lxd_client()
     try:
         machine = client.containers.get(machine)
     except NotFound:
@@ -153,85 +424,155 @@ def change_lxc_machine_status(machine: str, status: str = "stop"):
         logger.error(f"Unable to change LXC status container {machine.name}, got timeout after issuing {status} command")
 
 
-def create_machines(config: dict, machines: List[str] = None):
+def create_machines(config: dict, machines: List[str] = None) -> Dict[str, str]:
     """
-    Meta function to call the other machine creation functions per provider
+    Meta function to call the machine creation functions of the providers that create their machines one by one
+    LXC machines are created by their provisioning pipeline instead, see operations.provision
     :param dict config: The config generated by get_config()
     :param list machines: A list of machine to create, defaults to all machines in the config
+    :return: dict: The machines that failed to be created, with the error message
     """
     # Get all the machines from the config if not already provided
     machines = machines if machines else config["machines"].keys()
-    create_lxc_machines_from_base_image(config, machines)
+    failures = {}
+    # Call the relevant create_%s_machine function
+    topology = get_topology(config)
+    for machine in machines:
+        if machine not in topology.machines:
+            logger.error(f"Tried to create machine {machine}, but the machine was not found in the config, skipping")
+            continue
+        provider = topology.machines[machine].provider
+        if provider == "lxc":
+            logger.debug(f"LXC machine {machine} is created by its provisioning pipeline, skipping")
+            continue
+        try:
+            getattr(modules[__name__], f"create_{provider}_machine")(config, machine)
+        except (NetlinkError, OSError) as e:
+            logger.error(f"Unable to create {provider} machine {machine}, got error: {e}")
+            failures[machine] = str(e)
+    return failures
 
 
-def create_lxc_machines_from_base_image(config: dict, containers: List[str]):
+def generate_lxc_container_config(config: dict, container: str) -> dict:
     """
-    Create LXC machines from the base image specified in the settings
+    Generates the LXD instance config for a container based on the machine configuration
     :param dict config: The config generated by get_config()
-    :param list containers: A list of machines to create
-    """
-    containers_to_create = []
-    containers_already_created = False
-
-    # Get all the LXC machines to create
-    for container in containers:
-        # Check if the requested machine name is present in the config
-        if container not in config["machines"]:
-            logger.error(f"Tried to get provider for container {container}, but the container was not found in the config, skipping")
-        # Quick check if the machine already exists
-        elif check_if_lxc_machine_exists(container):
-            logger.error(f"A LXC container with the name {container} already exists, skipping")
-            containers_already_created = True
-        # Check if LXC is the provider
-        elif settings.MACHINE_TYPE_PROVIDER_MAPPING[config["machines"][container]["type"]].lower() == "lxc":
-            logger.debug(f"Selecting LXC machine {container} for creation")
-            containers_to_create.append(container)
-        else:
-            logger.debug(f"Machine {container} is not provided by LXC, skipping LXC container creation")
-
-    # Create it
-    client = get_lxd_client()
-    for container in containers_to_create:
-        logger.debug(f"Generating LXC config for container {container}")
-        # Interface config
-        # First add eth0 (default), which does nothing
-        device_config = {"eth0": {"type": "none"}}
-        # Then for each interface in the config add the configuration for that interface to the interfaces_config dict
-        for inet_name, inet_config in config["machines"][container]["interfaces"].items():
-            device_config[inet_name] = {
-                "name": inet_name,  # The name of the interface inside the instance
-                "host_name": f"{container}-{inet_name}",  # The name of the interface inside the host
-                "parent": f"{settings.VNET_BRIDGE_NAME}{inet_config['bridge']}",  # The name of the host device
+    :param str container: The name of the container to generate the LXD config for
+    :return: dict: The LXD instance config
+    """
+    logger.debug(f"Generating LXC config for container {container}")
+    # Interface config
+    # First add eth0 (default), which does nothing
+    device_config = {"eth0": {"type": "none"}}
+    topology = get_topology(config)
+    # Then for each interface in the config add the configuration for that interface to the interfaces_config dict
+    for interface in topology.machines[container].interfaces:
+        switch = topology.switches[interface.switch]
+        if switch.p2p:
+            # Point-to-point switches have no bridge, the machine gets its end of the veth pair moved into it
+            device_config[interface.name] = {
+                "name": interface.name,
+                "parent": get_vnet_p2p_interface_names(switch.number)[switch.interfaces.index(interface)],
                 "type": "nic",
-                "nictype": "bridged",
-                "hwaddr": inet_config["mac"],
+                "nictype": "physical",
+                "hwaddr": interface.mac,
             }
-        container_config = {
-            "name": container,
-            "source": {"alias": settings.LXC_BASE_IMAGE_ALIAS, "type": "image"},
-            "ephemeral": False,
-            "config": {"user.network-config": "disabled"},
-            "devices": device_config,
-            "profiles": [settings.LXC_VNET_PROFILE],
+            continue
+        device_config[interface.name] = {
+            "name": interface.name,  # The name of the interface inside the instance
+            "host_name": f"{container}-{interface.name}",  # The name of the interface inside the host
+            "parent": interface.bridge,  # The name of the host device
+            "type": "nic",
+            "nictype": "bridged",
+            "hwaddr": interface.mac,
         }
-        logger.info(f"Creating LXC container {container}")
-        # TODO: Make this nicer by not waiting here but doing the configuration after we've created all containers
-        client.containers.create(container_config, wait=True)
-        place_lxc_interface_configuration_on_container(config, container)
+    return {
+        "name": container,
+        "source": get_lxc_container_source(),
+        "ephemeral": False,
+        "config": {"user.network-config": "disabled"},
+        "devices": device_config,
+        "profiles": [settings.LXC_VNET_PROFILE],
+    }
+
 
-    # Check with the user if it is okay to overwrite config files
-    if containers_already_created:
-        request_confirmation(
-            message="Some containers already existed, the next operation will overwrite network, "
-            "host and user config files on those containers",
-        )
+def get_lxc_container_source(strategy: Optional[str] = None) -> dict:
+    """
+    Get the source LXD creates the VNet containers from
+    With the 'copy' strategy the golden container is copied, on a btrfs storage pool this is an instant subvolume snapshot
+    that skips unpacking the base image
+    :param str strategy: The creation strategy, 'image' or 'copy', defaults to the strategy in the settings
+    :return: dict: The LXD instance source
+    """
+    if (strategy or settings.LXC_CREATE_STRATEGY) == "copy":
+        return {"type": "copy", "source": settings.LXC_GOLDEN_MACHINE_NAME, "instance_only": True}
+    return {"alias": settings.LXC_BASE_IMAGE_ALIAS, "type": "image"}
 
 
-def destroy_machines(config: dict, machines: List[str] = None):
+def submit_lxc_machine_creation(config: dict, container: str) -> str:
+    """
+    Submit the creation of a LXC container from the base image specified in the settings, without waiting for it
+    :param dict config: The config generated by get_config()
+    :param str container: The name of the container to create
+    :return: str: The create operation, see wait_for_lxc_machine_creation()
+    :raises LXDAPIException: If the creation could not be submitted
+    """
+    container_config = generate_lxc_container_config(config, container)
+    logger.info(f"Creating LXC container {container}")
+    with use_lxd_machine_remote(container):
+        client = get_lxd_client()
+    return client.api.containers.post(json=container_config).json()["operation"]
+
+
+def wait_for_lxc_machine_creation(container: str, operation: str):
+    """
+    Wait for the create operation of a LXC container submitted by submit_lxc_machine_creation()
+    :param str container: The name of the container that is created
+    :param str operation: The create operation
+    :raises LXDAPIException: If the container could not be created
+    """
+    with use_lxd_machine_remote(container):
+        client = get_lxd_client()
+    client.operations.wait_for_operation(operation)
+    logger.debug(f"LXC container {container} created")
+
+
+def update_lxc_machine_devices(config: dict, container: str) -> bool:
+    """
+    Update the devices of an existing LXC container in place to match the machine configuration
+    Added and changed devices are sent in a single PATCH of the instance, LXD hot-plugs them into a running container
+    :param dict config: The config generated by get_config()
+    :param str container: The name of the container to update
+    :return: bool: True if any of the devices changed, False otherwise
+    :raises LXDAPIException: If the container could not be updated
+    """
+    with use_lxd_machine_remote(container):
+        client = get_lxd_client()
+    machine = client.containers.get(container)
+    desired = generate_lxc_container_config(config, container)["devices"]
+    changed = {name: device for name, device in desired.items() if machine.devices.get(name) != device}
+    removed = [name for name in machine.devices if name not in desired]
+    if not changed and not removed:
+        logger.debug(f"Devices of LXC container {container} are up to date")
+        return False
+    logger.info(f"Updating devices {', '.join(sorted(changed) + sorted(removed))} of LXC container {container}")
+    if removed:
+        # A PATCH merges the devices with the existing ones, so removing a device requires replacing all of them
+        machine.devices = desired
+        machine.save(wait=True)
+    else:
+        response = machine.api.patch(json={"devices": changed})
+        client.operations.wait_for_operation(response.json()["operation"])
+        machine.devices.update(changed)
+    return True
+
+
+def destroy_machines(config: dict, machines: List[str] = None, parallel: int = 1):
     """
     Destroy's the passed machines
     :param dict config: The config generated by get config
     :param list machines: The machines to destroy, defaults to all machines in the config
+    :param int parallel: The amount of LXC machines to delete concurrently, 1 destroys them one by one
     """
     # Get all the machines from the config if not already provided
     machines = machines if machines else config["machines"].keys()
@@ -242,15 +583,89 @@ def destroy_machines(config: dict, machines: List[str] = None):
         prompt="This operation cannot be undone. Are you sure?! (yes/no) ",
     )
 
+    lxc_machines = []
+    topology = get_topology(config)
     for machine in machines:
         # First check if the machine exists
-        if machine not in config["machines"]:
+        if machine not in topology.machines:
             logger.error(f"Tried to get the config for machine {machine}, but there is no config entry for this machine, skipping")
             continue
         # Get the provider
-        provider = settings.MACHINE_TYPE_PROVIDER_MAPPING[config["machines"][machine]["type"]]
+        provider = topology.machines[machine].provider
+        if parallel > 1 and provider == "lxc":
+            # Destroyed all at once below
+            lxc_machines.append(machine)
+            continue
         # Call the provider destroy function
         getattr(modules[__name__], f"destroy_{provider}_machine")(machine)
+    if lxc_machines:
+        destroy_lxc_machines_in_parallel(lxc_machines, parallel=parallel)
+
+
+def destroy_lxc_machines_in_parallel(machines: List[str], parallel: int) -> Dict[str, str]:
+    """
+    Destroy multiple LXC machines concurrently
+    All running containers are force stopped at once, the stop operations are awaited together
+    and the containers are then deleted with a bounded amount of workers
+    :param list machines: The names of the machines to destroy
+    :param int parallel: The maximum amount of operations to wait for concurrently
+    :return: dict: The result per machine
+    """
+    results = {}
+    clients = {}
+    containers = {}
+    stop_operations = {}
+    for name in machines:
+        with use_lxd_machine_remote(name):
+            clients[name] = get_lxd_client()
+        try:
+            container = clients[name].containers.get(name)
+            if container.status.lower() == "running":
+                logger.info(f"Force stopping LXC container {name}")
+                response = container.api.state.put(json={"action": "stop", "force": True, "timeout": -1})
+                stop_operations[name] = (response.json()["operation"], monotonic())
+            containers[name] = container
+        except NotFound:
+            logger.warning(f"Tried to delete LXC machine {name}, but it does not exist. Maybe it was already deleted?")
+            results[name] = [name, 0.0, 0.0, "Not found"]
+        except LXDAPIException as e:
+            logger.error(f"Unable to stop LXC container {name}, got error: {e}")
+            results[name] = [name, 0.0, 0.0, f"Error: {e}"]
+
+    def wait_for_stop(name: str) -> float:
+        operation, issued = stop_operations[name]
+        clients[name].operations.wait_for_operation(operation)
+        return round(monotonic() - issued, 1)
+
+    def delete(name: str) -> float:
+        started = monotonic()
+        logger.info(f"Deleting LXC container {name}")
+        response = containers[name].api.delete()
+        clients[name].operations.wait_for_operation(response.json()["operation"])
+        return round(monotonic() - started, 1)
+
+    stop_times = {name: 0.0 for name in containers}
+    logger.debug(f"Waiting for {len(stop_operations)} LXC stop operations and {len(containers)} delete operations with {parallel} workers")
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = {executor.submit(wait_for_stop, name): name for name in stop_operations}
+        for future in as_completed(futures):
+            try:
+                stop_times[futures[future]] = future.result()
+            except LXDAPIException as e:
+                logger.error(f"Unable to stop LXC container {futures[future]}, got error: {e}")
+                results[futures[future]] = [futures[future], 0.0, 0.0, f"Error: {e}"]
+                del containers[futures[future]]
+        futures = {executor.submit(delete, name): name for name in containers}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = [name, stop_times[name], future.result(), "OK"]
+            except LXDAPIException as e:
+                logger.error(f"Unable to delete LXC container {name}, got error: {e}")
+                results[name] = [name, stop_times[name], 0.0, f"Error: {e}"]
+    statuses = [results[name] for name in machines]
+    print(tabulate(statuses, headers=["Name", "Stop (s)", "Delete (s)", "Result"], tablefmt="pretty"))
+    return {name: result[3] for name, result in results.items()}
 
 
 def destroy_lxc_machine(machine: str, wait: bool = False):
@@ -259,7 +674,8 @@ def destroy_lxc_machine(machine: str, wait: bool = False):
     :param str machine: The name of the machine to delete
     :param bool wait: Wait for the deletion to be complete before returning
     """
-    client = get_lxd_client()
+    with use_lxd_machine_remote(machine):
+        client = get_lxd_client()
     try:
         container = client.containers.get(machine)
     except NotFound:
@@ -313,13 +729,34 @@ def create_lxc_base_image_container():
     client.containers.create(machine_config, wait=True)
 
 
-def enable_type_specific_machine_configuration(config: dict):
+def create_lxc_golden_machine():
+    """
+    Creates the golden LXC container from the base image, it is never started
+    The 'copy' creation strategy creates the VNet machines as copies of this container
+    """
+    machine_config = {
+        "name": settings.LXC_GOLDEN_MACHINE_NAME,
+        "source": {"alias": settings.LXC_BASE_IMAGE_ALIAS, "type": "image"},
+        "ephemeral": False,
+        "config": {"user.network-config": "disabled"},
+        "devices": {"eth0": {"type": "none"}},
+        "profiles": [settings.LXC_VNET_PROFILE],
+    }
+    logger.info("Creating LXC golden container")
+    get_lxd_client().containers.create(machine_config, wait=True)
+
+
+def enable_type_specific_machine_configuration(config: dict, machines: List[str] = None):
     """
     Call type and provider specific machine configuration functions based on the settings
     :param dict config: The config generated by get_config()
+    :param list machines: The machines to configure, defaults to all machines in the config
     """
-    for machine_name, machine_data in config["machines"].items():
-        for func in settings.MACHINE_TYPE_CONFIG_FUNCTION_MAPPING[machine_data["type"]]:
+    topology = get_topology(config)
+    for machine_name in topology.machines if machines is None else machines:
+        if machine_name not in topology.machines:
+            continue
+        for func in settings.MACHINE_TYPE_CONFIG_FUNCTION_MAPPING[topology.machines[machine_name].type]:
             getattr(modules[__name__], func)(machine_name)
 
 
@@ -347,24 +784,53 @@ def configure_lxc_ip_forwarding(container_name: str, enable: bool = True):
     :param str container_name: The name of the container to enable IP forwarding on
     :param bool enable: Whether to enable IP forwarding or disable it
     """
-    value = 1 if enable else 0
     logger.info(f"{'Enabling' if enable else 'Disabling'} IP forwarding on LXC container {container_name}")
-    write_file_to_lxc_container(container_name, "/etc/sysctl.d/20-net.ipv4.ip_forward.conf", f"net.ipv4.ip_forward={value}\n")
-    write_file_to_lxc_container(
-        container_name, "/etc/sysctl.d/20-net.ipv6.conf.all.forwarding.conf", f"net.ipv6.conf.all.forwarding={value}\n"
-    )
+    for path, data in get_lxc_ip_forwarding_files(enable=enable).items():
+        write_file_to_lxc_container(container_name, path, data)
 
 
-def place_lxc_interface_configuration_on_container(config: dict, container: str):
+def get_lxc_ip_forwarding_files(enable: bool = True) -> Dict[str, str]:
+    """
+    Get the sysctl files that configure IP forwarding on a LXC machine
+    :param bool enable: Whether to enable IP forwarding or disable it
+    :return: dict: guest path -> file data
+    """
+    value = 1 if enable else 0
+    return {
+        "/etc/sysctl.d/20-net.ipv4.ip_forward.conf": f"net.ipv4.ip_forward={value}\n",
+        "/etc/sysctl.d/20-net.ipv6.conf.all.forwarding.conf": f"net.ipv6.conf.all.forwarding={value}\n",
+    }
+
+
+def place_lxc_interface_configuration_on_container(config: dict, container: str, apply: bool = False):
     """
     Places the interfaces configuration on the LXC container
     :param dict config: The config generated by get_config()
     :param str container: The name of the container to place the interfaces configuration on
+    :param bool apply: Apply the configuration if the container is running, so changed NICs are configured without a restart
     """
     logger.debug(f"Generating network config for LXC container {container}")
     network_conf = generate_machine_netplan_config(config, container)
     logger.info(f"Placing network config on LXC container {container}")
     write_file_to_lxc_container(container, settings.VNET_NETPLAN_CONFIG_FILE_PATH, safe_dump(network_conf))
+    if apply:
+        apply_lxc_interface_configuration(container)
+
+
+def apply_lxc_interface_configuration(container: str):
+    """
+    Applies the placed interfaces configuration on a running LXC container
+    :param str container: The name of the container to apply the interfaces configuration on
+    """
+    with use_lxd_machine_remote(container):
+        machine = get_lxd_client().containers.get(container)
+    if machine.status.lower() != "running":
+        logger.debug(f"LXC container {container} is not running, the network config is applied on start")
+        return
+    logger.info(f"Applying network config on LXC container {container}")
+    result = machine.execute(["netplan", "apply"])
+    if result[0] != 0:
+        logger.warning(f"Unable to apply network config on LXC container {container}, got error: {result[2]}")
 
 
 def generate_machine_netplan_config(config: dict, machine: str) -> dict:
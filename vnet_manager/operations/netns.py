@@ -0,0 +1,237 @@
+from logging import getLogger
+from ipaddress import ip_address, ip_interface
+from subprocess import call
+from typing import Dict, List
+from pyroute2 import netns
+from pyroute2.iproute import IPRoute
+from pyroute2.netlink.exceptions import NetlinkError
+
+from vnet_manager.conf import settings
+
+logger = getLogger(__name__)
+
+IFF_UP = 0x1
+
+
+def get_netns_machine_port_names(config: dict, machine: str) -> Dict[str, str]:
+    """
+    Get the names of the host ends of the veth pairs that connect a netns machine to the VNet bridges
+    :param dict config: The config generated by get_config()
+    :param str machine: The name of the machine
+    :return: dict: interface name inside the namespace -> interface name on the host
+    """
+    return {ifname: f"{machine}-{ifname}" for ifname in config["machines"][machine]["interfaces"]}
+
+
+def check_if_netns_machine_exists(machine: str) -> bool:
+    """
+    Checks if a netns machine exists
+    :param str machine: The machine/namespace to check for
+    :return: bool: True if it exists, false otherwise
+    """
+    return machine in netns.listnetns()
+
+
+def open_netns_socket(machine: str) -> IPRoute:
+    """
+    Open a netlink socket inside the namespace of a netns machine
+    The thread only enters the namespace to create the socket, unlike NetNS() no process is forked for it
+    :param str machine: The name of the machine
+    :return: IPRoute: The netlink socket, close it when done
+    """
+    netns.pushns(machine)
+    try:
+        return IPRoute()
+    finally:
+        netns.popns()
+
+
+def get_netns_route(route: dict) -> dict:
+    """
+    Convert a route from the interface config to the route() arguments of pyroute2
+    :param dict route: The route, with the 'to' and 'via' keys
+    :return: dict: The destination and gateway of the route
+    """
+    gateway = ip_address(route["via"])
+    dst = route["to"]
+    if dst == "default":
+        dst = "0.0.0.0/0" if gateway.version == 4 else "::/0"
+    return {"dst": dst, "gateway": str(gateway)}
+
+
+def create_netns_machine(config: dict, machine: str):
+    """
+    Create a netns machine: a network namespace with a veth pair per interface, the addresses and routes are applied right away
+    :param dict config: The config generated by get_config()
+    :param str machine: The name of the machine to create
+    :raises NetlinkError: If an interface, address or route could not be created
+    """
+    if check_if_netns_machine_exists(machine):
+        logger.warning(f"Network namespace {machine} already exists, skipping creation")
+        return
+    logger.info(f"Creating netns machine {machine}")
+    netns.create(machine)
+    interfaces = config["machines"][machine]["interfaces"]
+    ip = IPRoute()
+    try:
+        for ifname, port in get_netns_machine_port_names(config, machine).items():
+            logger.debug(f"Creating veth pair {port} -> {machine}:{ifname}")
+            ip.link("add", ifname=port, kind="veth", peer={"ifname": ifname, "net_ns_fd": machine})
+            # The alias records the VNet bridge of the port, so the machine can be started without the config
+            ip.link("set", index=ip.link_lookup(ifname=port)[0], ifalias=f"{settings.VNET_BRIDGE_NAME}{interfaces[ifname]['bridge']}")
+    finally:
+        ip.close()
+    configure_netns_machine_interfaces(config, machine)
+
+
+def configure_netns_machine_interfaces(config: dict, machine: str):
+    """
+    Apply the MAC addresses, IP addresses and routes of the interface config inside the namespace of a netns machine
+    The routes are added after all addresses, as their gateways may be reached over another interface
+    :param dict config: The config generated by get_config()
+    :param str machine: The name of the machine
+    """
+    interfaces = config["machines"][machine]["interfaces"]
+    ns = open_netns_socket(machine)
+    try:
+        ns.link("set", index=ns.link_lookup(ifname="lo")[0], state="up")
+        for ifname, data in interfaces.items():
+            index = ns.link_lookup(ifname=ifname)[0]
+            ns.link("set", index=index, address=data["mac"], state="up")
+            for family in ("ipv4", "ipv6"):
+                if family in data:
+                    address = ip_interface(data[family])
+                    ns.addr("add", index=index, address=str(address.ip), prefixlen=address.network.prefixlen)
+        for ifname, data in interfaces.items():
+            for route in data.get("routes", []):
+                ns.route("add", oif=ns.link_lookup(ifname=ifname)[0], **get_netns_route(route))
+    finally:
+        ns.close()
+
+
+def get_netns_machine_ports(ip: IPRoute, machine: str) -> Dict[str, dict]:
+    """
+    Get the host ends of the interfaces of a netns machine
+    The ports are looked up by name from the interfaces in the namespace, so no dump of all host links is needed per machine
+    :param IPRoute ip: The IPRoute socket of the host
+    :param str machine: The name of the machine
+    :return: dict: interface name on the host -> {index, bridge, up, master}
+    """
+    ns = open_netns_socket(machine)
+    try:
+        ifnames = [link.get_attr("IFLA_IFNAME") for link in ns.get_links() if link.get_attr("IFLA_IFNAME") != "lo"]
+    finally:
+        ns.close()
+    ports = {}
+    for ifname in ifnames:
+        port = f"{machine}-{ifname}"
+        try:
+            link = ip.link("get", ifname=port)[0]
+        except NetlinkError:
+            logger.warning(f"Port {port} of netns machine {machine} not found")
+            continue
+        ports[port] = {
+            "index": link["index"],
+            "bridge": link.get_attr("IFLA_IFALIAS"),
+            "up": bool(link["flags"] & IFF_UP),
+            "master": link.get_attr("IFLA_MASTER"),
+        }
+    return ports
+
+
+def get_netns_machine_addresses(machine: str) -> Dict[str, List[str]]:
+    """
+    Get the global addresses inside the namespace of a netns machine
+    :param str machine: The name of the machine
+    :return: dict: ipv4 / ipv6 -> the addresses with their prefix length
+    """
+    addresses = {"ipv4": [], "ipv6": []}
+    ns = open_netns_socket(machine)
+    try:
+        for addr in ns.get_addr():
+            if addr["scope"] != 0:  # Only the global addresses, not the link local ones
+                continue
+            family = "ipv4" if ip_address(addr.get_attr("IFA_ADDRESS")).version == 4 else "ipv6"
+            addresses[family].append(f"{addr.get_attr('IFA_ADDRESS')}/{addr['prefixlen']}")
+    finally:
+        ns.close()
+    return addresses
+
+
+def get_netns_machine_status(name: str) -> List[str]:
+    """
+    Gets the netns machine state and returns a list
+    A netns machine is running when all of its ports are up and connected to their VNet bridge
+    :param name: str: The name of the machine
+    :return: list: [name, state, provider, ipv4, ipv6]
+    """
+    if not check_if_netns_machine_exists(name):
+        return [name, "NA", "netns"]
+    ip = IPRoute()
+    try:
+        ports = get_netns_machine_ports(ip, name)
+    finally:
+        ip.close()
+    running = bool(ports) and all(port["up"] and port["master"] for port in ports.values())
+    addresses = get_netns_machine_addresses(name)
+    return [name, "Running" if running else "Stopped", "netns", "\n".join(addresses["ipv4"]), "\n".join(addresses["ipv6"])]
+
+
+def change_netns_machine_status(machine: str, status: str = "stop"):
+    """
+    Start a netns machine by connecting its ports to their VNet bridge and bringing them up, stop it by bringing them down
+    :param str machine: The name of the machine
+    :param str status: The status to change the machine to, start or stop
+    """
+    if not check_if_netns_machine_exists(machine):
+        logger.error(f"Tried to {status} netns machine {machine}, but it does not exist")
+        return
+    ip = IPRoute()
+    try:
+        for port, data in get_netns_machine_ports(ip, machine).items():
+            if status == "stop":
+                ip.link("set", index=data["index"], state="down")
+                continue
+            bridge = ip.link_lookup(ifname=data["bridge"])
+            if not bridge:
+                logger.error(f"Unable to connect port {port} of netns machine {machine}, VNet bridge {data['bridge']} does not exist")
+                continue
+            ip.link("set", index=data["index"], master=bridge[0], state="up")
+    finally:
+        ip.close()
+
+
+def destroy_netns_machine(machine: str):
+    """
+    Destroy a netns machine, the host ends of its ports are deleted first as a process in the namespace would keep them around
+    :param str machine: The name of the machine to destroy
+    """
+    if not check_if_netns_machine_exists(machine):
+        logger.warning(f"Tried to delete netns machine {machine}, but it does not exist")
+        return
+    logger.info(f"Destroying netns machine {machine}")
+    ip = IPRoute()
+    try:
+        for port, data in get_netns_machine_ports(ip, machine).items():
+            try:
+                ip.link("del", index=data["index"])
+            except NetlinkError as e:
+                logger.warning(f"Unable to delete port {port} of netns machine {machine}, got error: {e}")
+    finally:
+        ip.close()
+    netns.remove(machine)
+
+
+def connect_to_netns_machine(machine: str) -> bool:
+    """
+    Try to connect to a netns machine using ip netns exec <machine> <shell>
+    :param str machine: the machine name to connect to
+    :return: bool: Whether the connection was successfully made
+    """
+    if not check_if_netns_machine_exists(machine):
+        logger.error(f"Unable to connect to netns machine {machine}, network namespace does not exist")
+        return False
+    logger.info(f"Connecting to netns machine {machine}")
+    call(["ip", "netns", "exec", machine, settings.SHELL])
+    logger.info("Connection closed, goodbye")
+    return True
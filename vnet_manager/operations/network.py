@@ -0,0 +1,134 @@
+from logging import getLogger
+from typing import Dict, List
+
+from vnet_manager.conf import settings
+from vnet_manager.config.topology import get_vnet_p2p_switches_from_config
+from vnet_manager.providers.lxc import get_lxd_client, use_lxd_remote
+
+logger = getLogger(__name__)
+
+
+def get_vnet_p2p_interface_names(switch: int) -> List[str]:
+    """
+    Get the names of the veth pair that wires a point-to-point switch
+    :param int switch: The number of the switch
+    :return: list: The names of both ends, the first end goes to the first machine on the switch
+    """
+    return [f"{settings.VNET_P2P_NAME}{switch}-{end}" for end in range(0, 2)]
+
+
+def get_vnet_bridged_switches_from_config(config: dict) -> List[int]:
+    """
+    Get the switches that are a VNet bridge, these are all switches that are not point-to-point
+    :param dict config: The config generated by get_config()
+    :return: list: The switch numbers
+    """
+    p2p = get_vnet_p2p_switches_from_config(config) if "machines" in config else {}
+    return [switch for switch in range(0, config["switches"]) if switch not in p2p]
+
+
+def get_vnet_lxd_remotes_from_config(config: dict) -> List[str]:
+    """
+    Get the LXD remotes that machines of the config are placed on, the local LXD is not included
+    :param dict config: The config validated by ValidateConfig, which places every machine on a remote
+    :return: list: The remote names, in the order of the lxd_remotes config item
+    """
+    used = {machine.get("remote") for machine in config["machines"].values()}
+    return [name for name in config.get("lxd_remotes", {}) if name != settings.LXC_LOCAL_REMOTE_NAME and name in used]
+
+
+def get_vnet_lxd_remote_number(config: dict, remote: str) -> int:
+    """
+    Get the number of an LXD remote, its position in the lxd_remotes config item starting at 1 (the local LXD is skipped)
+    :param dict config: The config generated by get_config()
+    :param str remote: The name of the remote
+    :return: int: The remote number
+    """
+    return [name for name in config["lxd_remotes"] if name != settings.LXC_LOCAL_REMOTE_NAME].index(remote) + 1
+
+
+def get_vnet_vxlan_id(config: dict, switch: int, remote: str) -> int:
+    """
+    Get the VXLAN id of the tunnel that stretches a VNet bridge to an LXD remote, every remote gets its own range of ids
+    :param dict config: The config generated by get_config()
+    :param int switch: The number of the VNet bridge
+    :param str remote: The name of the remote
+    :return: int: The VXLAN id
+    """
+    return settings.VNET_VXLAN_ID_BASE + get_vnet_lxd_remote_number(config, remote) * settings.VNET_VXLAN_ID_STRIDE + switch
+
+
+def get_vnet_vxlan_interfaces_from_config(config: dict) -> Dict[str, dict]:
+    """
+    Get the VXLAN interfaces that stretch the local VNet bridges to the LXD remotes
+    The local host is the hub, every remote only has a tunnel to the local host so the stretched bridges can not form a loop
+    :param dict config: The config generated by get_config()
+    :return: dict: interface name -> {"bridge": str, "id": int, "local": str, "remote": str}
+    """
+    interfaces = {}
+    for remote in get_vnet_lxd_remotes_from_config(config):
+        for switch in get_vnet_bridged_switches_from_config(config):
+            interfaces[f"{settings.VNET_VXLAN_NAME}{switch}-{get_vnet_lxd_remote_number(config, remote)}"] = {
+                "bridge": f"{settings.VNET_BRIDGE_NAME}{switch}",
+                "id": get_vnet_vxlan_id(config, switch, remote),
+                "local": config["lxd_remotes"][settings.LXC_LOCAL_REMOTE_NAME]["tunnel_address"],
+                "remote": config["lxd_remotes"][remote]["tunnel_address"],
+            }
+    return interfaces
+
+
+def generate_vnet_lxd_network_config(config: dict, switch: int, remote: str) -> dict:
+    """
+    Generates the config of the LXD managed bridge that is the VNet bridge on an LXD remote
+    The bridge is not addressed, so LXD does not route or NAT the VNet traffic, and is tunneled to the local host
+    :param dict config: The config generated by get_config()
+    :param int switch: The number of the VNet bridge
+    :param str remote: The name of the remote
+    :return: dict: The LXD network config
+    """
+    tunnel = f"tunnel.{settings.VNET_VXLAN_LXD_TUNNEL_NAME}"
+    return {
+        "ipv4.address": "none",
+        "ipv6.address": "none",
+        f"{tunnel}.protocol": "vxlan",
+        f"{tunnel}.id": str(get_vnet_vxlan_id(config, switch, remote)),
+        f"{tunnel}.local": config["lxd_remotes"][remote]["tunnel_address"],
+        f"{tunnel}.remote": config["lxd_remotes"][settings.LXC_LOCAL_REMOTE_NAME]["tunnel_address"],
+        f"{tunnel}.port": str(settings.VNET_VXLAN_PORT),
+    }
+
+
+def ensure_vnet_lxd_networks(config: dict):
+    """
+    Creates the VNet bridges on the LXD remotes that machines of the config are placed on
+    :param dict config: The config generated by get_config()
+    """
+    for remote in get_vnet_lxd_remotes_from_config(config):
+        with use_lxd_remote(remote):
+            client = get_lxd_client()
+        for switch in get_vnet_bridged_switches_from_config(config):
+            name = f"{settings.VNET_BRIDGE_NAME}{switch}"
+            if client.networks.exists(name):
+                logger.debug(f"VNet bridge {name} found on LXD remote {remote}")
+                continue
+            logger.info(f"Creating VNet bridge {name} on LXD remote {remote}")
+            client.networks.create(
+                name, description="VNet bridge", type="bridge", config=generate_vnet_lxd_network_config(config, switch, remote)
+            )
+
+
+def delete_vnet_lxd_networks(config: dict):
+    """
+    Deletes the VNet bridges on the LXD remotes that machines of the config are placed on
+    :param dict config: The config generated by get_config()
+    """
+    for remote in get_vnet_lxd_remotes_from_config(config):
+        with use_lxd_remote(remote):
+            client = get_lxd_client()
+        for switch in get_vnet_bridged_switches_from_config(config):
+            name = f"{settings.VNET_BRIDGE_NAME}{switch}"
+            if not client.networks.exists(name):
+                logger.info(f"Tried to delete VNet bridge {name} on LXD remote {remote}, but it is already gone. That's okay")
+                continue
+            logger.info(f"Deleting VNet bridge {name} on LXD remote {remote}")
+            client.networks.get(name).delete()
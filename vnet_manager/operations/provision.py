@@ -0,0 +1,122 @@
+from logging import getLogger
+from time import perf_counter
+from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tabulate import tabulate
+
+import vnet_manager.operations.machine as machine_op
+from vnet_manager.operations.files import put_files_on_machine, place_vnet_hosts_file_on_machines
+
+logger = getLogger(__name__)
+
+PROVISION_STAGES = ["create", "devices", "netplan", "files", "hosts", "sysctl"]
+
+
+def provision_machine(
+    config: dict,
+    name: str,
+    create: bool = True,
+    devices: bool = False,
+    files: bool = True,
+    hosts: bool = True,
+    create_operation: Optional[str] = None,
+) -> dict:
+    """
+    Run the provisioning pipeline of a single machine: create -> devices -> netplan -> files -> hosts -> sysctl
+    The pipeline stops at the first stage that fails, its error is returned so the pipelines of the other machines can finish
+    :param dict config: The config generated by get_config()
+    :param str name: The name of the machine to provision
+    :param bool create: Create the machine, disable for machines that already exist.
+        The network config of existing machines is applied right away
+    :param bool devices: Update the devices of an existing machine to match the config
+    :param bool files: Place the user requested files, /etc/hosts and type specific config on the machine,
+        disable to only re-wire the NICs of an existing machine
+    :param bool hosts: Place the VNet /etc/hosts file on the machine
+    :param str create_operation: The create operation of the machine if it has been submitted already,
+        the create stage then only waits for it
+    :return: dict: The duration of each stage that ran in seconds, and the error of the failed stage (if any)
+    """
+    stages = {
+        "create": lambda: machine_op.wait_for_lxc_machine_creation(
+            name, create_operation or machine_op.submit_lxc_machine_creation(config, name)
+        ),
+        "devices": lambda: machine_op.update_lxc_machine_devices(config, name),
+        "netplan": lambda: machine_op.place_lxc_interface_configuration_on_container(config, name, apply=not create),
+        "files": lambda: put_files_on_machine(config, machines=[name]),
+        "hosts": lambda: place_vnet_hosts_file_on_machines(config, machines=[name]),
+        "sysctl": lambda: machine_op.enable_type_specific_machine_configuration(config, machines=[name]),
+    }
+    if not create:
+        del stages["create"]
+    if not devices:
+        del stages["devices"]
+    if not files:
+        for stage in ("files", "hosts", "sysctl"):
+            del stages[stage]
+    elif not hosts:
+        del stages["hosts"]
+    result = {"stages": {}, "error": None}
+    for stage, func in stages.items():
+        start = perf_counter()
+        try:
+            func()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error(f"Provisioning stage {stage} failed for machine {name}, got error: {e}")
+            result["error"] = f"{stage}: {e}"
+        result["stages"][stage] = perf_counter() - start
+        if result["error"]:
+            break
+    return result
+
+
+def run_provision_pipelines(config: dict, jobs: Dict[str, dict], parallel: int = 1, hosts: bool = True) -> Dict[str, str]:
+    """
+    Run the provisioning pipelines of multiple machines concurrently
+    The creation of all machines is submitted up front, so LXD creates them together while the pipelines wait for them.
+    The uploads to one machine overlap with the creation of the others
+    :param dict config: The config generated by get_config()
+    :param dict jobs: machine name -> provision_machine() keyword arguments, such as create and devices
+    :param int parallel: The amount of machine pipelines to run concurrently
+    :param bool hosts: Place the VNet /etc/hosts file on the machines, it should have been generated already
+    :return: dict: The machines that failed to be provisioned, with the error message
+    """
+    results = {}
+    create_operations = {}
+    for name, job in jobs.items():
+        if not job.get("create", True):
+            continue
+        start = perf_counter()
+        try:
+            create_operations[name] = machine_op.submit_lxc_machine_creation(config, name)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error(f"Provisioning stage create failed for machine {name}, got error: {e}")
+            results[name] = {"stages": {"create": perf_counter() - start}, "error": f"create: {e}"}
+    logger.info(f"Provisioning {len(jobs)} machine(s) with {parallel} concurrent pipeline(s)")
+    with ThreadPoolExecutor(max_workers=max(parallel, 1)) as executor:
+        futures = {
+            executor.submit(provision_machine, config, name, hosts=hosts, create_operation=create_operations.get(name), **job): name
+            for name, job in jobs.items()
+            if name not in results
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            logger.info(f"Provisioned machine {futures[future]} ({done}/{len(futures)})")
+    show_provision_summary(results)
+    return {name: result["error"] for name, result in results.items() if result["error"]}
+
+
+def show_provision_summary(results: Dict[str, dict]):
+    """
+    Shows the provisioning stage durations and result of each machine to the user
+    :param dict results: machine name -> result returned by provision_machine()
+    """
+    header = ["Name"] + [stage.capitalize() for stage in PROVISION_STAGES] + ["Total", "Result"]
+    rows = []
+    for name in sorted(results):
+        stages = results[name]["stages"]
+        rows.append(
+            [name]
+            + [f"{stages[stage]:.2f}s" if stage in stages else "-" for stage in PROVISION_STAGES]
+            + [f"{sum(stages.values()):.2f}s", results[name]["error"] or "OK"]
+        )
+    print(tabulate(rows, headers=header, tablefmt="pretty"))
@@ -0,0 +1,312 @@
+from logging import getLogger
+from typing import Dict, List, NamedTuple, Optional
+from pyroute2.iproute import IPRoute
+from tabulate import tabulate
+from yaml import safe_dump
+
+import vnet_manager.operations.machine as machine_op
+from vnet_manager.conf import settings
+from vnet_manager.operations.files import (
+    get_files_to_put_on_machine,
+    get_file_sha256,
+    get_lxc_file_manifest,
+    get_sha256,
+    generate_vnet_hosts_file,
+)
+from vnet_manager.operations.interface import (
+    get_interface_link_map,
+    get_vnet_interface_names_from_config,
+    bring_up_vnet_interfaces,
+    delete_vnet_interface_iptables_rules,
+)
+from vnet_manager.operations.netns import get_netns_machine_port_names
+from vnet_manager.operations.provision import run_provision_pipelines
+from vnet_manager.providers.lxc import use_lxd_remote
+from vnet_manager.utils.user import request_confirmation
+
+logger = getLogger(__name__)
+
+RECONCILE_ACTION_SYMBOLS = {"add": "+", "remove": "-", "modify": "~"}
+
+
+class Change(NamedTuple):
+    """
+    A single change of a reconcile plan
+    """
+
+    action: str  # add, remove or modify
+    kind: str  # machine, nic, file, bridge or veth
+    name: str  # The machine or interface name
+    detail: str = ""  # The NIC or file of the machine that changes
+    remote: Optional[str] = None  # The LXD remote of a machine that is removed, None is the local LXD
+
+
+def is_vnet_lxc_instance(instance: dict) -> bool:
+    """
+    Check if a LXC instance has been created by VNet-manager, these use the VNet profile
+    :param dict instance: The instance data returned by the LXD API
+    :return: bool: True if the instance is a VNet machine, the base image and golden machines are not
+    """
+    return settings.LXC_VNET_PROFILE in instance.get("profiles", []) and instance["name"] not in (
+        settings.LXC_BASE_IMAGE_MACHINE_NAME,
+        settings.LXC_GOLDEN_MACHINE_NAME,
+    )
+
+
+def get_vnet_lxc_instances(remote_instances: Optional[dict] = None) -> Dict[str, dict]:
+    """
+    Get the LXC instances that have been created by VNet-manager
+    :param dict remote_instances: The instances fetched per LXD client, see machine_op.get_lxc_remote_instances()
+    :return: dict: The instance data, by instance name
+    """
+    return {
+        name: instance
+        for name, instance in machine_op.get_lxc_instances(remote_instances=remote_instances).items()
+        if is_vnet_lxc_instance(instance)
+    }
+
+
+def plan_stale_machine_changes(config: dict, remote_instances: Optional[dict] = None) -> List[Change]:
+    """
+    Plan the removal of the VNet LXC instances that are not in the config, on the LXD remote they are found on
+    :param dict config: The config generated by get_config()
+    :param dict remote_instances: The instances fetched per LXD client, see machine_op.get_lxc_remote_instances()
+    :return: list: The planned changes
+    """
+    return [
+        Change("remove", "machine", instance["name"], remote=remote)
+        for remote, instances in machine_op.get_lxc_remote_instances(remote_instances=remote_instances).items()
+        for instance in sorted(instances, key=lambda instance: instance["name"])
+        if is_vnet_lxc_instance(instance) and instance["name"] not in config["machines"]
+    ]
+
+
+def is_lxc_machine(config: dict, name: str) -> bool:
+    """
+    Check if a machine in the config is provided by LXC, only those are provisioned by the reconcile pipelines
+    :param dict config: The config generated by get_config()
+    :param str name: The name of the machine
+    :return: bool: True if the machine is a LXC machine
+    """
+    return settings.MACHINE_TYPE_PROVIDER_MAPPING[config["machines"][name]["type"]] == "lxc"
+
+
+def get_desired_lxc_machine_files(config: dict, name: str, hosts: bool = True) -> Dict[str, str]:
+    """
+    Get the files VNet-manager places on a LXC machine, with the hash of their desired content
+    :param dict config: The config generated by get_config()
+    :param str name: The name of the machine
+    :param bool hosts: Include the VNet /etc/hosts file, it should have been generated already
+    :return: dict: guest path -> SHA-256 hex digest
+    """
+    machine_type = config["machines"][name]["type"]
+    files = {settings.VNET_NETPLAN_CONFIG_FILE_PATH: get_sha256(safe_dump(machine_op.generate_machine_netplan_config(config, name)))}
+    for host_path, guest_path in get_files_to_put_on_machine(config["machines"][name].get("files", {})):
+        files[guest_path] = get_file_sha256(host_path)
+    if hosts:
+        files["/etc/hosts"] = get_file_sha256(settings.VNET_ETC_HOSTS_FILE_PATH)
+    forwarding = f"enable_{settings.MACHINE_TYPE_PROVIDER_MAPPING[machine_type]}_ip_forwarding"
+    enable = forwarding in settings.MACHINE_TYPE_CONFIG_FUNCTION_MAPPING[machine_type]
+    for guest_path, data in machine_op.get_lxc_ip_forwarding_files(enable=enable).items():
+        files[guest_path] = get_sha256(data)
+    return files
+
+
+def plan_machine_changes(config: dict, instances: Dict[str, dict], machines: List[str], hosts: bool = True) -> List[Change]:
+    """
+    Compare the desired machines with the VNet LXC instances and plan the changes
+    :param dict config: The config generated by get_config()
+    :param dict instances: The instances returned by get_vnet_lxc_instances()
+    :param list machines: The machines to plan the changes for
+    :param bool hosts: Take the VNet /etc/hosts file into account
+    :return: list: The planned changes
+    """
+    plan = []
+    for name in machines:
+        provider = settings.MACHINE_TYPE_PROVIDER_MAPPING[config["machines"][name]["type"]]
+        if provider != "lxc":
+            # Machines of the other providers are only created, their config is applied on creation
+            if getattr(machine_op, f"get_{provider}_machine_status")(name)[1] == "NA":
+                plan.append(Change("add", "machine", name))
+            continue
+        if name not in instances:
+            plan.append(Change("add", "machine", name))
+            continue
+        desired = machine_op.generate_lxc_container_config(config, name)["devices"]
+        actual = instances[name].get("devices", {})
+        for device in sorted(set(desired) | set(actual)):
+            if device not in actual:
+                plan.append(Change("add", "nic", name, device))
+            elif device not in desired:
+                plan.append(Change("remove", "nic", name, device))
+            elif desired[device] != actual[device]:
+                plan.append(Change("modify", "nic", name, device))
+        manifest = get_lxc_file_manifest(name, instances[name].get("config", {}))
+        for guest_path, digest in sorted(get_desired_lxc_machine_files(config, name, hosts=hosts).items()):
+            if manifest.get(guest_path) != digest:
+                plan.append(Change("modify", "file", name, guest_path))
+    return plan
+
+
+def plan_interface_changes(config: dict, instances: Dict[str, dict], links: Dict[str, dict], prune: bool = False) -> List[Change]:
+    """
+    Compare the desired VNet bridges and veths with the links on the host and plan the changes
+    Nothing is planned while none of the VNet bridges exist, as 'start' creates the interfaces
+    :param dict config: The config generated by get_config()
+    :param dict instances: The instances returned by get_vnet_lxc_instances(), used to recognize the machine NICs
+        The ports of the netns machines in the config are recognized as machine NICs too
+    :param dict links: The links returned by get_interface_link_map()
+    :param bool prune: Remove the VNet bridges and veths that are not in the config, these may belong to another config
+    :return: list: The planned changes
+    """
+    bridges = get_vnet_interface_names_from_config(config)
+    if not any(bridge in links for bridge in bridges):
+        return []
+    plan = [Change("add", "bridge", bridge) for bridge in bridges if bridge not in links]
+    veths = config.get("veths", {})
+    plan.extend(Change("add", "veth", name) for name in veths if name not in links)
+    if not prune:
+        return plan
+    plan.extend(
+        Change("remove", "bridge", name)
+        for name, link in sorted(links.items())
+        if link["kind"] == "bridge" and name.startswith(settings.VNET_BRIDGE_NAME) and name not in bridges
+    )
+    # Veths enslaved to a VNet bridge that are neither configured nor a machine NIC are left overs of a previous config
+    bridge_indexes = {link["index"] for name, link in links.items() if name.startswith(settings.VNET_BRIDGE_NAME)}
+    machine_nics = {
+        value
+        for instance in instances.values()
+        for source in (instance.get("config", {}), *instance.get("devices", {}).values())
+        for key, value in source.items()
+        if key == "host_name" or key.endswith(".host_name")
+    }
+    machine_nics.update(
+        port
+        for name, machine in config["machines"].items()
+        if settings.MACHINE_TYPE_PROVIDER_MAPPING[machine["type"]] == "netns"
+        for port in get_netns_machine_port_names(config, name).values()
+    )
+    plan.extend(
+        Change("remove", "veth", name)
+        for name, link in sorted(links.items())
+        if link["kind"] == "veth" and link["master"] in bridge_indexes and name not in veths and name not in machine_nics
+    )
+    return plan
+
+
+def get_reconcile_plan(config: dict, machines: Optional[List[str]] = None, hosts: bool = True, prune: bool = False) -> List[Change]:
+    """
+    Compute the changes needed to bring the live state in line with the config
+    :param dict config: The config generated by get_config()
+    :param list machines: Only plan the changes of these machines, no machines or interfaces are removed.
+        Defaults to all machines in the config
+    :param bool hosts: Take the VNet /etc/hosts file into account
+    :param bool prune: Remove the VNet machines and interfaces that are not in the config.
+        These may belong to another config on this host, so they are left alone by default
+    :return: list: The planned changes
+    """
+    # Both the machines and the stale instances are planned from a single API call per LXD remote
+    remote_instances = {}
+    instances = get_vnet_lxc_instances(remote_instances=remote_instances)
+    plan = []
+    if machines:
+        unknown = [name for name in machines if name not in config["machines"]]
+        for name in unknown:
+            logger.error(f"Machine {name} was not found in the config, skipping")
+        return plan_machine_changes(config, instances, [name for name in machines if name not in unknown], hosts=hosts)
+    if prune:
+        plan.extend(plan_stale_machine_changes(config, remote_instances=remote_instances))
+    plan.extend(plan_machine_changes(config, instances, list(config["machines"]), hosts=hosts))
+    ip = IPRoute()
+    try:
+        plan.extend(plan_interface_changes(config, instances, get_interface_link_map(ip), prune=prune))
+    finally:
+        ip.close()
+    return plan
+
+
+def show_reconcile_plan(plan: List[Change]):
+    """
+    Shows the planned changes to the user
+    :param list plan: The changes returned by get_reconcile_plan()
+    """
+    if not plan:
+        logger.info("Everything is up to date, no changes needed")
+        return
+    rows = [[RECONCILE_ACTION_SYMBOLS[change.action], change.kind, change.name, change.detail] for change in plan]
+    print(tabulate(rows, headers=["Action", "Type", "Name", "Detail"], tablefmt="pretty"))
+
+
+def apply_reconcile_plan(config: dict, plan: List[Change], parallel: int = 1, hosts: bool = True) -> Dict[str, str]:
+    """
+    Apply the planned changes, machines that are not part of the plan are left alone
+    :param dict config: The config generated by get_config()
+    :param list plan: The changes returned by get_reconcile_plan()
+    :param int parallel: The amount of machine pipelines to run concurrently
+    :param bool hosts: Place the VNet /etc/hosts file on the changed machines
+    :return: dict: The machines that failed to be provisioned, with the error message
+    """
+    for change in plan:
+        if change.kind == "machine" and change.action == "remove":
+            # Stale machines are not in the config, so they are deleted on the remote they were found on
+            with use_lxd_remote(change.remote):
+                machine_op.destroy_lxc_machine(change.name, wait=True)
+    removed_links = [change.name for change in plan if change.kind in ("bridge", "veth") and change.action == "remove"]
+    if removed_links:
+        ip = IPRoute()
+        try:
+            for ifname in removed_links:
+                logger.info(f"Deleting stale VNet interface {ifname}")
+                ip.link("del", ifname=ifname)
+        finally:
+            ip.close()
+        delete_vnet_interface_iptables_rules([change.name for change in plan if change.kind == "bridge" and change.action == "remove"])
+    if any(change.kind in ("bridge", "veth") and change.action == "add" for change in plan):
+        bring_up_vnet_interfaces(config)
+
+    jobs = {}
+    failures = {}
+    for change in plan:
+        if change.kind == "machine" and change.action == "add" and not is_lxc_machine(config, change.name):
+            failures.update(machine_op.create_machines(config, machines=[change.name]))
+        elif change.kind == "machine" and change.action == "add":
+            jobs[change.name] = {"create": True}
+        elif change.kind in ("nic", "file"):
+            # Only NICs that changed are re-wired, only the netplan config is pushed again unless other files changed too
+            job = jobs.setdefault(change.name, {"create": False, "devices": False, "files": False})
+            job["devices"] |= change.kind == "nic"
+            job["files"] |= change.kind == "file" and change.detail != settings.VNET_NETPLAN_CONFIG_FILE_PATH
+    if jobs:
+        failures.update(run_provision_pipelines(config, jobs, parallel=parallel, hosts=hosts))
+    return failures
+
+
+def reconcile_machines(
+    config: dict,
+    machines: Optional[List[str]] = None,
+    parallel: int = 1,
+    hosts: bool = True,
+    dry_run: bool = False,
+    prune: bool = False,
+) -> Dict[str, str]:
+    """
+    Bring the machines and interfaces in line with the config: plan the changes, show them and apply only those
+    :param dict config: The config generated by get_config()
+    :param list machines: Only reconcile these machines, defaults to all machines in the config
+    :param int parallel: The amount of machine pipelines to run concurrently
+    :param bool hosts: Generate the VNet /etc/hosts file and place it on the machines
+    :param bool dry_run: Only show the planned changes
+    :param bool prune: Remove the VNet machines and interfaces that are not in the config
+    :return: dict: The machines that failed to be provisioned, with the error message
+    """
+    if hosts:
+        generate_vnet_hosts_file(config)
+    plan = get_reconcile_plan(config, machines=machines, hosts=hosts, prune=prune)
+    show_reconcile_plan(plan)
+    if dry_run or not plan:
+        return {}
+    # Changes to existing machines and interfaces overwrite or destroy things, so check with the user first
+    if any(change.action != "add" or change.kind != "machine" for change in plan):
+        request_confirmation(message="The changes above will modify or remove existing machines and interfaces")
+    return apply_reconcile_plan(config, plan, parallel=parallel, hosts=hosts)
@@ -0,0 +1,148 @@
+from json import dump, load
+from logging import getLogger
+from os import kill, makedirs, remove
+from os.path import join, isfile, getsize, basename, splitext
+from datetime import datetime
+from glob import glob
+from typing import Dict, List, Optional
+from psutil import Process, NoSuchProcess
+from tabulate import tabulate
+
+from vnet_manager.conf import settings
+
+logger = getLogger(__name__)
+
+
+def get_sniffer_state_file_path(ifname: str) -> str:
+    """
+    Get the path of the registry state file for a sniffer
+    :param str ifname: The interface the sniffer captures on
+    :return: str: The path of the state file
+    """
+    return join(settings.VNET_SNIFFER_STATE_DIR, f"{ifname}.json")
+
+
+def register_sniffer(ifname: str, pid: int, pcap_path: str, pcap_files: Optional[str] = None):
+    """
+    Add a sniffer to the registry, any previous registration for the interface is overwritten
+    :param str ifname: The interface the sniffer captures on
+    :param int pid: The PID of the sniffer process
+    :param str pcap_path: The PCAP file the sniffer writes to
+    :param str pcap_files: A glob matching all (rotated) PCAP files of the sniffer, defaults to the PCAP file
+    """
+    makedirs(settings.VNET_SNIFFER_STATE_DIR, exist_ok=True)
+    state = {
+        "pid": pid,
+        "interface": ifname,
+        "pcap": pcap_path,
+        "pcap_files": pcap_files or pcap_path,
+        "started": datetime.now().isoformat(timespec="seconds"),
+        # Used to make sure the PID has not been recycled by another process
+        "create_time": Process(pid).create_time(),
+    }
+    with open(get_sniffer_state_file_path(ifname), "w", encoding="utf-8") as fh:
+        dump(state, fh)
+    logger.debug(f"Registered sniffer with PID {pid} on interface {ifname}")
+
+
+def unregister_sniffer(ifname: str):
+    """
+    Remove a sniffer from the registry
+    :param str ifname: The interface the sniffer captures on
+    """
+    try:
+        remove(get_sniffer_state_file_path(ifname))
+        logger.debug(f"Unregistered sniffer on interface {ifname}")
+    except FileNotFoundError:
+        pass
+
+
+def check_if_sniffer_is_alive(state: dict) -> bool:
+    """
+    Check if the process of a registered sniffer is still running
+    :param dict state: The sniffer registry state
+    :return: bool: True if the process is alive, False otherwise
+    """
+    try:
+        kill(state["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists, we are just not allowed to signal it
+        pass
+    try:
+        return Process(state["pid"]).create_time() == state["create_time"]
+    except NoSuchProcess:
+        return False
+
+
+def get_registered_sniffer(ifname: str) -> Optional[dict]:
+    """
+    Get the registry state of the sniffer on an interface
+    Registrations of sniffers that are no longer running are cleaned up
+    :param str ifname: The interface to get the sniffer for
+    :return: dict: The sniffer state, or None if there is no running sniffer on the interface
+    """
+    try:
+        with open(get_sniffer_state_file_path(ifname), "r", encoding="utf-8") as fh:
+            state = load(fh)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logger.warning(f"Sniffer registry state for interface {ifname} is corrupt, removing it")
+        unregister_sniffer(ifname)
+        return None
+    if not check_if_sniffer_is_alive(state):
+        logger.debug(f"Registered sniffer with PID {state['pid']} on interface {ifname} is no longer running")
+        unregister_sniffer(ifname)
+        return None
+    return state
+
+
+def get_registered_sniffers(ifnames: Optional[List[str]] = None) -> Dict[str, dict]:
+    """
+    Get the registry states of the running sniffers
+    :param list ifnames: The interfaces to get the sniffers for, defaults to all registered sniffers
+    :return: dict: interface name -> sniffer state, for each interface that has a running sniffer
+    """
+    if ifnames is None:
+        ifnames = sorted(splitext(basename(path))[0] for path in glob(get_sniffer_state_file_path("*")))
+    sniffers = {}
+    for ifname in ifnames:
+        state = get_registered_sniffer(ifname)
+        if state:
+            sniffers[ifname] = state
+    return sniffers
+
+
+def get_sniffer_pid_map(ifnames: Optional[List[str]] = None) -> Dict[str, List[int]]:
+    """
+    Get the PIDs of the running sniffers, indexed by interface name
+    :param list ifnames: The interfaces to get the sniffers for, defaults to all registered sniffers
+    :return: dict: interface name -> list of sniffer PIDs
+    """
+    return {ifname: [state["pid"]] for ifname, state in get_registered_sniffers(ifnames).items()}
+
+
+def get_captured_bytes(state: dict) -> Optional[int]:
+    """
+    Get the amount of bytes a sniffer has written to disk, including rotated (and compressed) PCAP files
+    :param dict state: The sniffer registry state
+    :return: int: The size of the PCAP files, or None if there are none (yet)
+    """
+    pcap_files = [path for path in glob(state.get("pcap_files", state["pcap"])) if isfile(path)]
+    return sum(getsize(path) for path in pcap_files) if pcap_files else None
+
+
+def show_sniffer_status(ifnames: Optional[List[str]] = None):
+    """
+    Shows the registered sniffers to the user
+    :param list ifnames: The interfaces to show the sniffers for, defaults to all registered sniffers
+    """
+    logger.info("Listing VNet sniffers")
+    header = ["Interface", "PID", "Started", "PCAP", "Captured (bytes)"]
+    statuses = []
+    for ifname, state in get_registered_sniffers(ifnames).items():
+        captured = get_captured_bytes(state)
+        statuses.append([ifname, state["pid"], state["started"], state["pcap"], "NA" if captured is None else captured])
+    print(tabulate(statuses, headers=header, tablefmt="pretty"))
@@ -1,19 +1,257 @@
 import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from json import loads
 from logging import getLogger
+from os import register_at_fork
+from queue import Queue
+from threading import Lock, Thread
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlparse
 from pylxd import client
 from pylxd.exceptions import ClientConnectionFailed
+from requests.adapters import HTTPAdapter
+from ws4py.client import WebSocketBaseClient
+from ws4py.exc import WebSocketException
+
+from vnet_manager.conf import settings
 
 logger = getLogger(__name__)
 
+# Process wide LXD client pool, keyed by the kwargs the client was created with
+_lxd_clients = {}
+_lxd_clients_lock = Lock()
+_lxd_handshakes = 0
+# The LXD remotes of the config and the remote each machine is placed on, see configure_lxd_remotes()
+_lxd_remotes: Dict[str, dict] = {}
+_lxd_machine_remotes: Dict[str, str] = {}
+# The client parameters of the remote that get_lxd_client() connects to when called without parameters
+_lxd_active_remote: ContextVar[dict] = ContextVar("lxd_active_remote", default={})
+
 
 def get_lxd_client(**kwargs) -> client.Client:
     """
     Get an LXC client.Client() with the passed parameters
+    Clients are shared process wide, so the connection setup (and /1.0 handshake) is only done once per set of parameters
+    Without parameters the client of the active LXD remote is returned, see use_lxd_remote()
     :return: pylxd.client.Client()
     """
+    kwargs = kwargs or _lxd_active_remote.get()
+    key = tuple(sorted(kwargs.items()))
+    with _lxd_clients_lock:
+        if key not in _lxd_clients:
+            _lxd_clients[key] = create_lxd_client(**kwargs)
+        return _lxd_clients[key]
+
+
+def create_lxd_client(**kwargs) -> client.Client:
+    """
+    Create a new LXC client.Client() with the passed parameters, bypassing the client pool
+    The HTTP adapter of the client session is re-mounted with the pool size from the settings
+    :return: pylxd.client.Client()
+    """
+    global _lxd_handshakes  # pylint: disable=global-statement
     try:
-        return client.Client(**kwargs)
+        lxd_client = client.Client(**kwargs)
     except ClientConnectionFailed as e:
         logger.error(f"Error while connecting to LXD: {e}")
         logger.critical("Unable to talk to LXD API, crashing out of program")
         sys.exit(1)
+    _lxd_handshakes += 1
+    configure_lxd_client_session(lxd_client.api.session)
+    return lxd_client
+
+
+def configure_lxd_client_session(session, pool_size: int = settings.LXC_CLIENT_POOL_SIZE):
+    """
+    Replace the adapters of a LXD client session with adapters that keep up to pool_size connections per LXD host alive,
+    so concurrent workers reuse their connections instead of opening a new one per request
+    :param requests.Session session: The session used by the LXD client
+    :param int pool_size: The amount of connections to keep alive per LXD host, should be at least the amount of workers
+    """
+    for prefix, adapter in list(session.adapters.items()):
+        if prefix.startswith("http+unix://"):
+            session.mount(prefix, LXDUnixSocketAdapter(adapter, pool_size))
+            continue
+        try:
+            session.mount(prefix, type(adapter)(pool_maxsize=pool_size))
+        except TypeError:
+            logger.debug(f"LXD session adapter for {prefix} does not support pool configuration, leaving it as is")
+
+
+class LXDUnixSocketAdapter(HTTPAdapter):
+    """
+    Unix socket adapter that shares a single connection pool per LXD socket
+    The adapter of PyLXD creates a pool per URL, which only keeps one connection alive
+    """
+
+    def __init__(self, adapter: HTTPAdapter, pool_size: int):
+        """
+        :param requests.adapters.HTTPAdapter adapter: The unix socket adapter of PyLXD, used to create the connection pools
+        :param int pool_size: The amount of connections to keep alive per socket
+        """
+        super().__init__(pool_maxsize=pool_size)
+        self.adapter = adapter
+        self.pool_size = pool_size
+        self.pools = {}
+        self.pools_lock = Lock()
+
+    def get_connection(self, url, proxies=None):
+        socket = urlparse(url).netloc
+        with self.pools_lock:
+            if socket not in self.pools:
+                pool = self.adapter.get_connection(url, proxies)
+                # The pool is created with room for a single connection, make room for pool_size (like urllib3 does on init)
+                pool.pool = pool.QueueCls(self.pool_size)
+                for _ in range(self.pool_size):
+                    pool.pool.put(None)
+                self.pools[socket] = pool
+            return self.pools[socket]
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):  # pylint: disable=unused-argument
+        # Used instead of get_connection() by newer versions of requests, there is no TLS on the socket
+        return self.get_connection(request.url, proxies)
+
+    def request_url(self, request, proxies):
+        return self.adapter.request_url(request, proxies)
+
+    def close(self):
+        with self.pools_lock:
+            for pool in self.pools.values():
+                pool.close()
+            self.pools.clear()
+        self.adapter.close()
+
+
+def reset_lxd_client_pool():
+    """
+    Drop all pooled LXD clients, the next get_lxd_client() call will create a fresh connection
+    Called automatically in forked child processes, as sockets must not be shared with the parent
+    """
+    global _lxd_clients_lock  # pylint: disable=global-statement
+    # The lock might have been held by another thread while forking, so we replace it
+    _lxd_clients_lock = Lock()
+    _lxd_clients.clear()
+
+
+def get_lxd_remote_client_kwargs(remote: dict) -> dict:
+    """
+    Get the LXD client parameters of a remote from the config
+    :param dict remote: The remote config, see the lxd_remotes config item
+    :return: dict: The client.Client() parameters, empty for the local LXD
+    """
+    kwargs = {key: remote[key] for key in ("endpoint", "verify") if key in remote}
+    if "cert" in remote:
+        # The parameters are part of the client pool key, so they must be hashable
+        kwargs["cert"] = tuple(remote["cert"]) if isinstance(remote["cert"], list) else remote["cert"]
+    return kwargs
+
+
+def configure_lxd_remotes(config: dict):
+    """
+    Register the LXD remotes of the config and the remote each machine is placed on
+    The placement is done by the config validator, machines without a remote run on the local LXD
+    :param dict config: The validated config
+    """
+    _lxd_remotes.clear()
+    _lxd_machine_remotes.clear()
+    for name, remote in config.get("lxd_remotes", {}).items():
+        _lxd_remotes[name] = get_lxd_remote_client_kwargs(remote)
+    for name, machine in config.get("machines", {}).items():
+        if machine.get("remote", settings.LXC_LOCAL_REMOTE_NAME) != settings.LXC_LOCAL_REMOTE_NAME:
+            _lxd_machine_remotes[name] = machine["remote"]
+
+
+def get_lxd_remotes() -> List[Optional[str]]:
+    """
+    Get the LXD remotes machines can be placed on
+    :return: list: The remote names, None is the local LXD
+    """
+    return [None] + [name for name in _lxd_remotes if name != settings.LXC_LOCAL_REMOTE_NAME]
+
+
+def get_lxd_machine_remote(machine: str) -> Optional[str]:
+    """
+    Get the LXD remote a machine is placed on
+    :param str machine: The name of the machine
+    :return: str: The remote name, None if the machine runs on the local LXD
+    """
+    return _lxd_machine_remotes.get(machine)
+
+
+@contextmanager
+def use_lxd_remote(remote: Optional[str]) -> Iterator[None]:
+    """
+    Make get_lxd_client() connect to an LXD remote within the context, the context is local to the current thread
+    :param str remote: The remote name, None for the local LXD
+    """
+    token = _lxd_active_remote.set(_lxd_remotes.get(remote, {}) if remote else {})
+    try:
+        yield
+    finally:
+        _lxd_active_remote.reset(token)
+
+
+@contextmanager
+def use_lxd_machine_remote(machine: str) -> Iterator[None]:
+    """
+    Make get_lxd_client() connect to the LXD remote a machine is placed on within the context
+    The context is local to the current thread, so it must be entered in the thread that uses the client
+    :param str machine: The name of the machine
+    """
+    if machine not in _lxd_machine_remotes:
+        # Machines without a remote, such as the base image machine, use the active remote
+        yield
+        return
+    with use_lxd_remote(_lxd_machine_remotes[machine]):
+        yield
+
+
+def get_lxd_handshake_count() -> int:
+    """
+    Get the amount of LXD client handshakes that have been performed since the last reset
+    :return: int: The amount of handshakes
+    """
+    return _lxd_handshakes
+
+
+def reset_lxd_handshake_count():
+    """
+    Reset the LXD client handshake counter
+    """
+    global _lxd_handshakes  # pylint: disable=global-statement
+    _lxd_handshakes = 0
+
+
+class LXDEventListener(WebSocketBaseClient):
+    """
+    Websocket client for the LXD /1.0/events endpoint
+    All received events are put on the events queue, so they can be consumed from another thread
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.events = Queue()
+
+    def received_message(self, message):
+        self.events.put(loads(message.data.decode("utf-8")))
+
+
+def get_lxd_lifecycle_event_listener() -> Optional[LXDEventListener]:
+    """
+    Subscribe to the LXD lifecycle and operation events, the listener runs in a background thread until it is closed
+    :return: LXDEventListener: The connected listener, or None if the subscription failed
+    """
+    listener = get_lxd_client().events(
+        websocket_client=LXDEventListener, event_types={client.EventType.Lifecycle, client.EventType.Operation}
+    )
+    try:
+        listener.connect()
+    except (OSError, WebSocketException) as e:
+        logger.warning(f"Unable to subscribe to LXD lifecycle events, got error: {e}")
+        return None
+    Thread(target=listener.run, daemon=True).start()
+    return listener
+
+
+register_at_fork(after_in_child=reset_lxd_client_pool)
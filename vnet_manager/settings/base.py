@@ -44,7 +44,6 @@ LOGGING = {
             "level": "CRITICAL",
         },
         "pyroute2": {"level": "INFO"},
-        "pyroute2.ndb": {"level": "WARNING"},
     },
 }
 LOGGING_DEFAULT_VERBOSITY = 3  # logging.INFO
@@ -76,20 +75,53 @@ PROVIDERS = {
             "server": "https://cloud-images.ubuntu.com/daily",
             "protocol": "simplestreams",
         },
-    }
+    },
+    # Plain network namespaces, machines without a userland of their own. Lightweight enough to run thousands of hosts
+    "netns": {
+        "supported_operating_systems": ["bionic", "focal", "jammy"],
+    },
 }
 SHELL = "/bin/bash"
 VNET_BRIDGE_NAME = "vnet-br"
+# VNet bridges are stretched to the LXD remotes with a VXLAN tunnel per switch and remote
+VNET_VXLAN_NAME = "vnet-vx"  # Followed by the switch and remote number, for example vnet-vx0-1
+VNET_VXLAN_ID_BASE = 100000
+VNET_VXLAN_ID_STRIDE = 1000  # The VXLAN ids of each remote are this far apart, so it caps the amount of switches
+VNET_VXLAN_PORT = 4789
+VNET_VXLAN_LXD_TUNNEL_NAME = "vnet"  # The name of the tunnel of the LXD managed bridges on the remotes
+# Switches that connect exactly two machines can be wired with a veth pair instead of a bridge
+VNET_P2P_NAME = "vnet-p2p"  # Followed by the switch and end number, for example vnet-p2p0-1
+VNET_P2P_AUTO_DETECT = getenv("VNET_P2P_AUTO_DETECT", "false") == "true"  # Also use a veth pair for switches without p2p: true
 VNET_SNIFFER_PCAP_DIR = getenv("VNET_SNIFFER_PCAP_DIR", "/tmp")
-SUPPORTED_MACHINE_TYPES = ["host", "router"]
+VNET_SNIFFER_STATE_DIR = getenv("VNET_SNIFFER_STATE_DIR", "/run/vnet-manager/sniffers")  # The sniffer registry
+VNET_SNIFFER_OPTIONS = {
+    # The sniffer options that can be passed on the command line or set per switch / veth in the config, and their type
+    "snaplen": int,  # tcpdump -s, the amount of bytes to capture per packet
+    "filter": str,  # BPF filter expression
+    "rotate_size": int,  # tcpdump -C, rotate the PCAP file after this many million bytes
+    "rotate_seconds": int,  # tcpdump -G, rotate the PCAP file every this many seconds
+    "rotate_count": int,  # tcpdump -W, the amount of rotated PCAP files to keep
+    "compress": bool,  # tcpdump -z, compress rotated PCAP files
+}
+VNET_SNIFFER_COMPRESS_COMMAND = "gzip"
+# tcpdump: one tcpdump process per interface, builtin: one AF_PACKET capture process for all interfaces writing a single pcapng
+VNET_SNIFFER_ENGINES = ["tcpdump", "builtin"]
+VNET_CAPTURE_DEFAULT_SNAPLEN = 262144
+VNET_CAPTURE_RING_BLOCK_SIZE = 1 << 18  # Bytes, must be a multiple of the page size
+VNET_CAPTURE_RING_BLOCK_NR = 4  # Blocks per interface, so the ring uses 1MiB of kernel memory per interface
+VNET_CAPTURE_RING_FRAME_SIZE = 2048
+VNET_CAPTURE_RING_BLOCK_TIMEOUT = 100  # Milliseconds before a partially filled block is handed over
+SUPPORTED_MACHINE_TYPES = ["host", "router", "netns-host"]
 MACHINE_TYPE_PROVIDER_MAPPING = {
     "host": "lxc",
     "router": "lxc",
+    "netns-host": "netns",
 }
 MACHINE_TYPE_CONFIG_FUNCTION_MAPPING = {
     # For each machine type specify the type specific functions that should be called for it
     "host": [f"disable_{MACHINE_TYPE_PROVIDER_MAPPING['router']}_ip_forwarding"],
     "router": [f"enable_{MACHINE_TYPE_PROVIDER_MAPPING['router']}_ip_forwarding"],
+    "netns-host": [],  # New network namespaces do not forward
 }
 VALID_STATUSES = ["start", "stop"]
 VNET_FORCE_ENV_VAR = "VNET_FORCE"
@@ -109,6 +141,9 @@ ff02::3 ip6-allhosts
 
 """
 VNET_NETPLAN_CONFIG_FILE_PATH = "/etc/netplan/10-vnet-config.yaml"
+VNET_FILES_ARCHIVE_GUEST_PATH = "/tmp/.vnet_files.tar"  # Where the archive with the user requested files is extracted from
+VNET_FILES_MMAP = getenv("VNET_FILES_MMAP", "false") == "true"  # Memory map host files when uploading them to machines
+VNET_FILES_HASH_CHUNK_SIZE = 1 << 20
 VNET_BASH_COMPLETION_TEMPLATE = """#!/usr/bin/env bash
 
 _{name}_completions() {{
@@ -132,12 +167,29 @@ VNET_BASH_COMPLETION_PATH = f"/etc/bash_completion.d/{PYTHON_PACKAGE_NAME}.bash"
 LXC_MAX_STATUS_WAIT_ATTEMPTS = 15
 LXC_STATUS_WAIT_SLEEP = 4
 LXC_STATUS_BACKOFF_MULTIPLIER = 0.3
+LXC_PARALLEL_STATUS_TIMEOUT = 180  # Global deadline in seconds for parallel status changes to converge
+LXC_LIFECYCLE_EVENT_STATUS_MAPPING = {
+    # Maps the LXD lifecycle event actions to the status they result in
+    "instance-started": "Running",
+    "instance-stopped": "Stopped",
+    "instance-shutdown": "Stopped",
+    "container-started": "Running",
+    "container-stopped": "Stopped",
+    "container-shutdown": "Stopped",
+}
 LXC_STORAGE_POOL_NAME = "vnet-pool"
 LXC_STORAGE_POOL_DRIVER = "btrfs"
 LXC_STORAGE_POOL_SIZE = "30GB"
 LXC_BASE_IMAGE_ALIAS = getenv("VNET_LXC_BASE_IMAGE", "vnet-base-image")
 LXC_BASE_IMAGE_MACHINE_NAME = "vnet-base"
+# Create machines from the base 'image' or as a 'copy' of the golden machine
+LXC_CREATE_STRATEGY = getenv("VNET_LXC_CREATE_STRATEGY", "image")
+LXC_GOLDEN_MACHINE_NAME = "vnet-golden"  # Stopped container kept in the VNet storage pool, the source of the 'copy' strategy
+LXC_LOCAL_REMOTE_NAME = "local"  # The name of the local LXD in the lxd_remotes config item
 LXC_VNET_PROFILE = "vnet-profile"
+LXC_FILE_MANIFEST_CONFIG_KEY = "user.vnet.file_manifest"  # Container config key holding the hashes of the files placed by VNet
+# The amount of connections kept alive per LXD host, at least the amount of concurrent workers (--parallel)
+LXC_CLIENT_POOL_SIZE = int(getenv("VNET_LXC_CLIENT_POOL_SIZE", "25"))
 
 # FRR settings
 FRR_RELEASE = "frr-stable"
@@ -1,5 +1,5 @@
-from os import EX_OK, EX_USAGE, EX_OSERR
-from unittest.mock import MagicMock
+from os import EX_OK, EX_USAGE, EX_OSERR, EX_SOFTWARE
+from unittest.mock import MagicMock, Mock
 
 from vnet_manager.tests import VNetTestCase
 from vnet_manager.actions.manager import ActionManager
@@ -9,32 +9,41 @@ from vnet_manager.conf import settings
 class TestActionManager(VNetTestCase):
     def setUp(self) -> None:
         self.get_config = self.set_up_patch("vnet_manager.actions.manager.get_config")
+        self.get_config.return_value = {}
         self.validator = MagicMock()
-        self.validate = self.set_up_patch("vnet_manager.actions.manager.ValidateConfig")
+        self.validate = self.set_up_patch("vnet_manager.config.validate.ValidateConfig")
         self.validate.return_value = self.validator
         self.validator.updated_config = {}
-        self.machine_op = self.set_up_patch("vnet_manager.actions.manager.machine_op")
+        self.machine_op = MagicMock()
+        for func in ("show_status", "get_lxc_instances", "change_machine_status", "destroy_machines", "connect_to_lxc_machine"):
+            self.set_up_patch(f"vnet_manager.operations.machine.{func}", themock=getattr(self.machine_op, func))
         self.show_version = self.set_up_patch("vnet_manager.actions.manager.show_version")
-        self.show_status_interfaces = self.set_up_patch("vnet_manager.actions.manager.show_vnet_interface_status")
-        self.show_status_interfaces_veth = self.set_up_patch("vnet_manager.actions.manager.show_vnet_veth_interface_status")
-        self.bring_up_vnet_interfaces = self.set_up_patch("vnet_manager.actions.manager.bring_up_vnet_interfaces")
-        self.bring_down_vnet_interfaces = self.set_up_patch("vnet_manager.actions.manager.bring_down_vnet_interfaces")
+        self.show_status_interfaces = self.set_up_patch("vnet_manager.operations.interface.show_vnet_interface_status")
+        self.show_status_interfaces_veth = self.set_up_patch("vnet_manager.operations.interface.show_vnet_veth_interface_status")
+        self.bring_up_vnet_interfaces = self.set_up_patch("vnet_manager.operations.interface.bring_up_vnet_interfaces")
+        self.bring_down_vnet_interfaces = self.set_up_patch("vnet_manager.operations.interface.bring_down_vnet_interfaces")
         self.bring_down_vnet_interfaces.return_value = False
-        self.ensure_vnet_lxc_environment = self.set_up_patch("vnet_manager.actions.manager.ensure_vnet_lxc_environment")
-        self.put_files_on_machine = self.set_up_patch("vnet_manager.actions.manager.put_files_on_machine")
-        self.generate_vnet_hosts_file = self.set_up_patch("vnet_manager.actions.manager.generate_vnet_hosts_file")
-        self.place_vnet_hosts_file_on_machines = self.set_up_patch("vnet_manager.actions.manager.place_vnet_hosts_file_on_machines")
+        self.ensure_vnet_lxc_environment = self.set_up_patch("vnet_manager.environment.lxc.ensure_vnet_lxc_environment")
+        self.reconcile_machines = self.set_up_patch("vnet_manager.operations.reconcile.reconcile_machines")
+        self.reconcile_machines.return_value = {}
         self.request_confirmation = self.set_up_patch("vnet_manager.actions.manager.request_confirmation")
-        self.destroy_lxc_image = self.set_up_patch("vnet_manager.actions.manager.destroy_lxc_image")
-        self.delete_vnet_interfaces = self.set_up_patch("vnet_manager.actions.manager.delete_vnet_interfaces")
+        self.destroy_lxc_image = self.set_up_patch("vnet_manager.operations.image.destroy_lxc_image")
+        self.delete_vnet_interfaces = self.set_up_patch("vnet_manager.operations.interface.delete_vnet_interfaces")
         self.kill_tcpdump_processes_on_vnet_interfaces = self.set_up_patch(
-            "vnet_manager.actions.manager.kill_tcpdump_processes_on_vnet_interfaces"
+            "vnet_manager.operations.interface.kill_tcpdump_processes_on_vnet_interfaces"
         )
-        self.cleanup_vnet_lxc_environment = self.set_up_patch("vnet_manager.actions.manager.cleanup_vnet_lxc_environment")
+        self.cleanup_vnet_lxc_environment = self.set_up_patch("vnet_manager.environment.lxc.cleanup_vnet_lxc_environment")
         self.isdir = self.set_up_patch("vnet_manager.actions.manager.isdir")
         self.write_file = self.set_up_patch("vnet_manager.actions.manager.write_file_to_disk")
         self.get_yaml_file_from_disk_path = self.set_up_patch("vnet_manager.actions.manager.get_yaml_files_from_disk_path")
         self.get_yaml_file_from_disk_path.return_value = ["file1"]
+        self.reset_lxd_handshake_count = self.set_up_patch("vnet_manager.providers.lxc.reset_lxd_handshake_count")
+        self.get_lxd_handshake_count = self.set_up_patch("vnet_manager.providers.lxc.get_lxd_handshake_count")
+        self.show_sniffer_status = self.set_up_patch("vnet_manager.operations.sniffer.show_sniffer_status")
+        self.configure_lxd_remotes = self.set_up_patch("vnet_manager.providers.lxc.configure_lxd_remotes")
+        self.register_topology = self.set_up_patch("vnet_manager.config.topology.register_topology")
+        self.ensure_vnet_lxd_networks = self.set_up_patch("vnet_manager.operations.network.ensure_vnet_lxd_networks")
+        self.delete_vnet_lxd_networks = self.set_up_patch("vnet_manager.operations.network.delete_vnet_lxd_networks")
 
     def test_action_manager_returns_usage_exit_code_if_action_does_not_exist(self):
         ret = ActionManager().execute("blaap")
@@ -46,6 +55,11 @@ class TestActionManager(VNetTestCase):
         self.show_version.assert_called_once_with()
         self.assertEqual(ret, EX_OK)
 
+    def test_action_manager_resets_lxd_handshake_count_before_action(self):
+        ActionManager().execute("version")
+        self.reset_lxd_handshake_count.assert_called_once_with()
+        self.get_lxd_handshake_count.assert_called_once_with()
+
     def test_action_manager_calls_get_config(self):
         manager = ActionManager(config_path="blaap")
         manager.execute("list")
@@ -78,7 +92,25 @@ class TestActionManager(VNetTestCase):
     def test_action_manager_calls_show_status_with_list_action(self):
         manager = ActionManager(config_path="blaap")
         manager.execute("list")
-        self.machine_op.show_status.assert_called_once_with(self.validator.updated_config)
+        self.machine_op.show_status.assert_called_once_with(
+            self.validator.updated_config, lxc_instances=self.machine_op.get_lxc_instances.return_value
+        )
+
+    def test_action_manager_shares_fetched_lxc_instances_between_configs_with_list_action(self):
+        self.get_yaml_file_from_disk_path.return_value = ["file1", "file2", "file3"]
+        manager = ActionManager(config_path="blaap")
+        manager.execute("list")
+        self.assertEqual(self.machine_op.get_lxc_instances.call_count, 3)
+        remote_instances = [kwargs["remote_instances"] for _, kwargs in self.machine_op.get_lxc_instances.call_args_list]
+        self.assertIs(remote_instances[0], remote_instances[1])
+        self.assertIs(remote_instances[0], remote_instances[2])
+
+    def test_action_manager_gets_lxc_instances_after_configuring_lxd_remotes_with_list_action(self):
+        manager = Mock()
+        manager.attach_mock(self.configure_lxd_remotes, "configure_lxd_remotes")
+        manager.attach_mock(self.machine_op.get_lxc_instances, "get_lxc_instances")
+        ActionManager(config_path="blaap").execute("list")
+        self.assertEqual([name for name, _, _ in manager.mock_calls], ["configure_lxd_remotes", "get_lxc_instances"])
 
     def test_action_manager_calls_get_yaml_file_from_disk_path_with_list_action(self):
         manager = ActionManager(config_path="blaap")
@@ -134,7 +166,11 @@ class TestActionManager(VNetTestCase):
         manager = ActionManager(config_path="blaap")
         manager.execute("start")
         self.bring_up_vnet_interfaces.assert_called_once_with(
-            self.validator.updated_config, sniffer=False, pcap_dir=settings.VNET_SNIFFER_PCAP_DIR
+            self.validator.updated_config,
+            sniffer=False,
+            pcap_dir=settings.VNET_SNIFFER_PCAP_DIR,
+            sniffer_options={},
+            sniffer_engine="tcpdump",
         )
         self.assertFalse(self.bring_down_vnet_interfaces.called)
 
@@ -142,30 +178,65 @@ class TestActionManager(VNetTestCase):
         manager = ActionManager(config_path="blaap", sniffer=True)
         manager.execute("start")
         self.bring_up_vnet_interfaces.assert_called_once_with(
-            self.validator.updated_config, sniffer=True, pcap_dir=settings.VNET_SNIFFER_PCAP_DIR
+            self.validator.updated_config,
+            sniffer=True,
+            pcap_dir=settings.VNET_SNIFFER_PCAP_DIR,
+            sniffer_options={},
+            sniffer_engine="tcpdump",
+        )
+
+    def test_action_manager_calls_bring_up_vnet_interfaces_with_sniffer_options(self):
+        manager = ActionManager(config_path="blaap", sniffer=True, sniffer_options={"snaplen": 96})
+        manager.execute("start")
+        self.bring_up_vnet_interfaces.assert_called_once_with(
+            self.validator.updated_config,
+            sniffer=True,
+            pcap_dir=settings.VNET_SNIFFER_PCAP_DIR,
+            sniffer_options={"snaplen": 96},
+            sniffer_engine="tcpdump",
         )
 
+    def test_action_manager_calls_bring_up_vnet_interfaces_with_sniffer_engine(self):
+        manager = ActionManager(config_path="blaap", sniffer=True, sniffer_engine="builtin")
+        manager.execute("start")
+        self.assertEqual(self.bring_up_vnet_interfaces.call_args[1]["sniffer_engine"], "builtin")
+
     def test_action_manager_calls_change_machine_status_with_start_action(self):
         manager = ActionManager(config_path="blaap")
         manager.execute("start")
-        self.machine_op.change_machine_status.assert_called_once_with(self.validator.updated_config, machines=None, status="start")
+        self.machine_op.change_machine_status.assert_called_once_with(
+            self.validator.updated_config, machines=None, status="start", parallel=1
+        )
 
     def test_action_manager_calls_change_machine_status_with_start_action_and_machines(self):
         manager = ActionManager(config_path="blaap")
         manager.machines = ["machine"]
         manager.execute("start")
-        self.machine_op.change_machine_status.assert_called_once_with(self.validator.updated_config, machines=["machine"], status="start")
+        self.machine_op.change_machine_status.assert_called_once_with(
+            self.validator.updated_config, machines=["machine"], status="start", parallel=1
+        )
 
     def test_action_manager_calls_change_machine_status_with_stop_action(self):
         manager = ActionManager(config_path="blaap")
         manager.execute("stop")
-        self.machine_op.change_machine_status.assert_called_once_with(self.validator.updated_config, machines=None, status="stop")
+        self.machine_op.change_machine_status.assert_called_once_with(
+            self.validator.updated_config, machines=None, status="stop", parallel=1
+        )
 
     def test_action_manager_calls_change_machine_status_with_stop_action_and_machines(self):
         manager = ActionManager(config_path="blaap")
         manager.machines = ["machine"]
         manager.execute("stop")
-        self.machine_op.change_machine_status.assert_called_once_with(self.validator.updated_config, machines=["machine"], status="stop")
+        self.machine_op.change_machine_status.assert_called_once_with(
+            self.validator.updated_config, machines=["machine"], status="stop", parallel=1
+        )
+
+    def test_action_manager_calls_change_machine_status_with_start_action_and_parallel(self):
+        manager = ActionManager(config_path="blaap", parallel=8)
+        manager.execute("start")
+        self.machine_op.change_machine_status.assert_called_once_with(
+            self.validator.updated_config, machines=None, status="start", parallel=8
+        )
 
     def test_action_manager_calls_bring_down_vnet_interfaces_with_stop_action(self):
         manager = ActionManager(config_path="blaap")
@@ -194,83 +265,78 @@ class TestActionManager(VNetTestCase):
         manager.execute("create")
         self.ensure_vnet_lxc_environment.assert_called_once_with(self.validator.updated_config)
 
-    def test_action_manager_calls_create_machines_with_create_action(self):
+    def test_action_manager_calls_reconcile_machines_with_create_action(self):
         manager = ActionManager(config_path="blaap")
         manager.execute("create")
-        self.machine_op.create_machines.assert_called_once_with(self.validator.updated_config, machines=None)
+        self.reconcile_machines.assert_called_once_with(
+            self.validator.updated_config, machines=None, parallel=1, hosts=True, dry_run=False, prune=False
+        )
 
-    def test_action_manager_calls_create_machines_with_create_action_and_machines(self):
+    def test_action_manager_calls_reconcile_machines_with_create_action_and_machines(self):
         manager = ActionManager(config_path="blaap")
         manager.machines = ["machine"]
         manager.execute("create")
-        self.machine_op.create_machines.assert_called_once_with(self.validator.updated_config, machines=["machine"])
+        self.reconcile_machines.assert_called_once_with(
+            self.validator.updated_config, machines=["machine"], parallel=1, hosts=True, dry_run=False, prune=False
+        )
 
-    def test_action_manager_calls_put_files_on_machine_with_create_action(self):
-        manager = ActionManager(config_path="blaap")
+    def test_action_manager_calls_reconcile_machines_with_create_action_and_parallel(self):
+        manager = ActionManager(config_path="blaap", parallel=4)
         manager.execute("create")
-        self.put_files_on_machine.assert_called_once_with(self.validator.updated_config)
+        self.reconcile_machines.assert_called_once_with(
+            self.validator.updated_config, machines=None, parallel=4, hosts=True, dry_run=False, prune=False
+        )
 
-    def test_action_manager_calls_place_vnet_hosts_file_on_machines_with_create_action(self):
-        manager = ActionManager(config_path="blaap")
+    def test_action_manager_calls_reconcile_machines_with_create_action_and_prune(self):
+        manager = ActionManager(config_path="blaap", prune=True)
         manager.execute("create")
-        self.place_vnet_hosts_file_on_machines.assert_called_once_with(self.validator.updated_config)
+        self.reconcile_machines.assert_called_once_with(
+            self.validator.updated_config, machines=None, parallel=1, hosts=True, dry_run=False, prune=True
+        )
 
-    def test_action_manager_calls_generate_vnet_hosts_file_with_create_action(self):
-        manager = ActionManager(config_path="blaap")
+    def test_action_manager_calls_reconcile_machines_with_create_action_and_dry_run(self):
+        manager = ActionManager(config_path="blaap", dry_run=True)
         manager.execute("create")
-        self.generate_vnet_hosts_file.assert_called_once_with(self.validator.updated_config)
+        self.reconcile_machines.assert_called_once_with(
+            self.validator.updated_config, machines=None, parallel=1, hosts=True, dry_run=True, prune=False
+        )
 
-    def test_action_manager_calls_enable_type_specific_machine_configuration(self):
+    def test_action_manager_returns_software_exit_code_when_machines_failed_to_create(self):
+        self.reconcile_machines.return_value = {"machine": "error"}
         manager = ActionManager(config_path="blaap")
-        manager.execute("create")
-        self.machine_op.enable_type_specific_machine_configuration.assert_called_once_with(self.validator.updated_config)
+        self.assertEqual(manager.execute("create"), EX_SOFTWARE)
+
+    def test_action_manager_returns_ok_exit_code_when_all_machines_are_provisioned(self):
+        manager = ActionManager(config_path="blaap")
+        self.assertEqual(manager.execute("create"), EX_OK)
 
     def test_action_manager_calls_ensure_vnet_lxc_environment_with_create_action_and_nohosts(self):
         manager = ActionManager(config_path="blaap", no_hosts=True)
         manager.execute("create")
         self.ensure_vnet_lxc_environment.assert_called_once_with(self.validator.updated_config)
 
-    def test_action_manager_calls_create_machines_with_create_action_and_nohosts(self):
+    def test_action_manager_calls_reconcile_machines_without_hosts_with_create_action_and_nohosts(self):
         manager = ActionManager(config_path="blaap", no_hosts=True)
         manager.execute("create")
-        self.machine_op.create_machines.assert_called_once_with(self.validator.updated_config, machines=None)
-
-    def test_action_manager_calls_create_machines_with_create_action_and_machines_and_nohosts(self):
-        manager = ActionManager(config_path="blaap", no_hosts=True)
-        manager.machines = ["machine"]
-        manager.execute("create")
-        self.machine_op.create_machines.assert_called_once_with(self.validator.updated_config, machines=["machine"])
-
-    def test_action_manager_calls_put_files_on_machine_with_create_action_and_nohosts(self):
-        manager = ActionManager(config_path="blaap", no_hosts=True)
-        manager.execute("create")
-        self.put_files_on_machine.assert_called_once_with(self.validator.updated_config)
-
-    def test_action_manager_calls_place_vnet_hosts_file_on_machines_with_create_action_and_nohosts(self):
-        manager = ActionManager(config_path="blaap", no_hosts=True)
-        manager.execute("create")
-        self.assertFalse(self.place_vnet_hosts_file_on_machines.called)
-
-    def test_action_manager_calls_generate_vnet_hosts_file_with_create_action_and_nohosts(self):
-        manager = ActionManager(config_path="blaap", no_hosts=True)
-        manager.execute("create")
-        self.assertFalse(self.generate_vnet_hosts_file.called)
-
-    def test_action_manager_calls_enable_type_specific_machine_configuration_and_nohosts(self):
-        manager = ActionManager(config_path="blaap", no_hosts=True)
-        manager.execute("create")
-        self.machine_op.enable_type_specific_machine_configuration.assert_called_once_with(self.validator.updated_config)
+        self.reconcile_machines.assert_called_once_with(
+            self.validator.updated_config, machines=None, parallel=1, hosts=False, dry_run=False, prune=False
+        )
 
     def test_action_manager_calls_destroy_machines_with_destroy_action(self):
         manager = ActionManager(config_path="blaap")
         manager.execute("destroy")
-        self.machine_op.destroy_machines.assert_called_once_with(self.validator.updated_config, machines=None)
+        self.machine_op.destroy_machines.assert_called_once_with(self.validator.updated_config, machines=None, parallel=1)
 
     def test_action_manager_calls_destroy_machines_with_destroy_action_and_machines(self):
         manager = ActionManager(config_path="blaap")
         manager.machines = ["machine"]
         manager.execute("destroy")
-        self.machine_op.destroy_machines.assert_called_once_with(self.validator.updated_config, machines=["machine"])
+        self.machine_op.destroy_machines.assert_called_once_with(self.validator.updated_config, machines=["machine"], parallel=1)
+
+    def test_action_manager_calls_destroy_machines_with_destroy_action_and_parallel(self):
+        manager = ActionManager(config_path="blaap", parallel=8)
+        manager.execute("destroy")
+        self.machine_op.destroy_machines.assert_called_once_with(self.validator.updated_config, machines=None, parallel=8)
         self.assertFalse(self.destroy_lxc_image.called)
 
     def test_action_manager_calls_delete_vnet_interfaces_with_destroy_action(self):
@@ -278,6 +344,41 @@ class TestActionManager(VNetTestCase):
         manager.execute("destroy")
         self.delete_vnet_interfaces.assert_called_once_with(self.validator.updated_config)
 
+    def test_action_manager_calls_delete_vnet_lxd_networks_with_destroy_action(self):
+        manager = ActionManager(config_path="blaap")
+        manager.execute("destroy")
+        self.delete_vnet_lxd_networks.assert_called_once_with(self.validator.updated_config)
+
+    def test_action_manager_configures_lxd_remotes_after_config_validation(self):
+        manager = ActionManager(config_path="blaap")
+        manager.execute("show")
+        self.configure_lxd_remotes.assert_called_once_with(self.validator.updated_config)
+
+    def test_action_manager_validates_config_without_lxd_instances_when_there_are_no_remotes(self):
+        ActionManager(config_path="blaap").execute("show")
+        self.validate.assert_called_once_with({}, lxd_instances=None)
+
+    def test_action_manager_validates_config_with_lxd_instances_when_there_are_remotes(self):
+        get_lxd_remote_instance_names = self.set_up_patch("vnet_manager.operations.machine.get_lxd_remote_instance_names")
+        self.get_config.return_value = {"lxd_remotes": {}}
+        ActionManager(config_path="blaap").execute("show")
+        self.validate.assert_called_once_with({"lxd_remotes": {}}, lxd_instances=get_lxd_remote_instance_names)
+
+    def test_action_manager_registers_topology_after_config_validation(self):
+        manager = ActionManager(config_path="blaap")
+        manager.execute("show")
+        self.register_topology.assert_called_once_with(self.validator.updated_config, self.validator.topology)
+
+    def test_action_manager_calls_ensure_vnet_lxd_networks_with_start_action(self):
+        manager = ActionManager(config_path="blaap")
+        manager.execute("start")
+        self.ensure_vnet_lxd_networks.assert_called_once_with(self.validator.updated_config)
+
+    def test_action_manager_calls_ensure_vnet_lxd_networks_with_create_action(self):
+        manager = ActionManager(config_path="blaap")
+        manager.execute("create")
+        self.ensure_vnet_lxd_networks.assert_called_once_with(self.validator.updated_config)
+
     def test_action_manager_does_not_call_delete_vnet_interfaces_with_destroy_action_and_machines(self):
         manager = ActionManager(config_path="blaap")
         manager.machines = ["machine"]
@@ -318,10 +419,19 @@ class TestActionManager(VNetTestCase):
     def test_action_manager_writes_bash_completion_file(self):
         manager = ActionManager()
         manager.execute("bash_completion")
-        actions = ("create", "connect", "destroy", "list", "show", "status", "start", "stop")
+        actions = ("create", "connect", "destroy", "list", "show", "sniffer", "status", "start", "stop")
         self.write_file.assert_called_once_with(
             settings.VNET_BASH_COMPLETION_PATH,
             settings.VNET_BASH_COMPLETION_TEMPLATE.format(
                 options=" ".join(actions), name=settings.get("PYTHON_PACKAGE_NAME", "vnet-manager")
             ),
         )
+
+    def test_action_manager_calls_show_sniffer_status_for_all_sniffers_without_config(self):
+        ActionManager().execute("sniffer-list")
+        self.show_sniffer_status.assert_called_once_with(None)
+
+    def test_action_manager_calls_show_sniffer_status_for_config_interfaces(self):
+        self.validator.updated_config = settings.CONFIG
+        ActionManager(config_path="blaap").execute("sniffer-list")
+        self.show_sniffer_status.assert_called_once_with(["vnet-br0", "vnet-br1", "vnet-veth1", "vnet-veth0"])
@@ -0,0 +1,153 @@
+from copy import deepcopy
+from dataclasses import FrozenInstanceError
+
+from vnet_manager.tests import VNetTestCase
+from vnet_manager.conf import settings
+from vnet_manager.config.topology import (
+    Interface,
+    get_vnet_p2p_switches_from_config,
+    compile_topology,
+    register_topology,
+    get_topology,
+)
+
+
+class TestGetVNetP2PSwitchesFromConfig(VNetTestCase):
+    def setUp(self) -> None:
+        self.set_up_patch("vnet_manager.conf.settings.VNET_P2P_AUTO_DETECT", themock=True)
+        self.config = deepcopy(settings.CONFIG)
+        del self.config["veths"]
+
+    def test_get_vnet_p2p_switches_from_config_detects_switches_with_two_machines(self):
+        self.assertEqual(
+            get_vnet_p2p_switches_from_config(self.config),
+            {0: [("router100", "eth12"), ("router101", "eth12")], 1: [("router101", "eth23"), ("host102", "eth23")]},
+        )
+
+    def test_get_vnet_p2p_switches_from_config_does_not_detect_switches_with_veth_interfaces(self):
+        self.assertEqual(get_vnet_p2p_switches_from_config(settings.CONFIG), {})
+
+    def test_get_vnet_p2p_switches_from_config_does_not_detect_switches_with_more_machines(self):
+        self.config["machines"]["host102"]["interfaces"]["eth23"]["bridge"] = 0
+        self.assertEqual(get_vnet_p2p_switches_from_config(self.config), {})
+
+    def test_get_vnet_p2p_switches_from_config_does_not_detect_switches_with_machines_on_different_remotes(self):
+        self.config["machines"]["host102"]["remote"] = "node1"
+        self.assertEqual(list(get_vnet_p2p_switches_from_config(self.config)), [0])
+
+    def test_get_vnet_p2p_switches_from_config_does_not_detect_switches_with_netns_machines(self):
+        self.config["machines"]["host102"]["type"] = "netns-host"
+        self.assertEqual(list(get_vnet_p2p_switches_from_config(self.config)), [0])
+
+    def test_get_vnet_p2p_switches_from_config_does_not_detect_switches_with_sniffer_options(self):
+        self.config["switch_config"] = {1: {"sniffer": {"snaplen": 96}}}
+        self.assertEqual(list(get_vnet_p2p_switches_from_config(self.config)), [0])
+
+    def test_get_vnet_p2p_switches_from_config_does_not_detect_switches_that_disable_p2p(self):
+        self.config["switch_config"] = {1: {"p2p": False}}
+        self.assertEqual(list(get_vnet_p2p_switches_from_config(self.config)), [0])
+
+    def test_get_vnet_p2p_switches_from_config_does_not_detect_switches_when_auto_detect_is_disabled(self):
+        self.set_up_patch("vnet_manager.conf.settings.VNET_P2P_AUTO_DETECT", themock=False)
+        self.assertEqual(get_vnet_p2p_switches_from_config(self.config), {})
+
+    def test_get_vnet_p2p_switches_from_config_returns_switches_that_enable_p2p(self):
+        self.set_up_patch("vnet_manager.conf.settings.VNET_P2P_AUTO_DETECT", themock=False)
+        self.config["switch_config"] = {1: {"p2p": True}}
+        self.assertEqual(list(get_vnet_p2p_switches_from_config(self.config)), [1])
+
+
+class TestCompileTopology(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = deepcopy(settings.CONFIG)
+        self.topology = compile_topology(self.config)
+
+    def test_compile_topology_returns_machines_in_config_order(self):
+        self.assertEqual(list(self.topology.machines), ["router100", "router101", "host102"])
+        machine = self.topology.machines["router101"]
+        self.assertEqual((machine.type, machine.provider, machine.remote), ("router", "lxc", None))
+        self.assertEqual([interface.name for interface in machine.interfaces], ["eth12", "eth23"])
+
+    def test_compile_topology_returns_interfaces(self):
+        self.assertEqual(
+            self.topology.machines["router100"].interfaces[0],
+            Interface(
+                machine="router100",
+                name="eth12",
+                mac="00:00:00:00:01:11",
+                switch=0,
+                bridge=f"{settings.VNET_BRIDGE_NAME}0",
+                ipv4="192.168.0.2/24",
+                ipv6="fd00:12::2/64",
+            ),
+        )
+
+    def test_compile_topology_returns_all_switches(self):
+        self.config["switches"] = 3
+        topology = compile_topology(self.config)
+        self.assertEqual(list(topology.switches), [0, 1, 2])
+        self.assertEqual(topology.switches[2].interfaces, ())
+        self.assertEqual(topology.switches[2].bridge, f"{settings.VNET_BRIDGE_NAME}2")
+
+    def test_compile_topology_returns_veths(self):
+        veth = self.topology.veths["vnet-veth0"]
+        self.assertEqual((veth.bridge, veth.peer, veth.stp), ("vnet-br0", "vnet-veth1", False))
+
+    def test_compile_topology_marks_p2p_switches(self):
+        self.config["switch_config"] = {1: {"p2p": True}}
+        del self.config["veths"]["vnet-veth1"]
+        topology = compile_topology(self.config)
+        self.assertTrue(topology.switches[1].p2p)
+        self.assertEqual(topology.bridge_names, [f"{settings.VNET_BRIDGE_NAME}0"])
+
+    def test_compile_topology_indexes_machines_by_bridge(self):
+        self.assertEqual(
+            dict(self.topology.machines_by_bridge), {"vnet-br0": ("router100", "router101"), "vnet-br1": ("router101", "host102")}
+        )
+
+    def test_compile_topology_indexes_interfaces_by_bridge(self):
+        self.assertEqual(
+            [(interface.machine, interface.name) for interface in self.topology.interfaces_by_bridge["vnet-br1"]],
+            [("router101", "eth23"), ("host102", "eth23")],
+        )
+
+    def test_compile_topology_indexes_bridges_by_machine(self):
+        self.assertEqual(self.topology.bridges_by_machine["router101"], ("vnet-br0", "vnet-br1"))
+
+    def test_compile_topology_indexes_machines_by_ip(self):
+        self.assertEqual(self.topology.machine_by_ip["192.168.0.2"], "router100")
+        self.assertEqual(self.topology.machine_by_ip["fd00:12::2"], "router100")
+
+    def test_compile_topology_indexes_switches_beyond_ten(self):
+        self.config["switches"] = 12
+        self.config["machines"]["host102"]["interfaces"]["eth23"]["bridge"] = 11
+        topology = compile_topology(self.config)
+        self.assertEqual(topology.machines_by_bridge[f"{settings.VNET_BRIDGE_NAME}11"], ("host102",))
+        self.assertEqual(topology.machines_by_bridge[f"{settings.VNET_BRIDGE_NAME}1"], ("router101",))
+
+    def test_compile_topology_returns_immutable_topology(self):
+        with self.assertRaises(FrozenInstanceError):
+            self.topology.machines["router100"].name = "blaap"
+        with self.assertRaises(TypeError):
+            self.topology.machines["blaap"] = self.topology.machines["router100"]
+
+    def test_compile_topology_returns_slotted_objects(self):
+        self.assertFalse(hasattr(self.topology.machines["router100"], "__dict__"))
+        self.assertFalse(hasattr(self.topology.machines["router100"].interfaces[0], "__dict__"))
+
+
+class TestGetTopology(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = deepcopy(settings.CONFIG)
+        self.addCleanup(register_topology, None, None)
+
+    def test_get_topology_returns_registered_topology(self):
+        topology = compile_topology(self.config)
+        register_topology(self.config, topology)
+        self.assertIs(get_topology(self.config), topology)
+
+    def test_get_topology_compiles_topology_of_unregistered_configs(self):
+        register_topology(self.config, compile_topology(self.config))
+        other = deepcopy(settings.CONFIG)
+        other["machines"]["router100"]["type"] = "host"
+        self.assertEqual(get_topology(other).machines["router100"].type, "host")
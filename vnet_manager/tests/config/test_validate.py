@@ -28,6 +28,11 @@ class TestValidateConfigClass(VNetTestCase):
     def test_validate_class_returns_original_config_on_init(self):
         self.assertEqual(self.validator.updated_config, settings.CONFIG)
 
+    def test_validate_class_compiles_topology_of_updated_config_once(self):
+        topology = self.validator.topology
+        self.assertIs(self.validator.topology, topology)
+        self.assertEqual(list(topology.machines), list(self.validator.updated_config["machines"]))
+
     def test_validate_function_calls_standard_validator_functions(self):
         self.validator.validate()
         self.switch_config.assert_called_once_with()
@@ -42,6 +47,23 @@ class TestValidateConfigClass(VNetTestCase):
         self.validator.validate()
         self.veth_config.assert_called_once_with()
 
+    def test_validate_function_does_not_call_lxd_remotes_validator_when_not_present_in_config(self):
+        self.validator.validate_lxd_remotes_config = Mock()
+        self.validator.validate()
+        self.assertFalse(self.validator.validate_lxd_remotes_config.called)
+
+    def test_validate_function_calls_p2p_switch_validator_when_switch_config_in_config(self):
+        self.validator.validate_p2p_switch_config = Mock()
+        self.validator.config["switch_config"] = {0: {"p2p": True}}
+        self.validator.validate()
+        self.validator.validate_p2p_switch_config.assert_called_once_with()
+
+    def test_validate_function_calls_lxd_remotes_validator_when_lxd_remotes_in_config(self):
+        self.validator.validate_lxd_remotes_config = Mock()
+        self.validator.config["lxd_remotes"] = {}
+        self.validator.validate()
+        self.validator.validate_lxd_remotes_config.assert_called_once_with()
+
 
 class TestValidateConfigValidateSwitchConfig(VNetTestCase):
     def setUp(self) -> None:
@@ -68,6 +90,83 @@ class TestValidateConfigValidateSwitchConfig(VNetTestCase):
         )
 
 
+class TestValidateConfigValidateSwitchSpecificConfig(VNetTestCase):
+    def setUp(self) -> None:
+        self.validator = ValidateConfig(deepcopy(settings.CONFIG))
+        self.validator.config["switch_config"] = {0: {"sniffer": {"snaplen": 96}}, 1: {}}
+        self.logger = self.set_up_patch("vnet_manager.config.validate.logger")
+
+    def test_validate_switch_config_calls_validate_switch_specific_config_if_present(self):
+        validate_switch_specific_config = self.set_up_patch("vnet_manager.config.validate.ValidateConfig.validate_switch_specific_config")
+        self.validator.validate_switch_config()
+        validate_switch_specific_config.assert_called_once_with()
+
+    def test_validate_switch_specific_config_runs_ok_with_good_config(self):
+        self.validator.validate_switch_specific_config()
+        self.assertTrue(self.validator.config_validation_successful)
+
+    def test_validate_switch_specific_config_fails_when_not_a_dict(self):
+        self.validator.config["switch_config"] = [0]
+        self.validator.validate_switch_specific_config()
+        self.assertFalse(self.validator.config_validation_successful)
+        self.logger.error.assert_called_once_with(f"Config item 'switch_config' does not seem to be a dict{self.validator.default_message}")
+
+    def test_validate_switch_specific_config_fails_when_switch_number_out_of_range(self):
+        self.validator.config["switch_config"] = {2: {}}
+        self.validator.validate_switch_specific_config()
+        self.assertFalse(self.validator.config_validation_successful)
+
+    def test_validate_switch_specific_config_fails_when_switch_values_not_a_dict(self):
+        self.validator.config["switch_config"] = {1: "blaap"}
+        self.validator.validate_switch_specific_config()
+        self.assertFalse(self.validator.config_validation_successful)
+        self.logger.error.assert_called_once_with(f"switch_config for switch 1 does not seem to be a dict{self.validator.default_message}")
+
+    def test_validate_switch_specific_config_calls_validate_sniffer_config(self):
+        validate_sniffer_config = self.set_up_patch("vnet_manager.config.validate.ValidateConfig.validate_sniffer_config")
+        self.validator.validate_switch_specific_config()
+        validate_sniffer_config.assert_called_once_with({"snaplen": 96}, "switch 0")
+
+
+class TestValidateConfigValidateSnifferConfig(VNetTestCase):
+    def setUp(self) -> None:
+        self.validator = ValidateConfig(deepcopy(settings.CONFIG))
+        self.logger = self.set_up_patch("vnet_manager.config.validate.logger")
+
+    def test_validate_sniffer_config_runs_ok_with_good_config(self):
+        self.validator.validate_sniffer_config(
+            {"snaplen": 96, "filter": "icmp", "rotate_size": 10, "rotate_seconds": 60, "rotate_count": 5, "compress": True}, "switch 0"
+        )
+        self.assertTrue(self.validator.config_validation_successful)
+
+    def test_validate_sniffer_config_fails_when_not_a_dict(self):
+        self.validator.validate_sniffer_config("blaap", "switch 0")
+        self.assertFalse(self.validator.config_validation_successful)
+        self.logger.error.assert_called_once_with(f"Sniffer config for switch 0 does not seem to be a dict{self.validator.default_message}")
+
+    def test_validate_sniffer_config_fails_on_unknown_option(self):
+        self.validator.validate_sniffer_config({"blaap": 1}, "switch 0")
+        self.assertFalse(self.validator.config_validation_successful)
+
+    def test_validate_sniffer_config_fails_on_wrong_type(self):
+        self.validator.validate_sniffer_config({"snaplen": "96"}, "switch 0")
+        self.assertFalse(self.validator.config_validation_successful)
+        self.logger.error.assert_called_once_with(
+            f"Sniffer option snaplen for switch 0 does not seem to be a int{self.validator.default_message}"
+        )
+
+    def test_validate_sniffer_config_does_not_accept_booleans_as_numbers(self):
+        self.validator.validate_sniffer_config({"rotate_count": True}, "switch 0")
+        self.assertFalse(self.validator.config_validation_successful)
+
+    def test_validate_sniffer_config_fails_on_non_positive_numbers(self):
+        self.validator.validate_sniffer_config({"rotate_size": 0}, "switch 0")
+        self.assertFalse(self.validator.config_validation_successful)
+        self.logger.error.assert_called_once_with(
+            f"Sniffer option rotate_size for switch 0 should be a positive number{self.validator.default_message}"
+        )
+
+
 class TestValidateConfigValidateMachineConfig(VNetTestCase):
     def setUp(self) -> None:
         self.validator = ValidateConfig(deepcopy(settings.CONFIG))
@@ -84,6 +183,28 @@ class TestValidateConfigValidateMachineConfig(VNetTestCase):
         self.assertTrue(self.validator.config_validation_successful)
         self.assertGreater(self.validator.validators_ran, 0)
 
+    def test_validate_machine_config_fails_when_machine_remote_is_unknown(self):
+        self.validator.config["machines"]["router100"]["remote"] = "blaap"
+        self.validator.validate_machine_config()
+        self.assertFalse(self.validator.config_validation_successful)
+        self.logger.error.assert_any_call("Machine router100 is placed on LXD remote blaap, but that remote is not defined in lxd_remotes")
+
+    def test_validate_machine_config_fails_when_netns_machine_has_unsupported_items(self):
+        self.validator.config["machines"]["router100"]["type"] = "netns-host"
+        self.validator.validate_machine_config()
+        self.assertFalse(self.validator.config_validation_successful)
+        self.logger.error.assert_any_call(
+            f"Machine router100 is a netns machine, these do not support vlans{self.validator.default_message}"
+        )
+        self.logger.error.assert_any_call(
+            f"Machine router100 is a netns machine, these do not support bridges{self.validator.default_message}"
+        )
+
+    def test_validate_machine_config_runs_ok_with_netns_machine(self):
+        self.validator.config["machines"]["host102"]["type"] = "netns-host"
+        self.validator.validate_machine_config()
+        self.assertTrue(self.validator.config_validation_successful)
+
     def test_validate_machine_config_fails_when_machine_config_not_present(self):
         del self.validator.config["machines"]
         self.validator.validate_machine_config()
@@ -418,6 +539,12 @@ class TestValidateConfigValidateVethConfig(VNetTestCase):
             f"veth interface vnet-veth1 stp parameter does not seem to be a boolean{self.validator.default_message}"
         )
 
+    def test_validate_veth_config_calls_validate_sniffer_config_when_sniffer_present(self):
+        validate_sniffer_config = self.set_up_patch("vnet_manager.config.validate.ValidateConfig.validate_sniffer_config")
+        self.validator.config["veths"]["vnet-veth1"]["sniffer"] = {"snaplen": 96}
+        self.validator.validate_veth_config()
+        validate_sniffer_config.assert_called_once_with({"snaplen": 96}, "veth interface vnet-veth1")
+
 
 class TestValidateConfigValidateVLANConfig(VNetTestCase):
     def setUp(self) -> None:
@@ -538,3 +665,169 @@ class TestValidateConfigValidateMachineBridgeConfig(VNetTestCase):
         self.validator.validate_machine_bridge_config(self.machine)
         self.assertFalse(self.validator.config_validation_successful)
         self.logger.error.assert_called_once_with(f"Undefined slave interface {iface} assigned to bridge br1 on machine {self.machine}")
+
+
+class TestValidateConfigValidateLXDRemotesConfig(VNetTestCase):
+    def setUp(self) -> None:
+        self.validator = ValidateConfig(deepcopy(settings.CONFIG))
+        self.validator.config["lxd_remotes"] = {
+            "local": {"tunnel_address": "192.168.0.1"},
+            "node1": {"endpoint": "https://node1:8443", "cert": ["/tmp/crt", "/tmp/key"], "verify": False, "tunnel_address": "192.168.0.2"},
+        }
+        self.logger = self.set_up_patch("vnet_manager.config.validate.logger")
+        self.isfile = self.set_up_patch("vnet_manager.config.validate.isfile")
+        self.isfile.return_value = True
+
+    def test_validate_lxd_remotes_config_runs_ok_with_good_config(self):
+        self.validator.validate_lxd_remotes_config()
+        self.assertTrue(self.validator.config_validation_successful)
+        self.assertEqual(self.validator.validators_ran, 1)
+
+    def test_validate_lxd_remotes_config_fails_when_lxd_remotes_is_not_a_dict(self):
+        self.validator.config["lxd_remotes"] = "blaap"
+        self.validator.validate_lxd_remotes_config()
+        self.assertFalse(self.validator.config_validation_successful)
+
+    def test_validate_lxd_remotes_config_fails_when_local_remote_is_missing(self):
+        del self.validator.config["lxd_remotes"]["local"]
+        self.validator.validate_lxd_remotes_config()
+        self.assertFalse(self.validator.config_validation_successful)
+        self.logger.error.assert_called_once()
+
+    def test_validate_lxd_remotes_config_fails_when_remote_is_not_a_dict(self):
+        self.validator.config["lxd_remotes"]["node1"] = "blaap"
+        self.validator.validate_lxd_remotes_config()
+        self.assertFalse(self.validator.config_validation_successful)
+        self.logger.error.assert_called_once_with(f"LXD remote node1 data does not seem to be a dict{self.validator.default_message}")
+
+    def test_validate_lxd_remotes_config_fails_when_tunnel_address_is_invalid(self):
+        self.validator.config["lxd_remotes"]["local"]["tunnel_address"] = "blaap"
+        self.validator.validate_lxd_remotes_config()
+        self.assertFalse(self.validator.config_validation_successful)
+        self.logger.error.assert_called_once_with(
+            f"LXD remote local tunnel_address does not seem to be a valid IP address{self.validator.default_message}"
+        )
+
+    def test_validate_lxd_remotes_config_fails_when_endpoint_is_not_a_https_url(self):
+        self.validator.config["lxd_remotes"]["node1"]["endpoint"] = "http://node1:8443"
+        self.validator.validate_lxd_remotes_config()
+        self.assertFalse(self.validator.config_validation_successful)
+        self.logger.error.assert_called_once_with(
+            f"LXD remote node1 endpoint does not seem to be a https:// URL{self.validator.default_message}"
+        )
+
+    def test_validate_lxd_remotes_config_fails_when_cert_is_not_a_pair(self):
+        self.validator.config["lxd_remotes"]["node1"]["cert"] = ["/tmp/crt"]
+        self.validator.validate_lxd_remotes_config()
+        self.assertFalse(self.validator.config_validation_successful)
+
+    def test_validate_lxd_remotes_config_fails_when_cert_file_does_not_exist(self):
+        self.isfile.return_value = False
+        self.validator.validate_lxd_remotes_config()
+        self.assertFalse(self.validator.config_validation_successful)
+        self.assertEqual(self.logger.error.call_count, 2)
+
+    def test_validate_lxd_remotes_config_fails_when_verify_is_invalid(self):
+        self.validator.config["lxd_remotes"]["node1"]["verify"] = 1
+        self.validator.validate_lxd_remotes_config()
+        self.assertFalse(self.validator.config_validation_successful)
+
+    def test_validate_lxd_remotes_config_places_machines_round_robin(self):
+        self.validator.validate_lxd_remotes_config()
+        remotes = [machine["remote"] for machine in self.validator.updated_config["machines"].values()]
+        self.assertEqual(remotes, ["local", "node1", "local"])
+
+    def test_validate_lxd_remotes_config_places_machines_on_least_loaded_remote(self):
+        self.validator.config["machines"]["host102"]["remote"] = "local"
+        self.validator = ValidateConfig(self.validator.config)
+        self.validator.validate_lxd_remotes_config()
+        remotes = [machine["remote"] for machine in self.validator.updated_config["machines"].values()]
+        self.assertEqual(remotes, ["node1", "local", "local"])
+
+    def test_validate_lxd_remotes_config_keeps_existing_machines_on_their_remote(self):
+        lxd_instances = Mock(return_value={"local": [], "node1": ["router100", "host102"]})
+        self.validator = ValidateConfig(self.validator.config, lxd_instances=lxd_instances)
+        self.validator.validate_lxd_remotes_config()
+        remotes = [machine["remote"] for machine in self.validator.updated_config["machines"].values()]
+        self.assertEqual(remotes, ["node1", "local", "node1"])
+        lxd_instances.assert_called_once_with(self.validator.config["lxd_remotes"])
+
+    def test_validate_lxd_remotes_config_places_new_machines_on_remote_with_least_instances(self):
+        lxd_instances = Mock(return_value={"local": ["other1", "other2", "other3"], "node1": ["other4"]})
+        self.validator = ValidateConfig(self.validator.config, lxd_instances=lxd_instances)
+        self.validator.validate_lxd_remotes_config()
+        remotes = [machine["remote"] for machine in self.validator.updated_config["machines"].values()]
+        self.assertEqual(remotes, ["node1", "node1", "local"])
+
+    def test_validate_lxd_remotes_config_does_not_get_instances_of_invalid_remotes(self):
+        lxd_instances = Mock()
+        self.validator = ValidateConfig(self.validator.config, lxd_instances=lxd_instances)
+        self.validator.config["lxd_remotes"]["node1"]["verify"] = 1
+        self.validator.validate_lxd_remotes_config()
+        self.assertFalse(lxd_instances.called)
+
+    def test_validate_lxd_remotes_config_does_not_place_netns_machines(self):
+        self.validator.config["machines"]["router101"]["type"] = "netns-host"
+        self.validator = ValidateConfig(self.validator.config)
+        self.validator.validate_lxd_remotes_config()
+        self.assertNotIn("remote", self.validator.updated_config["machines"]["router101"])
+        self.assertEqual(self.validator.updated_config["machines"]["host102"]["remote"], "node1")
+
+    def test_validate_lxd_remotes_config_does_not_change_original_config(self):
+        self.validator.validate_lxd_remotes_config()
+        self.assertNotIn("remote", self.validator.config["machines"]["router100"])
+
+
+class TestValidateConfigValidateP2PSwitchConfig(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = deepcopy(settings.CONFIG)
+        del self.config["veths"]
+        self.config["switch_config"] = {0: {"p2p": True}}
+        self.validator = ValidateConfig(self.config)
+        self.logger = self.set_up_patch("vnet_manager.config.validate.logger")
+
+    def test_validate_p2p_switch_config_runs_ok_with_good_config(self):
+        self.validator.validate_p2p_switch_config()
+        self.assertTrue(self.validator.config_validation_successful)
+        self.assertEqual(self.validator.validators_ran, 1)
+
+    def test_validate_p2p_switch_config_fails_when_switch_does_not_connect_two_interfaces(self):
+        self.config["machines"]["host102"]["interfaces"]["eth23"]["bridge"] = 0
+        self.validator = ValidateConfig(self.config)
+        self.validator.validate_p2p_switch_config()
+        self.assertFalse(self.validator.config_validation_successful)
+        self.logger.error.assert_called_once_with(
+            f"Point-to-point switch 0 should connect exactly two interfaces, found 3{self.validator.default_message}"
+        )
+
+    def test_validate_p2p_switch_config_fails_when_machines_are_on_different_remotes(self):
+        self.config["machines"]["router100"]["remote"] = "node1"
+        self.validator = ValidateConfig(self.config)
+        self.validator.validate_p2p_switch_config()
+        self.assertFalse(self.validator.config_validation_successful)
+
+    def test_validate_p2p_switch_config_fails_when_switch_connects_netns_machine(self):
+        self.config["machines"]["router100"]["type"] = "netns-host"
+        self.validator = ValidateConfig(self.config)
+        self.validator.validate_p2p_switch_config()
+        self.assertFalse(self.validator.config_validation_successful)
+        self.logger.error.assert_called_once_with(f"Point-to-point switch 0 can only connect LXC machines{self.validator.default_message}")
+
+    def test_validate_p2p_switch_config_fails_when_veth_connects_to_switch(self):
+        self.validator.config["veths"] = {"vnet-veth0": {"bridge": "vnet-br0"}}
+        self.validator.validate_p2p_switch_config()
+        self.assertFalse(self.validator.config_validation_successful)
+
+    def test_validate_p2p_switch_config_ignores_switches_that_are_not_explicitly_p2p(self):
+        self.validator.config["switch_config"] = {0: {"p2p": False}, 1: {}}
+        self.config["machines"]["host102"]["interfaces"]["eth23"]["bridge"] = 0
+        self.validator.validate_p2p_switch_config()
+        self.assertTrue(self.validator.config_validation_successful)
+
+    def test_validate_switch_specific_config_fails_when_p2p_is_not_a_boolean(self):
+        self.validator.config["switch_config"] = {0: {"p2p": "yes"}}
+        self.validator.validate_switch_specific_config()
+        self.assertFalse(self.validator.config_validation_successful)
+        self.logger.error.assert_called_once_with(
+            f"p2p parameter for switch 0 does not seem to be a boolean{self.validator.default_message}"
+        )
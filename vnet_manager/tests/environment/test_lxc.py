@@ -1,9 +1,16 @@
 from copy import deepcopy
 import shlex
-from unittest.mock import call, MagicMock
+from unittest.mock import call, Mock, MagicMock
 
 from vnet_manager.tests import VNetTestCase
-from vnet_manager.environment.lxc import ensure_vnet_lxc_environment, cleanup_vnet_lxc_environment, configure_lxc_base_machine
+from pylxd.exceptions import NotFound
+
+from vnet_manager.environment.lxc import (
+    ensure_vnet_lxc_environment,
+    ensure_lxc_golden_machine,
+    cleanup_vnet_lxc_environment,
+    configure_lxc_base_machine,
+)
 from vnet_manager.conf import settings
 
 
@@ -71,6 +78,17 @@ class TestEnsureVNetLXCEnvironment(VNetTestCase):
         self.assertFalse(self.destroy_lxc_machine.called)
         self.logger.debug.has_calls(call(f"Base image {settings.LXC_BASE_IMAGE_ALIAS} found"))
 
+    def test_ensure_vnet_lxc_environment_does_not_ensure_golden_machine_with_image_strategy(self):
+        ensure_golden = self.set_up_patch("vnet_manager.environment.lxc.ensure_lxc_golden_machine")
+        ensure_vnet_lxc_environment(self.config)
+        self.assertFalse(ensure_golden.called)
+
+    def test_ensure_vnet_lxc_environment_ensures_golden_machine_with_copy_strategy(self):
+        self.set_up_patch("vnet_manager.conf.settings.LXC_CREATE_STRATEGY", themock="copy")
+        ensure_golden = self.set_up_patch("vnet_manager.environment.lxc.ensure_lxc_golden_machine")
+        ensure_vnet_lxc_environment(self.config)
+        ensure_golden.assert_called_once_with()
+
     def test_ensure_vnet_lxc_environment_calls_base_image_creation_funtions_when_it_does_not_exist(self):
         self.check_if_lxc_image_exists.return_value = False
         ensure_vnet_lxc_environment(self.config)
@@ -82,9 +100,59 @@ class TestEnsureVNetLXCEnvironment(VNetTestCase):
         )
         self.destroy_lxc_machine.assert_called_once_with(settings.LXC_BASE_IMAGE_MACHINE_NAME, wait=False)
 
+    def test_ensure_vnet_lxc_environment_ensures_environment_on_every_used_remote(self):
+        use_lxd_remote = self.set_up_patch("vnet_manager.environment.lxc.use_lxd_remote", themock=MagicMock())
+        self.config["lxd_remotes"] = {"local": {}, "node1": {}, "node2": {}}
+        for name, remote in zip(self.config["machines"], ["local", "node2", "node2"]):
+            self.config["machines"][name]["remote"] = remote
+        ensure_vnet_lxc_environment(self.config)
+        use_lxd_remote.assert_called_once_with("node2")
+        self.assertEqual(self.check_if_lxc_storage_pool_exists.call_count, 2)
+
+    def test_ensure_vnet_lxc_environment_skips_local_environment_if_all_machines_are_on_remotes(self):
+        self.set_up_patch("vnet_manager.environment.lxc.use_lxd_remote", themock=MagicMock())
+        self.config["lxd_remotes"] = {"local": {}, "node1": {}}
+        for machine in self.config["machines"].values():
+            machine["remote"] = "node1"
+        ensure_vnet_lxc_environment(self.config)
+        self.assertEqual(self.check_if_lxc_storage_pool_exists.call_count, 1)
+
+
+class TestEnsureLXCGoldenMachine(VNetTestCase):
+    def setUp(self) -> None:
+        self.get_lxd_client = self.set_up_patch("vnet_manager.environment.lxc.get_lxd_client")
+        self.client = self.get_lxd_client.return_value
+        self.client.images.get_by_alias.return_value.fingerprint = "abc"
+        self.golden = self.client.containers.get.return_value
+        self.golden.config = {"volatile.base_image": "abc"}
+        self.create_lxc_golden_machine = self.set_up_patch("vnet_manager.environment.lxc.create_lxc_golden_machine")
+        self.destroy_lxc_machine = self.set_up_patch("vnet_manager.environment.lxc.destroy_lxc_machine")
+
+    def test_ensure_lxc_golden_machine_does_nothing_if_golden_machine_is_up_to_date(self):
+        ensure_lxc_golden_machine()
+        self.client.images.get_by_alias.assert_called_once_with(settings.LXC_BASE_IMAGE_ALIAS)
+        self.client.containers.get.assert_called_once_with(settings.LXC_GOLDEN_MACHINE_NAME)
+        self.assertFalse(self.create_lxc_golden_machine.called)
+        self.assertFalse(self.destroy_lxc_machine.called)
+
+    def test_ensure_lxc_golden_machine_creates_golden_machine_if_it_does_not_exist(self):
+        self.client.containers.get.side_effect = NotFound(Mock(status_code=404, json=Mock(return_value={"error": "not found"})))
+        ensure_lxc_golden_machine()
+        self.create_lxc_golden_machine.assert_called_once_with()
+        self.assertFalse(self.destroy_lxc_machine.called)
+
+    def test_ensure_lxc_golden_machine_recreates_golden_machine_from_older_base_image(self):
+        self.golden.config = {"volatile.base_image": "def"}
+        ensure_lxc_golden_machine()
+        self.destroy_lxc_machine.assert_called_once_with(settings.LXC_GOLDEN_MACHINE_NAME, wait=True)
+        self.create_lxc_golden_machine.assert_called_once_with()
+
 
 class TestCleanupVNetLXCEnvironment(VNetTestCase):
     def setUp(self) -> None:
+        self.check_if_lxc_machine_exists = self.set_up_patch("vnet_manager.environment.lxc.check_if_lxc_machine_exists")
+        self.check_if_lxc_machine_exists.return_value = False
+        self.destroy_lxc_machine = self.set_up_patch("vnet_manager.environment.lxc.destroy_lxc_machine")
         self.confirm = self.set_up_patch("vnet_manager.environment.lxc.request_confirmation")
         self.delete_vnet_lxc_profile = self.set_up_patch("vnet_manager.environment.lxc.delete_vnet_lxc_profile")
         self.delete_lxc_storage_pool = self.set_up_patch("vnet_manager.environment.lxc.delete_lxc_storage_pool")
@@ -98,6 +166,13 @@ class TestCleanupVNetLXCEnvironment(VNetTestCase):
         self.delete_vnet_lxc_profile.assert_called_once_with(settings.LXC_VNET_PROFILE)
         self.delete_lxc_storage_pool.assert_called_once_with(settings.LXC_STORAGE_POOL_NAME)
         self.destroy_image.assert_called_once_with(settings.LXC_BASE_IMAGE_ALIAS, by_alias=True, wait=True)
+        self.assertFalse(self.destroy_lxc_machine.called)
+
+    def test_cleanup_vnet_lxc_environment_destroys_golden_machine(self):
+        self.check_if_lxc_machine_exists.return_value = True
+        cleanup_vnet_lxc_environment()
+        self.check_if_lxc_machine_exists.assert_called_once_with(settings.LXC_GOLDEN_MACHINE_NAME)
+        self.destroy_lxc_machine.assert_called_once_with(settings.LXC_GOLDEN_MACHINE_NAME, wait=True)
 
 
 class TestConfigureLXCBaseMachine(VNetTestCase):
@@ -0,0 +1,186 @@
+from io import BytesIO
+from struct import pack_into, unpack_from
+from unittest.mock import Mock, MagicMock, call
+
+from vnet_manager.tests import VNetTestCase
+from vnet_manager.conf import settings
+from vnet_manager.operations.capture import (
+    get_pcapng_option,
+    get_pcapng_block,
+    PcapNgWriter,
+    PacketRing,
+    parse_capture_interfaces,
+    run_capture_engine,
+    main,
+    TPACKET3_HDR,
+    TPACKET_REQ3,
+    TP_STATUS_USER,
+    TP_STATUS_KERNEL,
+    SOL_PACKET,
+    PACKET_VERSION,
+    PACKET_RX_RING,
+    TPACKET_V3,
+    ETH_P_ALL,
+    PCAPNG_SECTION_HEADER_BLOCK,
+    PCAPNG_INTERFACE_DESCRIPTION_BLOCK,
+    PCAPNG_ENHANCED_PACKET_BLOCK,
+    PCAPNG_BYTE_ORDER_MAGIC,
+)
+
+
+class TestGetPcapNgOption(VNetTestCase):
+    def test_get_pcapng_option_pads_value_to_32_bits(self):
+        self.assertEqual(get_pcapng_option(2, b"eth0x"), b"\x02\x00\x05\x00eth0x\x00\x00\x00")
+
+    def test_get_pcapng_option_does_not_pad_aligned_values(self):
+        self.assertEqual(get_pcapng_option(2, b"eth0"), b"\x02\x00\x04\x00eth0")
+
+
+class TestGetPcapNgBlock(VNetTestCase):
+    def test_get_pcapng_block_wraps_body_with_type_and_lengths(self):
+        block = get_pcapng_block(6, b"abc")
+        self.assertEqual(len(block), 16)
+        self.assertEqual(unpack_from("=II", block), (6, 16))
+        self.assertEqual(block[8:12], b"abc\x00")
+        self.assertEqual(unpack_from("=I", block, 12)[0], 16)
+
+
+class TestPcapNgWriter(VNetTestCase):
+    def setUp(self) -> None:
+        self.fh = BytesIO()
+        self.writer = PcapNgWriter(self.fh)
+
+    def test_pcapng_writer_writes_section_header_block(self):
+        block_type, length, magic, major, minor = unpack_from("=IIIHH", self.fh.getvalue())
+        self.assertEqual((block_type, length, magic, major, minor), (PCAPNG_SECTION_HEADER_BLOCK, 28, PCAPNG_BYTE_ORDER_MAGIC, 1, 0))
+
+    def test_pcapng_writer_add_interface_returns_incrementing_ids(self):
+        self.assertEqual(self.writer.add_interface("vnet-br0", 96), 0)
+        self.assertEqual(self.writer.add_interface("vnet-br1", 96), 1)
+
+    def test_pcapng_writer_add_interface_writes_interface_description_block(self):
+        self.writer.add_interface("vnet-br0", 96)
+        block_type, length, linktype, _, snaplen = unpack_from("=IIHHI", self.fh.getvalue(), 28)
+        self.assertEqual((block_type, linktype, snaplen), (PCAPNG_INTERFACE_DESCRIPTION_BLOCK, 1, 96))
+        self.assertEqual(len(self.fh.getvalue()), 28 + length)
+        self.assertIn(b"vnet-br0", self.fh.getvalue())
+
+    def test_pcapng_writer_write_packet_writes_enhanced_packet_block(self):
+        self.writer.write_packet(1, (5 << 32) + 7, b"abcde", 60)
+        block_type, length, interface_id, ts_high, ts_low, captured, original = unpack_from("=IIIIIII", self.fh.getvalue(), 28)
+        self.assertEqual((block_type, length), (PCAPNG_ENHANCED_PACKET_BLOCK, 40))
+        self.assertEqual((interface_id, ts_high, ts_low, captured, original), (1, 5, 7, 5, 60))
+        self.assertEqual(self.fh.getvalue()[56:64], b"abcde\x00\x00\x00")
+
+
+class TestPacketRing(VNetTestCase):
+    def setUp(self) -> None:
+        self.socket = self.set_up_patch("vnet_manager.operations.capture.socket")
+        self.mmap = self.set_up_patch("vnet_manager.operations.capture.mmap")
+        self.ring = bytearray(512)
+        self.mmap.return_value = self.ring
+        self.packet_ring = PacketRing("vnet-br0", block_size=256, block_nr=2, frame_size=128, block_timeout=10)
+
+    def fill_block(self, block: int, packets: list):
+        offset = block * 256
+        pack_into("=III", self.ring, offset + 8, TP_STATUS_USER, len(packets), 48)
+        packet = offset + 48
+        for idx, (sec, nsec, data, length) in enumerate(packets):
+            next_offset = 64 if idx < len(packets) - 1 else 0
+            TPACKET3_HDR.pack_into(self.ring, packet, next_offset, sec, nsec, len(data), length, 0, 32, 0)
+            self.ring[packet + 32 : packet + 32 + len(data)] = data
+            packet += next_offset
+
+    def test_packet_ring_configures_tpacket_v3_ring(self):
+        sock = self.socket.return_value
+        sock.setsockopt.assert_has_calls(
+            [
+                call(SOL_PACKET, PACKET_VERSION, TPACKET_V3),
+                call(SOL_PACKET, PACKET_RX_RING, TPACKET_REQ3.pack(256, 2, 128, 4, 10, 0, 0)),
+            ]
+        )
+        self.mmap.assert_called_once_with(sock.fileno.return_value, 512)
+
+    def test_packet_ring_binds_to_interface(self):
+        self.socket.return_value.bind.assert_called_once_with(("vnet-br0", ETH_P_ALL))
+
+    def test_packet_ring_read_packets_returns_nothing_if_kernel_owns_block(self):
+        self.assertEqual(list(self.packet_ring.read_packets()), [])
+
+    def test_packet_ring_read_packets_returns_packets_of_user_owned_block(self):
+        self.fill_block(0, [(1, 5, b"abcd", 60), (2, 0, b"ef", 2)])
+        self.assertEqual(list(self.packet_ring.read_packets()), [(1000000005, b"abcd", 60), (2000000000, b"ef", 2)])
+
+    def test_packet_ring_read_packets_returns_block_to_kernel(self):
+        self.fill_block(0, [(1, 5, b"abcd", 60)])
+        list(self.packet_ring.read_packets())
+        self.assertEqual(unpack_from("=I", self.ring, 8)[0], TP_STATUS_KERNEL)
+        self.assertEqual(self.packet_ring.block, 1)
+
+    def test_packet_ring_read_packets_reads_following_blocks_and_wraps_around(self):
+        self.fill_block(0, [(1, 0, b"a", 1)])
+        self.fill_block(1, [(2, 0, b"b", 1)])
+        self.assertEqual([data for _, data, _ in self.packet_ring.read_packets()], [b"a", b"b"])
+        self.assertEqual(self.packet_ring.block, 0)
+
+    def test_packet_ring_close_closes_ring_and_socket(self):
+        self.packet_ring.ring = Mock()
+        self.packet_ring.close()
+        self.packet_ring.ring.close.assert_called_once_with()
+        self.socket.return_value.close.assert_called_once_with()
+
+
+class TestParseCaptureInterfaces(VNetTestCase):
+    def test_parse_capture_interfaces_returns_snaplen_per_interface(self):
+        self.assertEqual(
+            parse_capture_interfaces(["vnet-br0:96", "vnet-veth0"]),
+            {"vnet-br0": 96, "vnet-veth0": settings.VNET_CAPTURE_DEFAULT_SNAPLEN},
+        )
+
+
+class TestRunCaptureEngine(VNetTestCase):
+    def setUp(self) -> None:
+        self.open = self.set_up_patch("vnet_manager.operations.capture.open", themock=MagicMock())
+        self.fh = self.open.return_value.__enter__.return_value
+        self.writer = self.set_up_patch("vnet_manager.operations.capture.PcapNgWriter")
+        self.writer.return_value.add_interface.side_effect = [0, 1]
+        self.ring = self.set_up_patch("vnet_manager.operations.capture.PacketRing")
+        self.rings = [Mock(), Mock()]
+        self.rings[0].fileno.return_value = 3
+        self.rings[1].fileno.return_value = 4
+        self.rings[1].read_packets.return_value = [(42, b"abcdef", 6)]
+        self.ring.side_effect = self.rings
+        self.poll = self.set_up_patch("vnet_manager.operations.capture.poll")
+        # Stop the endless capture loop after the first batch
+        self.poll.return_value.poll.side_effect = [[(4, 1)], KeyboardInterrupt]
+
+    def run_engine(self):
+        with self.assertRaises(KeyboardInterrupt):
+            run_capture_engine({"vnet-br0": 96, "vnet-br1": 4}, "/tmp/vnet.pcapng")
+
+    def test_run_capture_engine_opens_a_ring_per_interface(self):
+        self.run_engine()
+        self.ring.assert_has_calls([call("vnet-br0"), call("vnet-br1")])
+        self.writer.return_value.add_interface.assert_has_calls([call("vnet-br0", 96), call("vnet-br1", 4)])
+
+    def test_run_capture_engine_writes_to_a_single_file(self):
+        self.run_engine()
+        self.open.assert_called_once_with("/tmp/vnet.pcapng", "wb")
+
+    def test_run_capture_engine_writes_truncated_packets_of_ready_ring(self):
+        self.run_engine()
+        self.assertFalse(self.rings[0].read_packets.called)
+        self.writer.return_value.write_packet.assert_called_once_with(1, 42, b"abcd", 6)
+        self.fh.flush.assert_called_with()
+
+    def test_run_capture_engine_closes_rings(self):
+        self.run_engine()
+        for ring in self.rings:
+            ring.close.assert_called_once_with()
+
+
+class TestCaptureMain(VNetTestCase):
+    def test_main_runs_capture_engine_with_parsed_arguments(self):
+        run_capture_engine = self.set_up_patch("vnet_manager.operations.capture.run_capture_engine")
+        self.assertEqual(main(["/tmp/vnet.pcapng", "vnet-br0:96", "vnet-br1"]), 0)
+        run_capture_engine.assert_called_once_with({"vnet-br0": 96, "vnet-br1": settings.VNET_CAPTURE_DEFAULT_SNAPLEN}, "/tmp/vnet.pcapng")
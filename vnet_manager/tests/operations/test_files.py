@@ -1,12 +1,26 @@
+import tarfile
+from hashlib import sha256
+from json import dumps
+from mmap import mmap
 from copy import deepcopy
+from io import BytesIO
+from os import chmod, makedirs, walk
+from os.path import join, isdir, isfile
+from tempfile import TemporaryDirectory
 from unittest.mock import call, patch, mock_open, MagicMock
-from os.path import join
 from pylxd.exceptions import NotFound
 
 from vnet_manager.tests import VNetTestCase
 from vnet_manager.operations.files import (
     put_files_on_machine,
+    get_files_to_put_on_machine,
     select_files_and_put_on_machine,
+    get_sha256,
+    get_lxc_file_manifest,
+    update_lxc_file_manifest,
+    open_file_for_upload,
+    create_tar_archive,
+    put_files_on_lxc_machine,
     place_file_on_lxc_machine,
     generate_vnet_hosts_file,
     place_vnet_hosts_file_on_machines,
@@ -19,22 +33,76 @@ class TestPutFilesOnMachine(VNetTestCase):
     def setUp(self) -> None:
         # Use VALIDATED_CONFIG because here the files part has been expanded to the absolute paths
         self.config = deepcopy(settings.VALIDATED_CONFIG)
-        self.select_and_put_on_machine = self.set_up_patch("vnet_manager.operations.files.select_files_and_put_on_machine")
+        self.get_files_to_put_on_machine = self.set_up_patch("vnet_manager.operations.files.get_files_to_put_on_machine")
+        self.put_files_on_lxc_machine = self.set_up_patch("vnet_manager.operations.files.put_files_on_lxc_machine")
 
-    def test_put_files_on_machine_gets_file_paths_from_config_and_calls_select_files_and_put_on_machine(self):
-        calls = [
-            call(name, data["files"], settings.MACHINE_TYPE_PROVIDER_MAPPING[data["type"]])
-            for name, data in self.config["machines"].items()
-            if "files" in data
-        ]
+    def test_put_files_on_machine_gets_file_paths_from_config(self):
+        put_files_on_machine(self.config)
+        self.get_files_to_put_on_machine.assert_has_calls(
+            [call(data["files"]) for data in self.config["machines"].values() if "files" in data]
+        )
+
+    def test_put_files_on_machine_puts_all_files_of_a_machine_at_once(self):
         put_files_on_machine(self.config)
-        self.select_and_put_on_machine.assert_has_calls(calls)
+        self.put_files_on_lxc_machine.assert_has_calls(
+            [call(name, self.get_files_to_put_on_machine.return_value) for name, data in self.config["machines"].items() if "files" in data]
+        )
+
+    def test_put_files_on_machine_only_puts_files_on_requested_machines(self):
+        put_files_on_machine(self.config, machines=["router101"])
+        self.put_files_on_lxc_machine.assert_called_once_with("router101", self.get_files_to_put_on_machine.return_value)
 
-    def test_put_files_on_machine_does_not_call_select_files_and_put_on_machine_when_there_are_no_machines_with_files(self):
+    def test_put_files_on_machine_returns_transfer_stats_per_machine(self):
+        ret = put_files_on_machine(self.config)
+        self.assertEqual(
+            ret, {"router100": self.put_files_on_lxc_machine.return_value, "router101": self.put_files_on_lxc_machine.return_value}
+        )
+
+    def test_put_files_on_machine_does_not_put_files_when_there_are_no_machines_with_files(self):
         del self.config["machines"]["router100"]
         del self.config["machines"]["router101"]
         put_files_on_machine(self.config)
-        self.assertFalse(self.select_and_put_on_machine.called)
+        self.assertFalse(self.put_files_on_lxc_machine.called)
+
+
+class TestGetFilesToPutOnMachine(VNetTestCase):
+    def setUp(self) -> None:
+        self.logger = self.set_up_patch("vnet_manager.operations.files.logger")
+        self.is_dir = self.set_up_patch("vnet_manager.operations.files.isdir")
+        self.is_dir.return_value = False
+        self.is_file = self.set_up_patch("vnet_manager.operations.files.isfile")
+        self.is_file.return_value = True
+        self.walk = self.set_up_patch("vnet_manager.operations.files.walk")
+        self.walk.return_value = [("/host", ["sub"], ["file2", "file1"]), ("/host/sub", [], ["file3"])]
+
+    def test_get_files_to_put_on_machine_returns_single_file(self):
+        self.assertEqual(get_files_to_put_on_machine({"/host/file": "/guest/file"}), [("/host/file", "/guest/file")])
+
+    def test_get_files_to_put_on_machine_returns_files_in_dir_and_subdirs(self):
+        self.is_dir.return_value = True
+        self.assertEqual(
+            get_files_to_put_on_machine({"/host": "/guest"}),
+            [("/host/file1", "/guest/file1"), ("/host/file2", "/guest/file2"), ("/host/sub/file3", "/guest/sub/file3")],
+        )
+
+    def test_get_files_to_put_on_machine_returns_nested_files_of_real_dir(self):
+        self.is_dir.side_effect = isdir
+        self.is_file.side_effect = isfile
+        self.walk.side_effect = walk
+        with TemporaryDirectory() as tmp_dir:
+            makedirs(join(tmp_dir, "a", "b"))
+            for path in ("top", join("a", "b", "nested")):
+                with open(join(tmp_dir, path), "wb") as fh:
+                    fh.write(b"\x00\xff")
+            self.assertEqual(
+                get_files_to_put_on_machine({tmp_dir: "/guest"}),
+                [(join(tmp_dir, "top"), "/guest/top"), (join(tmp_dir, "a", "b", "nested"), "/guest/a/b/nested")],
+            )
+
+    def test_get_files_to_put_on_machine_skips_and_logs_error_if_path_is_not_a_dir_or_file(self):
+        self.is_file.return_value = False
+        self.assertEqual(get_files_to_put_on_machine({"/host/file": "/guest/file"}), [])
+        self.logger.error.assert_called_once_with("Tried to select file /host/file for copying, but it is neither a file nor a directory")
 
 
 class TestSelectFilesAndPutOnMachine(VNetTestCase):
@@ -45,10 +113,10 @@ class TestSelectFilesAndPutOnMachine(VNetTestCase):
         self.is_file = self.set_up_patch("vnet_manager.operations.files.isfile")
         self.is_file.return_value = True
         self.place_file_on_lxc_machine = self.set_up_patch("vnet_manager.operations.files.place_file_on_lxc_machine")
-        self.list_dir = self.set_up_patch("vnet_manager.operations.files.listdir")
-        self.list_dir.return_value = ["file1", "file2", "file3"]
+        self.walk = self.set_up_patch("vnet_manager.operations.files.walk")
         self.machine = "router100"
         self.files = settings.VALIDATED_CONFIG["machines"]["router100"]["files"]
+        self.walk.return_value = [(next(iter(self.files)), [], ["file1", "file2", "file3"])]
 
     def test_select_files_and_put_on_machine_calls_check_methods_to_check_for_file_or_dir(self):
         self.is_dir.return_value = False
@@ -61,15 +129,15 @@ class TestSelectFilesAndPutOnMachine(VNetTestCase):
         select_files_and_put_on_machine(self.machine, self.files, "lxc")
         self.place_file_on_lxc_machine.assert_called_once_with(self.machine, next(iter(self.files)), next(iter(self.files.values())))
 
-    def test_select_files_and_put_on_machine_calls_listdir_function(self):
+    def test_select_files_and_put_on_machine_calls_walk_function(self):
         select_files_and_put_on_machine(self.machine, self.files, "lxc")
-        self.list_dir.assert_called_once_with(next(iter(self.files)))
+        self.walk.assert_called_once_with(next(iter(self.files)))
 
     def test_select_files_and_put_on_machine_calls_place_method_for_each_file_in_dir(self):
         select_files_and_put_on_machine(self.machine, self.files, "lxc")
         calls = [
             call(self.machine, join(next(iter(self.files)), file), join(next(iter(self.files.values())), file))
-            for file in self.list_dir.return_value
+            for file in ["file1", "file2", "file3"]
         ]
         self.place_file_on_lxc_machine.assert_has_calls(calls)
 
@@ -86,7 +154,10 @@ class TestPlaceFileOnLXCContainer(VNetTestCase):
     def setUp(self) -> None:
         self.get_lxd_client = self.set_up_patch("vnet_manager.operations.files.get_lxd_client")
         self.machine = MagicMock()
+        self.machine.config = {}
         self.get_lxd_client.return_value.containers.get.return_value = self.machine
+        self.get_sha256 = self.set_up_patch("vnet_manager.operations.files.get_sha256")
+        self.get_sha256.return_value = "digest"
         self.is_file = self.set_up_patch("vnet_manager.operations.files.isfile")
         self.host_file_p = "/root/host"
         self.guest_file_p = "/root/guest"
@@ -97,15 +168,14 @@ class TestPlaceFileOnLXCContainer(VNetTestCase):
         self.get_lxd_client.assert_called_once_with()
 
     @patch("builtins.open", new_callable=mock_open, read_data="data")
-    def test_place_file_on_lxc_machine_calls_open(self, open_mock):
+    def test_place_file_on_lxc_machine_opens_file_in_binary_mode(self, open_mock):
         place_file_on_lxc_machine("router100", self.host_file_p, self.guest_file_p)
-        open_mock.assert_called_once_with(self.host_file_p, "r", encoding="utf-8")
+        open_mock.assert_called_once_with(self.host_file_p, "rb")
 
     @patch("builtins.open", new_callable=mock_open, read_data="data")
-    def test_place_file_on_lxc_machine_calls_open_read_function(self, open_mock):
+    def test_place_file_on_lxc_machine_does_not_read_file_into_memory(self, open_mock):
         place_file_on_lxc_machine("router100", self.host_file_p, self.guest_file_p)
-        handle = open_mock()
-        handle.read.assert_called_once_with()
+        self.assertFalse(open_mock.return_value.read.called)
 
     @patch("builtins.open", new_callable=mock_open, read_data="data")
     def test_place_file_on_lxc_machine_does_nothing_if_container_not_found(self, _):
@@ -120,15 +190,42 @@ class TestPlaceFileOnLXCContainer(VNetTestCase):
         self.assertFalse(open_mock.called)
 
     @patch("builtins.open", new_callable=mock_open, read_data="data")
-    def test_place_file_on_lxc_machine_calls_files_put_method_on_machine(self, _):
+    def test_place_file_on_lxc_machine_streams_file_handle_to_files_put_method_on_machine(self, open_mock):
         place_file_on_lxc_machine("router100", self.host_file_p, self.guest_file_p)
-        self.machine.files.put.assert_called_once_with(self.guest_file_p, "data")
+        self.machine.files.put.assert_called_once_with(self.guest_file_p, open_mock.return_value)
+
+
+class TestOpenFileForUpload(VNetTestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.host_file = join(self.tmp_dir.name, "dataset.bin")
+        self.data = bytes(range(256)) * 64
+        with open(self.host_file, "wb") as fh:
+            fh.write(self.data)
+
+    def test_open_file_for_upload_returns_binary_file_handle(self):
+        with open_file_for_upload(self.host_file) as fh:
+            self.assertEqual(fh.read(), self.data)
+
+    def test_open_file_for_upload_returns_memory_map_of_file(self):
+        with open_file_for_upload(self.host_file, use_mmap=True) as fh:
+            self.assertIsInstance(fh, mmap)
+            self.assertEqual(len(fh), len(self.data))
+            self.assertEqual(fh.read(16), self.data[:16])
+
+    def test_open_file_for_upload_returns_file_handle_for_empty_file_with_mmap(self):
+        open(self.host_file, "wb").close()  # pylint: disable=consider-using-with
+        with open_file_for_upload(self.host_file, use_mmap=True) as fh:
+            self.assertNotIsInstance(fh, mmap)
+            self.assertEqual(fh.read(), b"")
 
 
 class TestWriteFilesToLXCContainer(VNetTestCase):
     def setUp(self) -> None:
         self.get_lxd_client = self.set_up_patch("vnet_manager.operations.files.get_lxd_client")
         self.machine = MagicMock()
+        self.machine.config = {}
         self.get_lxd_client.return_value.containers.get.return_value = self.machine
 
     def test_write_files_to_lxc_container_calls_lxd_client(self):
@@ -148,6 +245,68 @@ class TestWriteFilesToLXCContainer(VNetTestCase):
         write_file_to_lxc_container("blaap", "blaap", "blaap")
         self.assertFalse(self.machine.files.put.called)
 
+    def test_write_files_to_lxc_container_adds_written_file_to_manifest(self):
+        write_file_to_lxc_container("blaap", "path", "data")
+        manifest = dumps({"path": sha256(b"data").hexdigest()}, sort_keys=True)
+        self.machine.api.patch.assert_called_once_with(json={"config": {settings.LXC_FILE_MANIFEST_CONFIG_KEY: manifest}})
+
+    def test_write_files_to_lxc_container_skips_unchanged_file(self):
+        self.machine.config = {settings.LXC_FILE_MANIFEST_CONFIG_KEY: dumps({"path": sha256(b"data").hexdigest()})}
+        write_file_to_lxc_container("blaap", "path", "data")
+        self.assertFalse(self.machine.files.put.called)
+        self.assertFalse(self.machine.api.patch.called)
+
+    def test_write_files_to_lxc_container_writes_changed_file(self):
+        self.machine.config = {settings.LXC_FILE_MANIFEST_CONFIG_KEY: dumps({"path": sha256(b"old").hexdigest()})}
+        write_file_to_lxc_container("blaap", "path", "data")
+        self.machine.files.put.assert_called_once_with("path", "data")
+
+
+class TestGetSHA256(VNetTestCase):
+    def test_get_sha256_hashes_strings_as_utf8(self):
+        self.assertEqual(get_sha256("data"), sha256(b"data").hexdigest())
+
+    def test_get_sha256_hashes_bytes(self):
+        self.assertEqual(get_sha256(b"\x00\xff"), sha256(b"\x00\xff").hexdigest())
+
+    def test_get_sha256_hashes_file_objects_and_rewinds_them(self):
+        fh = BytesIO(b"\x00\xff" * 1000)
+        self.assertEqual(get_sha256(fh), sha256(b"\x00\xff" * 1000).hexdigest())
+        self.assertEqual(fh.tell(), 0)
+
+
+class TestGetLXCFileManifest(VNetTestCase):
+    def setUp(self) -> None:
+        self.machine = MagicMock()
+
+    def test_get_lxc_file_manifest_returns_empty_manifest_if_there_is_none(self):
+        self.machine.config = {}
+        self.assertEqual(get_lxc_file_manifest(self.machine.name, self.machine.config), {})
+
+    def test_get_lxc_file_manifest_returns_manifest_from_container_config(self):
+        self.machine.config = {settings.LXC_FILE_MANIFEST_CONFIG_KEY: '{"/etc/hosts": "abc"}'}
+        self.assertEqual(get_lxc_file_manifest(self.machine.name, self.machine.config), {"/etc/hosts": "abc"})
+
+    def test_get_lxc_file_manifest_ignores_corrupt_manifest(self):
+        self.machine.config = {settings.LXC_FILE_MANIFEST_CONFIG_KEY: "{corrupt"}
+        self.assertEqual(get_lxc_file_manifest(self.machine.name, self.machine.config), {})
+
+
+class TestUpdateLXCFileManifest(VNetTestCase):
+    def setUp(self) -> None:
+        self.machine = MagicMock()
+        self.machine.config = {settings.LXC_FILE_MANIFEST_CONFIG_KEY: '{"/etc/hosts": "abc"}'}
+
+    def test_update_lxc_file_manifest_patches_merged_manifest_into_container_config(self):
+        update_lxc_file_manifest(self.machine, {"/etc/frr/frr.conf": "def"})
+        self.machine.api.patch.assert_called_once_with(
+            json={"config": {settings.LXC_FILE_MANIFEST_CONFIG_KEY: '{"/etc/frr/frr.conf": "def", "/etc/hosts": "abc"}'}}
+        )
+
+    def test_update_lxc_file_manifest_updates_local_container_config(self):
+        update_lxc_file_manifest(self.machine, {"/etc/hosts": "def"})
+        self.assertEqual(get_lxc_file_manifest(self.machine.name, self.machine.config), {"/etc/hosts": "def"})
+
 
 class TestGenerateVNetHostsFile(VNetTestCase):
     def setUp(self) -> None:
@@ -179,3 +338,130 @@ class TestPlaceVNetHostsFileOnMachines(VNetTestCase):
         calls = [call(name, {settings.VNET_ETC_HOSTS_FILE_PATH: "/etc/hosts"}, "lxc") for name in self.config["machines"]]
         place_vnet_hosts_file_on_machines(self.config)
         self.select_and_put.assert_has_calls(calls)
+
+    def test_place_vnet_hosts_file_on_machines_only_places_hosts_file_on_requested_machines(self):
+        place_vnet_hosts_file_on_machines(self.config, machines=["host102"])
+        self.select_and_put.assert_called_once_with("host102", {settings.VNET_ETC_HOSTS_FILE_PATH: "/etc/hosts"}, "lxc")
+
+
+class TestCreateTarArchive(VNetTestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.host_file = join(self.tmp_dir.name, "frr.conf")
+        with open(self.host_file, "wb") as fh:
+            fh.write(b"router bgp 65000\n")
+        chmod(self.host_file, 0o640)
+
+    def get_members(self) -> list:
+        archive = BytesIO()
+        create_tar_archive([(self.host_file, "/etc/frr/frr.conf")], archive)
+        archive.seek(0)
+        with tarfile.open(fileobj=archive) as tar:
+            return [(member, tar.extractfile(member).read()) for member in tar.getmembers()]
+
+    def test_create_tar_archive_uses_guest_paths_as_member_names(self):
+        self.assertEqual([member.name for member, _ in self.get_members()], ["etc/frr/frr.conf"])
+
+    def test_create_tar_archive_contains_file_data(self):
+        self.assertEqual(self.get_members()[0][1], b"router bgp 65000\n")
+
+    def test_create_tar_archive_preserves_file_mode(self):
+        self.assertEqual(self.get_members()[0][0].mode, 0o640)
+
+
+class TestPutFilesOnLXCMachine(VNetTestCase):
+    def setUp(self) -> None:
+        self.get_lxd_client = self.set_up_patch("vnet_manager.operations.files.get_lxd_client")
+        self.machine = MagicMock()
+        self.machine.config = {}
+        self.machine.name = "router100"
+        self.machine.execute.return_value = (0, "", "")
+        self.get_file_sha256 = self.set_up_patch("vnet_manager.operations.files.get_file_sha256")
+        self.get_file_sha256.side_effect = lambda path: f"{path}-hash"
+        self.get_lxd_client.return_value.containers.get.return_value = self.machine
+        self.is_file = self.set_up_patch("vnet_manager.operations.files.isfile")
+        self.is_file.return_value = True
+        self.get_size = self.set_up_patch("vnet_manager.operations.files.getsize")
+        self.get_size.return_value = 10
+        self.create_tar_archive = self.set_up_patch("vnet_manager.operations.files.create_tar_archive")
+        self.create_tar_archive.side_effect = lambda files, fileobj: fileobj.write(b"archive")
+        self.temporary_file = self.set_up_patch("vnet_manager.operations.files.TemporaryFile")
+        self.archive = BytesIO()
+        self.temporary_file.return_value = self.archive
+        self.place_file_on_lxc_machine = self.set_up_patch("vnet_manager.operations.files.place_file_on_lxc_machine")
+        self.logger = self.set_up_patch("vnet_manager.operations.files.logger")
+        self.files = [("/host/file1", "/guest/file1"), ("/host/file2", "/guest/file2")]
+
+    def test_put_files_on_lxc_machine_gets_container_once(self):
+        put_files_on_lxc_machine("router100", self.files)
+        self.get_lxd_client.return_value.containers.get.assert_called_once_with("router100")
+
+    def test_put_files_on_lxc_machine_creates_a_single_archive_on_disk(self):
+        put_files_on_lxc_machine("router100", self.files)
+        self.temporary_file.assert_called_once_with()
+        self.create_tar_archive.assert_called_once_with(self.files, self.archive)
+
+    def test_put_files_on_lxc_machine_streams_archive_once_from_the_start(self):
+        self.machine.files.put.side_effect = lambda path, fileobj: self.assertEqual(fileobj.read(), b"archive")
+        put_files_on_lxc_machine("router100", self.files)
+        self.machine.files.put.assert_called_once_with(settings.VNET_FILES_ARCHIVE_GUEST_PATH, self.archive)
+
+    def test_put_files_on_lxc_machine_extracts_archive_preserving_ownership(self):
+        put_files_on_lxc_machine("router100", self.files)
+        command = self.machine.execute.call_args[0][0][-1]
+        self.assertIn(f"tar -xpf {settings.VNET_FILES_ARCHIVE_GUEST_PATH} --same-owner --numeric-owner -C /", command)
+        self.assertIn(f"rm -f {settings.VNET_FILES_ARCHIVE_GUEST_PATH}", command)
+
+    def test_put_files_on_lxc_machine_returns_transfer_stats(self):
+        stats = put_files_on_lxc_machine("router100", self.files)
+        self.assertEqual((stats["files"], stats["bytes"], stats["archive"]), (2, 20, 7))
+        self.assertIn("duration", stats)
+
+    def test_put_files_on_lxc_machine_skips_files_that_do_not_exist(self):
+        self.is_file.side_effect = [True, False]
+        put_files_on_lxc_machine("router100", self.files)
+        self.create_tar_archive.assert_called_once_with(self.files[:1], self.archive)
+        self.assertEqual(self.logger.error.call_count, 1)
+
+    def test_put_files_on_lxc_machine_does_nothing_if_there_are_no_files(self):
+        self.is_file.return_value = False
+        put_files_on_lxc_machine("router100", self.files)
+        self.assertFalse(self.get_lxd_client.called)
+
+    def test_put_files_on_lxc_machine_returns_empty_stats_if_container_not_found(self):
+        self.get_lxd_client.return_value.containers.get.side_effect = NotFound(response=b"response")
+        self.assertEqual(put_files_on_lxc_machine("router100", self.files), {})
+        self.assertFalse(self.machine.files.put.called)
+
+    def test_put_files_on_lxc_machine_does_not_place_files_one_by_one_if_archive_is_extracted(self):
+        put_files_on_lxc_machine("router100", self.files)
+        self.assertFalse(self.place_file_on_lxc_machine.called)
+
+    def test_put_files_on_lxc_machine_places_files_one_by_one_if_archive_extraction_fails(self):
+        self.machine.execute.return_value = (1, "", "tar: not found")
+        put_files_on_lxc_machine("router100", self.files)
+        self.place_file_on_lxc_machine.assert_has_calls([call("router100", host, guest) for host, guest in self.files])
+
+    def test_put_files_on_lxc_machine_adds_extracted_files_to_manifest(self):
+        put_files_on_lxc_machine("router100", self.files)
+        manifest = dumps({"/guest/file1": "/host/file1-hash", "/guest/file2": "/host/file2-hash"}, sort_keys=True)
+        self.machine.api.patch.assert_called_once_with(json={"config": {settings.LXC_FILE_MANIFEST_CONFIG_KEY: manifest}})
+
+    def test_put_files_on_lxc_machine_does_not_add_files_to_manifest_if_archive_extraction_fails(self):
+        self.machine.execute.return_value = (1, "", "tar: not found")
+        put_files_on_lxc_machine("router100", self.files)
+        self.assertFalse(self.machine.api.patch.called)
+
+    def test_put_files_on_lxc_machine_only_transfers_changed_files(self):
+        self.machine.config = {settings.LXC_FILE_MANIFEST_CONFIG_KEY: dumps({"/guest/file1": "/host/file1-hash"})}
+        stats = put_files_on_lxc_machine("router100", self.files)
+        self.create_tar_archive.assert_called_once_with(self.files[1:], self.archive)
+        self.assertEqual((stats["files"], stats["skipped"], stats["bytes"]), (1, 1, 10))
+
+    def test_put_files_on_lxc_machine_does_not_transfer_anything_if_all_files_are_unchanged(self):
+        self.machine.config = {settings.LXC_FILE_MANIFEST_CONFIG_KEY: dumps({guest: f"{host}-hash" for host, guest in self.files})}
+        stats = put_files_on_lxc_machine("router100", self.files)
+        self.assertFalse(self.machine.files.put.called)
+        self.assertFalse(self.machine.execute.called)
+        self.assertEqual((stats["files"], stats["skipped"], stats["archive"]), (0, 2, 0))
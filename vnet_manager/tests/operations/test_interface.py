@@ -1,18 +1,32 @@
 import shlex
-from subprocess import DEVNULL, CalledProcessError
+import sys
+from subprocess import CalledProcessError, PIPE, STDOUT
 from unittest.mock import Mock, MagicMock, ANY, call
 from copy import deepcopy
+from signal import SIGKILL
 
 from vnet_manager.tests import VNetTestCase
 from vnet_manager.operations.interface import (
+    get_bridge_stp_state,
+    get_interface_status_map,
+    get_interface_name_map,
+    set_bridge_stp_state,
     get_vnet_interface_names_from_config,
     get_machines_by_vnet_interface_name,
     show_vnet_interface_status,
     show_vnet_veth_interface_status,
     check_if_interface_exists,
-    create_vnet_interface,
+    create_vnet_interfaces,
+    create_vnet_vxlan_interfaces,
+    create_vnet_p2p_interfaces,
+    get_interface_index_map,
+    get_interface_link_map,
     create_veth_interface,
+    get_vnet_interface_iptables_rules,
+    get_iptables_filter_rules,
+    apply_iptables_filter_rules,
     create_vnet_interface_iptables_rules,
+    delete_vnet_interface_iptables_rules,
     configure_vnet_interface,
     configure_veth_interface,
     bring_up_vnet_interfaces,
@@ -20,7 +34,10 @@ from vnet_manager.operations.interface import (
     check_if_sniffer_exists,
     bring_down_vnet_interfaces,
     delete_vnet_interfaces,
+    get_sniffer_options_for_interface,
+    get_tcpdump_command,
     start_tcpdump_on_vnet_interface,
+    start_capture_engine_on_vnet_interfaces,
     kill_tcpdump_processes_on_vnet_interfaces,
 )
 from vnet_manager.conf import settings
@@ -50,17 +67,29 @@ class TestGetMachinesByVNetInterfaceName(VNetTestCase):
         for interface in interface_mapping:
             self.assertEqual(get_machines_by_vnet_interface_name(settings.CONFIG, interface), interface_mapping[interface])
 
+    def test_get_machines_by_vnet_interface_name_handles_more_than_ten_switches(self):
+        config = deepcopy(settings.CONFIG)
+        config["switches"] = 12
+        config["machines"]["host102"]["interfaces"]["eth23"]["bridge"] = 11
+        self.assertEqual(get_machines_by_vnet_interface_name(config, settings.VNET_BRIDGE_NAME + "1"), ["router101"])
+        self.assertEqual(get_machines_by_vnet_interface_name(config, settings.VNET_BRIDGE_NAME + "11"), ["host102"])
+
+    def test_get_machines_by_vnet_interface_name_returns_nothing_for_unknown_interfaces(self):
+        self.assertEqual(get_machines_by_vnet_interface_name(settings.CONFIG, "blaap"), [])
+
 
 class TestShowVNetInterfaceStatus(VNetTestCase):
     def setUp(self) -> None:
         self.iproute_obj = Mock()
         self.iproute = self.set_up_patch("vnet_manager.operations.interface.IPRoute")
         self.iproute.return_value = self.iproute_obj
-        self.iproute_obj.link_lookup.return_value = "dev1"
-        self.ndb_obj = MagicMock()
-        self.ndb = self.set_up_patch("vnet_manager.operations.interface.NDB", themock=MagicMock())
+        self.get_interface_status_map = self.set_up_patch("vnet_manager.operations.interface.get_interface_status_map")
+        self.get_interface_status_map.return_value = {
+            10: {"name": "vnet-br0", "state": "up", "address": "mac", "link": None, "master": None, "stp": True}
+        }
         self.check_if_sniffer_exists = self.set_up_patch("vnet_manager.operations.interface.check_if_sniffer_exists")
         self.check_if_sniffer_exists.return_value = True
+        self.get_sniffer_pid_map = self.set_up_patch("vnet_manager.operations.interface.get_sniffer_pid_map")
         self.tabulate = self.set_up_patch("vnet_manager.operations.interface.tabulate")
         self.interfaces = self.set_up_patch("vnet_manager.operations.interface.get_vnet_interface_names_from_config")
         self.interfaces.return_value = ["vnet-br0"]
@@ -69,9 +98,18 @@ class TestShowVNetInterfaceStatus(VNetTestCase):
         show_vnet_interface_status(settings.CONFIG)
         self.iproute.assert_called_once_with()
 
-    def test_show_vnet_interface_status_calls_ndb(self):
+    def test_show_vnet_interface_status_dumps_links_once(self):
+        show_vnet_interface_status(settings.CONFIG)
+        self.get_interface_status_map.assert_called_once_with(self.iproute_obj)
+
+    def test_show_vnet_interface_status_closes_iproute(self):
+        show_vnet_interface_status(settings.CONFIG)
+        self.iproute_obj.close.assert_called_once_with()
+
+    def test_show_vnet_interface_status_shows_disabled_stp(self):
+        self.get_interface_status_map.return_value[10]["stp"] = False
         show_vnet_interface_status(settings.CONFIG)
-        self.ndb.assert_called_once_with(log=False)
+        self.assertFalse(self.tabulate.call_args[0][0][0][4])
 
     def test_show_vnet_interfaces_status_calls_get_vnet_interface_names_from_config(self):
         show_vnet_interface_status(settings.CONFIG)
@@ -83,24 +121,26 @@ class TestShowVNetInterfaceStatus(VNetTestCase):
         show_vnet_interface_status(settings.CONFIG)
         machines.assert_called_once_with(settings.CONFIG, self.interfaces.return_value[0])
 
-    def test_show_vnet_interface_status_calls_link_lookup(self):
+    def test_show_vnet_interface_status_calls_check_if_sniffer_exists(self):
         show_vnet_interface_status(settings.CONFIG)
-        self.iproute_obj.link_lookup.assert_called_once_with(ifname=self.interfaces.return_value[0])
+        self.check_if_sniffer_exists.assert_called_once_with(
+            self.interfaces.return_value[0], sniffers=self.get_sniffer_pid_map.return_value
+        )
 
-    def test_show_vnet_interface_status_calls_check_if_sniffer_exists(self):
+    def test_show_vnet_interface_status_looks_up_sniffers_once(self):
         show_vnet_interface_status(settings.CONFIG)
-        self.check_if_sniffer_exists.assert_called_once_with(self.interfaces.return_value[0])
+        self.get_sniffer_pid_map.assert_called_once_with(self.interfaces.return_value)
 
     def test_show_vnet_interface_status_calls_tabulate(self):
         show_vnet_interface_status(settings.CONFIG)
         self.tabulate.assert_called_once_with(
-            [["vnet-br0", ANY, ANY, self.check_if_sniffer_exists.return_value, True, "router100, router101"]],
+            [["vnet-br0", "up", "mac", self.check_if_sniffer_exists.return_value, True, "router100, router101"]],
             headers=["Name", "Status", "L2_addr", "Sniffer", "STP", "Used by"],
             tablefmt="pretty",
         )
 
     def test_show_vnet_interface_status_makes_correct_output_if_interface_does_not_exist(self):
-        self.iproute_obj.link_lookup.return_value = []
+        self.get_interface_status_map.return_value = {}
         show_vnet_interface_status(settings.CONFIG)
         self.assertFalse(self.check_if_sniffer_exists.called)
         self.tabulate.assert_called_once_with(
@@ -113,7 +153,7 @@ class TestShowVNetInterfaceStatus(VNetTestCase):
         self.check_if_sniffer_exists.return_value = False
         show_vnet_interface_status(settings.CONFIG)
         self.tabulate.assert_called_once_with(
-            [["vnet-br0", ANY, ANY, self.check_if_sniffer_exists.return_value, True, "router100, router101"]],
+            [["vnet-br0", "up", "mac", self.check_if_sniffer_exists.return_value, True, "router100, router101"]],
             headers=["Name", "Status", "L2_addr", "Sniffer", "STP", "Used by"],
             tablefmt="pretty",
         )
@@ -124,45 +164,41 @@ class TestShowVNetVethInterfaceStatus(VNetTestCase):
         self.iproute_obj = Mock()
         self.iproute = self.set_up_patch("vnet_manager.operations.interface.IPRoute")
         self.iproute.return_value = self.iproute_obj
-        self.iproute_obj.link.return_value = [
-            {
-                "state": "up",
-                "attrs": [
-                    ("IFLA_ADDRESS", "mac"),
-                    ("IFLA_LINK", "dev2"),
-                    ("IFLA_IFNAME", "peer"),
-                    ("IFLA_MASTER", "eth0"),
-                    ("IFLA_IFNAME", "master"),
-                ],
-            }
-        ]
-        self.iproute_obj.link_lookup.return_value = ["dev1"]
+        self.get_interface_status_map = self.set_up_patch("vnet_manager.operations.interface.get_interface_status_map")
+        self.get_interface_status_map.return_value = {
+            10: {"name": "vnet-br0", "state": "up", "address": "mac0", "link": None, "master": None, "stp": False},
+            11: {"name": "vnet-br1", "state": "up", "address": "mac1", "link": None, "master": None, "stp": False},
+            20: {"name": "vnet-veth0", "state": "up", "address": "mac2", "link": 21, "master": 10, "stp": False},
+            21: {"name": "vnet-veth1", "state": "down", "address": "mac3", "link": 20, "master": 11, "stp": False},
+        }
         self.tabulate = self.set_up_patch("vnet_manager.operations.interface.tabulate")
 
     def test_show_vnet_veth_interface_status_calls_iproute(self):
         show_vnet_veth_interface_status(settings.CONFIG)
         self.iproute.assert_called_once_with()
+        self.iproute_obj.close.assert_called_once_with()
 
-    def test_show_vnet_veth_interface_status_calls_ip_lookup(self):
-        calls = [call(ifname=i) for i in settings.CONFIG["veths"]]
+    def test_show_vnet_veth_interface_status_dumps_links_once(self):
         show_vnet_veth_interface_status(settings.CONFIG)
-        self.iproute_obj.link_lookup.assert_has_calls(calls)
-
-    def test_show_vnet_veth_interface_status_calls_ip_link(self):
-        show_vnet_veth_interface_status(settings.CONFIG)
-        calls = [call("get", index="dev1"), call("get", index="dev2"), call("get", index="eth0")]
-        self.iproute_obj.link.assert_has_calls(calls)
+        self.get_interface_status_map.assert_called_once_with(self.iproute_obj)
+        self.assertFalse(self.iproute_obj.link.called)
+        self.assertFalse(self.iproute_obj.link_lookup.called)
 
     def test_show_vnet_veth_interface_status_calls_tabulate(self):
         show_vnet_veth_interface_status(settings.CONFIG)
         self.tabulate.assert_called_once_with(
-            [["vnet-veth1", "up", "mac", "peer", "peer"], ["vnet-veth0", "up", "mac", "peer", "peer"]],
+            [["vnet-veth1", "down", "mac3", "vnet-veth0", "vnet-br1"], ["vnet-veth0", "up", "mac2", "vnet-veth1", "vnet-br0"]],
             headers=["Name", "Status", "L2_addr", "Peer", "Master"],
             tablefmt="pretty",
         )
 
+    def test_show_vnet_veth_interface_status_shows_na_for_unknown_peer_and_master(self):
+        self.get_interface_status_map.return_value[21].update(link=99, master=None)
+        show_vnet_veth_interface_status(settings.CONFIG)
+        self.assertEqual(self.tabulate.call_args[0][0][0], ["vnet-veth1", "down", "mac3", "NA", "NA"])
+
     def test_show_vnet_veth_interface_status_calls_tabulate_when_dev_does_not_exist(self):
-        self.iproute_obj.link_lookup.return_value = []
+        self.get_interface_status_map.return_value = {}
         show_vnet_veth_interface_status(settings.CONFIG)
         self.tabulate.assert_called_once_with(
             [["vnet-veth1", "NA", "NA", "NA", "vnet-br1"], ["vnet-veth0", "NA", "NA", "NA", "vnet-br0"]],
@@ -171,6 +207,31 @@ class TestShowVNetVethInterfaceStatus(VNetTestCase):
         )
 
 
+class TestGetInterfaceStatusMap(VNetTestCase):
+    def setUp(self) -> None:
+        self.ip = Mock()
+        self.link = MagicMock()
+        attrs = {"IFLA_IFNAME": "vnet-veth0", "IFLA_ADDRESS": "mac", "IFLA_LINK": 21, "IFLA_MASTER": 10}
+        self.link.get_attr.side_effect = attrs.get
+        self.link.get_nested.return_value = None
+        self.link.__getitem__.side_effect = {"index": 20, "state": "up"}.__getitem__
+        self.ip.get_links.return_value = [self.link]
+
+    def test_get_interface_status_map_dumps_links_once(self):
+        get_interface_status_map(self.ip)
+        self.ip.get_links.assert_called_once_with()
+
+    def test_get_interface_status_map_returns_link_status_by_index(self):
+        self.assertEqual(
+            get_interface_status_map(self.ip),
+            {20: {"name": "vnet-veth0", "state": "up", "address": "mac", "link": 21, "master": 10, "stp": False}},
+        )
+
+    def test_get_interface_name_map_returns_link_status_by_name(self):
+        links = get_interface_status_map(self.ip)
+        self.assertEqual(get_interface_name_map(links), {"vnet-veth0": links[20]})
+
+
 class TestCheckIfInterfaceExists(VNetTestCase):
     def setUp(self) -> None:
         self.iproute = self.set_up_patch("vnet_manager.operations.interface.IPRoute")
@@ -188,20 +249,6 @@ class TestCheckIfInterfaceExists(VNetTestCase):
         self.assertFalse(check_if_interface_exists("dev1"))
 
 
-class TestCreateVNetInterface(VNetTestCase):
-    def setUp(self) -> None:
-        self.iproute = self.set_up_patch("vnet_manager.operations.interface.IPRoute")
-        self.configure_int = self.set_up_patch("vnet_manager.operations.interface.configure_vnet_interface")
-
-    def test_create_vnet_interface_calls_iproute_link_add(self):
-        create_vnet_interface("dev1")
-        self.iproute.return_value.link.assert_called_once_with("add", ifname="dev1", kind="bridge")
-
-    def test_create_vnet_interface_calls_configure_vnet_interface(self):
-        create_vnet_interface("dev1")
-        self.configure_int.assert_called_once_with("dev1")
-
-
 class TestCreateVethInterface(VNetTestCase):
     def setUp(self) -> None:
         self.iproute = self.set_up_patch("vnet_manager.operations.interface.IPRoute")
@@ -215,31 +262,101 @@ class TestCreateVethInterface(VNetTestCase):
         self.assertFalse(self.iproute.return_value.link.called)
 
 
+class TestGetVNetInterfaceIPtablesRules(VNetTestCase):
+    def test_get_vnet_interface_iptables_rules_returns_drop_rule_per_interface(self):
+        self.assertEqual(get_vnet_interface_iptables_rules(["dev1", "dev2"]), ["-A OUTPUT -o dev1 -j DROP", "-A OUTPUT -o dev2 -j DROP"])
+
+
+class TestGetIPtablesFilterRules(VNetTestCase):
+    def setUp(self) -> None:
+        self.check_output = self.set_up_patch("vnet_manager.operations.interface.check_output")
+        self.check_output.return_value = "# Generated by iptables-save\n*filter\n:OUTPUT ACCEPT [0:0]\n-A OUTPUT -o dev1 -j DROP\nCOMMIT\n"
+
+    def test_get_iptables_filter_rules_calls_iptables_save_once(self):
+        get_iptables_filter_rules()
+        self.check_output.assert_called_once_with(shlex.split("iptables-save -t filter"), universal_newlines=True)
+
+    def test_get_iptables_filter_rules_only_returns_rules(self):
+        self.assertEqual(get_iptables_filter_rules(), ["-A OUTPUT -o dev1 -j DROP"])
+
+
+class TestApplyIPtablesFilterRules(VNetTestCase):
+    def setUp(self) -> None:
+        self.run = self.set_up_patch("vnet_manager.operations.interface.run")
+
+    def test_apply_iptables_filter_rules_calls_iptables_restore_once_without_flushing(self):
+        apply_iptables_filter_rules(["-A OUTPUT -o dev1 -j DROP", "-A OUTPUT -o dev2 -j DROP"])
+        self.run.assert_called_once_with(
+            shlex.split("iptables-restore --noflush"),
+            input="*filter\n-A OUTPUT -o dev1 -j DROP\n-A OUTPUT -o dev2 -j DROP\nCOMMIT\n",
+            universal_newlines=True,
+            check=True,
+            stdout=PIPE,
+            stderr=STDOUT,
+        )
+
+    def test_apply_iptables_filter_rules_raises_if_iptables_restore_fails(self):
+        self.run.side_effect = CalledProcessError(1, "test")
+        with self.assertRaises(CalledProcessError):
+            apply_iptables_filter_rules(["-A OUTPUT -o dev1 -j DROP"])
+
+
 class TestCreateVNetInterfaceIPtablesDropRules(VNetTestCase):
     def setUp(self) -> None:
-        self.check_call = self.set_up_patch("vnet_manager.operations.interface.check_call")
-        self.check_call.side_effect = [CalledProcessError(1, "test"), 0]
+        self.get_iptables_filter_rules = self.set_up_patch("vnet_manager.operations.interface.get_iptables_filter_rules")
+        self.get_iptables_filter_rules.return_value = ["-A INPUT -j ACCEPT", "-A OUTPUT -o dev1 -j DROP"]
+        self.apply_iptables_filter_rules = self.set_up_patch("vnet_manager.operations.interface.apply_iptables_filter_rules")
         self.logger = self.set_up_patch("vnet_manager.operations.interface.logger")
 
-    def test_create_vnet_interface_iptables_drop_rules_makes_correct_check_call_calls(self):
-        calls = [
-            call(shlex.split("iptables -C OUTPUT -o dev1 -j DROP"), stderr=DEVNULL),
-            call(shlex.split("iptables -A OUTPUT -o dev1 -j DROP")),
-        ]
-        create_vnet_interface_iptables_rules("dev1")
-        self.check_call.assert_has_calls(calls)
-        self.logger.info.assert_called_once_with("Creating IPtables DROP rule to the outside world for VNet interface dev1")
+    def test_create_vnet_interface_iptables_drop_rules_reads_the_filter_table_once(self):
+        create_vnet_interface_iptables_rules(["dev1", "dev2", "dev3"])
+        self.get_iptables_filter_rules.assert_called_once_with()
+
+    def test_create_vnet_interface_iptables_drop_rules_only_applies_missing_rules_in_one_transaction(self):
+        create_vnet_interface_iptables_rules(["dev1", "dev2", "dev3"])
+        self.apply_iptables_filter_rules.assert_called_once_with(["-A OUTPUT -o dev2 -j DROP", "-A OUTPUT -o dev3 -j DROP"])
+        self.logger.info.assert_called_once_with("Creating 2 IPtables DROP rule(s) to the outside world for the VNet interfaces")
 
     def test_create_vnet_interface_iptables_drop_rules_does_not_add_rules_if_they_already_exist(self):
-        self.check_call.side_effect = [0, 0]
-        create_vnet_interface_iptables_rules("dev1")
-        self.check_call.assert_called_once_with(shlex.split("iptables -C OUTPUT -o dev1 -j DROP"), stderr=DEVNULL)
-        self.logger.debug.assert_called_once_with("IPtables DROP rule for VNet interface dev1 already exists, skipping creation")
+        create_vnet_interface_iptables_rules(["dev1"])
+        self.assertFalse(self.apply_iptables_filter_rules.called)
+        self.logger.debug.assert_called_once_with("IPtables DROP rules for all VNet interfaces already exist, skipping creation")
+
+    def test_create_vnet_interface_iptables_drop_rules_logs_error_if_iptables_save_fails(self):
+        self.get_iptables_filter_rules.side_effect = CalledProcessError(1, "test")
+        create_vnet_interface_iptables_rules(["dev1"])
+        self.logger.error.assert_called_once_with("Unable to create IPtables rules, got output: None")
+        self.assertFalse(self.apply_iptables_filter_rules.called)
+
+    def test_create_vnet_interface_iptables_drop_rules_logs_error_if_iptables_restore_fails(self):
+        self.apply_iptables_filter_rules.side_effect = CalledProcessError(1, "test", output="blaap")
+        create_vnet_interface_iptables_rules(["dev2"])
+        self.logger.error.assert_called_once_with("Unable to create IPtables rules, got output: blaap")
+
+
+class TestDeleteVNetInterfaceIPtablesDropRules(VNetTestCase):
+    def setUp(self) -> None:
+        self.get_iptables_filter_rules = self.set_up_patch("vnet_manager.operations.interface.get_iptables_filter_rules")
+        self.get_iptables_filter_rules.return_value = ["-A INPUT -j ACCEPT", "-A OUTPUT -o dev1 -j DROP", "-A OUTPUT -o dev2 -j DROP"]
+        self.apply_iptables_filter_rules = self.set_up_patch("vnet_manager.operations.interface.apply_iptables_filter_rules")
+        self.logger = self.set_up_patch("vnet_manager.operations.interface.logger")
+
+    def test_delete_vnet_interface_iptables_drop_rules_reads_the_filter_table_once(self):
+        delete_vnet_interface_iptables_rules(["dev1", "dev2", "dev3"])
+        self.get_iptables_filter_rules.assert_called_once_with()
+
+    def test_delete_vnet_interface_iptables_drop_rules_only_removes_present_rules_in_one_transaction(self):
+        delete_vnet_interface_iptables_rules(["dev1", "dev2", "dev3"])
+        self.apply_iptables_filter_rules.assert_called_once_with(["-D OUTPUT -o dev1 -j DROP", "-D OUTPUT -o dev2 -j DROP"])
 
-    def test_create_vnet_interface_iptables_drop_rules_logs_error_if_both_commands_fail(self):
-        self.check_call.side_effect = [CalledProcessError(1, "test"), CalledProcessError(1, "test")]
-        create_vnet_interface_iptables_rules("dev1")
-        self.logger.error.assert_called_once_with("Unable to create IPtables rule, got output: None")
+    def test_delete_vnet_interface_iptables_drop_rules_does_nothing_if_no_rules_present(self):
+        delete_vnet_interface_iptables_rules(["dev3"])
+        self.assertFalse(self.apply_iptables_filter_rules.called)
+
+    def test_delete_vnet_interface_iptables_drop_rules_logs_error_if_iptables_restore_fails(self):
+        self.apply_iptables_filter_rules.side_effect = CalledProcessError(1, "test", output="blaap")
+        delete_vnet_interface_iptables_rules(["dev1"])
+        self.logger.error.assert_called_once_with("Unable to remove IPtables rules, got output: blaap")
 
 
 class TestConfigureVNetInterface(VNetTestCase):
@@ -294,6 +411,128 @@ class TestConfigureVethInterface(VNetTestCase):
         self.iproute_obj.link.assert_called_once_with("set", index=1, master=2)
 
 
+class TestGetInterfaceIndexMap(VNetTestCase):
+    def setUp(self) -> None:
+        self.ip = Mock()
+        self.link = MagicMock()
+        self.link.get_attr.return_value = "vnet-br0"
+        self.link.__getitem__.return_value = 42
+        self.ip.get_links.return_value = [self.link]
+
+    def test_get_interface_index_map_dumps_links_once(self):
+        get_interface_index_map(self.ip)
+        self.ip.get_links.assert_called_once_with()
+
+    def test_get_interface_index_map_returns_index_by_ifname(self):
+        self.assertEqual(get_interface_index_map(self.ip), {"vnet-br0": 42})
+        self.link.get_attr.assert_called_once_with("IFLA_IFNAME")
+
+
+class TestGetInterfaceLinkMap(VNetTestCase):
+    def setUp(self) -> None:
+        self.ip = Mock()
+        self.info = Mock()
+        self.info.get_attr.return_value = "veth"
+        self.link = MagicMock()
+        self.link.get_attr.side_effect = {"IFLA_IFNAME": "vnet-veth0", "IFLA_LINKINFO": self.info, "IFLA_MASTER": 10}.get
+        self.link.__getitem__.return_value = 42
+        self.ip.get_links.return_value = [self.link]
+
+    def test_get_interface_link_map_dumps_links_once(self):
+        get_interface_link_map(self.ip)
+        self.ip.get_links.assert_called_once_with()
+
+    def test_get_interface_link_map_returns_link_info_by_ifname(self):
+        self.assertEqual(get_interface_link_map(self.ip), {"vnet-veth0": {"index": 42, "kind": "veth", "master": 10}})
+        self.info.get_attr.assert_called_once_with("IFLA_INFO_KIND")
+
+    def test_get_interface_link_map_returns_no_kind_without_link_info(self):
+        self.link.get_attr.side_effect = {"IFLA_IFNAME": "lo"}.get
+        self.assertEqual(get_interface_link_map(self.ip), {"lo": {"index": 42, "kind": None, "master": None}})
+
+
+class TestCreateVNetInterfaces(VNetTestCase):
+    def setUp(self) -> None:
+        self.ip = Mock()
+        self.get_interface_index_map = self.set_up_patch("vnet_manager.operations.interface.get_interface_index_map")
+        self.get_interface_index_map.return_value = {"lo": 1, "vnet-br0": 10, "vnet-br1": 11}
+        self.rand_mac = self.set_up_patch("vnet_manager.operations.interface.random_mac_generator")
+
+    def test_create_vnet_interfaces_adds_bridge_per_interface(self):
+        create_vnet_interfaces(["vnet-br0", "vnet-br1"], self.ip)
+        self.ip.link.assert_has_calls([call("add", ifname="vnet-br0", kind="bridge"), call("add", ifname="vnet-br1", kind="bridge")])
+
+    def test_create_vnet_interfaces_resolves_indexes_with_a_single_dump(self):
+        create_vnet_interfaces(["vnet-br0", "vnet-br1"], self.ip)
+        self.get_interface_index_map.assert_called_once_with(self.ip)
+
+    def test_create_vnet_interfaces_sets_mac_and_state_in_one_request(self):
+        create_vnet_interfaces(["vnet-br0"], self.ip)
+        self.ip.link.assert_called_with("set", index=10, address=self.rand_mac.return_value, state="up")
+        self.assertEqual(self.ip.link.call_count, 2)
+
+    def test_create_vnet_interfaces_returns_created_interface_indexes(self):
+        self.assertEqual(create_vnet_interfaces(["vnet-br0", "vnet-br1"], self.ip), {"vnet-br0": 10, "vnet-br1": 11})
+
+
+class TestCreateVNetVXLANInterfaces(VNetTestCase):
+    def setUp(self) -> None:
+        self.ip = Mock()
+        self.get_interface_index_map = self.set_up_patch("vnet_manager.operations.interface.get_interface_index_map")
+        self.get_interface_index_map.return_value = {"lo": 1, "vnet-br0": 10, "vnet-vx0-1": 20}
+        self.interfaces = {"vnet-vx0-1": {"bridge": "vnet-br0", "id": 101000, "local": "192.168.0.1", "remote": "192.168.0.2"}}
+
+    def test_create_vnet_vxlan_interfaces_adds_vxlan_interface_to_remote(self):
+        create_vnet_vxlan_interfaces(self.interfaces, {"vnet-br0": 10}, self.ip)
+        self.ip.link.assert_any_call(
+            "add",
+            ifname="vnet-vx0-1",
+            kind="vxlan",
+            vxlan_id=101000,
+            vxlan_local="192.168.0.1",
+            vxlan_group="192.168.0.2",
+            vxlan_port=settings.VNET_VXLAN_PORT,
+        )
+
+    def test_create_vnet_vxlan_interfaces_connects_interface_to_bridge(self):
+        create_vnet_vxlan_interfaces(self.interfaces, {"vnet-br0": 10}, self.ip)
+        self.ip.link.assert_called_with("set", index=20, master=10, state="up")
+
+    def test_create_vnet_vxlan_interfaces_returns_created_interface_indexes(self):
+        self.assertEqual(create_vnet_vxlan_interfaces(self.interfaces, {"vnet-br0": 10}, self.ip), {"vnet-vx0-1": 20})
+
+
+class TestCreateVNetP2PInterfaces(VNetTestCase):
+    def setUp(self) -> None:
+        self.ip = Mock()
+        self.get_lxc_instances = self.set_up_patch("vnet_manager.operations.interface.get_lxc_instances")
+        self.get_lxc_instances.return_value = {"router100": {"status": "Stopped"}}
+        self.config = deepcopy(settings.CONFIG)
+        del self.config["veths"]
+        self.config["switch_config"] = {0: {"p2p": True}, 1: {"p2p": True}}
+
+    def test_create_vnet_p2p_interfaces_creates_veth_pair_per_p2p_switch(self):
+        self.assertEqual(create_vnet_p2p_interfaces(self.config, {}, self.ip), ["vnet-p2p0-0", "vnet-p2p1-0"])
+        self.ip.link.assert_has_calls(
+            [
+                call("add", ifname="vnet-p2p0-0", kind="veth", peer="vnet-p2p0-1"),
+                call("add", ifname="vnet-p2p1-0", kind="veth", peer="vnet-p2p1-1"),
+            ]
+        )
+
+    def test_create_vnet_p2p_interfaces_skips_pairs_with_an_end_on_the_host(self):
+        self.assertEqual(create_vnet_p2p_interfaces(self.config, {"vnet-p2p0-1": 5}, self.ip), ["vnet-p2p1-0"])
+
+    def test_create_vnet_p2p_interfaces_skips_pairs_of_running_machines(self):
+        self.get_lxc_instances.return_value = {"host102": {"status": "Running"}}
+        self.assertEqual(create_vnet_p2p_interfaces(self.config, {}, self.ip), ["vnet-p2p0-0"])
+
+    def test_create_vnet_p2p_interfaces_does_not_get_instances_if_all_pairs_exist(self):
+        create_vnet_p2p_interfaces(self.config, {"vnet-p2p0-0": 5, "vnet-p2p1-0": 6}, self.ip)
+        self.assertFalse(self.get_lxc_instances.called)
+        self.assertFalse(self.ip.link.called)
+
+
 class TestBringUpVNetInterfaces(VNetTestCase):
     def setUp(self) -> None:
         self.iproute = self.set_up_patch("vnet_manager.operations.interface.IPRoute")
@@ -301,46 +540,62 @@ class TestBringUpVNetInterfaces(VNetTestCase):
         self.iproute.return_value = self.iproute_obj
         self.get_vnet_interface_names = self.set_up_patch("vnet_manager.operations.interface.get_vnet_interface_names_from_config")
         self.get_vnet_interface_names.return_value = ["int1", "int2"]
-        self.check_if_interface_exists = self.set_up_patch("vnet_manager.operations.interface.check_if_interface_exists")
-        self.check_if_interface_exists.return_value = False
-        self.create_vnet_interface = self.set_up_patch("vnet_manager.operations.interface.create_vnet_interface")
+        self.get_interface_index_map = self.set_up_patch("vnet_manager.operations.interface.get_interface_index_map")
+        self.get_interface_index_map.return_value = {"lo": 1}
+        self.create_vnet_interfaces = self.set_up_patch("vnet_manager.operations.interface.create_vnet_interfaces")
+        self.create_vnet_interfaces.return_value = {"int1": 2, "int2": 3}
         self.create_vnet_interface_block_rules = self.set_up_patch("vnet_manager.operations.interface.create_vnet_interface_iptables_rules")
         self.check_if_sniffer_exists = self.set_up_patch("vnet_manager.operations.interface.check_if_sniffer_exists")
         self.check_if_sniffer_exists.return_value = False
+        self.get_sniffer_pid_map = self.set_up_patch("vnet_manager.operations.interface.get_sniffer_pid_map")
         self.start_tcpdump_on_interface = self.set_up_patch("vnet_manager.operations.interface.start_tcpdump_on_vnet_interface")
         self.ensure_vnet_veth_interfaces = self.set_up_patch("vnet_manager.operations.interface.ensure_vnet_veth_interfaces")
+        self.start_capture_engine = self.set_up_patch("vnet_manager.operations.interface.start_capture_engine_on_vnet_interfaces")
+        self.get_vxlan_interfaces = self.set_up_patch("vnet_manager.operations.interface.get_vnet_vxlan_interfaces_from_config")
+        self.get_vxlan_interfaces.return_value = {}
+        self.create_vxlan_interfaces = self.set_up_patch("vnet_manager.operations.interface.create_vnet_vxlan_interfaces")
+        self.create_vxlan_interfaces.return_value = {}
+        self.create_p2p_interfaces = self.set_up_patch("vnet_manager.operations.interface.create_vnet_p2p_interfaces")
         self.config = deepcopy(settings.CONFIG)
         self.expected_vnet_interface_calls = [call(i) for i in self.get_vnet_interface_names.return_value]
 
-    def test_bring_up_vnet_interfaces_calls_ip_route(self):
+    def test_bring_up_vnet_interfaces_calls_ip_route_once(self):
         bring_up_vnet_interfaces(self.config)
         self.iproute.assert_called_once_with()
 
+    def test_bring_up_vnet_interfaces_closes_ip_route(self):
+        bring_up_vnet_interfaces(self.config)
+        self.iproute_obj.close.assert_called_once_with()
+
     def test_bring_up_vnet_interfaces_calls_get_vnet_interface_names_from_config(self):
         bring_up_vnet_interfaces(self.config)
         self.get_vnet_interface_names.assert_called_once_with(self.config)
 
-    def test_bring_up_vnet_interfaces_calls_check_if_interface_exists_with_interface_names(self):
+    def test_bring_up_vnet_interfaces_dumps_links_once(self):
         bring_up_vnet_interfaces(self.config)
-        self.check_if_interface_exists.assert_has_calls(self.expected_vnet_interface_calls)
+        self.get_interface_index_map.assert_called_once_with(self.iproute_obj)
 
-    def test_bring_up_vnet_interfaces_calls_create_vnet_interface_with_interface_names(self):
+    def test_bring_up_vnet_interfaces_creates_all_missing_interfaces_at_once(self):
         bring_up_vnet_interfaces(self.config)
-        self.create_vnet_interface.assert_has_calls(self.expected_vnet_interface_calls)
+        self.create_vnet_interfaces.assert_called_once_with(["int1", "int2"], self.iproute_obj)
 
-    def test_bring_up_vnet_interfaces_does_not_call_create_interface_if_the_interface_already_exists(self):
-        self.check_if_interface_exists.return_value = True
+    def test_bring_up_vnet_interfaces_does_not_call_create_interfaces_if_the_interfaces_already_exist(self):
+        self.get_interface_index_map.return_value = {"int1": 2, "int2": 3}
         bring_up_vnet_interfaces(self.config)
-        self.assertFalse(self.create_vnet_interface.called)
+        self.assertFalse(self.create_vnet_interfaces.called)
 
-    def test_bring_up_vnet_interfaces_calls_create_vnet_interface_iptables_rules(self):
+    def test_bring_up_vnet_interfaces_calls_create_vnet_interface_iptables_rules_once(self):
         bring_up_vnet_interfaces(self.config)
-        self.create_vnet_interface_block_rules.assert_has_calls(self.expected_vnet_interface_calls)
+        self.create_vnet_interface_block_rules.assert_called_once_with(["int1", "int2"])
 
-    def test_bring_up_vnet_interfaces_calls_ip_link_to_bring_up_interfaces(self):
-        calls = [call("set", ifname=i, state="up") for i in self.get_vnet_interface_names.return_value]
+    def test_bring_up_vnet_interfaces_calls_ip_link_to_bring_up_existing_interfaces(self):
+        self.get_interface_index_map.return_value = {"int1": 2, "int2": 3}
         bring_up_vnet_interfaces(self.config)
-        self.iproute_obj.link.assert_has_calls(calls)
+        self.iproute_obj.link.assert_has_calls([call("set", index=2, state="up"), call("set", index=3, state="up")])
+
+    def test_bring_up_vnet_interfaces_does_not_bring_up_newly_created_interfaces_again(self):
+        bring_up_vnet_interfaces(self.config)
+        self.assertFalse(self.iproute_obj.link.called)
 
     def test_bring_up_vnet_interfaces_does_not_create_sniffer_by_default(self):
         bring_up_vnet_interfaces(self.config)
@@ -348,11 +603,29 @@ class TestBringUpVNetInterfaces(VNetTestCase):
 
     def test_bring_up_vnet_interfaces_calls_sniffer_when_sniffer_argument_passed(self):
         bring_up_vnet_interfaces(self.config, sniffer=True)
-        self.start_tcpdump_on_interface.assert_has_calls([call(ifname=i, path="/tmp") for i in self.get_vnet_interface_names.return_value])
+        self.start_tcpdump_on_interface.assert_has_calls(
+            [call(ifname=i, path="/tmp", options={}) for i in self.get_vnet_interface_names.return_value]
+        )
+
+    def test_bring_up_vnet_interfaces_passes_sniffer_options_to_sniffers(self):
+        bring_up_vnet_interfaces(self.config, sniffer=True, sniffer_options={"snaplen": 96})
+        self.start_tcpdump_on_interface.assert_has_calls(
+            [call(ifname=i, path="/tmp", options={"snaplen": 96}) for i in self.get_vnet_interface_names.return_value]
+        )
 
     def test_bring_up_vnet_interfaces_calls_check_if_sniffer_exists(self):
         bring_up_vnet_interfaces(self.config, sniffer=True)
-        self.check_if_sniffer_exists.assert_has_calls(self.expected_vnet_interface_calls)
+        self.check_if_sniffer_exists.assert_has_calls(
+            [call(i, sniffers=self.get_sniffer_pid_map.return_value) for i in self.get_vnet_interface_names.return_value]
+        )
+
+    def test_bring_up_vnet_interfaces_looks_up_sniffers_of_all_interfaces_once(self):
+        bring_up_vnet_interfaces(self.config, sniffer=True)
+        self.get_sniffer_pid_map.assert_called_once_with(["int1", "int2", "vnet-veth1", "vnet-veth0"])
+
+    def test_bring_up_vnet_interfaces_does_not_look_up_sniffers_without_sniffer(self):
+        bring_up_vnet_interfaces(self.config)
+        self.assertFalse(self.get_sniffer_pid_map.called)
 
     def test_bring_up_vnet_interfaces_does_not_call_start_sniffer_when_the_sniffer_already_exists(self):
         self.check_if_sniffer_exists.return_value = True
@@ -361,56 +634,149 @@ class TestBringUpVNetInterfaces(VNetTestCase):
 
     def test_bring_up_vnet_interfaces_calls_ensure_vnet_veth_interfaces_with_default_values(self):
         bring_up_vnet_interfaces(self.config)
-        self.ensure_vnet_veth_interfaces.assert_called_once_with(config=self.config, sniffer=False, pcap_dir=settings.VNET_SNIFFER_PCAP_DIR)
+        self.ensure_vnet_veth_interfaces.assert_called_once_with(
+            config=self.config,
+            sniffer=False,
+            pcap_dir=settings.VNET_SNIFFER_PCAP_DIR,
+            ip=self.iproute_obj,
+            sniffers={},
+            sniffer_options=None,
+        )
 
     def test_bring_up_vnet_interfaces_calls_ensure_vnet_veth_interfaces_with_sniffer(self):
         bring_up_vnet_interfaces(self.config, sniffer=True, pcap_dir="/test")
-        self.ensure_vnet_veth_interfaces.assert_called_once_with(config=self.config, sniffer=True, pcap_dir="/test")
+        self.ensure_vnet_veth_interfaces.assert_called_once_with(
+            config=self.config,
+            sniffer=True,
+            pcap_dir="/test",
+            ip=self.iproute_obj,
+            sniffers=self.get_sniffer_pid_map.return_value,
+            sniffer_options=None,
+        )
 
     def test_bring_up_vnet_interfaces_does_not_calls_ensure_vnet_veth_interface_if_no_veth_interfaces_present_in_config(self):
         del self.config["veths"]
         bring_up_vnet_interfaces(self.config)
         self.assertFalse(self.ensure_vnet_veth_interfaces.called)
 
+    def test_bring_up_vnet_interfaces_does_not_start_capture_engine_by_default(self):
+        bring_up_vnet_interfaces(self.config, sniffer=True)
+        self.assertFalse(self.start_capture_engine.called)
+
+    def test_bring_up_vnet_interfaces_starts_capture_engine_on_all_interfaces_with_builtin_engine(self):
+        bring_up_vnet_interfaces(self.config, sniffer=True, pcap_dir="/test", sniffer_options={"snaplen": 96}, sniffer_engine="builtin")
+        self.start_capture_engine.assert_called_once_with(
+            self.config, ["int1", "int2", "vnet-veth1", "vnet-veth0"], path="/test", sniffer_options={"snaplen": 96}
+        )
+
+    def test_bring_up_vnet_interfaces_does_not_start_tcpdump_with_builtin_engine(self):
+        bring_up_vnet_interfaces(self.config, sniffer=True, sniffer_engine="builtin")
+        self.assertFalse(self.start_tcpdump_on_interface.called)
+        self.assertFalse(self.ensure_vnet_veth_interfaces.call_args[1]["sniffer"])
+
+    def test_bring_up_vnet_interfaces_does_not_create_p2p_interfaces_without_p2p_switches(self):
+        bring_up_vnet_interfaces(self.config)
+        self.assertFalse(self.create_p2p_interfaces.called)
+
+    def test_bring_up_vnet_interfaces_creates_p2p_interfaces(self):
+        self.config["switch_config"] = {0: {"p2p": True}}
+        bring_up_vnet_interfaces(self.config)
+        self.create_p2p_interfaces.assert_called_once_with(self.config, ANY, self.iproute_obj)
+
+    def test_bring_up_vnet_interfaces_does_not_create_vxlan_interfaces_without_remotes(self):
+        bring_up_vnet_interfaces(self.config)
+        self.assertFalse(self.create_vxlan_interfaces.called)
+
+    def test_bring_up_vnet_interfaces_creates_missing_vxlan_interfaces(self):
+        self.get_interface_index_map.return_value = {"lo": 1, "vnet-vx0-1": 4}
+        self.get_vxlan_interfaces.return_value = {"vnet-vx0-1": {"bridge": "int1"}, "vnet-vx1-1": {"bridge": "int2"}}
+        bring_up_vnet_interfaces(self.config)
+        self.create_vxlan_interfaces.assert_called_once_with({"vnet-vx1-1": {"bridge": "int2"}}, ANY, self.iproute_obj)
+
+    def test_bring_up_vnet_interfaces_does_not_start_capture_engine_if_all_sniffers_exist(self):
+        self.check_if_sniffer_exists.return_value = True
+        bring_up_vnet_interfaces(self.config, sniffer=True, sniffer_engine="builtin")
+        self.assertFalse(self.start_capture_engine.called)
+
+
+class TestBridgeSTPState(VNetTestCase):
+    def setUp(self) -> None:
+        self.ip = Mock()
+        self.ip.link_lookup.return_value = [42]
+
+    def test_get_bridge_stp_state_reads_stp_state_from_link_info(self):
+        link = Mock()
+        link.get_nested.return_value = 1
+        self.assertTrue(get_bridge_stp_state(link))
+        link.get_nested.assert_called_once_with("IFLA_LINKINFO", "IFLA_INFO_DATA", "IFLA_BR_STP_STATE")
+
+    def test_get_bridge_stp_state_returns_false_without_link_info(self):
+        link = Mock()
+        link.get_nested.return_value = None
+        self.assertFalse(get_bridge_stp_state(link))
+
+    def test_set_bridge_stp_state_sets_stp_state_on_bridge(self):
+        set_bridge_stp_state("vnet-br0", True, self.ip)
+        self.ip.link_lookup.assert_called_once_with(ifname="vnet-br0")
+        self.ip.link.assert_called_once_with("set", index=42, kind="bridge", br_stp_state=1)
+
+    def test_set_bridge_stp_state_disables_stp(self):
+        set_bridge_stp_state("vnet-br0", False, self.ip)
+        self.ip.link.assert_called_once_with("set", index=42, kind="bridge", br_stp_state=0)
+
+    def test_set_bridge_stp_state_does_nothing_if_bridge_does_not_exist(self):
+        self.ip.link_lookup.return_value = []
+        set_bridge_stp_state("vnet-br0", True, self.ip)
+        self.assertFalse(self.ip.link.called)
+
 
 class TestEnsureVNetVethInterfaces(VNetTestCase):
     def setUp(self) -> None:
         self.config = deepcopy(settings.CONFIG)
-        self.ndb = self.set_up_patch("vnet_manager.operations.interface.NDB", themock=MagicMock())
+        self.set_bridge_stp_state = self.set_up_patch("vnet_manager.operations.interface.set_bridge_stp_state")
         self.check_if_interface_exists = self.set_up_patch("vnet_manager.operations.interface.check_if_interface_exists")
         self.check_if_interface_exists.return_value = False
         self.create_veth_interface = self.set_up_patch("vnet_manager.operations.interface.create_veth_interface")
         self.configure_veth_interface = self.set_up_patch("vnet_manager.operations.interface.configure_veth_interface")
         self.configure_vnet_interface = self.set_up_patch("vnet_manager.operations.interface.configure_vnet_interface")
         self.start_tcpdump = self.set_up_patch("vnet_manager.operations.interface.start_tcpdump_on_vnet_interface")
+        self.iproute = self.set_up_patch("vnet_manager.operations.interface.IPRoute")
+        self.ip = self.iproute.return_value
+        self.get_sniffer_pid_map = self.set_up_patch("vnet_manager.operations.interface.get_sniffer_pid_map")
+        self.get_sniffer_pid_map.return_value = {}
 
-    def test_ensure_vnet_veth_interfaces_calls_ndb(self):
-        ensure_vnet_veth_interfaces(self.config)
-        self.ndb.assert_called_with(log=False)
+    def test_ensure_vnet_veth_interfaces_looks_up_sniffers_if_not_passed(self):
+        ensure_vnet_veth_interfaces(self.config, sniffer=True)
+        self.get_sniffer_pid_map.assert_called_once_with(["vnet-veth1", "vnet-veth0"])
 
-    def test_ensure_vnet_veth_interfaces_set_stp_state_to_correct_state_according_to_config(self):
-        ensure_vnet_veth_interfaces(self.config)
-        calls = [call("vnet-br1"), call("vnet-br0")]
-        self.assertIn(calls, self.ndb.return_value.interfaces.__getitem__.call_args_list)
+    def test_ensure_vnet_veth_interfaces_uses_passed_sniffers(self):
+        ensure_vnet_veth_interfaces(self.config, sniffer=True, sniffers={"vnet-veth0": [42]})
+        self.assertFalse(self.get_sniffer_pid_map.called)
+        self.start_tcpdump.assert_called_once_with(ifname="vnet-veth1", path=settings.VNET_SNIFFER_PCAP_DIR, options={})
 
-    def test_ensure_vnet_veth_interfaces_does_not_call_ndb_if_stp_not_in_int_data(self):
-        del self.config["veths"]["vnet-veth1"]["stp"]
+    def test_ensure_vnet_veth_interfaces_uses_passed_ip_route(self):
+        ip = Mock()
+        ensure_vnet_veth_interfaces(self.config, ip=ip)
+        self.assertFalse(self.iproute.called)
+        self.configure_vnet_interface.assert_called_with("vnet-veth0", ip=ip)
+
+    def test_ensure_vnet_veth_interfaces_sets_stp_state_according_to_config(self):
         ensure_vnet_veth_interfaces(self.config)
-        self.assertNotIn(call("vnet-br1"), self.ndb.return_value.interfaces.__getitem__.call_args_list)
+        self.set_bridge_stp_state.assert_has_calls([call("vnet-br1", True, self.ip), call("vnet-br0", False, self.ip)])
 
-    def test_ensure_vnet_veth_interfaces_sets_correct_stp_state_on_bridge_ints(self):
+    def test_ensure_vnet_veth_interfaces_does_not_set_stp_state_if_stp_not_in_int_data(self):
+        del self.config["veths"]["vnet-veth1"]["stp"]
         ensure_vnet_veth_interfaces(self.config)
-        calls = [call("br_stp_state", 1), call("br_stp_state", 0)]
-        self.assertIn(calls, self.ndb.return_value.interfaces.__getitem__.return_value.__enter__.return_value.set.call_args_list)
+        self.set_bridge_stp_state.assert_called_once_with("vnet-br0", False, self.ip)
 
     def test_ensure_vnet_veth_interfaces_checks_if_veth_interfaces_already_exist(self):
         ensure_vnet_veth_interfaces(self.config)
-        calls = [call(i) for i in self.config["veths"]]
+        calls = [call(i, ip=self.ip) for i in self.config["veths"]]
         self.check_if_interface_exists.assert_has_calls(calls)
 
     def test_ensure_vnet_veth_interfaces_calls_create_veth_interfaces(self):
         ensure_vnet_veth_interfaces(self.config)
-        calls = [call(k, v) for k, v in self.config["veths"].items()]
+        calls = [call(k, v, ip=self.ip) for k, v in self.config["veths"].items()]
         self.create_veth_interface.assert_has_calls(calls)
 
     def test_ensure_vnet_veth_interfaces_does_not_call_create_interfaces_if_they_already_exist(self):
@@ -419,12 +785,12 @@ class TestEnsureVNetVethInterfaces(VNetTestCase):
 
     def test_ensure_vnet_veth_interfaces_calls_configure_veth_interface(self):
         ensure_vnet_veth_interfaces(self.config)
-        calls = [call(k, v) for k, v in self.config["veths"].items()]
+        calls = [call(k, v, ip=self.ip) for k, v in self.config["veths"].items()]
         self.configure_veth_interface.assert_has_calls(calls)
 
     def test_ensure_vnet_veth_interfaces_calls_configure_vnet_interface(self):
         ensure_vnet_veth_interfaces(self.config)
-        calls = [call(i) for i in self.config["veths"]]
+        calls = [call(i, ip=self.ip) for i in self.config["veths"]]
         self.configure_vnet_interface.assert_has_calls(calls)
 
     def test_ensure_vnet_veth_interfaces_does_not_start_sniffers_by_default(self):
@@ -433,29 +799,37 @@ class TestEnsureVNetVethInterfaces(VNetTestCase):
 
     def test_ensure_vnet_veth_interfaces_calls_start_tcpdump_on_sniffer_with_default_path(self):
         ensure_vnet_veth_interfaces(self.config, sniffer=True)
-        calls = [call(ifname=i, path=settings.VNET_SNIFFER_PCAP_DIR) for i in self.config["veths"]]
+        calls = [call(ifname=i, path=settings.VNET_SNIFFER_PCAP_DIR, options={}) for i in self.config["veths"]]
         self.start_tcpdump.assert_has_calls(calls)
 
     def test_ensure_vnet_veth_interfaces_call_start_tcpdump_on_sniffer_with_custom_path(self):
         ensure_vnet_veth_interfaces(self.config, sniffer=True, pcap_dir="/test")
-        calls = [call(ifname=i, path="/test") for i in self.config["veths"]]
+        calls = [call(ifname=i, path="/test", options={}) for i in self.config["veths"]]
         self.start_tcpdump.assert_has_calls(calls)
 
+    def test_ensure_vnet_veth_interfaces_uses_sniffer_options_from_config(self):
+        self.config["veths"]["vnet-veth0"]["sniffer"] = {"filter": "icmp"}
+        ensure_vnet_veth_interfaces(self.config, sniffer=True, sniffer_options={"snaplen": 96})
+        self.start_tcpdump.assert_called_with(
+            ifname="vnet-veth0", path=settings.VNET_SNIFFER_PCAP_DIR, options={"snaplen": 96, "filter": "icmp"}
+        )
+
 
 class TestCheckIfSnifferExists(VNetTestCase):
     def setUp(self) -> None:
-        self.process = Mock()
-        self.process_iter = self.set_up_patch("vnet_manager.operations.interface.process_iter")
-        self.process_iter.return_value = [self.process]
-        self.process.cmdline.return_value = "testprocess testargs"
+        self.get_sniffer_pid_map = self.set_up_patch("vnet_manager.operations.interface.get_sniffer_pid_map")
+        self.get_sniffer_pid_map.return_value = {"dev1": [42]}
 
     def test_check_if_sniffer_exists_returns_false_if_sniffer_does_not_exist(self):
         self.assertFalse(check_if_sniffer_exists("dev0"))
 
     def test_check_if_sniffer_exists_returns_true_if_sniffer_exists(self):
-        self.process.cmdline.return_value = "/usr/sbin/tcpdump -i dev1 -n"
         self.assertTrue(check_if_sniffer_exists("dev1"))
 
+    def test_check_if_sniffer_exists_uses_passed_snapshot(self):
+        self.assertTrue(check_if_sniffer_exists("dev0", sniffers={"dev0": [43]}))
+        self.assertFalse(self.get_sniffer_pid_map.called)
+
 
 class TestBringDownVNetInterfaces(VNetTestCase):
     def setUp(self) -> None:
@@ -465,20 +839,33 @@ class TestBringDownVNetInterfaces(VNetTestCase):
         self.check_if_interface_exists = self.set_up_patch("vnet_manager.operations.interface.check_if_interface_exists")
         self.check_if_sniffer_exsits = self.set_up_patch("vnet_manager.operations.interface.check_if_sniffer_exists")
         self.check_if_sniffer_exsits.return_value = False
+        self.get_sniffer_pid_map = self.set_up_patch("vnet_manager.operations.interface.get_sniffer_pid_map")
         self.config = deepcopy(settings.CONFIG)
 
     def test_bring_down_vnet_interfaces_calls_iproute(self):
         bring_down_vnet_interfaces(self.config)
         self.iproute.assert_called_once_with()
 
+    def test_bring_down_vnet_interfaces_looks_up_sniffers_once(self):
+        self.check_if_interface_exists.return_value = True
+        bring_down_vnet_interfaces(self.config)
+        self.get_sniffer_pid_map.assert_called_once_with(["vnet-veth1", "vnet-veth0", "vnet-br0", "vnet-br1"])
+        for check in self.check_if_sniffer_exsits.call_args_list:
+            self.assertEqual(check[1], {"sniffers": self.get_sniffer_pid_map.return_value})
+
     def test_bring_down_vnet_interfaces_check_if_interface_exists_for_each_interface_in_config(self):
-        calls = [call("vnet-veth1"), call("vnet-veth0"), call("vnet-br0"), call("vnet-br1")]
+        calls = [
+            call("vnet-veth1", ip=self.iproute_obj),
+            call("vnet-veth0", ip=self.iproute_obj),
+            call("vnet-br0", ip=self.iproute_obj),
+            call("vnet-br1", ip=self.iproute_obj),
+        ]
         bring_down_vnet_interfaces(self.config)
         self.check_if_interface_exists.assert_has_calls(calls)
         self.assertEqual(self.check_if_interface_exists.call_count, 4)
 
     def test_bring_down_vnet_interfaces_does_not_check_veth_interfaces_if_not_in_config(self):
-        calls = [call("vnet-br0"), call("vnet-br1")]
+        calls = [call("vnet-br0", ip=self.iproute_obj), call("vnet-br1", ip=self.iproute_obj)]
         del self.config["veths"]
         bring_down_vnet_interfaces(self.config)
         self.check_if_interface_exists.assert_has_calls(calls)
@@ -516,25 +903,32 @@ class TestDeleteVNetInterfaces(VNetTestCase):
         self.iproute_obj = Mock()
         self.iproute.return_value = self.iproute_obj
         self.check_if_interface_exists = self.set_up_patch("vnet_manager.operations.interface.check_if_interface_exists")
+        self.delete_vnet_interface_iptables_rules = self.set_up_patch(
+            "vnet_manager.operations.interface.delete_vnet_interface_iptables_rules"
+        )
         self.config = deepcopy(settings.CONFIG)
 
     def test_delete_vnet_interfaces_calls_iproute(self):
         delete_vnet_interfaces(self.config)
         self.iproute.assert_called_once_with()
 
+    def test_delete_vnet_interfaces_removes_iptables_rules_of_all_vnet_interfaces(self):
+        delete_vnet_interfaces(self.config)
+        self.delete_vnet_interface_iptables_rules.assert_called_once_with(get_vnet_interface_names_from_config(self.config))
+
     def test_delete_vnet_interfaces_does_nothing_if_interfaces_do_not_exist(self):
         self.check_if_interface_exists.return_value = False
         delete_vnet_interfaces(self.config)
         self.assertFalse(self.iproute_obj.link.called)
 
     def test_delete_vnet_interfaces_check_if_interface_exists_for_each_interface_in_config(self):
-        calls = [call("vnet-veth0"), call("vnet-br0"), call("vnet-br1")]
+        calls = [call("vnet-veth0", ip=self.iproute_obj), call("vnet-br0", ip=self.iproute_obj), call("vnet-br1", ip=self.iproute_obj)]
         delete_vnet_interfaces(self.config)
         self.check_if_interface_exists.assert_has_calls(calls)
         self.assertEqual(self.check_if_interface_exists.call_count, 3)
 
     def test_delete_vnet_interfaces_does_not_check_veth_interfaces_if_not_in_config(self):
-        calls = [call("vnet-br0"), call("vnet-br1")]
+        calls = [call("vnet-br0", ip=self.iproute_obj), call("vnet-br1", ip=self.iproute_obj)]
         del self.config["veths"]
         delete_vnet_interfaces(self.config)
         self.check_if_interface_exists.assert_has_calls(calls)
@@ -546,6 +940,20 @@ class TestDeleteVNetInterfaces(VNetTestCase):
         self.iproute_obj.link.assert_has_calls(calls)
         self.assertEqual(self.iproute_obj.link.call_count, 3)
 
+    def test_delete_vnet_interfaces_deletes_one_end_of_p2p_interfaces(self):
+        self.config["switch_config"] = {0: {"p2p": True}}
+        self.check_if_interface_exists.side_effect = lambda ifname, ip: ifname != "vnet-p2p0-0"
+        delete_vnet_interfaces(self.config)
+        self.iproute_obj.link.assert_any_call("del", ifname="vnet-p2p0-1")
+        self.assertNotIn(call("del", ifname="vnet-br0"), self.iproute_obj.link.mock_calls)
+
+    def test_delete_vnet_interfaces_deletes_vxlan_interfaces(self):
+        get_vxlan_interfaces = self.set_up_patch("vnet_manager.operations.interface.get_vnet_vxlan_interfaces_from_config")
+        get_vxlan_interfaces.return_value = {"vnet-vx0-1": {}}
+        delete_vnet_interfaces(self.config)
+        self.iproute_obj.link.assert_any_call("del", ifname="vnet-vx0-1")
+        self.assertEqual(self.iproute_obj.link.call_count, 4)
+
     def test_delete_vnet_interfaces_down_not_delete_veth_interfaces_if_not_in_config(self):
         calls = [call("del", ifname=i) for i in ["vnet-br0", "vnet-br1"]]
         del self.config["veths"]
@@ -554,33 +962,169 @@ class TestDeleteVNetInterfaces(VNetTestCase):
         self.assertEqual(self.iproute_obj.link.call_count, 2)
 
 
+class TestGetSnifferOptionsForInterface(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = deepcopy(settings.CONFIG)
+        self.config["switch_config"] = {1: {"sniffer": {"snaplen": 128}}}
+        self.config["veths"]["vnet-veth0"]["sniffer"] = {"filter": "icmp"}
+
+    def test_get_sniffer_options_for_interface_returns_defaults_if_no_config_present(self):
+        self.assertEqual(get_sniffer_options_for_interface(self.config, "vnet-br0", defaults={"snaplen": 96}), {"snaplen": 96})
+
+    def test_get_sniffer_options_for_interface_returns_empty_dict_without_defaults(self):
+        self.assertEqual(get_sniffer_options_for_interface(self.config, "vnet-br0"), {})
+
+    def test_get_sniffer_options_for_interface_overrides_defaults_with_switch_config(self):
+        self.assertEqual(
+            get_sniffer_options_for_interface(self.config, "vnet-br1", defaults={"snaplen": 96, "compress": True}),
+            {"snaplen": 128, "compress": True},
+        )
+
+    def test_get_sniffer_options_for_interface_overrides_defaults_with_veth_config(self):
+        self.assertEqual(
+            get_sniffer_options_for_interface(self.config, "vnet-veth0", defaults={"snaplen": 96}), {"snaplen": 96, "filter": "icmp"}
+        )
+
+    def test_get_sniffer_options_for_interface_does_not_modify_defaults(self):
+        defaults = {"snaplen": 96}
+        get_sniffer_options_for_interface(self.config, "vnet-br1", defaults=defaults)
+        self.assertEqual(defaults, {"snaplen": 96})
+
+    def test_get_sniffer_options_for_interface_supports_switch_numbers_over_nine(self):
+        self.config["switch_config"] = {12: {"sniffer": {"snaplen": 64}}}
+        self.assertEqual(get_sniffer_options_for_interface(self.config, "vnet-br12"), {"snaplen": 64})
+
+
+class TestGetTcpdumpCommand(VNetTestCase):
+    def setUp(self) -> None:
+        self.datetime = self.set_up_patch("vnet_manager.operations.interface.datetime")
+        self.datetime.now.return_value.strftime.return_value = "2301010000"
+
+    def test_get_tcpdump_command_returns_default_command(self):
+        self.assertEqual(
+            get_tcpdump_command("dev1", "/tmp"),
+            (["tcpdump", "-i", "dev1", "-U", "-w", "/tmp/dev1.2301010000.pcap"], "/tmp/dev1.2301010000.pcap", "/tmp/dev1.2301010000*"),
+        )
+
+    def test_get_tcpdump_command_adds_snaplen(self):
+        command, _, _ = get_tcpdump_command("dev1", "/tmp", options={"snaplen": 96})
+        self.assertEqual(command[-2:], ["-s", "96"])
+
+    def test_get_tcpdump_command_adds_size_rotation(self):
+        command, pcap, _ = get_tcpdump_command("dev1", "/tmp", options={"rotate_size": 100, "rotate_count": 5})
+        self.assertEqual(command[-4:], ["-C", "100", "-W", "5"])
+        self.assertEqual(pcap, "/tmp/dev1.2301010000.pcap")
+
+    def test_get_tcpdump_command_adds_time_rotation_with_strftime_file_name(self):
+        command, pcap, pcap_files = get_tcpdump_command("dev1", "/tmp", options={"rotate_seconds": 3600})
+        self.assertEqual(command[-2:], ["-G", "3600"])
+        self.assertEqual(pcap, "/tmp/dev1.2301010000.%Y%m%d%H%M%S.pcap")
+        self.assertEqual(pcap_files, "/tmp/dev1.2301010000*")
+
+    def test_get_tcpdump_command_adds_compression_when_rotating(self):
+        command, _, _ = get_tcpdump_command("dev1", "/tmp", options={"rotate_size": 100, "compress": True})
+        self.assertEqual(command[-2:], ["-z", settings.VNET_SNIFFER_COMPRESS_COMMAND])
+
+    def test_get_tcpdump_command_does_not_compress_without_rotation(self):
+        logger = self.set_up_patch("vnet_manager.operations.interface.logger")
+        command, _, _ = get_tcpdump_command("dev1", "/tmp", options={"compress": True})
+        self.assertNotIn("-z", command)
+        logger.warning.assert_called_once_with("Compression of the sniffer on dev1 requires rotation to be enabled, not compressing")
+
+    def test_get_tcpdump_command_adds_filter_as_last_argument(self):
+        command, _, _ = get_tcpdump_command("dev1", "/tmp", options={"snaplen": 96, "filter": "not port 22"})
+        self.assertEqual(command[-1], "not port 22")
+
+
 class TestStartTcpdumpOnVNetInterface(VNetTestCase):
     def setUp(self) -> None:
         self.popen = self.set_up_patch("vnet_manager.operations.interface.Popen")
+        self.register_sniffer = self.set_up_patch("vnet_manager.operations.interface.register_sniffer")
+        self.get_tcpdump_command = self.set_up_patch("vnet_manager.operations.interface.get_tcpdump_command")
+        self.get_tcpdump_command.return_value = (["tcpdump"], "/test/dev1.pcap", "/test/dev1*")
+
+    def test_start_tcpdump_on_vnet_interface_builds_tcpdump_command(self):
+        start_tcpdump_on_vnet_interface("dev1", path="/test", options={"snaplen": 96})
+        self.get_tcpdump_command.assert_called_once_with("dev1", "/test", options={"snaplen": 96})
 
     def test_start_tcpdump_on_vnet_interface_makes_correct_popen_call(self):
         start_tcpdump_on_vnet_interface("dev1")
-        self.popen.assert_called_once_with(ANY)
+        self.popen.assert_called_once_with(["tcpdump"])
+
+    def test_start_tcpdump_on_vnet_interface_registers_sniffer(self):
+        start_tcpdump_on_vnet_interface("dev1", path="/test")
+        self.register_sniffer.assert_called_once_with("dev1", self.popen.return_value.pid, "/test/dev1.pcap", pcap_files="/test/dev1*")
+
+
+class TestStartCaptureEngineOnVNetInterfaces(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = deepcopy(settings.CONFIG)
+        self.popen = self.set_up_patch("vnet_manager.operations.interface.Popen")
+        self.register_sniffer = self.set_up_patch("vnet_manager.operations.interface.register_sniffer")
+        self.datetime = self.set_up_patch("vnet_manager.operations.interface.datetime")
+        self.datetime.now.return_value.strftime.return_value = "2001011200"
+        self.logger = self.set_up_patch("vnet_manager.operations.interface.logger")
+
+    def test_start_capture_engine_on_vnet_interfaces_starts_a_single_capture_engine(self):
+        start_capture_engine_on_vnet_interfaces(self.config, ["vnet-br0", "vnet-veth0"], path="/test")
+        self.popen.assert_called_once_with(
+            [sys.executable, "-m", "vnet_manager.operations.capture", "/test/vnet.2001011200.pcapng", "vnet-br0", "vnet-veth0"],
+            start_new_session=True,
+        )
+
+    def test_start_capture_engine_on_vnet_interfaces_passes_snaplen_per_interface(self):
+        self.config["veths"]["vnet-veth0"]["sniffer"] = {"snaplen": 64}
+        start_capture_engine_on_vnet_interfaces(self.config, ["vnet-br0", "vnet-veth0"], path="/test", sniffer_options={"snaplen": 96})
+        self.assertEqual(self.popen.call_args[0][0][-2:], ["vnet-br0:96", "vnet-veth0:64"])
+
+    def test_start_capture_engine_on_vnet_interfaces_registers_engine_for_each_interface(self):
+        start_capture_engine_on_vnet_interfaces(self.config, ["vnet-br0", "vnet-veth0"], path="/test")
+        self.register_sniffer.assert_has_calls(
+            [
+                call("vnet-br0", self.popen.return_value.pid, "/test/vnet.2001011200.pcapng"),
+                call("vnet-veth0", self.popen.return_value.pid, "/test/vnet.2001011200.pcapng"),
+            ]
+        )
+
+    def test_start_capture_engine_on_vnet_interfaces_warns_about_unsupported_options(self):
+        start_capture_engine_on_vnet_interfaces(self.config, ["vnet-br0"], path="/test", sniffer_options={"filter": "arp", "snaplen": 96})
+        self.assertEqual(self.logger.warning.call_count, 1)
+
+    def test_start_capture_engine_on_vnet_interfaces_does_not_warn_about_snaplen(self):
+        start_capture_engine_on_vnet_interfaces(self.config, ["vnet-br0"], path="/test", sniffer_options={"snaplen": 96})
+        self.assertFalse(self.logger.warning.called)
 
 
 class TestKillTCPDumpProcessesOnVNetInterfaces(VNetTestCase):
     def setUp(self) -> None:
         self.config = deepcopy(settings.CONFIG)
-        self.process = Mock()
-        self.process_iter = self.set_up_patch("vnet_manager.operations.interface.process_iter")
-        self.process_iter.return_value = [self.process]
-        self.process.cmdline.return_value = "testprocess testargs"
+        self.get_registered_sniffers = self.set_up_patch("vnet_manager.operations.interface.get_registered_sniffers")
+        self.get_registered_sniffers.return_value = {}
+        self.kill = self.set_up_patch("vnet_manager.operations.interface.kill")
+        self.unregister_sniffer = self.set_up_patch("vnet_manager.operations.interface.unregister_sniffer")
+
+    def test_kill_tcpdump_processes_on_vnet_interfaces_looks_up_sniffers_of_all_interfaces_once(self):
+        kill_tcpdump_processes_on_vnet_interfaces(self.config)
+        self.get_registered_sniffers.assert_called_once_with(["vnet-br0", "vnet-br1", "vnet-veth1", "vnet-veth0"])
+
+    def test_kill_tcpdump_processes_on_vnet_interfaces_doesnt_kill_anything_if_no_sniffers_found(self):
+        kill_tcpdump_processes_on_vnet_interfaces(self.config)
+        self.assertFalse(self.kill.called)
 
-    def test_kill_tcpdump_processes_on_vnet_interfaces_doesnt_kill_anything_if_no_interfaces_found(self):
+    def test_kill_tcpdump_processes_on_vnet_interfaces_kills_and_unregisters_sniffers(self):
+        self.get_registered_sniffers.return_value = {"vnet-br0": {"pid": 42}, "vnet-veth0": {"pid": 43}}
         kill_tcpdump_processes_on_vnet_interfaces(self.config)
-        self.assertFalse(self.process.kill.called)
+        self.kill.assert_has_calls([call(42, SIGKILL), call(43, SIGKILL)])
+        self.unregister_sniffer.assert_has_calls([call("vnet-br0"), call("vnet-veth0")])
 
-    def test_kill_tcpdump_processes_on_vnet_interfaces_kills_tcpdump_process_on_vnet_interface(self):
-        self.process.cmdline.return_value = f"/usr/sbin/tcpdump -i {settings.VNET_BRIDGE_NAME}0 -n"
+    def test_kill_tcpdump_processes_on_vnet_interfaces_unregisters_already_exited_sniffers(self):
+        self.get_registered_sniffers.return_value = {"vnet-br0": {"pid": 42}}
+        self.kill.side_effect = ProcessLookupError
         kill_tcpdump_processes_on_vnet_interfaces(self.config)
-        self.process.kill.assert_called_once_with()
+        self.unregister_sniffer.assert_called_once_with("vnet-br0")
 
-    def test_kill_tcpdump_processes_on_vnet_interfaces_kills_tcpdump_process_on_vnet_veth_interface(self):
-        self.process.cmdline.return_value = f"/usr/sbin/tcpdump -i vnet-veth0 -n"
+    def test_kill_tcpdump_processes_on_vnet_interfaces_kills_shared_capture_engine_once(self):
+        self.get_registered_sniffers.return_value = {"vnet-br0": {"pid": 42}, "vnet-veth0": {"pid": 42}}
         kill_tcpdump_processes_on_vnet_interfaces(self.config)
-        self.process.kill.assert_called_once_with()
+        self.kill.assert_called_once_with(42, SIGKILL)
+        self.unregister_sniffer.assert_has_calls([call("vnet-br0"), call("vnet-veth0")])
@@ -1,26 +1,43 @@
 from copy import deepcopy
-from unittest.mock import Mock, MagicMock, call
-from pylxd.exceptions import NotFound
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, MagicMock, ANY, call
+from pylxd.exceptions import NotFound, LXDAPIException
 from yaml import safe_dump
 
 from vnet_manager.tests import VNetTestCase
 from vnet_manager.conf import settings
 from vnet_manager.operations.machine import (
     show_status,
+    get_lxc_instances,
+    get_lxc_remote_instances,
+    get_lxd_remote_instance_names,
+    get_lxc_machine_status_from_instances,
     check_if_lxc_machine_exists,
     get_lxc_machine_status,
     wait_for_lxc_machine_status,
     change_machine_status,
     change_lxc_machine_status,
+    change_lxc_machines_status_in_parallel,
+    get_lxc_machines_from_lifecycle_events,
+    get_lxc_operation_error,
+    submit_lxc_machine_creation,
+    wait_for_lxc_machine_creation,
     create_machines,
-    create_lxc_machines_from_base_image,
+    update_lxc_machine_devices,
+    generate_lxc_container_config,
+    get_lxc_container_source,
+    create_lxc_golden_machine,
     destroy_machines,
+    destroy_lxc_machines_in_parallel,
     destroy_lxc_machine,
     place_lxc_interface_configuration_on_container,
+    apply_lxc_interface_configuration,
     generate_machine_netplan_config,
     create_lxc_base_image_container,
     enable_type_specific_machine_configuration,
     configure_lxc_ip_forwarding,
+    get_lxc_ip_forwarding_files,
     connect_to_lxc_machine,
 )
 
@@ -28,23 +45,165 @@ from vnet_manager.operations.machine import (
 class TestShowStatus(VNetTestCase):
     def setUp(self) -> None:
         self.tabulate = self.set_up_patch("vnet_manager.operations.machine.tabulate")
-        self.get_lxc_machine_status = self.set_up_patch("vnet_manager.operations.machine.get_lxc_machine_status")
-        self.get_lxc_machine_status.return_value = ["router", "up", "LXC"]
+        self.get_lxc_instances = self.set_up_patch("vnet_manager.operations.machine.get_lxc_instances")
+        self.get_lxc_machine_status_from_instances = self.set_up_patch(
+            "vnet_manager.operations.machine.get_lxc_machine_status_from_instances"
+        )
+        self.get_lxc_machine_status_from_instances.return_value = ["router", "up", "LXC", "", "", "NA", "NA", "NA"]
         self.config = deepcopy(settings.CONFIG)
         # Only 1 machine for less output
         self.config["machines"].pop("router101", None)
         self.config["machines"].pop("host102", None)
 
-    def test_show_status_call_get_lxc_machine_status(self):
+    def test_show_status_calls_get_lxc_instances_once(self):
+        show_status(settings.CONFIG)
+        self.get_lxc_instances.assert_called_once_with()
+
+    def test_show_status_does_not_call_get_lxc_instances_when_passed(self):
+        show_status(self.config, lxc_instances={})
+        self.assertFalse(self.get_lxc_instances.called)
+
+    def test_show_status_call_get_lxc_machine_status_from_instances(self):
         show_status(self.config)
-        self.get_lxc_machine_status.assert_called_once_with("router100")
+        self.get_lxc_machine_status_from_instances.assert_called_once_with("router100", self.get_lxc_instances.return_value)
 
     def test_show_status_makes_correct_tabulate_call(self):
         show_status(self.config)
         self.tabulate.assert_called_once_with(
-            [self.get_lxc_machine_status.return_value], headers=["Name", "Status", "Provider"], tablefmt="pretty"
+            [self.get_lxc_machine_status_from_instances.return_value],
+            headers=["Name", "Status", "Provider", "IPv4", "IPv6", "Memory", "CPU time", "Processes"],
+            tablefmt="pretty",
+        )
+
+
+class TestGetLXCInstances(VNetTestCase):
+    def setUp(self) -> None:
+        self.lxd_client = self.set_up_patch("vnet_manager.operations.machine.get_lxd_client")
+        self.client = Mock()
+        self.lxd_client.return_value = self.client
+        self.client.api.instances.get.return_value.json.return_value = {"metadata": [{"name": "router100"}, {"name": "host102"}]}
+
+    def test_get_lxc_instances_requests_instances_with_state(self):
+        get_lxc_instances()
+        self.client.api.instances.get.assert_called_once_with(params={"recursion": 2})
+
+    def test_get_lxc_instances_returns_instances_by_name(self):
+        self.assertEqual(get_lxc_instances(), {"router100": {"name": "router100"}, "host102": {"name": "host102"}})
+
+    def test_get_lxc_instances_falls_back_to_containers_api(self):
+        self.client.api.instances.get.side_effect = NotFound(response="blaap")
+        self.client.api.containers.get.return_value.json.return_value = {"metadata": [{"name": "router100"}]}
+        self.assertEqual(get_lxc_instances(), {"router100": {"name": "router100"}})
+        self.client.api.containers.get.assert_called_once_with(params={"recursion": 2})
+
+    def test_get_lxc_instances_merges_instances_of_all_remotes(self):
+        self.set_up_patch("vnet_manager.operations.machine.get_lxd_remotes", return_value=[None, "node1"])
+        use_lxd_remote = self.set_up_patch("vnet_manager.operations.machine.use_lxd_remote", themock=MagicMock())
+        self.set_up_patch(
+            "vnet_manager.operations.machine.get_lxd_machine_remote", side_effect=lambda name: "node1" if name == "router101" else None
+        )
+        remote = Mock()
+        remote.api.instances.get.return_value.json.return_value = {
+            "metadata": [{"name": "router101", "remote": True}, {"name": "router100", "remote": True}]
+        }
+        self.lxd_client.side_effect = [self.client, remote]
+        self.assertEqual(
+            get_lxc_instances(),
+            {"router100": {"name": "router100"}, "host102": {"name": "host102"}, "router101": {"name": "router101", "remote": True}},
+        )
+        use_lxd_remote.assert_has_calls([call(None), call("node1")], any_order=True)
+
+    def test_get_lxc_instances_fetches_instances_of_remote_once(self):
+        remote_instances = {}
+        get_lxc_instances(remote_instances=remote_instances)
+        self.assertEqual(
+            get_lxc_instances(remote_instances=remote_instances), {"router100": {"name": "router100"}, "host102": {"name": "host102"}}
+        )
+        self.client.api.instances.get.assert_called_once_with(params={"recursion": 2})
+
+    def test_get_lxc_instances_fetches_instances_of_remotes_added_by_other_configs(self):
+        remote_instances = {}
+        get_lxc_instances(remote_instances=remote_instances)
+        self.set_up_patch("vnet_manager.operations.machine.get_lxd_remotes", return_value=[None, "node1"])
+        self.set_up_patch("vnet_manager.operations.machine.use_lxd_remote", themock=MagicMock())
+        remote = Mock()
+        remote.api.instances.get.return_value.json.return_value = {"metadata": [{"name": "router101"}]}
+        self.lxd_client.side_effect = [self.client, remote]
+        self.assertIn("router101", get_lxc_instances(remote_instances=remote_instances))
+        self.client.api.instances.get.assert_called_once_with(params={"recursion": 2})
+
+
+class TestGetLXCRemoteInstances(VNetTestCase):
+    def setUp(self) -> None:
+        self.lxd_client = self.set_up_patch("vnet_manager.operations.machine.get_lxd_client")
+        self.client = Mock()
+        self.client.api.instances.get.return_value.json.return_value = {"metadata": [{"name": "router100"}]}
+        self.remote = Mock()
+        self.remote.api.instances.get.return_value.json.return_value = {"metadata": [{"name": "router100"}, {"name": "host102"}]}
+        self.lxd_client.side_effect = [self.client, self.remote]
+        self.set_up_patch("vnet_manager.operations.machine.get_lxd_remotes", return_value=[None, "node1"])
+        self.set_up_patch("vnet_manager.operations.machine.use_lxd_remote", themock=MagicMock())
+
+    def test_get_lxc_remote_instances_returns_instances_by_remote(self):
+        self.assertEqual(get_lxc_remote_instances(), {None: [{"name": "router100"}], "node1": [{"name": "router100"}, {"name": "host102"}]})
+
+
+class TestGetLXDRemoteInstanceNames(VNetTestCase):
+    def setUp(self) -> None:
+        self.configure_lxd_remotes = self.set_up_patch("vnet_manager.operations.machine.configure_lxd_remotes")
+        self.get_lxc_remote_instances = self.set_up_patch("vnet_manager.operations.machine.get_lxc_remote_instances")
+        self.get_lxc_remote_instances.return_value = {None: [{"name": "router100"}], "node1": [{"name": "host102"}]}
+        self.lxd_remotes = {"local": {"tunnel_address": "192.168.0.1"}, "node1": {"endpoint": "https://node1:8443"}}
+
+    def test_get_lxd_remote_instance_names_configures_the_remotes(self):
+        get_lxd_remote_instance_names(self.lxd_remotes)
+        self.configure_lxd_remotes.assert_called_once_with({"lxd_remotes": self.lxd_remotes})
+
+    def test_get_lxd_remote_instance_names_returns_instance_names_by_remote_name(self):
+        self.assertEqual(
+            get_lxd_remote_instance_names(self.lxd_remotes), {settings.LXC_LOCAL_REMOTE_NAME: ["router100"], "node1": ["host102"]}
+        )
+
+
+class TestGetLXCMachineStatusFromInstances(VNetTestCase):
+    def setUp(self) -> None:
+        self.instances = {
+            "router100": {
+                "name": "router100",
+                "status": "Running",
+                "state": {
+                    "network": {
+                        "lo": {"addresses": [{"family": "inet", "address": "127.0.0.1", "scope": "local"}]},
+                        "eth12": {
+                            "addresses": [
+                                {"family": "inet", "address": "192.168.0.2", "scope": "global"},
+                                {"family": "inet6", "address": "fd00:12::2", "scope": "global"},
+                                {"family": "inet6", "address": "fe80::1", "scope": "link"},
+                            ]
+                        },
+                    },
+                    "memory": {"usage": 52428800},
+                    "cpu": {"usage": 12500000000},
+                    "processes": 42,
+                },
+            },
+            "router101": {"name": "router101", "status": "Stopped", "state": None},
+        }
+
+    def test_get_lxc_machine_status_from_instances_returns_state_details(self):
+        self.assertEqual(
+            get_lxc_machine_status_from_instances("router100", self.instances),
+            ["router100", "Running", "LXC", "192.168.0.2", "fd00:12::2", "50.0MiB", "12.5s", 42],
+        )
+
+    def test_get_lxc_machine_status_from_instances_deals_with_missing_state(self):
+        self.assertEqual(
+            get_lxc_machine_status_from_instances("router101", self.instances), ["router101", "Stopped", "LXC", "", "", "NA", "NA", "NA"]
         )
 
+    def test_get_lxc_machine_status_from_instances_returns_na_for_unknown_machines(self):
+        self.assertEqual(get_lxc_machine_status_from_instances("host102", self.instances), ["host102"] + ["NA"] + ["LXC"] + ["NA"] * 5)
+
 
 class TestCheckIfLXCMachineExists(VNetTestCase):
     def setUp(self) -> None:
@@ -137,6 +296,145 @@ class TestChangeMachineStatus(VNetTestCase):
         change_machine_status(settings.CONFIG, machines=machines)
         self.assertFalse(self.change_lxc_machine_status.called)
 
+    def test_change_machine_status_calls_change_lxc_machines_status_in_parallel_when_parallel_requested(self):
+        change_in_parallel = self.set_up_patch("vnet_manager.operations.machine.change_lxc_machines_status_in_parallel")
+        change_machine_status(settings.CONFIG, status="start", parallel=4)
+        change_in_parallel.assert_called_once_with(list(settings.CONFIG["machines"].keys()), status="start", parallel=4)
+        self.assertFalse(self.change_lxc_machine_status.called)
+
+
+class TestChangeLXCMachinesStatusInParallel(VNetTestCase):
+    def setUp(self) -> None:
+        self.lxd_client = self.set_up_patch("vnet_manager.operations.machine.get_lxd_client")
+        self.client = Mock()
+        self.lxd_client.return_value = self.client
+        self.containers = {}
+        self.client.containers.get.side_effect = self.get_container
+        self.listener = Mock()
+        self.get_listener = self.set_up_patch("vnet_manager.operations.machine.get_lxd_lifecycle_event_listener")
+        self.get_listener.return_value = self.listener
+        self.get_events = self.set_up_patch("vnet_manager.operations.machine.get_lxc_machines_from_lifecycle_events")
+        self.get_events.return_value = (["router100", "router101"], {})
+        self.get_operation_error = self.set_up_patch("vnet_manager.operations.machine.get_lxc_operation_error")
+        self.get_operation_error.return_value = None
+        self.tabulate = self.set_up_patch("vnet_manager.operations.machine.tabulate")
+
+    def get_container(self, name):
+        if name not in self.containers:
+            self.containers[name] = Mock(status="Stopped")
+            self.containers[name].name = name
+            self.containers[name].api.state.put.return_value.json.return_value = {"operation": f"/1.0/operations/op-{name}"}
+        return self.containers[name]
+
+    def test_change_lxc_machines_status_in_parallel_starts_all_machines_without_waiting(self):
+        change_lxc_machines_status_in_parallel(["router100", "router101"], status="start")
+        for name in ("router100", "router101"):
+            self.containers[name].api.state.put.assert_called_once_with(json={"action": "start", "timeout": 30, "force": True})
+
+    def test_change_lxc_machines_status_in_parallel_returns_ok_for_converged_machines(self):
+        ret = change_lxc_machines_status_in_parallel(["router100", "router101"], status="start")
+        self.assertEqual(ret, {"router100": "OK", "router101": "OK"})
+        self.get_events.assert_called_once_with(
+            self.listener, "Running", ANY, operations={"op-router100": "router100", "op-router101": "router101"}
+        )
+
+    def test_change_lxc_machines_status_in_parallel_skips_machines_already_in_requested_status(self):
+        self.get_container("router100").status = "Running"
+        ret = change_lxc_machines_status_in_parallel(["router100"], status="start")
+        self.assertFalse(self.containers["router100"].api.state.put.called)
+        self.assertEqual(ret, {"router100": "OK"})
+
+    def test_change_lxc_machines_status_in_parallel_reports_not_found_machines(self):
+        self.client.containers.get.side_effect = NotFound(response="blaap")
+        self.assertEqual(change_lxc_machines_status_in_parallel(["router100"], status="start"), {"router100": "Not found"})
+
+    def test_change_lxc_machines_status_in_parallel_limits_amount_of_machines_in_flight(self):
+        self.get_events.side_effect = [(["router100"], {}), (["router101"], {})]
+        change_lxc_machines_status_in_parallel(["router100", "router101"], status="start", parallel=1)
+        self.assertEqual(self.get_events.call_count, 2)
+
+    def test_change_lxc_machines_status_in_parallel_polls_state_when_no_events_are_received(self):
+        self.get_events.return_value = ([], {})
+        self.get_container("router100").state.return_value.status = "Running"
+        ret = change_lxc_machines_status_in_parallel(["router100"], status="start")
+        self.assertEqual(ret, {"router100": "OK"})
+        self.get_operation_error.assert_called_once_with(self.containers["router100"], "op-router100")
+
+    def test_change_lxc_machines_status_in_parallel_reports_failed_operations_from_events(self):
+        self.get_events.return_value = (["router101"], {"router100": "Failed to start device"})
+        ret = change_lxc_machines_status_in_parallel(["router100", "router101"], status="start")
+        self.assertEqual(ret, {"router100": "Error: Failed to start device", "router101": "OK"})
+        self.assertEqual(self.get_events.call_count, 1)
+
+    def test_change_lxc_machines_status_in_parallel_handles_machines_with_multiple_events(self):
+        self.get_events.return_value = (["router100", "router100"], {"router100": "blaap"})
+        self.assertEqual(change_lxc_machines_status_in_parallel(["router100"], status="start"), {"router100": "Error: blaap"})
+
+    def test_change_lxc_machines_status_in_parallel_reports_failed_operations_when_polling(self):
+        self.get_events.return_value = ([], {})
+        self.get_operation_error.return_value = "Failed to start device"
+        ret = change_lxc_machines_status_in_parallel(["router100"], status="start")
+        self.assertEqual(ret, {"router100": "Error: Failed to start device"})
+        self.assertEqual(self.get_events.call_count, 1)
+
+    def test_change_lxc_machines_status_in_parallel_reports_timeout_after_deadline(self):
+        self.set_up_patch("vnet_manager.operations.machine.monotonic", themock=Mock(side_effect=[0, 0, 0, 1000, 1000, 1000]))
+        self.get_events.return_value = ([], {})
+        self.get_container("router100").state.return_value.status = "Stopped"
+        self.assertEqual(change_lxc_machines_status_in_parallel(["router100"], status="start"), {"router100": "Timeout"})
+
+    def test_change_lxc_machines_status_in_parallel_closes_listener(self):
+        change_lxc_machines_status_in_parallel(["router100"], status="start")
+        self.listener.close.assert_called_once_with()
+
+
+class TestGetLXCMachinesFromLifecycleEvents(VNetTestCase):
+    def setUp(self) -> None:
+        self.listener = Mock()
+        self.listener.events = Queue()
+        self.sleep = self.set_up_patch("vnet_manager.operations.machine.sleep")
+
+    def test_get_lxc_machines_from_lifecycle_events_returns_machines_with_matching_status(self):
+        self.listener.events.put({"metadata": {"action": "instance-started", "source": "/1.0/instances/router100"}})
+        self.listener.events.put({"metadata": {"action": "instance-stopped", "source": "/1.0/instances/router101"}})
+        self.listener.events.put({"metadata": {"action": "container-started", "source": "/1.0/containers/host102?project=default"}})
+        self.assertEqual(get_lxc_machines_from_lifecycle_events(self.listener, "Running", 1), (["router100", "host102"], {}))
+
+    def test_get_lxc_machines_from_lifecycle_events_returns_machines_with_failed_operations(self):
+        self.listener.events.put({"type": "operation", "metadata": {"id": "op1", "status": "Failure", "err": "blaap"}})
+        self.listener.events.put({"type": "operation", "metadata": {"id": "op2", "status": "Success", "err": ""}})
+        self.listener.events.put({"type": "operation", "metadata": {"id": "op3", "status": "Failure", "err": "other"}})
+        self.assertEqual(
+            get_lxc_machines_from_lifecycle_events(self.listener, "Running", 1, operations={"op1": "router100", "op2": "router101"}),
+            ([], {"router100": "blaap"}),
+        )
+
+    def test_get_lxc_machines_from_lifecycle_events_returns_empty_list_on_timeout(self):
+        self.assertEqual(get_lxc_machines_from_lifecycle_events(self.listener, "Running", 0.01), ([], {}))
+
+    def test_get_lxc_machines_from_lifecycle_events_sleeps_without_listener(self):
+        self.assertEqual(get_lxc_machines_from_lifecycle_events(None, "Running", 2), ([], {}))
+        self.sleep.assert_called_once_with(2)
+
+
+class TestGetLXCOperationError(VNetTestCase):
+    def setUp(self) -> None:
+        self.container = MagicMock()
+        self.operation = self.container.client.api.operations.__getitem__.return_value
+
+    def test_get_lxc_operation_error_returns_error_of_failed_operation(self):
+        self.operation.get.return_value.json.return_value = {"metadata": {"status": "Failure", "err": "blaap"}}
+        self.assertEqual(get_lxc_operation_error(self.container, "op1"), "blaap")
+        self.container.client.api.operations.__getitem__.assert_called_once_with("op1")
+
+    def test_get_lxc_operation_error_returns_none_for_running_operation(self):
+        self.operation.get.return_value.json.return_value = {"metadata": {"status": "Running", "err": ""}}
+        self.assertIsNone(get_lxc_operation_error(self.container, "op1"))
+
+    def test_get_lxc_operation_error_returns_none_for_forgotten_operation(self):
+        self.operation.get.side_effect = NotFound(response="blaap")
+        self.assertIsNone(get_lxc_operation_error(self.container, "op1"))
+
 
 class TestChangeLXCMachineStatus(VNetTestCase):
     def setUp(self) -> None:
@@ -198,78 +496,139 @@ class TestChangeLXCMachineStatus(VNetTestCase):
 
 class TestCreateMachines(VNetTestCase):
     def setUp(self) -> None:
-        self.create_lxc_machines_from_base_image = self.set_up_patch("vnet_manager.operations.machine.create_lxc_machines_from_base_image")
+        self.create_netns_machine = self.set_up_patch("vnet_manager.operations.machine.create_netns_machine")
+        self.config = deepcopy(settings.CONFIG)
+        self.config["machines"]["host103"] = {"type": "netns-host", "interfaces": {}}
+
+    def test_create_machines_calls_provider_create_function_for_other_providers(self):
+        self.assertEqual(create_machines(self.config), {})
+        self.create_netns_machine.assert_called_once_with(self.config, "host103")
+
+    def test_create_machines_calls_provider_create_function_with_custom_machine_list(self):
+        self.config["machines"]["host104"] = {"type": "netns-host", "interfaces": {}}
+        create_machines(self.config, machines=["host104"])
+        self.create_netns_machine.assert_called_once_with(self.config, "host104")
+
+    def test_create_machines_skips_machines_not_in_config(self):
+        create_machines(self.config, machines=["blaap"])
+        self.assertFalse(self.create_netns_machine.called)
+
+    def test_create_machines_returns_failed_machines_of_other_providers(self):
+        self.create_netns_machine.side_effect = OSError("File exists")
+        self.assertEqual(create_machines(self.config, machines=["host103"]), {"host103": "File exists"})
+
+
+class TestGenerateLXCContainerConfig(VNetTestCase):
+    def test_generate_lxc_container_config_returns_bridged_nic_per_interface(self):
+        devices = generate_lxc_container_config(settings.CONFIG, "router101")["devices"]
+        self.assertEqual(sorted(devices.keys()), ["eth0", "eth12", "eth23"])
+        self.assertEqual(devices["eth23"]["parent"], "vnet-br1")
+        self.assertEqual(devices["eth23"]["hwaddr"], "00:00:00:00:02:22")
+
+    def test_generate_lxc_container_config_returns_physical_nic_with_veth_end_for_p2p_switches(self):
+        config = deepcopy(settings.CONFIG)
+        config["switch_config"] = {1: {"p2p": True}}
+        del config["veths"]["vnet-veth1"]
+        devices = generate_lxc_container_config(config, "host102")["devices"]
+        self.assertEqual(
+            devices["eth23"],
+            {"name": "eth23", "parent": "vnet-p2p1-1", "type": "nic", "nictype": "physical", "hwaddr": "00:00:00:00:03:23"},
+        )
+        self.assertEqual(generate_lxc_container_config(config, "router101")["devices"]["eth23"]["parent"], "vnet-p2p1-0")
+
+    def test_generate_lxc_container_config_uses_base_image(self):
+        self.assertEqual(
+            generate_lxc_container_config(settings.CONFIG, "router100")["source"], {"alias": settings.LXC_BASE_IMAGE_ALIAS, "type": "image"}
+        )
+
 
-    def test_create_machines_calls_create_lxc_machines_with_config_machines(self):
-        create_machines(settings.CONFIG)
-        self.create_lxc_machines_from_base_image.assert_called_once_with(settings.CONFIG, settings.CONFIG["machines"].keys())
+class TestSubmitLXCMachineCreation(VNetTestCase):
+    def setUp(self) -> None:
+        self.lxd_client = self.set_up_patch("vnet_manager.operations.machine.get_lxd_client")
+        self.lxd_client.return_value.api.containers.post.return_value.json.return_value = {"operation": "/1.0/operations/op1"}
+        self.generate_lxc_container_config = self.set_up_patch("vnet_manager.operations.machine.generate_lxc_container_config")
 
-    def test_create_machines_calls_create_lxc_machine_with_custom_machine_list(self):
-        create_machines(settings.CONFIG, machines=["test1", "test2"])
-        self.create_lxc_machines_from_base_image.assert_called_once_with(settings.CONFIG, ["test1", "test2"])
+    def test_submit_lxc_machine_creation_posts_generated_config_without_waiting(self):
+        self.assertEqual(submit_lxc_machine_creation(settings.CONFIG, "router100"), "/1.0/operations/op1")
+        self.generate_lxc_container_config.assert_called_once_with(settings.CONFIG, "router100")
+        self.lxd_client.return_value.api.containers.post.assert_called_once_with(json=self.generate_lxc_container_config.return_value)
+        self.assertFalse(self.lxd_client.return_value.operations.wait_for_operation.called)
 
 
-class TestCreateLXCMachinesFromBaseImage(VNetTestCase):
+class TestWaitForLXCMachineCreation(VNetTestCase):
     def setUp(self) -> None:
-        self.check_if_lxc_machine_exists = self.set_up_patch("vnet_manager.operations.machine.check_if_lxc_machine_exists")
-        self.check_if_lxc_machine_exists.return_value = False
         self.lxd_client = self.set_up_patch("vnet_manager.operations.machine.get_lxd_client")
-        self.client = Mock()
-        self.lxd_client.return_value = self.client
-        self.place_lxc_interface_configuration_on_container = self.set_up_patch(
-            "vnet_manager.operations.machine.place_lxc_interface_configuration_on_container"
+
+    def test_wait_for_lxc_machine_creation_waits_for_operation(self):
+        wait_for_lxc_machine_creation("router100", "/1.0/operations/op1")
+        self.lxd_client.return_value.operations.wait_for_operation.assert_called_once_with("/1.0/operations/op1")
+
+
+class TestGetLXCContainerSource(VNetTestCase):
+    def test_get_lxc_container_source_returns_base_image_by_default(self):
+        self.assertEqual(get_lxc_container_source(), {"alias": settings.LXC_BASE_IMAGE_ALIAS, "type": "image"})
+
+    def test_get_lxc_container_source_returns_golden_machine_with_copy_strategy(self):
+        self.assertEqual(
+            get_lxc_container_source("copy"), {"type": "copy", "source": settings.LXC_GOLDEN_MACHINE_NAME, "instance_only": True}
         )
-        self.request_confirm = self.set_up_patch("vnet_manager.operations.machine.request_confirmation")
-        self.config = deepcopy(settings.CONFIG)
-        self.excepted_config = {
-            "name": "router100",
-            "source": {"alias": settings.LXC_BASE_IMAGE_ALIAS, "type": "image"},
-            "ephemeral": False,
-            "config": {"user.network-config": "disabled"},
-            "devices": {
-                "eth0": {"type": "none"},
-                "eth12": {
-                    "name": "eth12",
-                    "host_name": "router100-eth12",
-                    "parent": "vnet-br0",
-                    "type": "nic",
-                    "nictype": "bridged",
-                    "hwaddr": "00:00:00:00:01:11",
-                },
-            },
-            "profiles": [settings.LXC_VNET_PROFILE],
-        }
 
-    def test_create_lxc_machines_from_base_image_calls_lxc_client(self):
-        create_lxc_machines_from_base_image(settings.CONFIG, ["router100", "router101"])
-        self.lxd_client.assert_called_once_with()
+    def test_get_lxc_container_source_uses_strategy_from_settings(self):
+        self.set_up_patch("vnet_manager.conf.settings.LXC_CREATE_STRATEGY", themock="copy")
+        self.assertEqual(get_lxc_container_source()["type"], "copy")
+        self.assertEqual(generate_lxc_container_config(settings.CONFIG, "router100")["source"]["type"], "copy")
 
-    def test_create_lxc_machines_from_base_image_does_nothing_if_machines_already_exist(self):
-        self.check_if_lxc_machine_exists.return_value = True
-        create_lxc_machines_from_base_image(self.config, ["router100", "router101"])
-        self.assertFalse(self.place_lxc_interface_configuration_on_container.called)
-        self.assertFalse(self.client.containers.create.called)
 
-    def test_create_lxc_machines_from_base_image_calls_containers_create_method(self):
-        create_lxc_machines_from_base_image(self.config, ["router100"])
-        self.client.containers.create.assert_called_once_with(self.excepted_config, wait=True)
+class TestCreateLXCGoldenMachine(VNetTestCase):
+    def setUp(self) -> None:
+        self.lxd_client = self.set_up_patch("vnet_manager.operations.machine.get_lxd_client")
 
-    def test_create_lxc_machines_from_base_image_calls_place_lxc_interface_configuration_on_container(self):
-        create_lxc_machines_from_base_image(self.config, ["router100"])
-        self.place_lxc_interface_configuration_on_container.assert_called_once_with(self.config, "router100")
+    def test_create_lxc_golden_machine_creates_container_from_base_image_in_vnet_profile(self):
+        create_lxc_golden_machine()
+        machine_config = self.lxd_client.return_value.containers.create.call_args[0][0]
+        self.assertEqual(machine_config["name"], settings.LXC_GOLDEN_MACHINE_NAME)
+        self.assertEqual(machine_config["source"], {"alias": settings.LXC_BASE_IMAGE_ALIAS, "type": "image"})
+        self.assertEqual(machine_config["profiles"], [settings.LXC_VNET_PROFILE])
+        self.lxd_client.return_value.containers.create.assert_called_once_with(machine_config, wait=True)
 
-    def test_create_lxc_machine_from_base_image_calls_create_functions_on_the_basis_of_the_number_of_containers(self):
-        create_lxc_machines_from_base_image(self.config, ["router100", "router101", "host102"])
-        self.assertEqual(self.client.containers.create.call_count, 3)
-        self.assertEqual(self.place_lxc_interface_configuration_on_container.call_count, 3)
 
-    def test_create_lxc_machines_from_base_image_calls_request_confirmation_if_containers_already_created(self):
-        self.check_if_lxc_machine_exists.return_value = True
-        create_lxc_machines_from_base_image(self.config, ["router100", "host102"])
-        self.request_confirm.assert_called_once_with(
-            message="Some containers already existed, the next operation will overwrite network, "
-            "host and user config files on those containers"
-        )
+class TestUpdateLXCMachineDevices(VNetTestCase):
+    def setUp(self) -> None:
+        self.lxd_client = self.set_up_patch("vnet_manager.operations.machine.get_lxd_client")
+        self.client = self.lxd_client.return_value
+        self.machine = self.client.containers.get.return_value
+        self.devices = generate_lxc_container_config(settings.CONFIG, "router100")["devices"]
+        self.machine.devices = deepcopy(self.devices)
+        self.machine.api.patch.return_value.json.return_value = {"operation": "/1.0/operations/1234"}
+
+    def test_update_lxc_machine_devices_gets_container(self):
+        update_lxc_machine_devices(settings.CONFIG, "router100")
+        self.client.containers.get.assert_called_once_with("router100")
+
+    def test_update_lxc_machine_devices_does_nothing_if_devices_are_up_to_date(self):
+        self.assertFalse(update_lxc_machine_devices(settings.CONFIG, "router100"))
+        self.assertFalse(self.machine.api.patch.called)
+        self.assertFalse(self.machine.save.called)
+
+    def test_update_lxc_machine_devices_patches_only_changed_devices(self):
+        self.machine.devices["eth12"]["parent"] = "vnet-br1"
+        self.assertTrue(update_lxc_machine_devices(settings.CONFIG, "router100"))
+        self.machine.api.patch.assert_called_once_with(json={"devices": {"eth12": self.devices["eth12"]}})
+        self.client.operations.wait_for_operation.assert_called_once_with("/1.0/operations/1234")
+        self.assertFalse(self.machine.save.called)
+
+    def test_update_lxc_machine_devices_patches_added_devices(self):
+        del self.machine.devices["eth12"]
+        update_lxc_machine_devices(settings.CONFIG, "router100")
+        self.machine.api.patch.assert_called_once_with(json={"devices": {"eth12": self.devices["eth12"]}})
+        self.assertEqual(self.machine.devices, self.devices)
+
+    def test_update_lxc_machine_devices_replaces_devices_if_devices_are_removed(self):
+        self.machine.devices["eth99"] = {"type": "nic"}
+        self.assertTrue(update_lxc_machine_devices(settings.CONFIG, "router100"))
+        self.assertEqual(self.machine.devices, self.devices)
+        self.machine.save.assert_called_once_with(wait=True)
+        self.assertFalse(self.machine.api.patch.called)
 
 
 class TestDestroyMachines(VNetTestCase):
@@ -293,6 +652,87 @@ class TestDestroyMachines(VNetTestCase):
         destroy_machines(settings.CONFIG, machines=["router100"])
         self.destroy_lxc_machine.assert_called_once_with("router100")
 
+    def test_destroy_machines_destroys_lxc_machines_in_parallel(self):
+        destroy_in_parallel = self.set_up_patch("vnet_manager.operations.machine.destroy_lxc_machines_in_parallel")
+        destroy_machines(settings.CONFIG, parallel=4)
+        destroy_in_parallel.assert_called_once_with(list(settings.CONFIG["machines"].keys()), parallel=4)
+        self.assertFalse(self.destroy_lxc_machine.called)
+
+
+class TestDestroyLXCMachinesInParallel(VNetTestCase):
+    def setUp(self) -> None:
+        self.lxd_client = self.set_up_patch("vnet_manager.operations.machine.get_lxd_client")
+        self.client = Mock()
+        self.lxd_client.return_value = self.client
+        self.containers = {}
+        self.client.containers.get.side_effect = self.get_container
+        self.tabulate = self.set_up_patch("vnet_manager.operations.machine.tabulate")
+        self.api_error_response = Mock(status_code=400, json=Mock(return_value={"error": "blaap"}))
+
+    def get_container(self, name):
+        if name not in self.containers:
+            self.containers[name] = Mock(status="Running")
+            self.containers[name].api.state.put.return_value.json.return_value = {"operation": f"/1.0/operations/stop-{name}"}
+            self.containers[name].api.delete.return_value.json.return_value = {"operation": f"/1.0/operations/delete-{name}"}
+        return self.containers[name]
+
+    def test_destroy_lxc_machines_in_parallel_force_stops_running_machines_without_waiting(self):
+        destroy_lxc_machines_in_parallel(["router100", "router101"], 2)
+        for name in ("router100", "router101"):
+            self.containers[name].api.state.put.assert_called_once_with(json={"action": "stop", "force": True, "timeout": -1})
+            self.assertFalse(self.containers[name].stop.called)
+
+    def test_destroy_lxc_machines_in_parallel_does_not_stop_stopped_machines(self):
+        self.get_container("router100").status = "Stopped"
+        destroy_lxc_machines_in_parallel(["router100"], 2)
+        self.assertFalse(self.containers["router100"].api.state.put.called)
+        self.containers["router100"].api.delete.assert_called_once_with()
+
+    def test_destroy_lxc_machines_in_parallel_waits_for_stop_and_delete_operations(self):
+        destroy_lxc_machines_in_parallel(["router100"], 2)
+        self.assertEqual(
+            self.client.operations.wait_for_operation.call_args_list,
+            [call("/1.0/operations/stop-router100"), call("/1.0/operations/delete-router100")],
+        )
+
+    def test_destroy_lxc_machines_in_parallel_issues_all_stops_before_waiting(self):
+        manager = Mock()
+        manager.attach_mock(self.client.operations.wait_for_operation, "wait")
+        for name in ("router100", "router101"):
+            manager.attach_mock(self.get_container(name).api.state.put, f"stop_{name}")
+        destroy_lxc_machines_in_parallel(["router100", "router101"], 2)
+        calls = [c[0] for c in manager.mock_calls if c[0] in ("stop_router100", "stop_router101", "wait")]
+        self.assertEqual(calls[:3], ["stop_router100", "stop_router101", "wait"])
+
+    def test_destroy_lxc_machines_in_parallel_limits_concurrency(self):
+        thread_pool = self.set_up_patch("vnet_manager.operations.machine.ThreadPoolExecutor", themock=Mock(wraps=ThreadPoolExecutor))
+        destroy_lxc_machines_in_parallel(["router100", "router101"], 3)
+        thread_pool.assert_called_once_with(max_workers=3)
+
+    def test_destroy_lxc_machines_in_parallel_returns_ok_for_destroyed_machines(self):
+        self.assertEqual(destroy_lxc_machines_in_parallel(["router100", "router101"], 2), {"router100": "OK", "router101": "OK"})
+
+    def test_destroy_lxc_machines_in_parallel_skips_machines_that_do_not_exist(self):
+        self.client.containers.get.side_effect = NotFound(self.api_error_response)
+        self.assertEqual(destroy_lxc_machines_in_parallel(["router100"], 2), {"router100": "Not found"})
+        self.assertFalse(self.client.operations.wait_for_operation.called)
+
+    def test_destroy_lxc_machines_in_parallel_does_not_delete_machines_that_failed_to_stop(self):
+        self.client.operations.wait_for_operation.side_effect = LXDAPIException(self.api_error_response)
+        self.assertEqual(destroy_lxc_machines_in_parallel(["router100"], 2), {"router100": "Error: blaap"})
+        self.assertFalse(self.containers["router100"].api.delete.called)
+
+    def test_destroy_lxc_machines_in_parallel_reports_failed_deletes(self):
+        self.get_container("router100").api.delete.side_effect = LXDAPIException(self.api_error_response)
+        self.assertEqual(destroy_lxc_machines_in_parallel(["router100"], 2), {"router100": "Error: blaap"})
+
+    def test_destroy_lxc_machines_in_parallel_shows_timings(self):
+        self.get_container("router100").status = "Stopped"
+        destroy_lxc_machines_in_parallel(["router100"], 2)
+        self.tabulate.assert_called_once_with(
+            [["router100", 0.0, ANY, "OK"]], headers=["Name", "Stop (s)", "Delete (s)", "Result"], tablefmt="pretty"
+        )
+
 
 class TestDestroyLXCMachine(VNetTestCase):
     def setUp(self) -> None:
@@ -405,6 +845,40 @@ class TestPlaceLXCInterfaceConfigurationOnContainer(VNetTestCase):
             "router100", settings.VNET_NETPLAN_CONFIG_FILE_PATH, safe_dump(self.network_conf.return_value)
         )
 
+    def test_place_lxc_interface_configuration_on_container_does_not_apply_configuration_by_default(self):
+        apply = self.set_up_patch("vnet_manager.operations.machine.apply_lxc_interface_configuration")
+        place_lxc_interface_configuration_on_container(self.config, "router100")
+        self.assertFalse(apply.called)
+
+    def test_place_lxc_interface_configuration_on_container_applies_configuration(self):
+        apply = self.set_up_patch("vnet_manager.operations.machine.apply_lxc_interface_configuration")
+        place_lxc_interface_configuration_on_container(self.config, "router100", apply=True)
+        apply.assert_called_once_with("router100")
+
+
+class TestApplyLXCInterfaceConfiguration(VNetTestCase):
+    def setUp(self) -> None:
+        self.lxd_client = self.set_up_patch("vnet_manager.operations.machine.get_lxd_client")
+        self.machine = self.lxd_client.return_value.containers.get.return_value
+        self.machine.status = "Running"
+        self.machine.execute.return_value = (0, "", "")
+        self.logger = self.set_up_patch("vnet_manager.operations.machine.logger")
+
+    def test_apply_lxc_interface_configuration_runs_netplan_apply(self):
+        apply_lxc_interface_configuration("router100")
+        self.lxd_client.return_value.containers.get.assert_called_once_with("router100")
+        self.machine.execute.assert_called_once_with(["netplan", "apply"])
+
+    def test_apply_lxc_interface_configuration_does_nothing_if_container_is_not_running(self):
+        self.machine.status = "Stopped"
+        apply_lxc_interface_configuration("router100")
+        self.assertFalse(self.machine.execute.called)
+
+    def test_apply_lxc_interface_configuration_logs_warning_if_netplan_apply_fails(self):
+        self.machine.execute.return_value = (1, "", "blaap")
+        apply_lxc_interface_configuration("router100")
+        self.assertTrue(self.logger.warning.called)
+
 
 class TestEnableTypeSpecificMachineConfiguration(VNetTestCase):
     def setUp(self) -> None:
@@ -417,6 +891,10 @@ class TestEnableTypeSpecificMachineConfiguration(VNetTestCase):
         )
         self.assertEqual(self.configure_lxc_ip_forwarding.call_count, 3)
 
+    def test_enable_type_specific_machine_configuration_only_configures_requested_machines(self):
+        enable_type_specific_machine_configuration(settings.CONFIG, machines=["host102"])
+        self.configure_lxc_ip_forwarding.assert_called_once_with("host102", enable=False)
+
 
 class TestConfigureLXCIPForwarding(VNetTestCase):
     def setUp(self) -> None:
@@ -432,6 +910,26 @@ class TestConfigureLXCIPForwarding(VNetTestCase):
         )
         self.assertEqual(self.write_file_to_lxc_container.call_count, 2)
 
+    def test_configure_lxc_ip_forwarding_disables_ip_forwarding(self):
+        configure_lxc_ip_forwarding("host102", enable=False)
+        self.write_file_to_lxc_container.assert_any_call("host102", "/etc/sysctl.d/20-net.ipv4.ip_forward.conf", "net.ipv4.ip_forward=0\n")
+
+
+class TestGetLXCIPForwardingFiles(VNetTestCase):
+    def test_get_lxc_ip_forwarding_files_returns_enabled_sysctl_files(self):
+        self.assertEqual(
+            get_lxc_ip_forwarding_files(),
+            {
+                "/etc/sysctl.d/20-net.ipv4.ip_forward.conf": "net.ipv4.ip_forward=1\n",
+                "/etc/sysctl.d/20-net.ipv6.conf.all.forwarding.conf": "net.ipv6.conf.all.forwarding=1\n",
+            },
+        )
+
+    def test_get_lxc_ip_forwarding_files_returns_disabled_sysctl_files(self):
+        self.assertEqual(
+            set(get_lxc_ip_forwarding_files(enable=False).values()), {"net.ipv4.ip_forward=0\n", "net.ipv6.conf.all.forwarding=0\n"}
+        )
+
 
 class TestGenerateMachineNetplanConfig(VNetTestCase):
     def setUp(self) -> None:
@@ -503,6 +1001,11 @@ class TestConnectToLXCMachine(VNetTestCase):
         connect_to_lxc_machine("machine1")
         self.call.assert_called_once_with(["lxc", "exec", "machine1", settings.SHELL])
 
+    def test_connect_to_lxc_machine_connects_through_lxc_remote_of_machine(self):
+        self.set_up_patch("vnet_manager.operations.machine.get_lxd_machine_remote", return_value="node1")
+        connect_to_lxc_machine("machine1")
+        self.call.assert_called_once_with(["lxc", "exec", "node1:machine1", settings.SHELL])
+
     def test_connect_to_lxc_machine_returns_true_if_connection_successful(self):
         self.assertTrue(connect_to_lxc_machine("machine1"))
 
@@ -0,0 +1,288 @@
+from copy import deepcopy
+from unittest.mock import Mock, call
+from pyroute2.netlink.exceptions import NetlinkError
+
+from vnet_manager.tests import VNetTestCase
+from vnet_manager.conf import settings
+from vnet_manager.operations.netns import (
+    get_netns_machine_port_names,
+    check_if_netns_machine_exists,
+    open_netns_socket,
+    get_netns_route,
+    create_netns_machine,
+    configure_netns_machine_interfaces,
+    get_netns_machine_ports,
+    get_netns_machine_addresses,
+    get_netns_machine_status,
+    change_netns_machine_status,
+    destroy_netns_machine,
+    connect_to_netns_machine,
+)
+
+
+def get_netns_config() -> dict:
+    config = deepcopy(settings.CONFIG)
+    config["machines"]["host103"] = {
+        "type": "netns-host",
+        "interfaces": {
+            "eth23": {
+                "ipv4": "192.168.1.3/24",
+                "ipv6": "fd00:23::3/64",
+                "mac": "00:00:00:00:01:13",
+                "bridge": 1,
+                "routes": [{"to": "default", "via": "192.168.1.1"}, {"to": "default", "via": "fd00:23::1"}],
+            }
+        },
+    }
+    return config
+
+
+def get_link(index: int, attrs: dict, flags: int = 0) -> Mock:
+    link = {"index": index, "flags": flags}
+    mock = Mock(**{"__getitem__": Mock(side_effect=link.__getitem__)})
+    mock.get_attr.side_effect = attrs.get
+    return mock
+
+
+class TestGetNetNSMachinePortNames(VNetTestCase):
+    def test_get_netns_machine_port_names_returns_host_end_per_interface(self):
+        self.assertEqual(get_netns_machine_port_names(get_netns_config(), "host103"), {"eth23": "host103-eth23"})
+
+
+class TestCheckIfNetNSMachineExists(VNetTestCase):
+    def setUp(self) -> None:
+        self.listnetns = self.set_up_patch("vnet_manager.operations.netns.netns.listnetns")
+        self.listnetns.return_value = ["host103"]
+
+    def test_check_if_netns_machine_exists_returns_true_if_namespace_exists(self):
+        self.assertTrue(check_if_netns_machine_exists("host103"))
+
+    def test_check_if_netns_machine_exists_returns_false_if_namespace_does_not_exist(self):
+        self.assertFalse(check_if_netns_machine_exists("host104"))
+
+
+class TestOpenNetNSSocket(VNetTestCase):
+    def setUp(self) -> None:
+        self.pushns = self.set_up_patch("vnet_manager.operations.netns.netns.pushns")
+        self.popns = self.set_up_patch("vnet_manager.operations.netns.netns.popns")
+        self.ip = self.set_up_patch("vnet_manager.operations.netns.IPRoute")
+
+    def test_open_netns_socket_opens_socket_inside_namespace(self):
+        self.assertEqual(open_netns_socket("host103"), self.ip.return_value)
+        self.pushns.assert_called_once_with("host103")
+        self.popns.assert_called_once_with()
+
+    def test_open_netns_socket_leaves_namespace_on_error(self):
+        self.ip.side_effect = OSError
+        with self.assertRaises(OSError):
+            open_netns_socket("host103")
+        self.popns.assert_called_once_with()
+
+
+class TestGetNetNSRoute(VNetTestCase):
+    def test_get_netns_route_returns_destination_and_gateway(self):
+        self.assertEqual(get_netns_route({"to": "10.0.0.0/8", "via": "192.168.1.1"}), {"dst": "10.0.0.0/8", "gateway": "192.168.1.1"})
+
+    def test_get_netns_route_converts_ipv4_default_route(self):
+        self.assertEqual(get_netns_route({"to": "default", "via": "192.168.1.1"})["dst"], "0.0.0.0/0")
+
+    def test_get_netns_route_converts_ipv6_default_route(self):
+        self.assertEqual(get_netns_route({"to": "default", "via": "fd00:23::1"})["dst"], "::/0")
+
+
+class TestCreateNetNSMachine(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = get_netns_config()
+        self.check_if_netns_machine_exists = self.set_up_patch("vnet_manager.operations.netns.check_if_netns_machine_exists")
+        self.check_if_netns_machine_exists.return_value = False
+        self.create = self.set_up_patch("vnet_manager.operations.netns.netns.create")
+        self.ip = self.set_up_patch("vnet_manager.operations.netns.IPRoute")
+        self.ip.return_value.link_lookup.return_value = [42]
+        self.configure_netns_machine_interfaces = self.set_up_patch("vnet_manager.operations.netns.configure_netns_machine_interfaces")
+
+    def test_create_netns_machine_creates_namespace(self):
+        create_netns_machine(self.config, "host103")
+        self.create.assert_called_once_with("host103")
+
+    def test_create_netns_machine_creates_veth_pair_into_namespace(self):
+        create_netns_machine(self.config, "host103")
+        self.ip.return_value.link.assert_has_calls(
+            [
+                call("add", ifname="host103-eth23", kind="veth", peer={"ifname": "eth23", "net_ns_fd": "host103"}),
+                call("set", index=42, ifalias=f"{settings.VNET_BRIDGE_NAME}1"),
+            ]
+        )
+        self.ip.return_value.close.assert_called_once_with()
+
+    def test_create_netns_machine_configures_interfaces(self):
+        create_netns_machine(self.config, "host103")
+        self.configure_netns_machine_interfaces.assert_called_once_with(self.config, "host103")
+
+    def test_create_netns_machine_skips_existing_machines(self):
+        self.check_if_netns_machine_exists.return_value = True
+        create_netns_machine(self.config, "host103")
+        self.assertFalse(self.create.called)
+        self.assertFalse(self.ip.called)
+
+
+class TestConfigureNetNSMachineInterfaces(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = get_netns_config()
+        self.open_netns_socket = self.set_up_patch("vnet_manager.operations.netns.open_netns_socket")
+        self.ns = self.open_netns_socket.return_value
+        self.ns.link_lookup.side_effect = lambda ifname: [1] if ifname == "lo" else [2]
+
+    def test_configure_netns_machine_interfaces_brings_up_interfaces_with_mac(self):
+        configure_netns_machine_interfaces(self.config, "host103")
+        self.ns.link.assert_has_calls([call("set", index=1, state="up"), call("set", index=2, address="00:00:00:00:01:13", state="up")])
+
+    def test_configure_netns_machine_interfaces_adds_addresses(self):
+        configure_netns_machine_interfaces(self.config, "host103")
+        self.ns.addr.assert_has_calls(
+            [call("add", index=2, address="192.168.1.3", prefixlen=24), call("add", index=2, address="fd00:23::3", prefixlen=64)]
+        )
+
+    def test_configure_netns_machine_interfaces_adds_routes(self):
+        configure_netns_machine_interfaces(self.config, "host103")
+        self.ns.route.assert_has_calls(
+            [
+                call("add", oif=2, dst="0.0.0.0/0", gateway="192.168.1.1"),
+                call("add", oif=2, dst="::/0", gateway="fd00:23::1"),
+            ]
+        )
+        self.ns.close.assert_called_once_with()
+
+
+class TestGetNetNSMachinePorts(VNetTestCase):
+    def setUp(self) -> None:
+        self.open_netns_socket = self.set_up_patch("vnet_manager.operations.netns.open_netns_socket")
+        self.open_netns_socket.return_value.get_links.return_value = [
+            get_link(1, {"IFLA_IFNAME": "lo"}),
+            get_link(2, {"IFLA_IFNAME": "eth23"}),
+        ]
+        self.ip = Mock()
+        self.ip.link.return_value = [get_link(42, {"IFLA_IFALIAS": "vnet-br1", "IFLA_MASTER": 11}, flags=1)]
+
+    def test_get_netns_machine_ports_looks_up_host_end_of_namespace_interfaces(self):
+        self.assertEqual(
+            get_netns_machine_ports(self.ip, "host103"), {"host103-eth23": {"index": 42, "bridge": "vnet-br1", "up": True, "master": 11}}
+        )
+        self.ip.link.assert_called_once_with("get", ifname="host103-eth23")
+
+    def test_get_netns_machine_ports_skips_missing_host_ends(self):
+        self.ip.link.side_effect = NetlinkError(19)
+        self.assertEqual(get_netns_machine_ports(self.ip, "host103"), {})
+
+
+class TestGetNetNSMachineAddresses(VNetTestCase):
+    def setUp(self) -> None:
+        self.open_netns_socket = self.set_up_patch("vnet_manager.operations.netns.open_netns_socket")
+        self.addresses = [
+            {"IFA_ADDRESS": "192.168.1.3", "prefixlen": 24, "scope": 0},
+            {"IFA_ADDRESS": "fd00:23::3", "prefixlen": 64, "scope": 0},
+            {"IFA_ADDRESS": "fe80::1", "prefixlen": 64, "scope": 253},
+        ]
+        self.open_netns_socket.return_value.get_addr.return_value = [
+            Mock(get_attr=Mock(return_value=addr["IFA_ADDRESS"]), **{"__getitem__": Mock(side_effect=addr.__getitem__)})
+            for addr in self.addresses
+        ]
+
+    def test_get_netns_machine_addresses_returns_global_addresses(self):
+        self.assertEqual(get_netns_machine_addresses("host103"), {"ipv4": ["192.168.1.3/24"], "ipv6": ["fd00:23::3/64"]})
+
+
+class TestGetNetNSMachineStatus(VNetTestCase):
+    def setUp(self) -> None:
+        self.check_if_netns_machine_exists = self.set_up_patch("vnet_manager.operations.netns.check_if_netns_machine_exists")
+        self.check_if_netns_machine_exists.return_value = True
+        self.ip = self.set_up_patch("vnet_manager.operations.netns.IPRoute")
+        self.get_netns_machine_ports = self.set_up_patch("vnet_manager.operations.netns.get_netns_machine_ports")
+        self.get_netns_machine_ports.return_value = {"host103-eth23": {"index": 42, "bridge": "vnet-br1", "up": True, "master": 11}}
+        self.get_netns_machine_addresses = self.set_up_patch("vnet_manager.operations.netns.get_netns_machine_addresses")
+        self.get_netns_machine_addresses.return_value = {"ipv4": ["192.168.1.3/24"], "ipv6": []}
+
+    def test_get_netns_machine_status_returns_running_if_ports_are_connected(self):
+        self.assertEqual(get_netns_machine_status("host103"), ["host103", "Running", "netns", "192.168.1.3/24", ""])
+
+    def test_get_netns_machine_status_returns_stopped_if_ports_are_down(self):
+        self.get_netns_machine_ports.return_value["host103-eth23"]["up"] = False
+        self.assertEqual(get_netns_machine_status("host103")[1], "Stopped")
+
+    def test_get_netns_machine_status_returns_stopped_if_ports_are_not_connected(self):
+        self.get_netns_machine_ports.return_value["host103-eth23"]["master"] = None
+        self.assertEqual(get_netns_machine_status("host103")[1], "Stopped")
+
+    def test_get_netns_machine_status_returns_na_if_machine_does_not_exist(self):
+        self.check_if_netns_machine_exists.return_value = False
+        self.assertEqual(get_netns_machine_status("host103"), ["host103", "NA", "netns"])
+
+
+class TestChangeNetNSMachineStatus(VNetTestCase):
+    def setUp(self) -> None:
+        self.check_if_netns_machine_exists = self.set_up_patch("vnet_manager.operations.netns.check_if_netns_machine_exists")
+        self.check_if_netns_machine_exists.return_value = True
+        self.ip = self.set_up_patch("vnet_manager.operations.netns.IPRoute")
+        self.ip.return_value.link_lookup.return_value = [11]
+        self.get_netns_machine_ports = self.set_up_patch("vnet_manager.operations.netns.get_netns_machine_ports")
+        self.get_netns_machine_ports.return_value = {"host103-eth23": {"index": 42, "bridge": "vnet-br1", "up": False, "master": None}}
+
+    def test_change_netns_machine_status_connects_ports_to_bridge_on_start(self):
+        change_netns_machine_status("host103", status="start")
+        self.ip.return_value.link_lookup.assert_called_once_with(ifname="vnet-br1")
+        self.ip.return_value.link.assert_called_once_with("set", index=42, master=11, state="up")
+        self.ip.return_value.close.assert_called_once_with()
+
+    def test_change_netns_machine_status_skips_ports_without_bridge(self):
+        self.ip.return_value.link_lookup.return_value = []
+        change_netns_machine_status("host103", status="start")
+        self.assertFalse(self.ip.return_value.link.called)
+
+    def test_change_netns_machine_status_brings_ports_down_on_stop(self):
+        change_netns_machine_status("host103", status="stop")
+        self.ip.return_value.link.assert_called_once_with("set", index=42, state="down")
+
+    def test_change_netns_machine_status_does_nothing_if_machine_does_not_exist(self):
+        self.check_if_netns_machine_exists.return_value = False
+        change_netns_machine_status("host103", status="start")
+        self.assertFalse(self.ip.called)
+
+
+class TestDestroyNetNSMachine(VNetTestCase):
+    def setUp(self) -> None:
+        self.check_if_netns_machine_exists = self.set_up_patch("vnet_manager.operations.netns.check_if_netns_machine_exists")
+        self.check_if_netns_machine_exists.return_value = True
+        self.ip = self.set_up_patch("vnet_manager.operations.netns.IPRoute")
+        self.get_netns_machine_ports = self.set_up_patch("vnet_manager.operations.netns.get_netns_machine_ports")
+        self.get_netns_machine_ports.return_value = {"host103-eth23": {"index": 42, "bridge": "vnet-br1", "up": True, "master": 11}}
+        self.remove = self.set_up_patch("vnet_manager.operations.netns.netns.remove")
+
+    def test_destroy_netns_machine_deletes_ports_and_namespace(self):
+        destroy_netns_machine("host103")
+        self.ip.return_value.link.assert_called_once_with("del", index=42)
+        self.remove.assert_called_once_with("host103")
+
+    def test_destroy_netns_machine_removes_namespace_if_port_could_not_be_deleted(self):
+        self.ip.return_value.link.side_effect = NetlinkError(19)
+        destroy_netns_machine("host103")
+        self.remove.assert_called_once_with("host103")
+
+    def test_destroy_netns_machine_does_nothing_if_machine_does_not_exist(self):
+        self.check_if_netns_machine_exists.return_value = False
+        destroy_netns_machine("host103")
+        self.assertFalse(self.remove.called)
+
+
+class TestConnectToNetNSMachine(VNetTestCase):
+    def setUp(self) -> None:
+        self.check_if_netns_machine_exists = self.set_up_patch("vnet_manager.operations.netns.check_if_netns_machine_exists")
+        self.check_if_netns_machine_exists.return_value = True
+        self.call = self.set_up_patch("vnet_manager.operations.netns.call")
+
+    def test_connect_to_netns_machine_runs_shell_in_namespace(self):
+        self.assertTrue(connect_to_netns_machine("host103"))
+        self.call.assert_called_once_with(["ip", "netns", "exec", "host103", settings.SHELL])
+
+    def test_connect_to_netns_machine_returns_false_if_machine_does_not_exist(self):
+        self.check_if_netns_machine_exists.return_value = False
+        self.assertFalse(connect_to_netns_machine("host103"))
+        self.assertFalse(self.call.called)
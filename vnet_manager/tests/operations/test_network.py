@@ -0,0 +1,159 @@
+from copy import deepcopy
+from unittest.mock import MagicMock, Mock
+
+from vnet_manager.conf import settings
+from vnet_manager.tests import VNetTestCase
+from vnet_manager.operations.network import (
+    get_vnet_p2p_interface_names,
+    get_vnet_bridged_switches_from_config,
+    get_vnet_lxd_remotes_from_config,
+    get_vnet_lxd_remote_number,
+    get_vnet_vxlan_id,
+    get_vnet_vxlan_interfaces_from_config,
+    generate_vnet_lxd_network_config,
+    ensure_vnet_lxd_networks,
+    delete_vnet_lxd_networks,
+)
+
+
+def get_remotes_config() -> dict:
+    config = deepcopy(settings.CONFIG)
+    config["lxd_remotes"] = {
+        "local": {"tunnel_address": "192.168.0.1"},
+        "node1": {"endpoint": "https://node1:8443", "tunnel_address": "192.168.0.2"},
+        "node2": {"endpoint": "https://node2:8443", "tunnel_address": "192.168.0.3"},
+    }
+    config["machines"]["router100"]["remote"] = "local"
+    config["machines"]["router101"]["remote"] = "node2"
+    config["machines"]["host102"]["remote"] = "node2"
+    return config
+
+
+class FakeLXDNetworks:
+    """
+    Stand-in for the networks API of an LXD remote, keeps the networks in memory
+    """
+
+    def __init__(self):
+        self.networks = {}
+
+    def exists(self, name: str) -> bool:
+        return name in self.networks
+
+    def create(self, name: str, description: str = None, type: str = None, config: dict = None):
+        # pylint: disable=redefined-builtin
+        self.networks[name] = Mock(description=description, type=type, config=config)
+        self.networks[name].delete.side_effect = lambda: self.networks.pop(name)
+
+    def get(self, name: str):
+        return self.networks[name]
+
+
+class TestGetVNetP2PInterfaceNames(VNetTestCase):
+    def test_get_vnet_p2p_interface_names_returns_both_ends(self):
+        self.assertEqual(get_vnet_p2p_interface_names(1), [f"{settings.VNET_P2P_NAME}1-0", f"{settings.VNET_P2P_NAME}1-1"])
+
+
+class TestGetVNetBridgedSwitchesFromConfig(VNetTestCase):
+    def setUp(self) -> None:
+        self.set_up_patch("vnet_manager.conf.settings.VNET_P2P_AUTO_DETECT", themock=True)
+        self.config = deepcopy(settings.CONFIG)
+        del self.config["veths"]
+
+    def test_get_vnet_bridged_switches_from_config_skips_p2p_switches(self):
+        self.config["switch_config"] = {1: {"p2p": False}}
+        self.assertEqual(get_vnet_bridged_switches_from_config(self.config), [1])
+
+    def test_get_vnet_bridged_switches_from_config_returns_all_switches_without_machines(self):
+        self.assertEqual(get_vnet_bridged_switches_from_config({"switches": 2}), [0, 1])
+
+
+class TestGetVNetLXDRemotesFromConfig(VNetTestCase):
+    def test_get_vnet_lxd_remotes_from_config_returns_used_remotes(self):
+        self.assertEqual(get_vnet_lxd_remotes_from_config(get_remotes_config()), ["node2"])
+
+    def test_get_vnet_lxd_remotes_from_config_returns_nothing_without_remotes(self):
+        self.assertEqual(get_vnet_lxd_remotes_from_config(settings.CONFIG), [])
+
+
+class TestGetVNetVXLANId(VNetTestCase):
+    def test_get_vnet_lxd_remote_number_skips_local_remote(self):
+        self.assertEqual(get_vnet_lxd_remote_number(get_remotes_config(), "node2"), 2)
+
+    def test_get_vnet_vxlan_id_returns_id_in_range_of_remote(self):
+        self.assertEqual(
+            get_vnet_vxlan_id(get_remotes_config(), 1, "node2"), settings.VNET_VXLAN_ID_BASE + 2 * settings.VNET_VXLAN_ID_STRIDE + 1
+        )
+
+
+class TestGetVNetVXLANInterfacesFromConfig(VNetTestCase):
+    def test_get_vnet_vxlan_interfaces_from_config_returns_interface_per_switch_and_used_remote(self):
+        interfaces = get_vnet_vxlan_interfaces_from_config(get_remotes_config())
+        self.assertEqual(list(interfaces), [f"{settings.VNET_VXLAN_NAME}0-2", f"{settings.VNET_VXLAN_NAME}1-2"])
+        self.assertEqual(
+            interfaces[f"{settings.VNET_VXLAN_NAME}1-2"],
+            {
+                "bridge": f"{settings.VNET_BRIDGE_NAME}1",
+                "id": get_vnet_vxlan_id(get_remotes_config(), 1, "node2"),
+                "local": "192.168.0.1",
+                "remote": "192.168.0.3",
+            },
+        )
+
+    def test_get_vnet_vxlan_interfaces_from_config_returns_nothing_without_remotes(self):
+        self.assertEqual(get_vnet_vxlan_interfaces_from_config(settings.CONFIG), {})
+
+
+class TestGenerateVNetLXDNetworkConfig(VNetTestCase):
+    def test_generate_vnet_lxd_network_config_returns_unaddressed_bridge_tunneled_to_local_host(self):
+        tunnel = f"tunnel.{settings.VNET_VXLAN_LXD_TUNNEL_NAME}"
+        self.assertEqual(
+            generate_vnet_lxd_network_config(get_remotes_config(), 0, "node2"),
+            {
+                "ipv4.address": "none",
+                "ipv6.address": "none",
+                f"{tunnel}.protocol": "vxlan",
+                f"{tunnel}.id": str(get_vnet_vxlan_id(get_remotes_config(), 0, "node2")),
+                f"{tunnel}.local": "192.168.0.3",
+                f"{tunnel}.remote": "192.168.0.1",
+                f"{tunnel}.port": str(settings.VNET_VXLAN_PORT),
+            },
+        )
+
+
+class TestEnsureAndDeleteVNetLXDNetworks(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = get_remotes_config()
+        self.client = Mock(networks=FakeLXDNetworks())
+        self.get_lxd_client = self.set_up_patch("vnet_manager.operations.network.get_lxd_client")
+        self.get_lxd_client.return_value = self.client
+        self.use_lxd_remote = self.set_up_patch("vnet_manager.operations.network.use_lxd_remote", themock=MagicMock())
+
+    def test_ensure_vnet_lxd_networks_connects_to_used_remotes(self):
+        ensure_vnet_lxd_networks(self.config)
+        self.use_lxd_remote.assert_called_once_with("node2")
+
+    def test_ensure_vnet_lxd_networks_creates_bridge_per_switch(self):
+        ensure_vnet_lxd_networks(self.config)
+        self.assertEqual(sorted(self.client.networks.networks), [f"{settings.VNET_BRIDGE_NAME}0", f"{settings.VNET_BRIDGE_NAME}1"])
+        network = self.client.networks.get(f"{settings.VNET_BRIDGE_NAME}1")
+        self.assertEqual(network.type, "bridge")
+        self.assertEqual(network.config, generate_vnet_lxd_network_config(self.config, 1, "node2"))
+
+    def test_ensure_vnet_lxd_networks_leaves_existing_bridges_alone(self):
+        self.client.networks.create(f"{settings.VNET_BRIDGE_NAME}0", config={})
+        ensure_vnet_lxd_networks(self.config)
+        self.assertEqual(self.client.networks.get(f"{settings.VNET_BRIDGE_NAME}0").config, {})
+
+    def test_ensure_vnet_lxd_networks_does_nothing_without_remotes(self):
+        ensure_vnet_lxd_networks(settings.CONFIG)
+        self.assertFalse(self.get_lxd_client.called)
+
+    def test_delete_vnet_lxd_networks_deletes_bridges(self):
+        ensure_vnet_lxd_networks(self.config)
+        delete_vnet_lxd_networks(self.config)
+        self.assertEqual(self.client.networks.networks, {})
+
+    def test_delete_vnet_lxd_networks_skips_missing_bridges(self):
+        delete_vnet_lxd_networks(self.config)
+        self.assertEqual(self.client.networks.networks, {})
@@ -0,0 +1,169 @@
+from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, call
+from pylxd.exceptions import LXDAPIException
+
+from vnet_manager.tests import VNetTestCase
+from vnet_manager.conf import settings
+from vnet_manager.operations.provision import (
+    provision_machine,
+    run_provision_pipelines,
+    show_provision_summary,
+)
+
+
+class TestProvisionMachine(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = deepcopy(settings.CONFIG)
+        self.machine_op = self.set_up_patch("vnet_manager.operations.provision.machine_op")
+        self.put_files_on_machine = self.set_up_patch("vnet_manager.operations.provision.put_files_on_machine")
+        self.place_vnet_hosts_file_on_machines = self.set_up_patch("vnet_manager.operations.provision.place_vnet_hosts_file_on_machines")
+        self.logger = self.set_up_patch("vnet_manager.operations.provision.logger")
+
+    def test_provision_machine_runs_all_stages_in_order(self):
+        ret = provision_machine(self.config, "router100")
+        self.assertEqual(list(ret["stages"]), ["create", "netplan", "files", "hosts", "sysctl"])
+        self.assertIsNone(ret["error"])
+
+    def test_provision_machine_calls_stage_functions_for_the_machine(self):
+        provision_machine(self.config, "router100")
+        self.machine_op.submit_lxc_machine_creation.assert_called_once_with(self.config, "router100")
+        self.machine_op.wait_for_lxc_machine_creation.assert_called_once_with(
+            "router100", self.machine_op.submit_lxc_machine_creation.return_value
+        )
+        self.machine_op.place_lxc_interface_configuration_on_container.assert_called_once_with(self.config, "router100", apply=False)
+        self.put_files_on_machine.assert_called_once_with(self.config, machines=["router100"])
+        self.place_vnet_hosts_file_on_machines.assert_called_once_with(self.config, machines=["router100"])
+        self.machine_op.enable_type_specific_machine_configuration.assert_called_once_with(self.config, machines=["router100"])
+
+    def test_provision_machine_does_not_create_existing_machine(self):
+        ret = provision_machine(self.config, "router100", create=False)
+        self.assertFalse(self.machine_op.submit_lxc_machine_creation.called)
+        self.assertFalse(self.machine_op.wait_for_lxc_machine_creation.called)
+        self.assertNotIn("create", ret["stages"])
+
+    def test_provision_machine_waits_for_submitted_create_operation(self):
+        ret = provision_machine(self.config, "router100", create_operation="/1.0/operations/op1")
+        self.assertFalse(self.machine_op.submit_lxc_machine_creation.called)
+        self.machine_op.wait_for_lxc_machine_creation.assert_called_once_with("router100", "/1.0/operations/op1")
+        self.assertIn("create", ret["stages"])
+
+    def test_provision_machine_updates_devices_when_requested(self):
+        ret = provision_machine(self.config, "router100", create=False, devices=True)
+        self.machine_op.update_lxc_machine_devices.assert_called_once_with(self.config, "router100")
+        self.assertEqual(list(ret["stages"]), ["devices", "netplan", "files", "hosts", "sysctl"])
+
+    def test_provision_machine_applies_network_config_of_existing_machine(self):
+        provision_machine(self.config, "router100", create=False)
+        self.machine_op.place_lxc_interface_configuration_on_container.assert_called_once_with(self.config, "router100", apply=True)
+
+    def test_provision_machine_only_rewires_nics_without_files(self):
+        ret = provision_machine(self.config, "router100", create=False, devices=True, files=False)
+        self.assertEqual(list(ret["stages"]), ["devices", "netplan"])
+        self.assertFalse(self.put_files_on_machine.called)
+        self.assertFalse(self.place_vnet_hosts_file_on_machines.called)
+
+    def test_provision_machine_does_not_update_devices_by_default(self):
+        provision_machine(self.config, "router100")
+        self.assertFalse(self.machine_op.update_lxc_machine_devices.called)
+
+    def test_provision_machine_does_not_place_hosts_file_without_hosts(self):
+        provision_machine(self.config, "router100", hosts=False)
+        self.assertFalse(self.place_vnet_hosts_file_on_machines.called)
+
+    def test_provision_machine_stops_at_failed_stage(self):
+        self.machine_op.wait_for_lxc_machine_creation.side_effect = LXDAPIException(
+            Mock(status_code=400, json=Mock(return_value={"error": "blaap"}))
+        )
+        ret = provision_machine(self.config, "router100")
+        self.assertEqual(list(ret["stages"]), ["create"])
+        self.assertEqual(ret["error"], "create: blaap")
+        self.assertFalse(self.put_files_on_machine.called)
+
+    def test_provision_machine_returns_error_of_failed_non_api_stage(self):
+        self.put_files_on_machine.side_effect = OSError("No such file or directory")
+        ret = provision_machine(self.config, "router100")
+        self.assertEqual(list(ret["stages"]), ["create", "netplan", "files"])
+        self.assertEqual(ret["error"], "files: No such file or directory")
+        self.assertFalse(self.place_vnet_hosts_file_on_machines.called)
+
+
+class TestRunProvisionPipelines(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = deepcopy(settings.CONFIG)
+        self.jobs = {"router100": {"create": True}, "host102": {"create": False, "devices": True}}
+        self.provision_machine = self.set_up_patch("vnet_manager.operations.provision.provision_machine")
+        self.provision_machine.return_value = {"stages": {"create": 1.0}, "error": None}
+        self.submit_lxc_machine_creation = self.set_up_patch("vnet_manager.operations.provision.machine_op.submit_lxc_machine_creation")
+        self.submit_lxc_machine_creation.side_effect = lambda config, name: f"/1.0/operations/{name}"
+        self.show_provision_summary = self.set_up_patch("vnet_manager.operations.provision.show_provision_summary")
+
+    def test_run_provision_pipelines_runs_pipeline_per_job(self):
+        run_provision_pipelines(self.config, self.jobs)
+        self.provision_machine.assert_has_calls(
+            [
+                call(self.config, "router100", hosts=True, create_operation="/1.0/operations/router100", create=True),
+                call(self.config, "host102", hosts=True, create_operation=None, create=False, devices=True),
+            ],
+            any_order=True,
+        )
+
+    def test_run_provision_pipelines_passes_hosts(self):
+        run_provision_pipelines(self.config, {"router100": {"create": True}}, hosts=False)
+        self.provision_machine.assert_called_once_with(
+            self.config, "router100", hosts=False, create_operation="/1.0/operations/router100", create=True
+        )
+
+    def test_run_provision_pipelines_submits_all_creations_before_running_pipelines(self):
+        manager = Mock()
+        manager.attach_mock(self.submit_lxc_machine_creation, "submit")
+        manager.attach_mock(self.provision_machine, "provision")
+        jobs = {"router100": {"create": True}, "router101": {"create": True}}
+        run_provision_pipelines(self.config, jobs)
+        self.assertEqual([name for name, _, _ in manager.mock_calls], ["submit", "submit", "provision", "provision"])
+
+    def test_run_provision_pipelines_does_not_run_pipeline_of_failed_submission(self):
+        self.submit_lxc_machine_creation.side_effect = LXDAPIException(Mock(status_code=400, json=Mock(return_value={"error": "blaap"})))
+        self.assertEqual(run_provision_pipelines(self.config, {"router100": {"create": True}}), {"router100": "create: blaap"})
+        self.assertFalse(self.provision_machine.called)
+
+    def test_run_provision_pipelines_limits_concurrency(self):
+        thread_pool = self.set_up_patch("vnet_manager.operations.provision.ThreadPoolExecutor", themock=Mock(wraps=ThreadPoolExecutor))
+        run_provision_pipelines(self.config, self.jobs, parallel=3)
+        thread_pool.assert_called_once_with(max_workers=3)
+
+    def test_run_provision_pipelines_shows_summary(self):
+        run_provision_pipelines(self.config, self.jobs)
+        self.show_provision_summary.assert_called_once_with(
+            {"router100": self.provision_machine.return_value, "host102": self.provision_machine.return_value}
+        )
+
+    def test_run_provision_pipelines_returns_failed_machines(self):
+        self.provision_machine.side_effect = lambda config, name, **kwargs: {
+            "stages": {},
+            "error": "create: boom" if name == "host102" else None,
+        }
+        self.assertEqual(run_provision_pipelines(self.config, self.jobs), {"host102": "create: boom"})
+
+
+class TestShowProvisionSummary(VNetTestCase):
+    def setUp(self) -> None:
+        self.tabulate = self.set_up_patch("vnet_manager.operations.provision.tabulate")
+        self.print = self.set_up_patch("vnet_manager.operations.provision.print")
+
+    def test_show_provision_summary_shows_stage_durations_per_machine(self):
+        show_provision_summary(
+            {
+                "router100": {"stages": {"netplan": 0.5, "files": 1.25}, "error": None},
+                "host102": {"stages": {"create": 2.0}, "error": "create: boom"},
+            }
+        )
+        self.tabulate.assert_called_once_with(
+            [
+                ["host102", "2.00s", "-", "-", "-", "-", "-", "2.00s", "create: boom"],
+                ["router100", "-", "-", "0.50s", "1.25s", "-", "-", "1.75s", "OK"],
+            ],
+            headers=["Name", "Create", "Devices", "Netplan", "Files", "Hosts", "Sysctl", "Total", "Result"],
+            tablefmt="pretty",
+        )
+        self.print.assert_called_once_with(self.tabulate.return_value)
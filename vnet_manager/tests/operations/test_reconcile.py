@@ -0,0 +1,415 @@
+from copy import deepcopy
+from json import dumps
+from unittest.mock import MagicMock, Mock, call
+
+from vnet_manager.tests import VNetTestCase
+from vnet_manager.conf import settings
+from vnet_manager.operations.machine import generate_lxc_container_config
+from vnet_manager.operations.reconcile import (
+    Change,
+    get_vnet_lxc_instances,
+    plan_stale_machine_changes,
+    get_desired_lxc_machine_files,
+    plan_machine_changes,
+    plan_interface_changes,
+    get_reconcile_plan,
+    show_reconcile_plan,
+    apply_reconcile_plan,
+    reconcile_machines,
+)
+
+
+class TestGetVNetLXCInstances(VNetTestCase):
+    def setUp(self) -> None:
+        self.get_lxc_instances = self.set_up_patch("vnet_manager.operations.reconcile.machine_op.get_lxc_instances")
+
+    def test_get_vnet_lxc_instances_returns_instances_with_vnet_profile(self):
+        self.get_lxc_instances.return_value = {
+            "router100": {"name": "router100", "profiles": [settings.LXC_VNET_PROFILE]},
+            "other": {"name": "other", "profiles": ["default"]},
+            settings.LXC_BASE_IMAGE_MACHINE_NAME: {"name": settings.LXC_BASE_IMAGE_MACHINE_NAME, "profiles": [settings.LXC_VNET_PROFILE]},
+            settings.LXC_GOLDEN_MACHINE_NAME: {"name": settings.LXC_GOLDEN_MACHINE_NAME, "profiles": [settings.LXC_VNET_PROFILE]},
+        }
+        self.assertEqual(get_vnet_lxc_instances(), {"router100": {"name": "router100", "profiles": [settings.LXC_VNET_PROFILE]}})
+
+
+class TestPlanStaleMachineChanges(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = deepcopy(settings.CONFIG)
+        self.get_lxc_remote_instances = self.set_up_patch("vnet_manager.operations.reconcile.machine_op.get_lxc_remote_instances")
+        self.get_lxc_remote_instances.return_value = {
+            None: [
+                {"name": "router100", "profiles": [settings.LXC_VNET_PROFILE]},
+                {"name": "old", "profiles": [settings.LXC_VNET_PROFILE]},
+                {"name": "other", "profiles": ["default"]},
+            ],
+            "node1": [
+                {"name": settings.LXC_BASE_IMAGE_MACHINE_NAME, "profiles": [settings.LXC_VNET_PROFILE]},
+                {"name": "older", "profiles": [settings.LXC_VNET_PROFILE]},
+            ],
+        }
+
+    def test_plan_stale_machine_changes_removes_vnet_machines_not_in_config_on_their_remote(self):
+        self.assertEqual(
+            plan_stale_machine_changes(self.config),
+            [Change("remove", "machine", "old", remote=None), Change("remove", "machine", "older", remote="node1")],
+        )
+
+    def test_plan_stale_machine_changes_passes_fetched_instances(self):
+        remote_instances = {}
+        plan_stale_machine_changes(self.config, remote_instances=remote_instances)
+        self.get_lxc_remote_instances.assert_called_once_with(remote_instances=remote_instances)
+
+
+class TestGetDesiredLXCMachineFiles(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = deepcopy(settings.VALIDATED_CONFIG)
+        self.get_file_sha256 = self.set_up_patch("vnet_manager.operations.reconcile.get_file_sha256")
+        self.get_file_sha256.side_effect = lambda path: f"sha:{path}"
+        self.get_files_to_put_on_machine = self.set_up_patch("vnet_manager.operations.reconcile.get_files_to_put_on_machine")
+        self.get_files_to_put_on_machine.return_value = [("/root/file", "/etc/file")]
+
+    def test_get_desired_lxc_machine_files_returns_placed_files(self):
+        files = get_desired_lxc_machine_files(self.config, "router100")
+        self.assertEqual(
+            set(files),
+            {
+                settings.VNET_NETPLAN_CONFIG_FILE_PATH,
+                "/etc/file",
+                "/etc/hosts",
+                "/etc/sysctl.d/20-net.ipv4.ip_forward.conf",
+                "/etc/sysctl.d/20-net.ipv6.conf.all.forwarding.conf",
+            },
+        )
+        self.assertEqual(files["/etc/file"], "sha:/root/file")
+        self.assertEqual(files["/etc/hosts"], f"sha:{settings.VNET_ETC_HOSTS_FILE_PATH}")
+
+    def test_get_desired_lxc_machine_files_skips_hosts_file_without_hosts(self):
+        self.assertNotIn("/etc/hosts", get_desired_lxc_machine_files(self.config, "router100", hosts=False))
+
+    def test_get_desired_lxc_machine_files_hashes_sysctl_files_by_machine_type(self):
+        router = get_desired_lxc_machine_files(self.config, "router100")
+        host = get_desired_lxc_machine_files(self.config, "host102")
+        self.assertNotEqual(router["/etc/sysctl.d/20-net.ipv4.ip_forward.conf"], host["/etc/sysctl.d/20-net.ipv4.ip_forward.conf"])
+
+
+class TestPlanMachineChanges(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = deepcopy(settings.CONFIG)
+        self.get_desired_lxc_machine_files = self.set_up_patch("vnet_manager.operations.reconcile.get_desired_lxc_machine_files")
+        self.get_desired_lxc_machine_files.return_value = {"/etc/hosts": "abc"}
+        self.instance = {
+            "devices": generate_lxc_container_config(self.config, "router100")["devices"],
+            "config": {settings.LXC_FILE_MANIFEST_CONFIG_KEY: dumps({"/etc/hosts": "abc"})},
+        }
+
+    def test_plan_machine_changes_adds_missing_machines(self):
+        self.assertEqual(plan_machine_changes(self.config, {}, ["router100"]), [Change("add", "machine", "router100")])
+
+    def test_plan_machine_changes_plans_nothing_for_up_to_date_machines(self):
+        self.assertEqual(plan_machine_changes(self.config, {"router100": self.instance}, ["router100"]), [])
+
+    def test_plan_machine_changes_plans_nic_changes(self):
+        devices = self.instance["devices"]
+        devices["eth99"] = {"type": "nic"}
+        devices["eth12"]["hwaddr"] = "00:00:00:00:00:01"
+        del devices["eth0"]
+        self.assertEqual(
+            plan_machine_changes(self.config, {"router100": self.instance}, ["router100"]),
+            [
+                Change("add", "nic", "router100", "eth0"),
+                Change("modify", "nic", "router100", "eth12"),
+                Change("remove", "nic", "router100", "eth99"),
+            ],
+        )
+
+    def test_plan_machine_changes_plans_changed_files(self):
+        self.get_desired_lxc_machine_files.return_value = {"/etc/hosts": "def", "/etc/file": "abc"}
+        self.assertEqual(
+            plan_machine_changes(self.config, {"router100": self.instance}, ["router100"]),
+            [Change("modify", "file", "router100", "/etc/file"), Change("modify", "file", "router100", "/etc/hosts")],
+        )
+
+    def test_plan_machine_changes_plans_all_files_of_machines_with_corrupt_manifest(self):
+        self.instance["config"][settings.LXC_FILE_MANIFEST_CONFIG_KEY] = "{"
+        self.assertEqual(
+            plan_machine_changes(self.config, {"router100": self.instance}, ["router100"]),
+            [Change("modify", "file", "router100", "/etc/hosts")],
+        )
+
+    def test_plan_machine_changes_adds_missing_machines_of_other_providers(self):
+        self.config["machines"]["host103"] = {"type": "netns-host", "interfaces": {}}
+        get_netns_machine_status = self.set_up_patch("vnet_manager.operations.reconcile.machine_op.get_netns_machine_status")
+        get_netns_machine_status.return_value = ["host103", "NA", "netns"]
+        self.assertEqual(plan_machine_changes(self.config, {}, ["host103"]), [Change("add", "machine", "host103")])
+        get_netns_machine_status.return_value = ["host103", "Running", "netns"]
+        self.assertEqual(plan_machine_changes(self.config, {}, ["host103"]), [])
+
+    def test_plan_machine_changes_passes_hosts(self):
+        plan_machine_changes(self.config, {"router100": self.instance}, ["router100"], hosts=False)
+        self.get_desired_lxc_machine_files.assert_called_once_with(self.config, "router100", hosts=False)
+
+
+class TestPlanInterfaceChanges(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = deepcopy(settings.CONFIG)
+        self.links = {
+            "lo": {"index": 1, "kind": None, "master": None},
+            "vnet-br0": {"index": 10, "kind": "bridge", "master": None},
+            "vnet-br1": {"index": 11, "kind": "bridge", "master": None},
+            "vnet-veth0": {"index": 20, "kind": "veth", "master": 10},
+            "vnet-veth1": {"index": 21, "kind": "veth", "master": 11},
+        }
+
+    def test_plan_interface_changes_plans_nothing_if_lab_is_not_running(self):
+        self.assertEqual(plan_interface_changes(self.config, {}, {"lo": self.links["lo"]}), [])
+
+    def test_plan_interface_changes_plans_nothing_for_up_to_date_interfaces(self):
+        self.assertEqual(plan_interface_changes(self.config, {}, self.links), [])
+
+    def test_plan_interface_changes_adds_missing_interfaces(self):
+        del self.links["vnet-br1"]
+        del self.links["vnet-veth1"]
+        self.assertEqual(
+            plan_interface_changes(self.config, {}, self.links), [Change("add", "bridge", "vnet-br1"), Change("add", "veth", "vnet-veth1")]
+        )
+
+    def test_plan_interface_changes_removes_stale_interfaces_with_prune(self):
+        self.links["vnet-br2"] = {"index": 12, "kind": "bridge", "master": None}
+        self.links["vnet-veth2"] = {"index": 22, "kind": "veth", "master": 12}
+        self.assertEqual(
+            plan_interface_changes(self.config, {}, self.links, prune=True),
+            [Change("remove", "bridge", "vnet-br2"), Change("remove", "veth", "vnet-veth2")],
+        )
+
+    def test_plan_interface_changes_does_not_remove_interfaces_of_other_configs_without_prune(self):
+        self.links["vnet-br2"] = {"index": 12, "kind": "bridge", "master": None}
+        self.links["vnet-veth2"] = {"index": 22, "kind": "veth", "master": 12}
+        self.assertEqual(plan_interface_changes(self.config, {}, self.links), [])
+
+    def test_plan_interface_changes_does_not_remove_machine_nics(self):
+        self.links["vethabc"] = {"index": 30, "kind": "veth", "master": 10}
+        self.links["vethdef"] = {"index": 31, "kind": "veth", "master": 11}
+        instances = {"router100": {"config": {"volatile.eth12.host_name": "vethabc"}, "devices": {"eth13": {"host_name": "vethdef"}}}}
+        self.assertEqual(plan_interface_changes(self.config, instances, self.links, prune=True), [])
+
+    def test_plan_interface_changes_does_not_remove_netns_machine_ports(self):
+        self.config["machines"]["host103"] = {"type": "netns-host", "interfaces": {"eth23": {"bridge": 1, "mac": "00:00:00:00:01:13"}}}
+        self.links["host103-eth23"] = {"index": 30, "kind": "veth", "master": 11}
+        self.assertEqual(plan_interface_changes(self.config, {}, self.links, prune=True), [])
+
+    def test_plan_interface_changes_does_not_remove_veths_on_other_bridges(self):
+        self.links["vethabc"] = {"index": 30, "kind": "veth", "master": 2}
+        self.assertEqual(plan_interface_changes(self.config, {}, self.links, prune=True), [])
+
+
+class TestGetReconcilePlan(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = deepcopy(settings.CONFIG)
+        self.get_vnet_lxc_instances = self.set_up_patch("vnet_manager.operations.reconcile.get_vnet_lxc_instances")
+        self.get_vnet_lxc_instances.return_value = {"router100": {}, "old": {}}
+        self.plan_stale_machine_changes = self.set_up_patch("vnet_manager.operations.reconcile.plan_stale_machine_changes")
+        self.plan_stale_machine_changes.return_value = [Change("remove", "machine", "old", remote="node1")]
+        self.plan_machine_changes = self.set_up_patch("vnet_manager.operations.reconcile.plan_machine_changes")
+        self.plan_machine_changes.return_value = [Change("add", "machine", "host102")]
+        self.plan_interface_changes = self.set_up_patch("vnet_manager.operations.reconcile.plan_interface_changes")
+        self.plan_interface_changes.return_value = [Change("add", "bridge", "vnet-br1")]
+        self.ip = self.set_up_patch("vnet_manager.operations.reconcile.IPRoute")
+        self.get_interface_link_map = self.set_up_patch("vnet_manager.operations.reconcile.get_interface_link_map")
+        self.logger = self.set_up_patch("vnet_manager.operations.reconcile.logger")
+
+    def test_get_reconcile_plan_plans_all_changes(self):
+        self.assertEqual(get_reconcile_plan(self.config), [Change("add", "machine", "host102"), Change("add", "bridge", "vnet-br1")])
+        self.plan_machine_changes.assert_called_once_with(
+            self.config, self.get_vnet_lxc_instances.return_value, list(self.config["machines"]), hosts=True
+        )
+
+    def test_get_reconcile_plan_removes_machines_not_in_config_with_prune(self):
+        self.assertEqual(
+            get_reconcile_plan(self.config, prune=True),
+            [Change("remove", "machine", "old", remote="node1"), Change("add", "machine", "host102"), Change("add", "bridge", "vnet-br1")],
+        )
+        remote_instances = self.get_vnet_lxc_instances.call_args[1]["remote_instances"]
+        self.plan_stale_machine_changes.assert_called_once_with(self.config, remote_instances=remote_instances)
+        self.plan_interface_changes.assert_called_once_with(
+            self.config, self.get_vnet_lxc_instances.return_value, self.get_interface_link_map.return_value, prune=True
+        )
+
+    def test_get_reconcile_plan_does_not_remove_machines_without_prune(self):
+        get_reconcile_plan(self.config)
+        self.assertFalse(self.plan_stale_machine_changes.called)
+
+    def test_get_reconcile_plan_compares_interfaces_with_single_link_dump(self):
+        get_reconcile_plan(self.config)
+        self.get_interface_link_map.assert_called_once_with(self.ip.return_value)
+        self.plan_interface_changes.assert_called_once_with(
+            self.config, self.get_vnet_lxc_instances.return_value, self.get_interface_link_map.return_value, prune=False
+        )
+        self.ip.return_value.close.assert_called_once_with()
+
+    def test_get_reconcile_plan_only_plans_requested_machines(self):
+        self.assertEqual(get_reconcile_plan(self.config, machines=["host102"], hosts=False), self.plan_machine_changes.return_value)
+        self.plan_machine_changes.assert_called_once_with(self.config, self.get_vnet_lxc_instances.return_value, ["host102"], hosts=False)
+        self.assertFalse(self.plan_interface_changes.called)
+
+    def test_get_reconcile_plan_skips_requested_machines_not_in_config(self):
+        get_reconcile_plan(self.config, machines=["host102", "blaap"])
+        self.plan_machine_changes.assert_called_once_with(self.config, self.get_vnet_lxc_instances.return_value, ["host102"], hosts=True)
+        self.assertTrue(self.logger.error.called)
+
+
+class TestShowReconcilePlan(VNetTestCase):
+    def setUp(self) -> None:
+        self.tabulate = self.set_up_patch("vnet_manager.operations.reconcile.tabulate")
+        self.print = self.set_up_patch("vnet_manager.operations.reconcile.print")
+        self.logger = self.set_up_patch("vnet_manager.operations.reconcile.logger")
+
+    def test_show_reconcile_plan_shows_changes(self):
+        show_reconcile_plan([Change("add", "machine", "host102"), Change("modify", "file", "router100", "/etc/hosts")])
+        self.tabulate.assert_called_once_with(
+            [["+", "machine", "host102", ""], ["~", "file", "router100", "/etc/hosts"]],
+            headers=["Action", "Type", "Name", "Detail"],
+            tablefmt="pretty",
+        )
+        self.print.assert_called_once_with(self.tabulate.return_value)
+
+    def test_show_reconcile_plan_logs_empty_plan(self):
+        show_reconcile_plan([])
+        self.assertFalse(self.print.called)
+        self.assertTrue(self.logger.info.called)
+
+
+class TestApplyReconcilePlan(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = deepcopy(settings.CONFIG)
+        self.destroy_lxc_machine = self.set_up_patch("vnet_manager.operations.reconcile.machine_op.destroy_lxc_machine")
+        self.use_lxd_remote = self.set_up_patch("vnet_manager.operations.reconcile.use_lxd_remote", themock=MagicMock())
+        self.ip = self.set_up_patch("vnet_manager.operations.reconcile.IPRoute")
+        self.delete_vnet_interface_iptables_rules = self.set_up_patch(
+            "vnet_manager.operations.reconcile.delete_vnet_interface_iptables_rules"
+        )
+        self.bring_up_vnet_interfaces = self.set_up_patch("vnet_manager.operations.reconcile.bring_up_vnet_interfaces")
+        self.run_provision_pipelines = self.set_up_patch("vnet_manager.operations.reconcile.run_provision_pipelines")
+        self.run_provision_pipelines.return_value = {}
+
+    def test_apply_reconcile_plan_destroys_removed_machines(self):
+        apply_reconcile_plan(self.config, [Change("remove", "machine", "old")])
+        self.destroy_lxc_machine.assert_called_once_with("old", wait=True)
+        self.use_lxd_remote.assert_called_once_with(None)
+
+    def test_apply_reconcile_plan_destroys_removed_machines_on_their_remote(self):
+        apply_reconcile_plan(self.config, [Change("remove", "machine", "old", remote="node1")])
+        self.use_lxd_remote.assert_called_once_with("node1")
+        self.destroy_lxc_machine.assert_called_once_with("old", wait=True)
+
+    def test_apply_reconcile_plan_deletes_stale_interfaces(self):
+        apply_reconcile_plan(self.config, [Change("remove", "bridge", "vnet-br2"), Change("remove", "veth", "vnet-veth2")])
+        self.ip.return_value.link.assert_has_calls([call("del", ifname="vnet-br2"), call("del", ifname="vnet-veth2")])
+        self.ip.return_value.close.assert_called_once_with()
+        self.delete_vnet_interface_iptables_rules.assert_called_once_with(["vnet-br2"])
+
+    def test_apply_reconcile_plan_does_not_touch_interfaces_without_interface_changes(self):
+        apply_reconcile_plan(self.config, [Change("add", "machine", "host102")])
+        self.assertFalse(self.ip.called)
+        self.assertFalse(self.bring_up_vnet_interfaces.called)
+
+    def test_apply_reconcile_plan_brings_up_interfaces_on_added_interfaces(self):
+        apply_reconcile_plan(self.config, [Change("add", "veth", "vnet-veth1")])
+        self.bring_up_vnet_interfaces.assert_called_once_with(self.config)
+
+    def test_apply_reconcile_plan_runs_provision_pipelines_for_changed_machines(self):
+        plan = [
+            Change("add", "machine", "host102"),
+            Change("modify", "file", "router100", "/etc/hosts"),
+            Change("modify", "nic", "router101", "eth12"),
+            Change("modify", "file", "router101", "/etc/hosts"),
+        ]
+        ret = apply_reconcile_plan(self.config, plan, parallel=3, hosts=False)
+        self.run_provision_pipelines.assert_called_once_with(
+            self.config,
+            {
+                "host102": {"create": True},
+                "router100": {"create": False, "devices": False, "files": True},
+                "router101": {"create": False, "devices": True, "files": True},
+            },
+            parallel=3,
+            hosts=False,
+        )
+        self.assertEqual(ret, self.run_provision_pipelines.return_value)
+
+    def test_apply_reconcile_plan_creates_added_machines_of_other_providers(self):
+        create_machines = self.set_up_patch("vnet_manager.operations.reconcile.machine_op.create_machines")
+        create_machines.return_value = {"host103": "error"}
+        self.config["machines"]["host103"] = {"type": "netns-host", "interfaces": {}}
+        ret = apply_reconcile_plan(self.config, [Change("add", "machine", "host103"), Change("add", "machine", "host102")])
+        create_machines.assert_called_once_with(self.config, machines=["host103"])
+        self.run_provision_pipelines.assert_called_once_with(self.config, {"host102": {"create": True}}, parallel=1, hosts=True)
+        self.assertEqual(ret, {"host103": "error"})
+
+    def test_apply_reconcile_plan_only_rewires_machines_with_nic_and_netplan_changes(self):
+        plan = [
+            Change("modify", "nic", "router100", "eth12"),
+            Change("modify", "file", "router100", settings.VNET_NETPLAN_CONFIG_FILE_PATH),
+        ]
+        apply_reconcile_plan(self.config, plan)
+        self.run_provision_pipelines.assert_called_once_with(
+            self.config, {"router100": {"create": False, "devices": True, "files": False}}, parallel=1, hosts=True
+        )
+
+    def test_apply_reconcile_plan_does_not_run_provision_pipelines_without_machine_changes(self):
+        self.assertEqual(apply_reconcile_plan(self.config, [Change("remove", "machine", "old")]), {})
+        self.assertFalse(self.run_provision_pipelines.called)
+
+
+class TestReconcileMachines(VNetTestCase):
+    def setUp(self) -> None:
+        self.config = deepcopy(settings.CONFIG)
+        self.generate_vnet_hosts_file = self.set_up_patch("vnet_manager.operations.reconcile.generate_vnet_hosts_file")
+        self.get_reconcile_plan = self.set_up_patch("vnet_manager.operations.reconcile.get_reconcile_plan")
+        self.get_reconcile_plan.return_value = [Change("add", "machine", "host102")]
+        self.show_reconcile_plan = self.set_up_patch("vnet_manager.operations.reconcile.show_reconcile_plan")
+        self.request_confirmation = self.set_up_patch("vnet_manager.operations.reconcile.request_confirmation")
+        self.apply_reconcile_plan = self.set_up_patch("vnet_manager.operations.reconcile.apply_reconcile_plan")
+        self.apply_reconcile_plan.return_value = {}
+
+    def test_reconcile_machines_generates_hosts_file_before_planning(self):
+        manager = Mock()
+        manager.attach_mock(self.generate_vnet_hosts_file, "generate_vnet_hosts_file")
+        manager.attach_mock(self.get_reconcile_plan, "get_reconcile_plan")
+        reconcile_machines(self.config)
+        self.assertEqual(manager.mock_calls[0], call.generate_vnet_hosts_file(self.config))
+
+    def test_reconcile_machines_does_not_generate_hosts_file_without_hosts(self):
+        reconcile_machines(self.config, hosts=False)
+        self.assertFalse(self.generate_vnet_hosts_file.called)
+        self.get_reconcile_plan.assert_called_once_with(self.config, machines=None, hosts=False, prune=False)
+
+    def test_reconcile_machines_shows_and_applies_plan(self):
+        ret = reconcile_machines(self.config, machines=["host102"], parallel=2)
+        self.get_reconcile_plan.assert_called_once_with(self.config, machines=["host102"], hosts=True, prune=False)
+        self.show_reconcile_plan.assert_called_once_with(self.get_reconcile_plan.return_value)
+        self.apply_reconcile_plan.assert_called_once_with(self.config, self.get_reconcile_plan.return_value, parallel=2, hosts=True)
+        self.assertEqual(ret, self.apply_reconcile_plan.return_value)
+
+    def test_reconcile_machines_passes_prune(self):
+        reconcile_machines(self.config, prune=True)
+        self.get_reconcile_plan.assert_called_once_with(self.config, machines=None, hosts=True, prune=True)
+
+    def test_reconcile_machines_does_not_apply_plan_on_dry_run(self):
+        self.assertEqual(reconcile_machines(self.config, dry_run=True), {})
+        self.show_reconcile_plan.assert_called_once_with(self.get_reconcile_plan.return_value)
+        self.assertFalse(self.apply_reconcile_plan.called)
+
+    def test_reconcile_machines_does_not_apply_empty_plan(self):
+        self.get_reconcile_plan.return_value = []
+        reconcile_machines(self.config)
+        self.assertFalse(self.apply_reconcile_plan.called)
+
+    def test_reconcile_machines_does_not_request_confirmation_for_new_machines(self):
+        reconcile_machines(self.config)
+        self.assertFalse(self.request_confirmation.called)
+
+    def test_reconcile_machines_requests_confirmation_for_changes_to_existing_machines(self):
+        self.get_reconcile_plan.return_value = [Change("modify", "file", "router100", "/etc/hosts")]
+        reconcile_machines(self.config)
+        self.request_confirmation.assert_called_once()
@@ -0,0 +1,208 @@
+from json import dumps
+from unittest.mock import Mock, mock_open, call
+from psutil import NoSuchProcess
+
+from vnet_manager.tests import VNetTestCase
+from vnet_manager.conf import settings
+from vnet_manager.operations.sniffer import (
+    get_sniffer_state_file_path,
+    register_sniffer,
+    unregister_sniffer,
+    check_if_sniffer_is_alive,
+    get_registered_sniffer,
+    get_registered_sniffers,
+    get_sniffer_pid_map,
+    get_captured_bytes,
+    show_sniffer_status,
+)
+
+STATE = {"pid": 42, "interface": "vnet-br0", "pcap": "/tmp/vnet-br0.pcap", "started": "2023-01-01T00:00:00", "create_time": 1.5}
+
+
+class TestGetSnifferStateFilePath(VNetTestCase):
+    def test_get_sniffer_state_file_path_returns_json_file_in_state_dir(self):
+        self.assertEqual(get_sniffer_state_file_path("vnet-br0"), f"{settings.VNET_SNIFFER_STATE_DIR}/vnet-br0.json")
+
+
+class TestRegisterSniffer(VNetTestCase):
+    def setUp(self) -> None:
+        self.makedirs = self.set_up_patch("vnet_manager.operations.sniffer.makedirs")
+        self.process = self.set_up_patch("vnet_manager.operations.sniffer.Process")
+        self.process.return_value.create_time.return_value = 1.5
+        self.open = self.set_up_patch("vnet_manager.operations.sniffer.open", themock=mock_open())
+        self.dump = self.set_up_patch("vnet_manager.operations.sniffer.dump")
+
+    def test_register_sniffer_creates_state_dir(self):
+        register_sniffer("vnet-br0", 42, "/tmp/vnet-br0.pcap")
+        self.makedirs.assert_called_once_with(settings.VNET_SNIFFER_STATE_DIR, exist_ok=True)
+
+    def test_register_sniffer_writes_state_file(self):
+        register_sniffer("vnet-br0", 42, "/tmp/vnet-br0.pcap")
+        self.open.assert_called_once_with(get_sniffer_state_file_path("vnet-br0"), "w", encoding="utf-8")
+
+    def test_register_sniffer_stores_pcap_files_glob(self):
+        register_sniffer("vnet-br0", 42, "/tmp/vnet-br0.pcap", pcap_files="/tmp/vnet-br0*")
+        self.assertEqual(self.dump.call_args[0][0]["pcap_files"], "/tmp/vnet-br0*")
+
+    def test_register_sniffer_stores_sniffer_state(self):
+        register_sniffer("vnet-br0", 42, "/tmp/vnet-br0.pcap")
+        state = self.dump.call_args[0][0]
+        self.assertEqual(state["pid"], 42)
+        self.assertEqual(state["interface"], "vnet-br0")
+        self.assertEqual(state["pcap"], "/tmp/vnet-br0.pcap")
+        self.assertEqual(state["pcap_files"], "/tmp/vnet-br0.pcap")
+        self.assertEqual(state["create_time"], 1.5)
+        self.assertIn("started", state)
+        self.process.assert_called_once_with(42)
+
+
+class TestUnregisterSniffer(VNetTestCase):
+    def setUp(self) -> None:
+        self.remove = self.set_up_patch("vnet_manager.operations.sniffer.remove")
+
+    def test_unregister_sniffer_removes_state_file(self):
+        unregister_sniffer("vnet-br0")
+        self.remove.assert_called_once_with(get_sniffer_state_file_path("vnet-br0"))
+
+    def test_unregister_sniffer_ignores_missing_state_file(self):
+        self.remove.side_effect = FileNotFoundError
+        unregister_sniffer("vnet-br0")
+
+
+class TestCheckIfSnifferIsAlive(VNetTestCase):
+    def setUp(self) -> None:
+        self.kill = self.set_up_patch("vnet_manager.operations.sniffer.kill")
+        self.process = self.set_up_patch("vnet_manager.operations.sniffer.Process")
+        self.process.return_value.create_time.return_value = 1.5
+
+    def test_check_if_sniffer_is_alive_sends_signal_zero(self):
+        check_if_sniffer_is_alive(STATE)
+        self.kill.assert_called_once_with(42, 0)
+
+    def test_check_if_sniffer_is_alive_returns_true_if_process_is_running(self):
+        self.assertTrue(check_if_sniffer_is_alive(STATE))
+
+    def test_check_if_sniffer_is_alive_returns_false_if_process_does_not_exist(self):
+        self.kill.side_effect = ProcessLookupError
+        self.assertFalse(check_if_sniffer_is_alive(STATE))
+        self.assertFalse(self.process.called)
+
+    def test_check_if_sniffer_is_alive_returns_true_if_not_permitted_to_signal_process(self):
+        self.kill.side_effect = PermissionError
+        self.assertTrue(check_if_sniffer_is_alive(STATE))
+
+    def test_check_if_sniffer_is_alive_returns_false_if_pid_has_been_recycled(self):
+        self.process.return_value.create_time.return_value = 2.5
+        self.assertFalse(check_if_sniffer_is_alive(STATE))
+
+    def test_check_if_sniffer_is_alive_returns_false_if_process_exits_during_check(self):
+        self.process.side_effect = NoSuchProcess(42)
+        self.assertFalse(check_if_sniffer_is_alive(STATE))
+
+
+class TestGetRegisteredSniffer(VNetTestCase):
+    def setUp(self) -> None:
+        self.open = self.set_up_patch("vnet_manager.operations.sniffer.open", themock=mock_open(read_data=dumps(STATE)))
+        self.check_if_sniffer_is_alive = self.set_up_patch("vnet_manager.operations.sniffer.check_if_sniffer_is_alive")
+        self.check_if_sniffer_is_alive.return_value = True
+        self.unregister_sniffer = self.set_up_patch("vnet_manager.operations.sniffer.unregister_sniffer")
+
+    def test_get_registered_sniffer_reads_state_file(self):
+        get_registered_sniffer("vnet-br0")
+        self.open.assert_called_once_with(get_sniffer_state_file_path("vnet-br0"), "r", encoding="utf-8")
+
+    def test_get_registered_sniffer_returns_state_of_running_sniffer(self):
+        self.assertEqual(get_registered_sniffer("vnet-br0"), STATE)
+
+    def test_get_registered_sniffer_returns_none_if_not_registered(self):
+        self.open.side_effect = FileNotFoundError
+        self.assertIsNone(get_registered_sniffer("vnet-br0"))
+
+    def test_get_registered_sniffer_removes_and_ignores_corrupt_state(self):
+        self.open.return_value.read.return_value = "blaap"
+        self.assertIsNone(get_registered_sniffer("vnet-br0"))
+        self.unregister_sniffer.assert_called_once_with("vnet-br0")
+
+    def test_get_registered_sniffer_unregisters_dead_sniffers(self):
+        self.check_if_sniffer_is_alive.return_value = False
+        self.assertIsNone(get_registered_sniffer("vnet-br0"))
+        self.unregister_sniffer.assert_called_once_with("vnet-br0")
+
+
+class TestGetRegisteredSniffers(VNetTestCase):
+    def setUp(self) -> None:
+        self.get_registered_sniffer = self.set_up_patch("vnet_manager.operations.sniffer.get_registered_sniffer")
+        self.get_registered_sniffer.side_effect = lambda ifname: STATE if ifname == "vnet-br0" else None
+        self.glob = self.set_up_patch("vnet_manager.operations.sniffer.glob")
+        self.glob.return_value = [f"{settings.VNET_SNIFFER_STATE_DIR}/vnet-br1.json", f"{settings.VNET_SNIFFER_STATE_DIR}/vnet-br0.json"]
+
+    def test_get_registered_sniffers_only_looks_up_requested_interfaces(self):
+        get_registered_sniffers(["vnet-br0", "vnet-br1"])
+        self.get_registered_sniffer.assert_has_calls([call("vnet-br0"), call("vnet-br1")])
+        self.assertFalse(self.glob.called)
+
+    def test_get_registered_sniffers_returns_running_sniffers(self):
+        self.assertEqual(get_registered_sniffers(["vnet-br0", "vnet-br1"]), {"vnet-br0": STATE})
+
+    def test_get_registered_sniffers_looks_up_all_registered_sniffers_by_default(self):
+        get_registered_sniffers()
+        self.glob.assert_called_once_with(get_sniffer_state_file_path("*"))
+        self.get_registered_sniffer.assert_has_calls([call("vnet-br0"), call("vnet-br1")])
+
+
+class TestGetSnifferPIDMap(VNetTestCase):
+    def test_get_sniffer_pid_map_returns_pids_by_interface(self):
+        get_registered_sniffers = self.set_up_patch("vnet_manager.operations.sniffer.get_registered_sniffers")
+        get_registered_sniffers.return_value = {"vnet-br0": STATE}
+        self.assertEqual(get_sniffer_pid_map(["vnet-br0"]), {"vnet-br0": [42]})
+        get_registered_sniffers.assert_called_once_with(["vnet-br0"])
+
+
+class TestGetCapturedBytes(VNetTestCase):
+    def setUp(self) -> None:
+        self.glob = self.set_up_patch("vnet_manager.operations.sniffer.glob")
+        self.glob.return_value = ["/tmp/vnet-br0.pcap0", "/tmp/vnet-br0.pcap1.gz"]
+        self.isfile = self.set_up_patch("vnet_manager.operations.sniffer.isfile")
+        self.getsize = self.set_up_patch("vnet_manager.operations.sniffer.getsize")
+        self.getsize.return_value = 1024
+
+    def test_get_captured_bytes_globs_pcap_files(self):
+        get_captured_bytes(dict(STATE, pcap_files="/tmp/vnet-br0*"))
+        self.glob.assert_called_once_with("/tmp/vnet-br0*")
+
+    def test_get_captured_bytes_falls_back_to_pcap_path(self):
+        get_captured_bytes(STATE)
+        self.glob.assert_called_once_with(STATE["pcap"])
+
+    def test_get_captured_bytes_returns_total_size_of_pcap_files(self):
+        self.assertEqual(get_captured_bytes(STATE), 2048)
+
+    def test_get_captured_bytes_returns_none_if_no_pcap_files_exist(self):
+        self.glob.return_value = []
+        self.assertIsNone(get_captured_bytes(STATE))
+
+
+class TestShowSnifferStatus(VNetTestCase):
+    def setUp(self) -> None:
+        self.get_registered_sniffers = self.set_up_patch("vnet_manager.operations.sniffer.get_registered_sniffers")
+        self.get_registered_sniffers.return_value = {"vnet-br0": STATE}
+        self.get_captured_bytes = self.set_up_patch("vnet_manager.operations.sniffer.get_captured_bytes")
+        self.get_captured_bytes.return_value = 1024
+        self.tabulate = self.set_up_patch("vnet_manager.operations.sniffer.tabulate")
+
+    def test_show_sniffer_status_calls_get_registered_sniffers(self):
+        show_sniffer_status(["vnet-br0"])
+        self.get_registered_sniffers.assert_called_once_with(["vnet-br0"])
+
+    def test_show_sniffer_status_calls_tabulate(self):
+        show_sniffer_status()
+        self.tabulate.assert_called_once_with(
+            [["vnet-br0", 42, STATE["started"], STATE["pcap"], 1024]],
+            headers=["Interface", "PID", "Started", "PCAP", "Captured (bytes)"],
+            tablefmt="pretty",
+        )
+
+    def test_show_sniffer_status_shows_na_if_nothing_captured_yet(self):
+        self.get_captured_bytes.return_value = None
+        show_sniffer_status()
+        self.assertEqual(self.tabulate.call_args[0][0][0][4], "NA")
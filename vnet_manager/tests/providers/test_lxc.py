@@ -1,12 +1,35 @@
+from unittest.mock import Mock
+from pylxd.client import EventType
 from pylxd.exceptions import ClientConnectionFailed
+from urllib3 import HTTPConnectionPool
 
 from vnet_manager.tests import VNetTestCase
-from vnet_manager.providers.lxc import get_lxd_client
+from vnet_manager.conf import settings
+from vnet_manager.providers.lxc import (
+    get_lxd_client,
+    configure_lxd_client_session,
+    reset_lxd_client_pool,
+    get_lxd_handshake_count,
+    reset_lxd_handshake_count,
+    get_lxd_lifecycle_event_listener,
+    get_lxd_remote_client_kwargs,
+    configure_lxd_remotes,
+    get_lxd_remotes,
+    get_lxd_machine_remote,
+    use_lxd_remote,
+    use_lxd_machine_remote,
+    LXDEventListener,
+    LXDUnixSocketAdapter,
+)
 
 
 class TestGetLXDClient(VNetTestCase):
     def setUp(self) -> None:
         self.client = self.set_up_patch("vnet_manager.providers.lxc.client")
+        self.configure_lxd_client_session = self.set_up_patch("vnet_manager.providers.lxc.configure_lxd_client_session")
+        reset_lxd_client_pool()
+        reset_lxd_handshake_count()
+        self.addCleanup(reset_lxd_client_pool)
 
     def test_get_lxd_client_calls_client(self):
         get_lxd_client()
@@ -21,3 +44,199 @@ class TestGetLXDClient(VNetTestCase):
         with self.assertRaises(SystemExit) as e:
             get_lxd_client()
         self.assertEqual(e.exception.code, 1)
+
+    def test_get_lxd_client_reuses_client_for_same_arguments(self):
+        self.assertEqual(get_lxd_client(), get_lxd_client())
+        self.client.Client.assert_called_once_with()
+
+    def test_get_lxd_client_creates_new_client_for_different_arguments(self):
+        get_lxd_client()
+        get_lxd_client(endpoint="https://remote:8443")
+        self.assertEqual(self.client.Client.call_count, 2)
+
+    def test_get_lxd_client_configures_client_session(self):
+        get_lxd_client()
+        self.configure_lxd_client_session.assert_called_once_with(self.client.Client.return_value.api.session)
+
+    def test_get_lxd_client_creates_new_client_after_pool_reset(self):
+        get_lxd_client()
+        reset_lxd_client_pool()
+        get_lxd_client()
+        self.assertEqual(self.client.Client.call_count, 2)
+
+    def test_get_lxd_client_increases_handshake_count_only_on_new_clients(self):
+        get_lxd_client()
+        get_lxd_client()
+        self.assertEqual(get_lxd_handshake_count(), 1)
+
+    def test_reset_lxd_handshake_count_resets_count(self):
+        get_lxd_client()
+        reset_lxd_handshake_count()
+        self.assertEqual(get_lxd_handshake_count(), 0)
+
+
+REMOTES_CONFIG = {
+    "lxd_remotes": {
+        "local": {"tunnel_address": "192.168.0.1"},
+        "node1": {"endpoint": "https://node1:8443", "cert": ["/tmp/crt", "/tmp/key"], "verify": False, "tunnel_address": "192.168.0.2"},
+    },
+    "machines": {"router100": {"remote": "local"}, "router101": {"remote": "node1"}, "host102": {}},
+}
+
+
+class TestLXDRemotes(VNetTestCase):
+    def setUp(self) -> None:
+        self.client = self.set_up_patch("vnet_manager.providers.lxc.client")
+        self.set_up_patch("vnet_manager.providers.lxc.configure_lxd_client_session")
+        reset_lxd_client_pool()
+        self.addCleanup(reset_lxd_client_pool)
+        configure_lxd_remotes(REMOTES_CONFIG)
+        self.addCleanup(configure_lxd_remotes, {})
+
+    def test_get_lxd_remote_client_kwargs_returns_hashable_client_parameters(self):
+        self.assertEqual(
+            get_lxd_remote_client_kwargs(REMOTES_CONFIG["lxd_remotes"]["node1"]),
+            {"endpoint": "https://node1:8443", "cert": ("/tmp/crt", "/tmp/key"), "verify": False},
+        )
+
+    def test_get_lxd_remote_client_kwargs_returns_nothing_for_local_remote(self):
+        self.assertEqual(get_lxd_remote_client_kwargs(REMOTES_CONFIG["lxd_remotes"]["local"]), {})
+
+    def test_get_lxd_remotes_returns_local_and_remotes(self):
+        self.assertEqual(get_lxd_remotes(), [None, "node1"])
+
+    def test_get_lxd_machine_remote_returns_remote_of_machine(self):
+        self.assertEqual(get_lxd_machine_remote("router101"), "node1")
+
+    def test_get_lxd_machine_remote_returns_none_for_local_machines(self):
+        self.assertIsNone(get_lxd_machine_remote("router100"))
+        self.assertIsNone(get_lxd_machine_remote("host102"))
+
+    def test_configure_lxd_remotes_clears_previous_remotes(self):
+        configure_lxd_remotes({"machines": {}})
+        self.assertEqual(get_lxd_remotes(), [None])
+        self.assertIsNone(get_lxd_machine_remote("router101"))
+
+    def test_use_lxd_remote_makes_get_lxd_client_connect_to_remote(self):
+        with use_lxd_remote("node1"):
+            get_lxd_client()
+        self.client.Client.assert_called_once_with(endpoint="https://node1:8443", cert=("/tmp/crt", "/tmp/key"), verify=False)
+
+    def test_use_lxd_remote_restores_local_client_afterwards(self):
+        with use_lxd_remote("node1"):
+            remote = get_lxd_client()
+        self.client.Client.side_effect = [Mock()]
+        self.assertNotEqual(get_lxd_client(), remote)
+        self.client.Client.assert_called_with()
+
+    def test_use_lxd_machine_remote_makes_get_lxd_client_connect_to_remote_of_machine(self):
+        with use_lxd_machine_remote("router101"):
+            get_lxd_client()
+        self.client.Client.assert_called_once_with(endpoint="https://node1:8443", cert=("/tmp/crt", "/tmp/key"), verify=False)
+
+    def test_use_lxd_machine_remote_keeps_active_remote_for_machines_without_remote(self):
+        with use_lxd_remote("node1"):
+            with use_lxd_machine_remote(settings.LXC_BASE_IMAGE_MACHINE_NAME):
+                get_lxd_client()
+        self.client.Client.assert_called_once_with(endpoint="https://node1:8443", cert=("/tmp/crt", "/tmp/key"), verify=False)
+
+
+class FakeAdapter:
+    def __init__(self, pool_maxsize=10):
+        self.pool_maxsize = pool_maxsize
+
+
+class TestConfigureLXDClientSession(VNetTestCase):
+    def setUp(self) -> None:
+        self.session = Mock()
+        self.session.headers = {}
+        self.session.adapters = {"http+unix://": Mock(), "https://": FakeAdapter()}
+
+    def get_mounted_adapter(self, prefix: str):
+        return {call_args[0][0]: call_args[0][1] for call_args in self.session.mount.call_args_list}[prefix]
+
+    def test_configure_lxd_client_session_mounts_unix_socket_adapter_with_pool_size(self):
+        configure_lxd_client_session(self.session, pool_size=42)
+        adapter = self.get_mounted_adapter("http+unix://")
+        self.assertIsInstance(adapter, LXDUnixSocketAdapter)
+        self.assertEqual(adapter.pool_size, 42)
+        self.assertEqual(adapter.adapter, self.session.adapters["http+unix://"])
+
+    def test_configure_lxd_client_session_mounts_adapter_with_pool_size(self):
+        configure_lxd_client_session(self.session, pool_size=42)
+        adapter = self.get_mounted_adapter("https://")
+        self.assertIsInstance(adapter, FakeAdapter)
+        self.assertEqual(adapter.pool_maxsize, 42)
+
+    def test_configure_lxd_client_session_uses_pool_size_from_settings_by_default(self):
+        configure_lxd_client_session(self.session)
+        self.assertEqual(self.get_mounted_adapter("https://").pool_maxsize, settings.LXC_CLIENT_POOL_SIZE)
+        self.assertEqual(self.get_mounted_adapter("http+unix://").pool_size, settings.LXC_CLIENT_POOL_SIZE)
+
+    def test_configure_lxd_client_session_leaves_adapter_alone_if_pool_configuration_unsupported(self):
+        self.session.adapters = {"https://": object()}
+        configure_lxd_client_session(self.session)
+        self.assertFalse(self.session.mount.called)
+
+
+class TestLXDUnixSocketAdapter(VNetTestCase):
+    def setUp(self) -> None:
+        self.pylxd_adapter = Mock()
+        self.pylxd_adapter.get_connection.side_effect = lambda url, proxies: HTTPConnectionPool("localhost")
+        self.adapter = LXDUnixSocketAdapter(self.pylxd_adapter, 4)
+        self.url = "http+unix://%2Fvar%2Flib%2Flxd%2Funix.socket"
+
+    def test_lxd_unix_socket_adapter_shares_pool_per_socket(self):
+        pool = self.adapter.get_connection(f"{self.url}/1.0/instances")
+        self.assertIs(self.adapter.get_connection(f"{self.url}/1.0/operations/1234/wait"), pool)
+        self.pylxd_adapter.get_connection.assert_called_once_with(f"{self.url}/1.0/instances", None)
+
+    def test_lxd_unix_socket_adapter_keeps_pool_size_connections_alive(self):
+        pool = self.adapter.get_connection(f"{self.url}/1.0/instances")
+        self.assertEqual(pool.pool.maxsize, 4)
+        self.assertEqual(pool.pool.qsize(), 4)
+
+    def test_lxd_unix_socket_adapter_creates_pool_per_socket(self):
+        pool = self.adapter.get_connection(f"{self.url}/1.0/instances")
+        self.assertIsNot(self.adapter.get_connection("http+unix://%2Frun%2Flxd.socket/1.0/instances"), pool)
+
+    def test_lxd_unix_socket_adapter_requests_url_like_pylxd_adapter(self):
+        request = Mock()
+        self.assertEqual(self.adapter.request_url(request, None), self.pylxd_adapter.request_url.return_value)
+        self.pylxd_adapter.request_url.assert_called_once_with(request, None)
+
+    def test_lxd_unix_socket_adapter_closes_pools(self):
+        self.adapter.get_connection(f"{self.url}/1.0/instances")
+        self.adapter.close()
+        self.assertEqual(self.adapter.pools, {})
+        self.pylxd_adapter.close.assert_called_once_with()
+
+
+class TestGetLXDLifecycleEventListener(VNetTestCase):
+    def setUp(self) -> None:
+        self.lxd_client = self.set_up_patch("vnet_manager.providers.lxc.get_lxd_client")
+        self.listener = self.lxd_client.return_value.events.return_value
+        self.thread = self.set_up_patch("vnet_manager.providers.lxc.Thread")
+
+    def test_get_lxd_lifecycle_event_listener_subscribes_to_lifecycle_events(self):
+        get_lxd_lifecycle_event_listener()
+        self.lxd_client.return_value.events.assert_called_once_with(
+            websocket_client=LXDEventListener, event_types={EventType.Lifecycle, EventType.Operation}
+        )
+
+    def test_get_lxd_lifecycle_event_listener_runs_listener_in_thread(self):
+        self.assertEqual(get_lxd_lifecycle_event_listener(), self.listener)
+        self.listener.connect.assert_called_once_with()
+        self.thread.assert_called_once_with(target=self.listener.run, daemon=True)
+
+    def test_get_lxd_lifecycle_event_listener_returns_none_if_connection_fails(self):
+        self.listener.connect.side_effect = OSError
+        self.assertIsNone(get_lxd_lifecycle_event_listener())
+        self.assertFalse(self.thread.called)
+
+
+class TestLXDEventListener(VNetTestCase):
+    def test_lxd_event_listener_queues_received_messages(self):
+        listener = LXDEventListener("ws+unix:///tmp/unix.socket")
+        listener.received_message(Mock(data=b'{"type": "lifecycle"}'))
+        self.assertEqual(listener.events.get_nowait(), {"type": "lifecycle"})
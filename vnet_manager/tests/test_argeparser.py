@@ -22,6 +22,21 @@ class TestParseArgs(VNetTestCase):
     def test_parse_args_accepts_machines_on_create(self):
         self.assertIsInstance(parse_vnet_args(["create", "config", "--machines", "machine1"]), Namespace)
 
+    def test_parse_args_accepts_parallel_on_create(self):
+        self.assertEqual(parse_vnet_args(["create", "config", "--parallel", "4"]).parallel, 4)
+
+    def test_parse_args_defaults_parallel_to_one_on_create(self):
+        self.assertEqual(parse_vnet_args(["create", "config"]).parallel, 1)
+
+    def test_parse_args_accepts_dry_run_on_create(self):
+        self.assertTrue(parse_vnet_args(["create", "config", "--dry-run"]).dry_run)
+
+    def test_parse_args_does_not_prune_on_create_by_default(self):
+        self.assertFalse(parse_vnet_args(["create", "config"]).prune)
+
+    def test_parse_args_accepts_prune_on_create(self):
+        self.assertTrue(parse_vnet_args(["create", "config", "--prune"]).prune)
+
     @patch("sys.stderr", new_callable=StringIO)
     def test_parse_args_exists_when_sniffer_is_passed_without_start_action(self, stderr):
         with self.assertRaises(SystemExit):
@@ -49,6 +64,16 @@ class TestParseArgs(VNetTestCase):
     def test_parse_args_accepts_pcap_dir_on_start(self):
         self.assertIsInstance(parse_vnet_args(["start", "config", "-pd", "/tmp"]), Namespace)
 
+    def test_parse_args_accepts_parallel_on_destroy(self):
+        self.assertEqual(parse_vnet_args(["destroy", "--config", "config", "--parallel", "10"]).parallel, 10)
+        self.assertEqual(parse_vnet_args(["destroy", "--config", "config", "-p", "10"]).parallel, 10)
+
+    def test_parse_args_accepts_parallel_on_start(self):
+        self.assertEqual(parse_vnet_args(["start", "config", "--parallel", "10"]).parallel, 10)
+
+    def test_parse_args_accepts_parallel_on_stop(self):
+        self.assertEqual(parse_vnet_args(["stop", "config", "-p", "10"]).parallel, 10)
+
     def test_parse_args_accepts_machines_on_stop(self):
         self.assertIsInstance(parse_vnet_args(["stop", "config", "--machines", "machine1"]), Namespace)
 
@@ -75,3 +100,67 @@ class TestParseArgs(VNetTestCase):
 
     def test_parse_args_returns_config_for_connect_action(self):
         self.assertIsNotNone(parse_vnet_args(["connect", "machine1"]).config)
+
+    def test_parse_args_accepts_sniffer_list_without_config(self):
+        args = parse_vnet_args(["sniffer", "list"])
+        self.assertEqual(args.sniffer_action, "list")
+        self.assertIsNone(args.config)
+
+    def test_parse_args_accepts_sniffer_list_with_config(self):
+        self.assertEqual(parse_vnet_args(["sniffer", "list", "config"]).config, "config")
+
+    @patch("sys.stderr", new_callable=StringIO)
+    def test_parse_args_exists_when_no_sniffer_action_is_passed(self, stderr):
+        with self.assertRaises(SystemExit):
+            parse_vnet_args(["sniffer"])
+
+    def test_parse_args_accepts_sniffer_options_on_start(self):
+        args = parse_vnet_args(
+            [
+                "start",
+                "config",
+                "--sniffer",
+                "--sniffer-snaplen",
+                "96",
+                "--sniffer-filter",
+                "not port 22",
+                "--sniffer-rotate-size",
+                "100",
+                "--sniffer-rotate-seconds",
+                "3600",
+                "--sniffer-rotate-count",
+                "5",
+                "--sniffer-compress",
+            ]
+        )
+        self.assertEqual(args.sniffer_snaplen, 96)
+        self.assertEqual(args.sniffer_filter, "not port 22")
+        self.assertEqual(args.sniffer_rotate_size, 100)
+        self.assertEqual(args.sniffer_rotate_seconds, 3600)
+        self.assertEqual(args.sniffer_rotate_count, 5)
+        self.assertTrue(args.sniffer_compress)
+
+    def test_parse_args_defaults_to_tcpdump_sniffer_engine(self):
+        self.assertEqual(parse_vnet_args(["start", "config", "--sniffer"]).sniffer_engine, "tcpdump")
+
+    def test_parse_args_accepts_builtin_sniffer_engine_on_start(self):
+        self.assertEqual(parse_vnet_args(["start", "config", "--sniffer", "--sniffer-engine", "builtin"]).sniffer_engine, "builtin")
+
+    @patch("sys.stderr", new_callable=StringIO)
+    def test_parse_args_exits_on_unknown_sniffer_engine(self, stderr):
+        with self.assertRaises(SystemExit):
+            parse_vnet_args(["start", "config", "--sniffer", "--sniffer-engine", "blaap"])
+
+    @patch("sys.stderr", new_callable=StringIO)
+    def test_parse_args_exits_on_non_positive_sniffer_options(self, stderr):
+        for option in ("--sniffer-snaplen", "--sniffer-rotate-size", "--sniffer-rotate-seconds", "--sniffer-rotate-count"):
+            for value in ("0", "-1"):
+                with self.assertRaises(SystemExit):
+                    parse_vnet_args(["start", "config", "--sniffer", option, value])
+                self.assertIn("should be a positive number", stderr.getvalue())
+
+    @patch("sys.stderr", new_callable=StringIO)
+    def test_parse_args_exits_on_non_integer_sniffer_options(self, stderr):
+        with self.assertRaises(SystemExit):
+            parse_vnet_args(["start", "config", "--sniffer", "--sniffer-snaplen", "blaap"])
+        self.assertIn("invalid int value: 'blaap'", stderr.getvalue())
@@ -1,4 +1,6 @@
 from unittest.mock import Mock
+from subprocess import check_output
+from sys import executable
 from os import environ, EX_NOPERM
 from logging import INFO, DEBUG
 
@@ -62,6 +64,11 @@ class TestVNetManagerMain(VNetTestCase):
             purge=False,
             provider=None,
             pcap_dir=settings.VNET_SNIFFER_PCAP_DIR,
+            parallel=1,
+            sniffer_options={},
+            sniffer_engine="tcpdump",
+            dry_run=False,
+            prune=False,
         )
 
     def test_main_calls_action_manager_with_base_image(self):
@@ -74,6 +81,11 @@ class TestVNetManagerMain(VNetTestCase):
             purge=False,
             provider=None,
             pcap_dir=settings.VNET_SNIFFER_PCAP_DIR,
+            parallel=1,
+            sniffer_options={},
+            sniffer_engine="tcpdump",
+            dry_run=False,
+            prune=False,
         )
 
     def test_main_calls_action_manager_with_no_hosts(self):
@@ -86,6 +98,11 @@ class TestVNetManagerMain(VNetTestCase):
             purge=False,
             provider=None,
             pcap_dir=settings.VNET_SNIFFER_PCAP_DIR,
+            parallel=1,
+            sniffer_options={},
+            sniffer_engine="tcpdump",
+            dry_run=False,
+            prune=False,
         )
 
     def test_main_calls_action_manager_with_sniffer(self):
@@ -98,6 +115,11 @@ class TestVNetManagerMain(VNetTestCase):
             purge=False,
             provider=None,
             pcap_dir=settings.VNET_SNIFFER_PCAP_DIR,
+            parallel=1,
+            sniffer_options={},
+            sniffer_engine="tcpdump",
+            dry_run=False,
+            prune=False,
         )
 
     def test_main_calls_action_manager_with_default_provider_on_connect(self):
@@ -110,6 +132,11 @@ class TestVNetManagerMain(VNetTestCase):
             purge=False,
             provider="lxc",
             pcap_dir=settings.VNET_SNIFFER_PCAP_DIR,
+            parallel=1,
+            sniffer_options={},
+            sniffer_engine="tcpdump",
+            dry_run=False,
+            prune=False,
         )
 
     def test_main_calls_action_manager_with_provider(self):
@@ -122,8 +149,17 @@ class TestVNetManagerMain(VNetTestCase):
             purge=False,
             provider="test",
             pcap_dir=settings.VNET_SNIFFER_PCAP_DIR,
+            parallel=1,
+            sniffer_options={},
+            sniffer_engine="tcpdump",
+            dry_run=False,
+            prune=False,
         )
 
+    def test_main_calls_action_manager_with_parallel(self):
+        main(default_args + ["--parallel", "8"])
+        self.assertEqual(self.action_manager.call_args[1]["parallel"], 8)
+
     def test_main_sets_manager_machine_attribute(self):
         main(default_args + ["--machines", "test1", "test2"])
         self.assertEqual(self.manager.machines, ["test1", "test2"])
@@ -137,6 +173,18 @@ class TestVNetManagerMain(VNetTestCase):
         main(["status", "config"])
         self.manager.execute.assert_called_once_with("show")
 
+    def test_main_executes_sniffer_sub_action(self):
+        main(["sniffer", "list"])
+        self.manager.execute.assert_called_once_with("sniffer-list")
+
+    def test_main_calls_action_manager_with_sniffer_options(self):
+        main(["start", "config", "--sniffer", "--sniffer-snaplen", "96", "--sniffer-compress"])
+        self.assertEqual(self.action_manager.call_args[1]["sniffer_options"], {"snaplen": 96, "compress": True})
+
+    def test_main_calls_action_manager_with_sniffer_engine(self):
+        main(["start", "config", "--sniffer", "--sniffer-engine", "builtin"])
+        self.assertEqual(self.action_manager.call_args[1]["sniffer_engine"], "builtin")
+
     def test_main_calls_vnet_manager_with_purge(self):
         main(["destroy", "--purge"])
         self.action_manager.assert_called_once_with(
@@ -147,9 +195,30 @@ class TestVNetManagerMain(VNetTestCase):
             purge=True,
             provider=None,
             pcap_dir=settings.VNET_SNIFFER_PCAP_DIR,
+            parallel=1,
+            sniffer_options={},
+            sniffer_engine="tcpdump",
+            dry_run=False,
+            prune=False,
         )
         self.manager.execute.assert_called_once_with("destroy")
 
     def test_main_calls_manager_with_version(self):
         main(["version"])
         self.manager.execute.assert_called_once_with("version")
+
+
+class TestVNetManagerStartup(VNetTestCase):
+    def test_importing_the_cli_does_not_load_heavy_dependencies(self):
+        # A fresh interpreter, the test run itself has already imported everything
+        loaded = check_output(
+            [
+                executable,
+                "-c",
+                "import sys, vnet_manager.vnet_manager; "
+                "print(' '.join(sorted(m for m in ('pylxd', 'requests', 'pyroute2', 'psutil', 'tabulate', 'yaml', 'pkg_resources') "
+                "if m in sys.modules)))",
+            ],
+            text=True,
+        )
+        self.assertEqual(loaded.strip(), "")
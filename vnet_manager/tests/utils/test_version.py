@@ -1,18 +1,21 @@
 from io import StringIO
-from unittest.mock import patch, Mock
+from unittest.mock import patch
 
 from vnet_manager.utils.version import show_version
 from vnet_manager.tests import VNetTestCase
+from vnet_manager.conf import settings
 
 
 class TestShowVersion(VNetTestCase):
     def setUp(self) -> None:
-        self.package = Mock()
-        self.package.version = 1
-        self.require = self.set_up_patch("vnet_manager.utils.version.require")
-        self.require.return_value = [self.package]
+        self.version = self.set_up_patch("vnet_manager.utils.version.version")
+        self.version.return_value = "1"
 
     @patch("sys.stdout", new_callable=StringIO)
     def test_show_version_shows_version(self, stdout):
         show_version()
         self.assertEqual(stdout.getvalue().strip(), "VNet manager version 1")
+
+    def test_show_version_gets_version_of_package(self):
+        show_version()
+        self.version.assert_called_once_with(settings.PYTHON_PACKAGE_NAME)
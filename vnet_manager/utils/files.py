@@ -2,7 +2,6 @@ from os.path import isfile, join
 from os import walk
 from logging import getLogger
 from typing import AnyStr, List
-from yaml import safe_load
 
 logger = getLogger(__name__)
 
@@ -17,6 +16,8 @@ def get_yaml_content(path: str) -> dict:
         logger.error(f"File {path} does not exist")
         raise IOError(f"File {path} does not exist")
 
+    from yaml import safe_load  # pylint: disable=import-outside-toplevel
+
     logger.debug(f"Loading YAML values from {path}")
     with open(path, "r", encoding="utf-8") as fh:
         content = safe_load(fh)
@@ -72,5 +72,5 @@ def generate_bash_completion_script() -> str:
     """
     logger.info("Generating bash completion script")
     template = settings.VNET_BASH_COMPLETION_TEMPLATE
-    actions = ("create", "connect", "destroy", "list", "show", "status", "start", "stop")
+    actions = ("create", "connect", "destroy", "list", "show", "sniffer", "status", "start", "stop")
     return template.format(options=" ".join(actions), name=settings.get("PYTHON_PACKAGE_NAME", "vnet-manager"))
@@ -1,4 +1,4 @@
-from pkg_resources import require
+from importlib.metadata import version
 
 from vnet_manager.conf import settings
 
@@ -6,6 +6,6 @@ from vnet_manager.conf import settings
 def show_version():
     print(
         f"""
-VNet manager version {require(settings.PYTHON_PACKAGE_NAME)[0].version}
+VNet manager version {version(settings.PYTHON_PACKAGE_NAME)}
 """
     )
@@ -38,14 +38,31 @@ def main(args: Sequence = None) -> int:
         purge=args.get("purge", False),
         provider=args.get("provider"),
         pcap_dir=args.get("pcap_dir", settings.VNET_SNIFFER_PCAP_DIR),
+        parallel=args.get("parallel", 1),
+        sniffer_options=get_sniffer_options_from_args(args),
+        sniffer_engine=args.get("sniffer_engine", "tcpdump"),
+        dry_run=args.get("dry_run", False),
+        prune=args.get("prune", False),
     )
     if args.get("machines"):
         manager.machines = args["machines"]
     # Status is renamed to show to make sure we execute the right action
     if args["action"] == "status":
         args["action"] = "show"
+    # Sub actions are executed as '<action>-<sub action>'
+    if args["action"] == "sniffer":
+        args["action"] = f"sniffer-{args['sniffer_action']}"
     return manager.execute(args["action"])
 
 
+def get_sniffer_options_from_args(args: dict) -> dict:
+    """
+    Get the sniffer options that have been passed on the command line
+    :param dict args: The parsed arguments
+    :return: dict: The passed sniffer options, see settings.VNET_SNIFFER_OPTIONS
+    """
+    return {option: args[f"sniffer_{option}"] for option in settings.VNET_SNIFFER_OPTIONS if args.get(f"sniffer_{option}")}
+
+
 if __name__ == "__main__":
     sys.exit(main())